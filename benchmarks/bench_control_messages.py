@@ -0,0 +1,84 @@
+"""
+Control-plane message handling throughput.
+
+Every frame goes through the full path a peer link would take:
+Message.serialize -> Message.deserialize -> ServerNode.process_message.
+The legacy rows re-create the old str(dict)/ast.literal_eval and
+string-split parsing, so the two encodings can be compared side by side.
+
+    python -m benchmarks.bench_control_messages [-n 20000]
+"""
+import argparse
+import ast
+import time
+from unittest.mock import patch, MagicMock
+
+from src.domain.models import Message, MessageType
+from src.domain.control import (
+    ElectionKind, ElectionPayload,
+    MetadataAction, MetadataPayload,
+    NeighbourPayload, NeighbourSide,
+    HeartbeatPayload, HeartbeatRole,
+)
+from src.server.server_node import ServerNode
+
+
+def _make_node() -> ServerNode:
+    with patch('src.server.server_node.ServerNode.create_room'):
+        node = ServerNode("999999", "127.0.0.1", 5000, 0)
+    node.connection_manager.send_to_node = MagicMock()
+    node.leader_id = "999999"
+    return node
+
+
+def _run(label, n, frames, handle):
+    start = time.perf_counter()
+    for i in range(n):
+        handle(Message.deserialize(frames[i % len(frames)]))
+    elapsed = time.perf_counter() - start
+    print(f"{label:<32} {n / elapsed:>12,.0f} msg/s {elapsed / n * 1e6:>8.2f} us/msg")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", type=int, default=20000, help="messages per row")
+    args = parser.parse_args()
+
+    node = _make_node()
+    rooms = {f"r{i:03d}": str(i % 7) for i in range(50)}
+
+    # ---- typed payloads through the dispatcher table ----
+    election = [ElectionPayload(ElectionKind.PROBE, "1", k=2, d=1).to_message("1").serialize()]
+    heartbeat = [HeartbeatPayload(HeartbeatRole.SERVER, time.monotonic()).to_message("1").serialize()]
+    update = [MetadataPayload(MetadataAction.UPDATE_ROOM, room_id="abcd").to_message("1").serialize()]
+    sync = [MetadataPayload(MetadataAction.SYNC_ROOMS, rooms=rooms).to_message("1").serialize()]
+    neighbour = [NeighbourPayload(NeighbourSide.LEFT, "1").to_message("1").serialize()]
+
+    print(f"{'row':<32} {'throughput':>16} {'latency':>14}")
+    _run("ELECTION (typed)", args.n, election, node.process_message)
+    _run("HEARTBEAT (typed)", args.n, heartbeat, node.process_message)
+    _run("METADATA UPDATE_ROOM (typed)", args.n, update, node.process_message)
+    _run("METADATA SYNC_ROOMS x50 (typed)", args.n, sync, node.process_message)
+    # update_neighbour_id sleeps to settle the ring, so only decode is timed here
+    _run("UPDATE_NEIGHBOUR decode (typed)", args.n, neighbour, NeighbourPayload.from_message)
+
+    # ---- legacy string encodings, parse only ----
+    legacy_election = [Message(
+        type=MessageType.ELECTION, sender_id="1",
+        content=str({'k': 2, 'd': 1, 'type': 'Election', 'mid': "1"}),
+    ).serialize()]
+    legacy_sync = [Message(
+        type=MessageType.METADATA_UPDATE, sender_id="1",
+        content="Sync Room" + str(rooms),
+    ).serialize()]
+    legacy_update = [Message(
+        type=MessageType.METADATA_UPDATE, sender_id="1", content="Update Room abcd",
+    ).serialize()]
+
+    _run("ELECTION parse (legacy)", args.n, legacy_election, lambda m: ast.literal_eval(m.content))
+    _run("SYNC_ROOMS x50 parse (legacy)", args.n, legacy_sync, lambda m: ast.literal_eval(m.content[9:]))
+    _run("UPDATE_ROOM parse (legacy)", args.n, legacy_update, lambda m: "Update" in m.content and m.content.split()[2])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Cluster cold-start time over the in-process loopback transport.
+
+All N nodes boot within `--boot-spread` virtual seconds and broadcast
+SERVER_DISCOVERY, exactly as ServerNode.run() does. Peers connect, exchange
+SERVER_JOIN and settle the ring through the JoinCoalescer. A join window of 0
+settles (recomputes the ring and starts an election) on every single join,
+which is the old per-peer behaviour.
+
+Reported per row: whether all nodes agree on the highest id as leader, the
+virtual time from the last boot until the last election frame, elections
+started across the cluster, and election / total frames sent.
+
+    python -m benchmarks.cluster_coldstart [--sizes 3 10 50] [--windows 0 0.3]
+"""
+import argparse
+import contextlib
+import io
+import random
+import time
+
+from src.server.election import ElectionModule
+from src.server.server_state import ServerState
+from src.sim.loopback import LoopbackNetwork
+from benchmarks.election_sim import ELECTION_TYPES, build_cluster
+
+
+def cold_start(n, mode, window, boot_spread=0.05, latency=0.001, seed=1):
+    rng = random.Random(seed)
+    network = LoopbackNetwork(latency=latency)
+    nodes = build_cluster(n, mode, network)
+    last_election_event = [0.0]
+
+    for node in nodes:
+        node.join_coalescer.window = window
+        handler = node.process_message
+        def traced(msg, handler=handler):
+            if msg.type in ELECTION_TYPES:
+                last_election_event[0] = network.now
+            handler(msg)
+        node.process_message = traced
+
+    boot_times = sorted(rng.uniform(0, boot_spread) for _ in nodes)
+    for node, at in zip(nodes, boot_times):
+        network.call_later(at, node._broadcast_server_discovery)
+
+    wall_start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        network.run()
+    wall = time.perf_counter() - wall_start
+
+    expected = str(max(int(node.server_id) for node in nodes))
+    return {
+        "n": n,
+        "mode": mode,
+        "window": window,
+        "agreed": all(
+            str(node.leader_id) == expected
+            and node.state in (ServerState.LEADER, ServerState.FOLLOWER)
+            for node in nodes
+        ),
+        "cold_start": max(0.0, last_election_event[0] - boot_times[-1]),
+        "elections": sum(node.join_coalescer.flushes for node in nodes),
+        "election_frames": sum(network.frames_sent.get(t, 0) for t in ELECTION_TYPES),
+        "frames": sum(network.frames_sent.values()),
+        "wall": wall,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[3, 10, 50])
+    parser.add_argument("--modes", nargs="+", default=[ElectionModule.MODE_HS, ElectionModule.MODE_DOUBLING])
+    parser.add_argument("--windows", type=float, nargs="+", default=[0.0, 0.3], help="join windows in seconds")
+    parser.add_argument("--boot-spread", type=float, default=0.05)
+    parser.add_argument("--latency", type=float, default=0.001)
+    args = parser.parse_args()
+
+    print(f"{'N':>4} {'mode':<9} {'window':>6} {'agreed':<7} {'cold_start(ms)':>15} {'elections':>10} {'elec_frames':>12} {'frames':>10} {'wall(s)':>8}")
+    for n in args.sizes:
+        for mode in args.modes:
+            for window in args.windows:
+                r = cold_start(n, mode, window, args.boot_spread, args.latency)
+                print(
+                    f"{r['n']:>4} {r['mode']:<9} {r['window']:>6.2f} {str(r['agreed']):<7} "
+                    f"{r['cold_start'] * 1000:>15.1f} {r['elections']:>10} {r['election_frames']:>12} "
+                    f"{r['frames']:>10} {r['wall']:>8.2f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
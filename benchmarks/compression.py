@@ -0,0 +1,194 @@
+"""
+CPU cost vs. bytes saved of frame compression, on recorded traffic.
+
+A loopback cluster (leader, follower, clients) runs a fixed scenario and
+every TCP frame is recorded per connection and direction: leader metadata
+syncs, directory pages, a room snapshot, plain and batched chat. The
+recording is then replayed through three codecs at several zlib levels:
+
+    frame        each frame compressed on its own
+    frame+dict   the same, primed with FRAME_DICTIONARY
+    stream+dict  one stream per connection and direction (what transport.py
+                 does), flushed after every frame
+
+Frames below --min-size are sent as they are in every mode. Reports wire
+bytes saved and compress/decompress CPU per frame, overall and by frame type.
+
+    python -m benchmarks.compression [--rooms 500] [--history 2000] [--min-size 1024]
+"""
+import argparse
+import contextlib
+import io
+import time
+import zlib
+from unittest.mock import patch
+
+from src.domain.control import DirectoryPayload
+from src.domain.models import Message, MessageType, VectorClock
+from src.network.compression import FRAME_DICTIONARY, FrameCompressor, FrameDecompressor
+from src.server.server_node import ServerNode
+from src.server.server_state import ServerState
+from src.sim.loopback import LoopbackNetwork
+
+
+def record(rooms: int, history: int):
+    """Runs the scenario; returns [(stream key, frame type, payload)] in send order."""
+    network = LoopbackNetwork()
+    frames = []
+    transmit = network.transmit
+
+    def recording(dest, msg):
+        source = dest.peer.label if dest.peer else ""
+        frames.append(((source, dest.label), msg.type, msg.serialize()))
+        transmit(dest, msg)
+    network.transmit = recording
+
+    with patch('src.server.server_node.ServerNode._get_local_ip', return_value="127.0.0.1"):
+        leader = ServerNode("1", "127.0.0.1", 24001, 0)
+        follower = ServerNode("2", "127.0.0.1", 24002, 0)
+    for node in (leader, follower):
+        network.attach(node)
+    network.connect(leader, follower)
+    leader.state = ServerState.LEADER
+
+    store = leader.metadata_store
+    for i in range(3):
+        store.servers[str(i + 1)] = {"ip": f"10.1.0.{i + 1}", "port": 24001 + i}
+    for i in range(rooms):
+        store.set_room(f"room-{i:05d}", str(i % 3 + 1))
+        store.set_members({f"room-{i:05d}": i % 40}, str(i % 3 + 1))
+
+    # leader syncs, one per heartbeat period
+    peer = leader.connection_manager.active_connections_peer_to_peer["2"]
+    for _ in range(10):
+        store.sync_with_leader(peer, leader.server_id, leader.connection_manager)
+        network.run()
+
+    # directory pages over TCP
+    client = network.open_client(leader, "browser", lambda msg: None)
+    network.run()
+    for offset in range(0, rooms, 100):
+        client.send(DirectoryPayload(offset=offset, limit=100).to_message("browser"))
+    network.run()
+
+    # chat: a plain room and a batched one, then a snapshot of the plain one
+    with contextlib.redirect_stdout(io.StringIO()):
+        plain = leader.create_room("plain")
+        batched = leader.create_room("batched")
+    batched.batch_interval = 0.1
+    members = {}
+    for name in ("alice", "bob", "carol"):
+        members[name] = network.open_client(leader, name, lambda msg: None)
+        for room in (plain, batched):
+            room.add_client(name)
+    network.run()
+    for i in range(1, history + 1):
+        for room in (plain, batched):
+            msg = Message(type=MessageType.CHAT, sender_id="alice", room_id=room.room_id,
+                          content=f"message {i} about the weather today",
+                          vector_clock=VectorClock({"alice": i}))
+            members["alice"].send(msg)
+        # stay under the per-client rate limit
+        network.run(until=network.now + 0.025)
+    network.run()
+    follower.snapshots.request("plain", "1")
+    network.run()
+    return frames
+
+
+class PerFrame:
+    def __init__(self, level, zdict):
+        self.level = level
+        self.zdict = zdict
+
+    def _compress(self, payload):
+        stream = zlib.compressobj(self.level, zdict=self.zdict) if self.zdict else zlib.compressobj(self.level)
+        return stream.compress(payload) + stream.flush()
+
+    def _decompress(self, data):
+        stream = zlib.decompressobj(zdict=self.zdict) if self.zdict else zlib.decompressobj()
+        return stream.decompress(data)
+
+    def pair(self):
+        return self._compress, self._decompress
+
+
+class Stream:
+    def __init__(self, level):
+        self.level = level
+
+    def pair(self):
+        compressor = FrameCompressor(self.level, min_size=0)
+        return (lambda payload: compressor.compress(payload)[0]), FrameDecompressor().decompress
+
+
+def replay(frames, codec, min_size):
+    """Returns {frame type: [frames, bytes in, bytes out, compress s, decompress s]}."""
+    streams = {}
+    by_type = {}
+    for key, kind, payload in frames:
+        row = by_type.setdefault(kind, [0, 0, 0, 0.0, 0.0])
+        row[0] += 1
+        row[1] += len(payload) + 4
+        if len(payload) < min_size:
+            row[2] += len(payload) + 4
+            continue
+        if key not in streams:
+            streams[key] = codec.pair()
+        compress, decompress = streams[key]
+
+        start = time.perf_counter()
+        data = compress(payload)
+        row[3] += time.perf_counter() - start
+        start = time.perf_counter()
+        restored = decompress(data)
+        row[4] += time.perf_counter() - start
+        assert restored == payload
+        row[2] += len(data) + 4
+    return by_type
+
+
+def _print_row(label, frames, bytes_in, bytes_out, compress_s, decompress_s):
+    saved = 1 - bytes_out / bytes_in if bytes_in else 0.0
+    print(f"{label:<24} {frames:>7} {bytes_in:>12,} {bytes_out:>12,} {saved:>7.1%} "
+          f"{compress_s / frames * 1e6:>9.2f} {decompress_s / frames * 1e6:>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rooms", type=int, default=500, help="rooms in the leader's metadata")
+    parser.add_argument("--history", type=int, default=2000, help="messages per chat room")
+    parser.add_argument("--min-size", type=int, default=1024, help="smallest frame that is compressed")
+    args = parser.parse_args()
+
+    frames = record(args.rooms, args.history)
+    print(f"recorded {len(frames)} frames, {sum(len(p) + 4 for _, _, p in frames):,} bytes\n")
+
+    header = f"{'codec':<24} {'frames':>7} {'bytes in':>12} {'bytes out':>12} {'saved':>7} {'comp us':>9} {'decomp us':>9}"
+    print(header)
+    results = {}
+    for level in (1, 6, 9):
+        for name, codec in (
+            ("frame", PerFrame(level, None)),
+            ("frame+dict", PerFrame(level, FRAME_DICTIONARY)),
+            ("stream+dict", Stream(level)),
+        ):
+            by_type = replay(frames, codec, args.min_size)
+            results[(name, level)] = by_type
+            total = [sum(row[i] for row in by_type.values()) for i in range(5)]
+            _print_row(f"{name} level {level}", *total)
+
+    print("\nstream+dict level 6 by --min-size")
+    print(header.replace("codec ", "min   "))
+    for min_size in (0, 256, 1024, 4096):
+        by_type = replay(frames, Stream(6), min_size)
+        _print_row(f"{min_size} bytes", *[sum(row[i] for row in by_type.values()) for i in range(5)])
+
+    print("\nby frame type, stream+dict level 6 (per-frame CPU over all frames of the type)")
+    print(header.replace("codec ", "type  "))
+    for kind, row in sorted(results[("stream+dict", 6)].items(), key=lambda item: -item[1][1]):
+        _print_row(kind.value, *row)
+
+
+if __name__ == "__main__":
+    main()
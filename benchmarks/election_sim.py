@@ -0,0 +1,103 @@
+"""
+Leader election simulation over the in-process loopback transport.
+
+N ServerNodes join one after another (every `--join-interval` seconds of
+virtual time). Each join opens links to all running nodes and, like
+handle_join / _handle_server_discovery, both sides re-trigger an election.
+For every N and election mode the harness reports the election frames sent
+and the virtual time from the last join until all nodes agree on the leader.
+
+    python -m benchmarks.election_sim [--sizes 4 8 16 ...] [--modes hs doubling]
+"""
+import argparse
+import contextlib
+import io
+import time
+from unittest.mock import patch
+
+from src.domain.models import MessageType
+from src.server.election import ElectionModule
+from src.server.server_node import ServerNode
+from src.server.server_state import ServerState
+from src.sim.loopback import LoopbackNetwork
+
+ELECTION_TYPES = (MessageType.ELECTION, MessageType.UPDATE_NEIGHBOUR)
+
+
+def build_cluster(n, mode, network):
+    nodes = []
+    with patch('src.server.server_node.ServerNode._get_local_ip', return_value="127.0.0.1"):
+        for i in range(n):
+            node = ServerNode(str(1000 + i), "127.0.0.1", 20000 + i, 0, election_mode=mode)
+            network.attach(node)
+            nodes.append(node)
+    return nodes
+
+
+def simulate(n, mode, join_interval=0.01, latency=0.001):
+    network = LoopbackNetwork(latency=latency)
+    nodes = build_cluster(n, mode, network)
+    last_election_event = [0.0]
+
+    for node in nodes:
+        handler = node.process_message
+        def traced(msg, handler=handler):
+            if msg.type in ELECTION_TYPES:
+                last_election_event[0] = network.now
+            handler(msg)
+        node.process_message = traced
+
+    def join(i):
+        newcomer = nodes[i]
+        for existing in nodes[:i]:
+            network.connect(newcomer, existing)
+        for node in nodes[:i + 1]:
+            node._recompute_ring()
+            node.election_module.start_election(node.connection_manager)
+
+    for i in range(n):
+        network.call_later(i * join_interval, lambda i=i: join(i))
+
+    wall_start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        network.run()
+    wall = time.perf_counter() - wall_start
+
+    expected = str(max(int(node.server_id) for node in nodes))
+    agreed = all(
+        str(node.leader_id) == expected
+        and node.state in (ServerState.LEADER, ServerState.FOLLOWER)
+        for node in nodes
+    )
+    last_join = (n - 1) * join_interval
+    return {
+        "n": n,
+        "mode": mode,
+        "agreed": agreed,
+        "messages": sum(network.frames_sent.get(t, 0) for t in ELECTION_TYPES),
+        "bytes": sum(network.bytes_sent.get(t, 0) for t in ELECTION_TYPES),
+        "time_to_agreement": max(0.0, last_election_event[0] - last_join),
+        "wall": wall,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[4, 8, 16, 32, 64, 128, 256])
+    parser.add_argument("--modes", nargs="+", default=[ElectionModule.MODE_HS, ElectionModule.MODE_DOUBLING])
+    parser.add_argument("--join-interval", type=float, default=0.01, help="virtual seconds between joins")
+    parser.add_argument("--latency", type=float, default=0.001, help="one-way link latency in virtual seconds")
+    args = parser.parse_args()
+
+    print(f"{'N':>5} {'mode':<10} {'agreed':<7} {'messages':>10} {'bytes':>12} {'t_agree(ms)':>12} {'wall(s)':>8}")
+    for n in args.sizes:
+        for mode in args.modes:
+            r = simulate(n, mode, args.join_interval, args.latency)
+            print(
+                f"{r['n']:>5} {r['mode']:<10} {str(r['agreed']):<7} {r['messages']:>10} "
+                f"{r['bytes']:>12} {r['time_to_agreement'] * 1000:>12.1f} {r['wall']:>8.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Leader failover at scale in virtual time.
+
+Builds an N-node full mesh over the loopback transport, elects a leader,
+starts every node's failure detector and then crashes the leader. Reports
+the virtual time until every survivor agrees on a new leader, the frames
+sent, and the wall-clock time of the whole simulation. Latency, jitter and
+loss are injected by the simulator (see src/sim/loopback.py), seeded so runs
+are reproducible.
+
+    python -m benchmarks.failover_sim [--sizes 16 64 256] [--mode doubling] [--loss 0.01]
+"""
+import argparse
+import contextlib
+import io
+import time
+from unittest.mock import patch
+
+from src.server.election import ElectionModule
+from src.server.server_node import ServerNode
+from src.server.server_state import ServerState
+from src.sim.loopback import LoopbackNetwork
+
+
+def build_cluster(n, mode, network):
+    nodes = []
+    with patch('src.server.server_node.ServerNode._get_local_ip', return_value="127.0.0.1"):
+        for i in range(n):
+            node = ServerNode(str(1000 + i), "127.0.0.1", 20000 + i, 0, election_mode=mode)
+            network.attach(node)
+            nodes.append(node)
+    for i, node in enumerate(nodes):
+        for existing in nodes[:i]:
+            network.connect(node, existing)
+    return nodes
+
+
+def agreed(nodes):
+    expected = str(max(int(node.server_id) for node in nodes))
+    return all(
+        str(node.leader_id) == expected and node.state in (ServerState.LEADER, ServerState.FOLLOWER)
+        for node in nodes
+    )
+
+
+def simulate(n, mode, latency, jitter, loss, seed, step=0.1, horizon=60.0):
+    network = LoopbackNetwork(latency=latency, jitter=jitter, loss=loss, seed=seed)
+    wall_start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        nodes = build_cluster(n, mode, network)
+        for node in nodes:
+            node._recompute_ring()
+            node.election_module.start_election(node.connection_manager)
+        network.run()
+        elected = agreed(nodes)
+        for node in nodes:
+            node.StartFailureDetection()
+        # a few heartbeat periods of steady state
+        network.run(until=network.now + 5.0)
+
+        leader = max(nodes, key=lambda node: int(node.server_id))
+        survivors = [node for node in nodes if node is not leader]
+        frames_before = sum(network.frames_sent.values())
+        crashed_at = network.now
+        network.crash(leader)
+        failover = None
+        while network.now - crashed_at < horizon:
+            network.run(until=network.now + step)
+            if agreed(survivors):
+                failover = network.now - crashed_at
+                break
+    return {
+        "n": n,
+        "elected": elected,
+        "failover": failover,
+        "frames": sum(network.frames_sent.values()) - frames_before,
+        "retransmitted": network.retransmitted,
+        "wall": time.perf_counter() - wall_start,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[16, 64, 256])
+    parser.add_argument("--mode", choices=[ElectionModule.MODE_HS, ElectionModule.MODE_DOUBLING], default=ElectionModule.MODE_DOUBLING)
+    parser.add_argument("--latency", type=float, default=0.001)
+    parser.add_argument("--jitter", type=float, default=0.0005)
+    parser.add_argument("--loss", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{'N':>5} {'elected':>8} {'failover(s)':>12} {'frames':>10} {'retx':>6} {'wall(s)':>8}")
+    for n in args.sizes:
+        r = simulate(n, args.mode, args.latency, args.jitter, args.loss, args.seed)
+        failover = f"{r['failover']:.2f}" if r["failover"] is not None else "-"
+        print(f"{r['n']:>5} {str(r['elected']):>8} {failover:>12} {r['frames']:>10} {r['retransmitted']:>6} {r['wall']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Fan-out cost of one room spread over 4 nodes, with and without federation.
+
+direct:    every member is connected to the room's owner, which sends one
+           frame per member for every message.
+federated: members are spread round-robin over the owner and 3 edge servers.
+           The owner sends one ROOM_DELIVER per edge and the edges fan out
+           to their own members.
+
+Reports, for the chat phase only, the bytes and frames sent by the owner
+and by all servers together.
+
+    python -m benchmarks.federation_fanout [--members 200] [--messages 100]
+"""
+import argparse
+import contextlib
+import io
+from unittest.mock import patch
+
+from src.domain.models import Message, MessageType, VectorClock
+from src.server.server_node import ServerNode
+from src.sim.loopback import LoopbackNetwork
+
+ROOM = "bench"
+
+
+def run(mode, members, messages, payload_size):
+    network = LoopbackNetwork()
+    with patch('src.server.server_node.ServerNode._get_local_ip', return_value="127.0.0.1"):
+        nodes = [ServerNode(str(i), "127.0.0.1", 21000 + i, 0) for i in range(1, 5)]
+    for node in nodes:
+        network.attach(node)
+    for i, a in enumerate(nodes):
+        for b in nodes[i + 1:]:
+            network.connect(a, b)
+
+    owner = nodes[0]
+    received = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        owner.create_room(ROOM)
+        for node in nodes[1:]:
+            node.metadata_store.room_locations[ROOM] = owner.server_id
+
+        clients = []
+        for i in range(members):
+            client_id = f"client-{i:05d}"
+            home = owner if mode == "direct" else nodes[i % len(nodes)]
+            received[client_id] = 0
+            def on_message(msg, client_id=client_id):
+                if msg.type == MessageType.CHAT:
+                    received[client_id] += 1
+            conn = network.open_client(home, client_id, on_message)
+            conn.send(Message(type=MessageType.JOIN_ROOM, sender_id=client_id, room_id=ROOM))
+            clients.append((client_id, conn))
+        network.run()
+
+        bytes_before = dict(network.bytes_by_source)
+        frames_before = dict(network.frames_by_source)
+        sender_id, sender = clients[0]
+        for seq in range(1, messages + 1):
+            sender.send(Message(
+                type=MessageType.CHAT, sender_id=sender_id, room_id=ROOM,
+                content="x" * payload_size,
+                vector_clock=VectorClock({sender_id: seq}),
+            ))
+        network.run()
+
+    def delta(counter, before, labels):
+        return sum(counter.get(l, 0) - before.get(l, 0) for l in labels)
+
+    server_labels = [str(n.server_id) for n in nodes]
+    return {
+        "mode": mode,
+        "owner_bytes": delta(network.bytes_by_source, bytes_before, server_labels[:1]),
+        "owner_frames": delta(network.frames_by_source, frames_before, server_labels[:1]),
+        "total_bytes": delta(network.bytes_by_source, bytes_before, server_labels),
+        "total_frames": delta(network.frames_by_source, frames_before, server_labels),
+        "complete": all(count == messages for count in received.values()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--members", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=100)
+    parser.add_argument("--payload", type=int, default=64, help="chat content size in bytes")
+    args = parser.parse_args()
+
+    print(f"{args.members} members, {args.messages} messages, 4 nodes")
+    print(f"{'mode':<10} {'owner_bytes':>12} {'owner_frames':>13} {'total_bytes':>12} {'total_frames':>13} {'complete':>9}")
+    for mode in ("direct", "federated"):
+        r = run(mode, args.members, args.messages, args.payload)
+        print(
+            f"{r['mode']:<10} {r['owner_bytes']:>12} {r['owner_frames']:>13} "
+            f"{r['total_bytes']:>12} {r['total_frames']:>13} {str(r['complete']):>9}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""
+End-to-end load generator for the chat cluster over loopback TCP.
+
+Starts `--nodes` ServerNode processes, each hosting `--rooms` rooms, and
+drives them from AsyncChatClients in this process: every room gets
+`--room-size` members, `--senders` of which post at `--rate` messages per
+second each for `--duration` seconds. Every CHAT carries its send time, and
+every member that receives it records the delivery latency.
+
+Reports p50/p99/p999 delivery latency, sent and delivered messages/sec, and
+per-node CPU time and peak RSS (from /proc). With --output the results are
+written as JSON to compare across commits.
+
+Profiles set defaults for the shape of the load; explicit flags override them.
+
+    python -m benchmarks.loadgen [--profile small|chatty|broadcast] [--nodes 2] [--output result.json]
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import threading
+import time
+from unittest.mock import patch
+
+PROFILES = {
+    "small": dict(nodes=2, rooms=4, room_size=10, senders=2, rate=20, duration=5),
+    "chatty": dict(nodes=2, rooms=2, room_size=50, senders=10, rate=50, duration=5),
+    "broadcast": dict(nodes=1, rooms=1, room_size=500, senders=1, rate=50, duration=5),
+}
+BASE_PORT = 24000
+
+
+def serve(server_id, port, rooms, client_rate, ready):
+    """Server process: one ServerNode that accepts clients on `port` and hosts `rooms`."""
+    from src.server.rate_limiter import RateLimiter
+    from src.server.server_node import ServerNode
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        with patch('src.server.server_node.ServerNode._get_local_ip', return_value="127.0.0.1"):
+            node = ServerNode(server_id, "127.0.0.1", port, 0)
+        if client_rate:
+            node.rate_limiter = RateLimiter(node, client_rate=client_rate, client_burst=client_rate * 2)
+        for room_id in rooms:
+            node.create_room(room_id)
+
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind(("127.0.0.1", port))
+        listener.listen(1024)
+        ready.send(os.getpid())
+        while True:
+            sock, addr = listener.accept()
+            # handle_join reads the first frame; keep accept() free meanwhile
+            threading.Thread(target=node.handle_join, args=(sock, addr), daemon=True).start()
+
+
+# ---------- /proc sampling ----------
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+
+
+def cpu_seconds(pid):
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    # utime and stime are fields 14 and 15 of the full line
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+
+def rss_kb(pid, key="VmRSS"):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith(key + ":"):
+                return int(line.split()[1])
+    return 0
+
+
+# ---------- load ----------
+
+def percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+async def drive(cfg, ports):
+    from src.client.async_client import AsyncChatClient
+    from src.domain.models import MessageType
+
+    latencies = []
+    def on_message(msg):
+        if msg.type == MessageType.CHAT and msg.content.startswith("t="):
+            latencies.append(time.perf_counter() - float(msg.content[2:]))
+
+    clients = []
+    senders = []
+    for node_index, port in enumerate(ports):
+        for r in range(cfg["rooms"]):
+            room_id = f"room-{node_index}-{r}"
+            for m in range(cfg["room_size"]):
+                client = AsyncChatClient(f"bot-{node_index}-{r}-{m}", on_message=on_message)
+                await client.connect("127.0.0.1", port)
+                await client.join_room(room_id)
+                clients.append(client)
+                if m < cfg["senders"]:
+                    senders.append(client)
+    # let every JOIN_ROOM land before the first CHAT
+    await asyncio.sleep(0.5)
+
+    posted = [0]
+    async def post(client):
+        interval = 1.0 / cfg["rate"]
+        next_at = time.perf_counter()
+        end = next_at + cfg["duration"]
+        while next_at < end:
+            await client.send_message(f"t={time.perf_counter():.9f}")
+            posted[0] += 1
+            next_at += interval
+            await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(post(client) for client in senders))
+    sent_elapsed = time.perf_counter() - start
+
+    # wait for the tail of the deliveries
+    expected = posted[0] * cfg["room_size"]
+    deadline = time.perf_counter() + cfg["drain_timeout"]
+    while len(latencies) < expected and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - start
+
+    sent = sum(client.stats()["acked"] for client in senders)
+    throttled = sum(client.stats()["throttled"] for client in senders)
+    for client in clients:
+        await client.close()
+    return {
+        "clients": len(clients),
+        "sent": sent,
+        "delivered": len(latencies),
+        "expected_deliveries": expected,
+        "throttled": throttled,
+        "sent_per_sec": sent / sent_elapsed,
+        "delivered_per_sec": len(latencies) / elapsed,
+        "latency_ms": {
+            "p50": _ms(percentile(latencies, 0.50)),
+            "p99": _ms(percentile(latencies, 0.99)),
+            "p999": _ms(percentile(latencies, 0.999)),
+            "max": _ms(max(latencies) if latencies else None),
+        },
+    }
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1e3, 3)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(cfg):
+    ctx = multiprocessing.get_context("spawn")
+    ports = [cfg["base_port"] + i for i in range(cfg["nodes"])]
+    procs = []
+    try:
+        for i, port in enumerate(ports):
+            parent, child = ctx.Pipe()
+            rooms = [f"room-{i}-{r}" for r in range(cfg["rooms"])]
+            proc = ctx.Process(target=serve, args=(str(i + 1), port, rooms, cfg["client_rate"], child), daemon=True)
+            proc.start()
+            parent.recv()
+            procs.append(proc)
+
+        cpu_before = [cpu_seconds(p.pid) for p in procs]
+        result = asyncio.run(drive(cfg, ports))
+        result["nodes"] = [
+            {
+                "port": port,
+                "cpu_s": round(cpu_seconds(p.pid) - before, 3),
+                "rss_kb": rss_kb(p.pid),
+                "peak_rss_kb": rss_kb(p.pid, "VmHWM"),
+            }
+            for port, p, before in zip(ports, procs, cpu_before)
+        ]
+        result["loadgen"] = {"cpu_s": round(cpu_seconds(os.getpid()), 3), "peak_rss_kb": rss_kb(os.getpid(), "VmHWM")}
+        return result
+    finally:
+        for proc in procs:
+            proc.terminate()
+            proc.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="small")
+    parser.add_argument("--nodes", type=int)
+    parser.add_argument("--rooms", type=int, help="rooms per node")
+    parser.add_argument("--room-size", type=int, help="members per room")
+    parser.add_argument("--senders", type=int, help="posting members per room")
+    parser.add_argument("--rate", type=float, help="messages per second per sender")
+    parser.add_argument("--duration", type=float, help="seconds of posting")
+    parser.add_argument("--client-rate", type=float, default=0, help="server rate limit per client (0: server default)")
+    parser.add_argument("--drain-timeout", type=float, default=10.0)
+    parser.add_argument("--base-port", type=int, default=BASE_PORT)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    cfg = dict(PROFILES[args.profile])
+    for key in ("nodes", "rooms", "room_size", "senders", "rate", "duration"):
+        if getattr(args, key) is not None:
+            cfg[key] = getattr(args, key)
+    cfg.update(profile=args.profile, client_rate=args.client_rate, drain_timeout=args.drain_timeout, base_port=args.base_port)
+
+    result = run(cfg)
+    report = {"revision": git_revision(), "timestamp": time.time(), "config": cfg, "result": result}
+
+    lat = result["latency_ms"]
+    print(f"profile {cfg['profile']}: {cfg['nodes']} nodes x {cfg['rooms']} rooms x {cfg['room_size']} members, "
+          f"{cfg['senders']} senders/room at {cfg['rate']:g} msg/s for {cfg['duration']:g}s")
+    print(f"sent {result['sent']} ({result['sent_per_sec']:.0f}/s), delivered {result['delivered']}/"
+          f"{result['expected_deliveries']} ({result['delivered_per_sec']:.0f}/s), throttled {result['throttled']}")
+    print(f"latency ms: p50 {lat['p50']}  p99 {lat['p99']}  p999 {lat['p999']}  max {lat['max']}")
+    for node in result["nodes"]:
+        print(f"node :{node['port']}  cpu {node['cpu_s']:.2f}s  rss {node['rss_kb']} kB  peak {node['peak_rss_kb']} kB")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Frames and bytes a room host sends when bots post at a high rate, with and
+without room batching.
+
+Bots post `--rate` messages per second in total for `--seconds` of virtual
+time into one room with `--members` listeners. Reports the host's frames and
+bytes, the mean delivery delay the batching adds, and the wall time spent
+in the simulation (serialization included).
+
+    python -m benchmarks.room_batching [--members 100] [--rate 500] [--interval 0.02] [--size 32]
+"""
+import argparse
+import contextlib
+import io
+import time
+from unittest.mock import patch
+
+from src.domain.batch import unpack_batch
+from src.domain.models import Message, MessageType, VectorClock
+from src.server.server_node import ServerNode
+from src.sim.loopback import LoopbackNetwork
+
+ROOM = "bots"
+
+
+def run(batched, members, bots, rate, seconds, interval, size):
+    network = LoopbackNetwork()
+    with patch('src.server.server_node.ServerNode._get_local_ip', return_value="127.0.0.1"):
+        node = ServerNode("1", "127.0.0.1", 23001, 0)
+    network.attach(node)
+
+    sent_at = {}
+    delays = []
+    def on_message(msg):
+        if msg.type not in (MessageType.CHAT, MessageType.BATCH):
+            return
+        chats = unpack_batch(msg) if msg.type == MessageType.BATCH else [msg]
+        for chat in chats:
+            delays.append(network.now - sent_at[chat.content])
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        if batched:
+            node.create_room(ROOM, batch_interval=interval, batch_size=size)
+        else:
+            node.create_room(ROOM)
+        for i in range(members):
+            client_id = f"listener-{i:04d}"
+            conn = network.open_client(node, client_id, on_message)
+            conn.send(Message(type=MessageType.JOIN_ROOM, sender_id=client_id, room_id=ROOM))
+        senders = []
+        for i in range(bots):
+            bot_id = f"bot-{i}"
+            conn = network.open_client(node, bot_id, lambda msg: None)
+            conn.send(Message(type=MessageType.JOIN_ROOM, sender_id=bot_id, room_id=ROOM))
+            senders.append((bot_id, conn))
+        network.run()
+
+        frames_before = network.frames_by_source.get("1", 0)
+        bytes_before = network.bytes_by_source.get("1", 0)
+        total = int(rate * seconds)
+        for n in range(total):
+            bot_id, conn = senders[n % bots]
+            seq = n // bots + 1
+            def post(bot_id=bot_id, conn=conn, seq=seq):
+                content = f"{bot_id}:{seq}"
+                sent_at[content] = network.now
+                conn.send(Message(
+                    type=MessageType.CHAT, sender_id=bot_id, room_id=ROOM,
+                    content=content, vector_clock=VectorClock({bot_id: seq}),
+                ))
+            network.call_later(n / rate, post)
+
+        wall_start = time.perf_counter()
+        network.run()
+        wall = time.perf_counter() - wall_start
+
+    return {
+        "mode": "batched" if batched else "per-message",
+        "frames": network.frames_by_source.get("1", 0) - frames_before,
+        "bytes": network.bytes_by_source.get("1", 0) - bytes_before,
+        "delay_ms": 1e3 * sum(delays) / len(delays),
+        "wall_s": wall,
+        "complete": len(delays) == total * members,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--members", type=int, default=100)
+    parser.add_argument("--bots", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=500, help="messages per second, all bots together")
+    parser.add_argument("--seconds", type=float, default=2.0)
+    parser.add_argument("--interval", type=float, default=0.02, help="batch interval in seconds")
+    parser.add_argument("--size", type=int, default=32, help="max messages per batch")
+    args = parser.parse_args()
+
+    print(f"{args.members} members, {args.bots} bots at {args.rate:.0f} msg/s for {args.seconds}s")
+    print(f"{'mode':<12} {'frames':>9} {'bytes':>11} {'delay_ms':>9} {'wall_s':>7} {'complete':>9}")
+    for batched in (False, True):
+        r = run(batched, args.members, args.bots, args.rate, args.seconds, args.interval, args.size)
+        print(
+            f"{r['mode']:<12} {r['frames']:>9} {r['bytes']:>11} {r['delay_ms']:>9.2f} "
+            f"{r['wall_s']:>7.2f} {str(r['complete']):>9}"
+        )
+
+
+if __name__ == "__main__":
+    main()
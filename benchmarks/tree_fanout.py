@@ -0,0 +1,118 @@
+"""
+End-to-end delivery latency of one large room vs. room size, for three
+dissemination strategies over a ring of `--nodes` servers.
+
+direct:    every member is connected to the room's host.
+flat:      members are spread over all nodes; the host sends one ROOM_DELIVER
+           per edge server, each edge fans out to its own members.
+tree:      as flat, but the host only sends to `--fanout` relays, which
+           forward along a relay tree built over the ring order.
+
+Every sender uplink is serialized at `--frame-cost` seconds per frame, so
+the width of a fan-out turns into queueing delay. Reports p50/p99/max of the
+virtual time from send to delivery over all members and messages, and the
+frames the host sends per message.
+
+    python -m benchmarks.tree_fanout [--sizes 1000 10000 50000] [--nodes 16] [--fanout 4]
+"""
+import argparse
+import contextlib
+import io
+from unittest.mock import patch
+
+from src.domain.models import Message, MessageType, VectorClock
+from src.server.server_node import ServerNode
+from src.sim.loopback import LoopbackNetwork
+
+ROOM = "broadcast"
+SENDER = "announcer"
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+def run(mode, members, n_nodes, fanout, messages, frame_cost, latency):
+    network = LoopbackNetwork(latency=latency, frame_cost=frame_cost)
+    with patch('src.server.server_node.ServerNode._get_local_ip', return_value="127.0.0.1"):
+        nodes = [ServerNode(str(i), "127.0.0.1", 22000 + i, 0) for i in range(1, n_nodes + 1)]
+    for node in nodes:
+        network.attach(node)
+    for i, a in enumerate(nodes):
+        for b in nodes[i + 1:]:
+            network.connect(a, b)
+    ring = sorted(node.server_id for node in nodes)
+    for node in nodes:
+        node.ring = list(ring)
+
+    host = nodes[0]
+    sent_at = {}
+    latencies = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        host.create_room(ROOM, relay_fanout=fanout if mode == "tree" else 0)
+        for node in nodes[1:]:
+            node.metadata_store.room_locations[ROOM] = host.server_id
+
+        def on_message(msg):
+            if msg.type == MessageType.CHAT:
+                latencies.append(network.now - sent_at[msg.content])
+
+        for i in range(members):
+            home = host if mode == "direct" else nodes[i % n_nodes]
+            client_id = f"listener-{i:06d}"
+            conn = network.open_client(home, client_id, on_message)
+            conn.send(Message(type=MessageType.JOIN_ROOM, sender_id=client_id, room_id=ROOM))
+        sender = network.open_client(host, SENDER, lambda msg: None)
+        sender.send(Message(type=MessageType.JOIN_ROOM, sender_id=SENDER, room_id=ROOM))
+        network.run()
+
+        host_frames_before = network.frames_by_source.get(str(host.server_id), 0)
+        for seq in range(1, messages + 1):
+            content = f"m{seq}"
+            def send(seq=seq, content=content):
+                sent_at[content] = network.now
+                sender.send(Message(
+                    type=MessageType.CHAT, sender_id=SENDER, room_id=ROOM,
+                    content=content, vector_clock=VectorClock({SENDER: seq}),
+                ))
+            # spaced out so that consecutive messages do not queue behind each other
+            network.call_later(seq * 1.0, send)
+        network.run()
+
+    return {
+        "mode": mode,
+        "members": members,
+        "p50": percentile(latencies, 0.50),
+        "p99": percentile(latencies, 0.99),
+        "max": max(latencies),
+        "host_frames": (network.frames_by_source.get(str(host.server_id), 0) - host_frames_before) // messages,
+        "complete": len(latencies) == members * messages,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--modes", nargs="+", default=["direct", "flat", "tree"])
+    parser.add_argument("--nodes", type=int, default=16)
+    parser.add_argument("--fanout", type=int, default=4)
+    parser.add_argument("--messages", type=int, default=3)
+    parser.add_argument("--frame-cost", type=float, default=20e-6, help="sender uplink time per frame, seconds")
+    parser.add_argument("--latency", type=float, default=0.001, help="one-way link latency, seconds")
+    args = parser.parse_args()
+
+    print(f"{args.nodes} nodes, fanout {args.fanout}, {args.messages} messages, "
+          f"frame cost {args.frame_cost * 1e6:.0f}us, latency {args.latency * 1e3:.1f}ms")
+    print(f"{'mode':<7} {'members':>8} {'p50_ms':>8} {'p99_ms':>8} {'max_ms':>8} {'host_frames':>12} {'complete':>9}")
+    for members in args.sizes:
+        for mode in args.modes:
+            r = run(mode, members, args.nodes, args.fanout, args.messages, args.frame_cost, args.latency)
+            print(
+                f"{r['mode']:<7} {r['members']:>8} {r['p50'] * 1e3:>8.2f} {r['p99'] * 1e3:>8.2f} "
+                f"{r['max'] * 1e3:>8.2f} {r['host_frames']:>12} {str(r['complete']):>9}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# src/client/admin.py
+# Sends one ADMIN command to a node started with CHAT_ADMIN=1 and prints the
+# reply. Admin commands are only accepted over loopback, so run this on the
+# node's host.
+#
+#   python -m src.client.admin <port> timing_on|timing_off|status
+#   python -m src.client.admin <port> profile_start [interval]
+#   python -m src.client.admin <port> profile_stop
+#   python -m src.client.admin <port> profile_dump [file]   (folded stacks, flamegraph.pl input)
+import json
+import os
+import socket
+import sys
+
+from src.domain.control import AdminCommand, AdminPayload
+from src.domain.models import Message, MessageType
+from src.network.transport import TCPConnection
+
+
+def send_command(port: int, payload: AdminPayload, ip: str = "127.0.0.1", timeout: float = 5.0) -> AdminPayload:
+    sock = socket.create_connection((ip, port), timeout=timeout)
+    conn = TCPConnection(sock, ip, port)
+    admin_id = f"admin-{os.getpid()}"
+    try:
+        conn.send(Message(type=MessageType.CLIENT_JOIN, sender_id=admin_id))
+        conn.send(payload.to_message(admin_id))
+        while True:
+            msg = conn.receive()
+            if msg is None:
+                raise ConnectionError("node closed the connection (is CHAT_ADMIN=1 set?)")
+            if msg.type == MessageType.ADMIN:
+                return AdminPayload.from_message(msg)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: python -m src.client.admin <port> <command> [interval|file]")
+        sys.exit(1)
+
+    port = int(sys.argv[1])
+    command = AdminCommand(sys.argv[2])
+    arg = sys.argv[3] if len(sys.argv) > 3 else ""
+    payload = AdminPayload(command)
+    if command == AdminCommand.PROFILE_START and arg:
+        payload.interval = float(arg)
+
+    try:
+        reply = send_command(port, payload)
+    except (OSError, ConnectionError) as e:
+        print("[Admin] failed:", e)
+        sys.exit(1)
+
+    collapsed = reply.result.pop("collapsed", None)
+    if collapsed is not None and arg:
+        with open(arg, "w") as f:
+            f.write(collapsed)
+        print(f"[Admin] wrote {len(collapsed.splitlines())} stacks to {arg}")
+    elif collapsed is not None:
+        sys.stdout.write(collapsed)
+    else:
+        print(json.dumps(reply.result))
@@ -0,0 +1,222 @@
+import asyncio
+from typing import Callable, Dict, List, Optional
+
+from ..domain.models import (
+    Message,
+    MessageType,
+    NodeId,
+    generate_node_id,
+)
+from ..domain.batch import unpack_batch
+from ..domain.control import ThrottleAction, ThrottlePayload
+from .rooms import RoomSessions
+
+# ASYNC CLIENT
+# asyncio counterpart of ChatClient for bots and load tests. Sends go through a
+# bounded queue that one writer task drains, several frames per write, so a
+# client can keep many CHATs in flight. Every CHAT gets a future that resolves
+# when the room delivers it back to us (the server multicasts to the sender
+# too), which doubles as the delivery ack. Clock handling, causal hold-back and
+# the per-room sessions over one connection match ChatClient.
+
+class AsyncChatClient:
+    QUEUE_SIZE = 1024
+    MAX_IN_FLIGHT = 256
+    # frames written per writer wakeup before awaiting drain()
+    WRITE_BATCH = 64
+
+    def __init__(
+        self,
+        username: str,
+        client_id: Optional[NodeId] = None,
+        queue_size: int = QUEUE_SIZE,
+        max_in_flight: int = MAX_IN_FLIGHT,
+        on_message: Optional[Callable[[Message], None]] = None,
+    ):
+        self.client_id = client_id or generate_node_id()
+        self.username = username
+        self.rooms = RoomSessions()
+        self.current_room: Optional[str] = None
+        self.on_message = on_message
+
+        self.queue_size = queue_size
+        self.max_in_flight = max_in_flight
+        self._queue: Optional[asyncio.Queue] = None
+        self._in_flight: Optional[asyncio.Semaphore] = None
+        # message_id -> (CHAT, ack future), in send order
+        self._pending: Dict[str, tuple] = {}
+        self._reader = None
+        self._writer = None
+        self._tasks: List[asyncio.Task] = []
+        self.closed = False
+
+        # stats
+        self.sent = 0
+        self.acked = 0
+        self.received = 0
+        self.throttled = 0
+        self.resent = 0
+
+    # Lifecycle
+    async def connect(self, ip: str, port: int):
+        self._reader, self._writer = await asyncio.open_connection(ip, port)
+        self._queue = asyncio.Queue(self.queue_size)
+        self._in_flight = asyncio.Semaphore(self.max_in_flight)
+        self._write(Message(type=MessageType.CLIENT_JOIN, sender_id=self.client_id))
+        await self._writer.drain()
+        self._tasks = [
+            asyncio.create_task(self._read_loop()),
+            asyncio.create_task(self._write_loop()),
+        ]
+
+    async def close(self):
+        self.closed = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._writer is not None:
+            self._writer.close()
+        self._fail_pending(ConnectionError("client closed"))
+
+    # Chat protocol
+    async def join_room(self, room_id: str):
+        self.rooms.session(room_id)
+        self.current_room = room_id
+        await self._queue.put(Message(type=MessageType.JOIN_ROOM, sender_id=self.client_id, room_id=room_id))
+
+    async def leave_room(self, room_id: str):
+        self.rooms.leave(room_id)
+        if self.current_room == room_id:
+            self.current_room = next(iter(self.rooms), None)
+        await self._queue.put(Message(type=MessageType.LEAVE_ROOM, sender_id=self.client_id, room_id=room_id))
+
+    async def send_message(self, content: str, room_id: Optional[str] = None) -> asyncio.Future:
+        """
+        Queues a CHAT and returns its ack future. Waits while the send queue is
+        full or max_in_flight CHATs are unacked, which is the backpressure.
+        """
+        if self.closed:
+            raise ConnectionError("client closed")
+        room_id = room_id or self.current_room
+        if room_id is None:
+            raise ValueError("not in a room: join_room() first or pass room_id")
+        await self._in_flight.acquire()
+
+        msg = Message(
+            type=MessageType.CHAT,
+            content=content,
+            sender_id=self.client_id,
+            room_id=room_id,
+            vector_clock=self.rooms.session(room_id).next_clock(self.client_id),
+        )
+        ack = asyncio.get_running_loop().create_future()
+        self._pending[msg.message_id] = (msg, ack)
+        await self._queue.put(msg)
+        return ack
+
+    async def send_and_wait(self, content: str, room_id: Optional[str] = None, timeout: Optional[float] = None) -> Message:
+        ack = await self.send_message(content, room_id)
+        return await asyncio.wait_for(ack, timeout)
+
+    # Send path
+    def _write(self, msg: Message):
+        payload = msg.serialize()
+        self._writer.write(len(payload).to_bytes(4, "big") + payload)
+
+    async def _write_loop(self):
+        try:
+            while True:
+                msg = await self._queue.get()
+                self._write(msg)
+                self.sent += 1
+                # pipeline whatever else is already queued into the same drain
+                for _ in range(self.WRITE_BATCH - 1):
+                    if self._queue.empty():
+                        break
+                    self._write(self._queue.get_nowait())
+                    self.sent += 1
+                await self._writer.drain()
+        except (ConnectionError, OSError) as e:
+            self._fail_pending(e)
+
+    # Receive path
+    async def _read_loop(self):
+        try:
+            while True:
+                length = int.from_bytes(await self._reader.readexactly(4), "big")
+                msg = Message.deserialize(await self._reader.readexactly(length))
+                self.receive_message(msg)
+        except (asyncio.IncompleteReadError, ConnectionError, OSError):
+            self._fail_pending(ConnectionError("connection closed by server"))
+
+    def receive_message(self, msg: Message):
+        if msg.type == MessageType.BATCH:
+            for chat in unpack_batch(msg):
+                self.receive_message(chat)
+            return
+        if msg.type == MessageType.THROTTLED:
+            self._handle_throttled(ThrottlePayload.from_message(msg))
+            return
+
+        if msg.type != MessageType.CHAT and msg.type != MessageType.SYNC:
+            self._deliver(msg)
+            return
+        # one connection carries many rooms: the frame's room_id picks the session
+        session = self.rooms.incoming(msg.room_id)
+        if session is None:
+            return
+        if msg.type == MessageType.SYNC:
+            session.sync(msg.vector_clock, self._deliver)
+        else:
+            session.receive(msg, self.client_id, self._deliver)
+
+    def _deliver(self, msg: Message):
+        if msg.type == MessageType.CHAT:
+            self.rooms.session(msg.room_id).clock.merge(msg.vector_clock)
+            self.received += 1
+            pending = self._pending.pop(msg.message_id, None)
+            if pending is not None:
+                self._release(pending[1], msg)
+        if self.on_message is not None:
+            self.on_message(msg)
+
+    def _handle_throttled(self, notice: ThrottlePayload):
+        self.throttled += 1
+        if notice.action != ThrottleAction.REJECTED:
+            return
+        pending = self._pending.get(notice.message_id)
+        if pending is None:
+            return
+        # the server holds back everything after this clock value, so resend
+        # it unchanged; order among resends does not matter for the room
+        asyncio.get_running_loop().call_later(notice.retry_after, self._resend, pending[0])
+
+    def _resend(self, msg: Message):
+        if self.closed or msg.message_id not in self._pending:
+            return
+        self.resent += 1
+        self._write(msg)
+
+    def _release(self, ack: asyncio.Future, msg: Message):
+        self._in_flight.release()
+        self.acked += 1
+        if not ack.done():
+            ack.set_result(msg)
+
+    def _fail_pending(self, error: Exception):
+        pending, self._pending = self._pending, {}
+        for _, ack in pending.values():
+            self._in_flight.release()
+            if not ack.done():
+                ack.set_exception(error)
+
+    def stats(self) -> Dict:
+        return {
+            "sent": self.sent,
+            "acked": self.acked,
+            "received": self.received,
+            "in_flight": len(self._pending),
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "throttled": self.throttled,
+            "resent": self.resent,
+        }
@@ -1,30 +1,64 @@
-from typing import Optional
+from typing import Dict, List, Optional, Set
+from collections import OrderedDict
+import threading
 import time
 import json
 from ..domain.models import (
-    VectorClock,
     Message,
     MessageType,
     NodeId,
+    VectorClock,
     generate_node_id,
 )
+from ..domain.batch import unpack_batch
+from ..domain.control import AckKind, AckPayload, ThrottleAction, ThrottlePayload
 from ..network.transport import TCPConnection, UDPHandler, ConnectionManager
 from ..network.constants import (DISCOVERY_PORT,DISCOVERY_INTERVAL,DISCOVERY_RETRIES)
+from ..network.constants import ACK_HEADER, ACK_INTERVAL, SENT_AT_HEADER
+from ..network.compression import CODEC, COMPRESS_HEADER
+from ..network.discovery import BroadcastDiscovery, DiscoveryBackend
+from .rooms import RoomSessions
 class ChatClient:
-    def __init__(self, username: str, client_id: Optional[NodeId] = None):
+    # sent CHATs kept around so a throttled one can be resent with its clock
+    OUTBOX_SIZE = 256
+
+    def __init__(self, username: str, client_id: Optional[NodeId] = None, discovery: Optional[DiscoveryBackend] = None, acks: bool = False):
         self.client_id = client_id or generate_node_id()
         self.username = username
         self.discovery_active = False
+        # None: broadcast on the port given to discover_server
+        self.discovery = discovery
 
         self.server_connection: Optional[TCPConnection] = None
-        self.client_clock = VectorClock()
 
         self.udp_handler = UDPHandler()
         self.connection_manager = ConnectionManager()
 
+        # every room joined over the one server connection, each with its own
+        # clock and hold-back buffer; current_room is where typed lines go
+        self.rooms = RoomSessions()
         self.current_room = None
         self.discovered_servers = {}
 
+        self.unsent: List[Message] = []
+
+        self.outbox: "OrderedDict[str, Message]" = OrderedDict()
+        # per room, what was in the outbox when the connection was replaced;
+        # resent once the room's SYNC says how much of it arrived
+        self.resend: Dict[str, List[Message]] = {}
+        self.retry_queue: List[Message] = []
+        self._retry_timer = None
+        self._retry_lock = threading.Lock()
+
+        # opt-in delivery acks, see server/acks.py: the server reports which of
+        # our messages it has stored, we report what we have delivered
+        self.acks = acks
+        self.stored: Dict[str, int] = {}
+        self._acks_due: Set[str] = set()
+        self._delivered_at: Dict[str, float] = {}
+        self._ack_timer = None
+        self._ack_lock = threading.Lock()
+
     # Lifecycle
     def start(self, ip: str, port: int):
         # Connect to server and start receiving messages.
@@ -40,9 +74,20 @@ class ChatClient:
         join_msg = Message(
             type=MessageType.CLIENT_JOIN,
             sender_id=self.client_id,
+            headers={COMPRESS_HEADER: CODEC, ACK_HEADER: True} if self.acks else {COMPRESS_HEADER: CODEC},
         )
         self.server_connection.send(join_msg)
 
+        # after a reconnect, resubscribe to every room on the new connection;
+        # each answers with a SYNC that moves that room's clock forward
+        unsent = {msg.message_id for msg in self.unsent}
+        for room_id in self.rooms:
+            self.resend[room_id] = [
+                msg for msg in self.outbox.values()
+                if msg.room_id == room_id and msg.message_id not in unsent
+            ]
+            self.server_connection.send(Message(type=MessageType.JOIN_ROOM, sender_id=self.client_id, room_id=room_id))
+
         # Start async receive loop
         self.connection_manager.listen_to_connection(
             self.server_connection,
@@ -62,17 +107,22 @@ class ChatClient:
 
         self.udp_handler.listen(0, self.on_server_discovered)
 
-        discovery_msg = Message(
-            type=MessageType.DISCOVERY_REQUEST,
-            sender_id=self.client_id,
-        )
-
-        for _ in range(DISCOVERY_RETRIES):
+        discovery = self.discovery or BroadcastDiscovery(discovery_port)
+        for attempt in range(DISCOVERY_RETRIES):
             if not self.discovery_active:
                 break
 
-            print("[Client] sending discovery broadcast")
-            self.udp_handler.broadcast(discovery_msg, discovery_port)
+            # servers pick the responder from the attempt, so a retry reaches another one
+            request = {"attempt": attempt}
+            if discovery.direct:
+                request["direct"] = True
+            discovery_msg = Message(
+                type=MessageType.DISCOVERY_REQUEST,
+                sender_id=self.client_id,
+                content=json.dumps(request),
+            )
+            print("[Client] sending discovery request")
+            discovery.request(self.udp_handler, discovery_msg, attempt)
             time.sleep(DISCOVERY_INTERVAL)
 
     def on_server_discovered(self, msg: Message):
@@ -86,11 +136,22 @@ class ChatClient:
             self.discovery_active = False
             self._handle_available_rooms(msg)
         
+    def _request_rooms(self, addr, prefix: str = "", offset: int = 0):
+        """Asks the server that answered discovery for another directory page."""
+        self.discovery_active = True
+        self.udp_handler.send_to(Message(
+            type=MessageType.DISCOVERY_REQUEST,
+            sender_id=self.client_id,
+            content=json.dumps({"direct": True, "prefix": prefix, "offset": offset}),
+        ), addr)
+
     def _handle_available_rooms(self, msg: Message):
         data = json.loads(msg.content)
         rooms = data["rooms"]
         servers = data["servers"]
 
+        members = data.get("members", {})
+
         room_list = list(rooms.items())
 
         if not room_list:
@@ -99,13 +160,24 @@ class ChatClient:
             self.discovery_active = True
             return
 
-        print("\nAvailable rooms:")
+        offset = data.get("offset", 0)
+        print(f"\nAvailable rooms ({offset + 1}-{offset + len(room_list)} of {data.get('total', len(room_list))}):")
         for i, (room_id, server_id) in enumerate(room_list):
-            print(f"{i}: {room_id} (server {server_id})")
+            print(f"{i}: {room_id} (server {server_id}, {members.get(room_id, 0)} members)")
+        more = data.get("next_offset") is not None
+        if more:
+            print("n: next page")
+        print("/<prefix>: search")
 
+        choice = input("Select room: ").strip()
+        if choice == "n" and more:
+            self._request_rooms(msg.sender_addr, prefix=data.get("prefix", ""), offset=data["next_offset"])
+            return
+        if choice.startswith("/"):
+            self._request_rooms(msg.sender_addr, prefix=choice[1:])
+            return
         try:
-            choice = int(input("Select room: "))
-            room_id, server_id = room_list[choice]
+            room_id, server_id = room_list[int(choice)]
         except (ValueError, IndexError):
             print("Invalid selection.")
             return
@@ -137,48 +209,197 @@ class ChatClient:
             room_id=room_id,
         )
         self.server_connection.send(join_room_msg)
-        self.send_message("joined room ", self.client_id)
+        self.rooms.session(room_id)
+        self.current_room = room_id
+        self._flush_unsent()
+        self.send_message("joined room ", room_id)
 
-    def send_message(self, content: str, room_id: str):
-        # Send a chat message.
-        # Increment local clock
-        self.client_clock.increment(self.client_id)
+    def leave_room(self, room_id: str):
+        # Leave one room; the others on this connection are unaffected.
+        if self.rooms.leave(room_id) is None:
+            return
+        if self.server_connection:
+            self.server_connection.send(Message(
+                type=MessageType.LEAVE_ROOM,
+                sender_id=self.client_id,
+                room_id=room_id,
+            ))
+        if self.current_room == room_id:
+            self.current_room = next(iter(self.rooms), None)
+        print(f"[Client {self.client_id}] left room {room_id}")
 
-        msg_clock = VectorClock(
-            timestamps=self.client_clock.timestamps.copy()
-        )
+    def switch_room(self, room_id: str) -> bool:
+        # Make a joined room the one typed lines go to.
+        if room_id not in self.rooms:
+            return False
+        self.current_room = room_id
+        return True
 
+    def send_message(self, content: str, room_id: Optional[str] = None):
+        # Send a chat message.
+        room_id = room_id or self.current_room
         msg = Message(
             type=MessageType.CHAT,
             content=content,
             sender_id=self.client_id,
             room_id=room_id,
-            vector_clock=msg_clock,
         )
+        if room_id is None:
+            # no room yet: kept without a clock, it is stamped by the room it
+            # goes to once we join one
+            print("[Client] Not in a room, message queued")
+            self.unsent.append(msg)
+            return
+        self._stamp(msg)
 
-        if self.server_connection:
-            try:
-                self.server_connection.send(msg)
-            except:
-                print("[Client] Not connected, Message not sent")
-                self.client_clock.decrement(self.client_id)
-                self.server_connection.close()
-                self.handle_server_crash(server_id)
-        #else case should never happen
-        else:
-            print("[Client] Not connected, Message not sent")
-            self.client_clock.decrement(self.client_id)
+        # the clock entry is spent either way: a message that could not be sent
+        # is kept and sent first once we are connected (and in a room) again
+        if self.server_connection is None:
+            print("[Client] Not connected, message queued")
+            self.unsent.append(msg)
+            return
+
+        if self.server_connection.send(msg) is False:
+            print("[Client] Connection lost, message queued")
+            self.unsent.append(msg)
             self.server_connection.close()
-            self.handle_server_crash(server_id)
+            self.server_connection = None
+            self.handle_server_crash()
+
+    def _stamp(self, msg: Message):
+        # Increment the room's clock: every room orders our messages on its own
+        msg.vector_clock = self.rooms.session(msg.room_id).next_clock(self.client_id)
+        if self.acks:
+            msg.headers[SENT_AT_HEADER] = time.time()
+
+        self.outbox[msg.message_id] = msg
+        if len(self.outbox) > self.OUTBOX_SIZE:
+            self.outbox.popitem(last=False)
+
+    def _retransmit_outbox(self, room_id: str, clock: VectorClock):
+        # frames in flight when the old connection broke may never have
+        # arrived; what the room's clock covers did, the rest is sent again
+        # (the room drops copies of messages it accepted but holds back)
+        delivered = clock.timestamps.get(self.client_id, 0)
+        for msg in self.resend.pop(room_id, []):
+            if msg.vector_clock.timestamps.get(self.client_id, 0) <= delivered:
+                self.outbox.pop(msg.message_id, None)
+            elif self.server_connection is not None:
+                self.server_connection.send(msg)
+
+    def _flush_unsent(self):
+        unsent, self.unsent = self.unsent, []
+        for msg in unsent:
+            if msg.room_id is None:
+                msg.room_id = self.current_room
+                self._stamp(msg)
+            self.server_connection.send(msg)
 
     # Receive
     def receive_message(self, msg: Message):
         # Handle incoming messages from server.
-        self.client_clock.merge(msg.vector_clock)
+        if msg.type == MessageType.BATCH:
+            for chat in unpack_batch(msg):
+                self.receive_message(chat)
+            return
+        if msg.type == MessageType.THROTTLED:
+            self._handle_throttled(msg)
+            return
+        if msg.type == MessageType.ACK:
+            self._handle_ack(AckPayload.from_message(msg))
+            return
+        # one connection carries many rooms: the frame's room_id picks the session
+        session = self.rooms.incoming(msg.room_id)
+        if session is None:
+            return
+        if msg.type == MessageType.SYNC:
+            session.sync(msg.vector_clock, self._deliver)
+            self._retransmit_outbox(msg.room_id, msg.vector_clock)
+            return
+        session.receive(msg, self.client_id, self._deliver)
+
+    def _deliver(self, msg: Message):
+        self.rooms.session(msg.room_id).clock.merge(msg.vector_clock)
+        if self.acks:
+            self._ack_delivered(msg.room_id)
         print(
             f"[Room {msg.room_id}] "
             f"[Client {msg.sender_id}]: {msg.content}" 
         )
 
+    # Acks
+    def is_stored(self, msg: Message) -> bool:
+        """True once the server has reported `msg` as stored by its room."""
+        return msg.vector_clock.timestamps.get(self.client_id, 0) <= self.stored.get(msg.room_id, 0)
+
+    def _handle_ack(self, ack: AckPayload):
+        if ack.kind != AckKind.STORED:
+            return
+        stored = ack.clock.get(self.client_id, 0)
+        if stored <= self.stored.get(ack.room_id, 0):
+            return
+        self.stored[ack.room_id] = stored
+        # stored messages are never retransmitted, so they need not be kept
+        for message_id, msg in list(self.outbox.items()):
+            if msg.room_id == ack.room_id and self.is_stored(msg):
+                del self.outbox[message_id]
+
+    def _ack_delivered(self, room_id: str):
+        # one cumulative ack per room and ACK_INTERVAL, however many deliveries
+        with self._ack_lock:
+            self._delivered_at[room_id] = time.time()
+            self._acks_due.add(room_id)
+            if self._ack_timer is None:
+                self._ack_timer = threading.Timer(ACK_INTERVAL, self._send_acks)
+                self._ack_timer.daemon = True
+                self._ack_timer.start()
+
+    def _send_acks(self):
+        with self._ack_lock:
+            due, self._acks_due = self._acks_due, set()
+            self._ack_timer = None
+        if self.server_connection is None:
+            return
+        for room_id in due:
+            session = self.rooms.incoming(room_id)
+            if session is None:
+                continue
+            ack = AckPayload(
+                AckKind.DELIVERED,
+                room_id,
+                clock=dict(session.clock.timestamps),
+                delivered_at=self._delivered_at.get(room_id, 0.0),
+            )
+            self.server_connection.send(ack.to_message(self.client_id))
+
+    def _handle_throttled(self, msg: Message):
+        notice = ThrottlePayload.from_message(msg)
+        if notice.action == ThrottleAction.DELAYED:
+            print(f"[Client] message delayed by {notice.scope.value} rate limit")
+            return
+
+        # the server expects this clock value next, so resend it unchanged
+        # (and in the original order) once the bucket has refilled
+        rejected = self.outbox.get(notice.message_id)
+        if rejected is None:
+            print("[Client] message rejected by rate limit, not resending")
+            return
+        print(f"[Client] message rejected by {notice.scope.value} rate limit, retrying in {notice.retry_after:.2f}s")
+        with self._retry_lock:
+            self.retry_queue.append(rejected)
+            self.retry_queue.sort(key=lambda m: (m.room_id, m.vector_clock.timestamps.get(self.client_id, 0)))
+            if self._retry_timer is None:
+                self._retry_timer = threading.Timer(notice.retry_after, self._resend_throttled)
+                self._retry_timer.daemon = True
+                self._retry_timer.start()
+
+    def _resend_throttled(self):
+        with self._retry_lock:
+            queue, self.retry_queue = self.retry_queue, []
+            self._retry_timer = None
+        for msg in queue:
+            if self.server_connection:
+                self.server_connection.send(msg)
+
     def handle_server_crash(self):
         self.discover_server(DISCOVERY_PORT)
\ No newline at end of file
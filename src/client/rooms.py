@@ -0,0 +1,81 @@
+from typing import Callable, Dict, Iterator, Optional, Set
+
+from ..domain.models import Message, NodeId, VectorClock
+from ..domain.causal import HoldBackBuffer
+
+# ROOM SESSIONS
+# One client connection carries JOIN_ROOM/LEAVE_ROOM and CHATs for any number
+# of rooms. Each room is ordered by its own host against its own clock, so a
+# client keeps one clock and one hold-back buffer per room: a CHAT in one room
+# must not advance the sequence number another room's host expects next.
+# Every frame already names its room (room_id), which is what incoming CHAT,
+# SYNC and BATCH frames are demultiplexed by. Used by ChatClient and
+# AsyncChatClient.
+
+Deliver = Callable[[Message], None]
+
+
+class RoomSession:
+    def __init__(self, room_id: str):
+        self.room_id = room_id
+        self.clock = VectorClock()
+        self.hold_back = HoldBackBuffer()
+
+    def next_clock(self, client_id: NodeId) -> VectorClock:
+        """Counts one more CHAT of ours in this room; the clock to send it with."""
+        self.clock.increment(client_id)
+        return self.clock.copy()
+
+    def sync(self, clock: VectorClock, deliver: Deliver):
+        # the room's clock at join time: everything up to it happened before
+        # we joined and will never be delivered to us
+        self.clock.merge(clock)
+        self.hold_back.drain(self.clock, deliver)
+
+    def receive(self, msg: Message, client_id: NodeId, deliver: Deliver):
+        # our own messages are already counted in our clock
+        if msg.sender_id == client_id:
+            deliver(msg)
+        elif self.clock.is_causally_ready(msg.vector_clock, msg.sender_id):
+            deliver(msg)
+            self.hold_back.drain(self.clock, deliver)
+        else:
+            self.hold_back.append(msg)
+
+
+class RoomSessions:
+    """room_id -> RoomSession for the rooms this client is in, in join order."""
+    def __init__(self):
+        self._rooms: Dict[str, RoomSession] = {}
+        # rooms left and not rejoined; frames still in flight for them are dropped
+        self._left: Set[str] = set()
+
+    def session(self, room_id: str) -> RoomSession:
+        """The room's session, started on first use: a JOIN_ROOM, or a frame
+        for a room sent to (or received from) without joining first."""
+        session = self._rooms.get(room_id)
+        if session is None:
+            session = self._rooms[room_id] = RoomSession(room_id)
+            self._left.discard(room_id)
+        return session
+
+    def incoming(self, room_id: str) -> Optional[RoomSession]:
+        """The session an incoming frame belongs to; None once the room was left."""
+        if room_id in self._left:
+            return None
+        return self.session(room_id)
+
+    def leave(self, room_id: str) -> Optional[RoomSession]:
+        session = self._rooms.pop(room_id, None)
+        if session is not None:
+            self._left.add(room_id)
+        return session
+
+    def __contains__(self, room_id) -> bool:
+        return room_id in self._rooms
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._rooms))
+
+    def __len__(self) -> int:
+        return len(self._rooms)
@@ -1,13 +1,21 @@
 # src/client/run_client.py
+import os
 import sys
 import time
 from src.client.chat_client import ChatClient
+from src.network.discovery import discovery_from_spec
 
 DISCOVERY_PORT = 6000
 DISCOVERY_TIMEOUT = 5 # seconds
 
 if __name__ == "__main__":
-    client = ChatClient(username="user")
+    # same CHAT_DISCOVERY spec as the servers: broadcast, seeds:..., multicast:... or file:...
+    # CHAT_ACKS=1: ask for delivery acks, so the servers can track delivery latency
+    client = ChatClient(
+        username="user",
+        discovery=discovery_from_spec(os.environ.get("CHAT_DISCOVERY")),
+        acks=os.environ.get("CHAT_ACKS") == "1",
+    )
 
     if len(sys.argv) == 3:
         ip = sys.argv[1]
@@ -19,8 +27,19 @@ if __name__ == "__main__":
         client.discover_server(DISCOVERY_PORT)
 
     try:
+        # /join <room>, /leave <room> and /room <room> manage the rooms on this
+        # connection; anything else goes to the current room
         while True:
             msg = input("> ")
-            client.send_message(msg, client.current_room)
+            command, _, room_id = msg.partition(" ")
+            if command == "/join" and room_id:
+                client.join_room(room_id)
+            elif command == "/leave" and room_id:
+                client.leave_room(room_id)
+            elif command == "/room" and room_id:
+                if not client.switch_room(room_id):
+                    print(f"[Client] not in room {room_id}")
+            else:
+                client.send_message(msg, client.current_room)
     except KeyboardInterrupt:
         print("\n[Client] shutting down")
@@ -0,0 +1,55 @@
+import json
+from typing import Dict, List
+
+from .models import Message, MessageType, VectorClock, NodeId
+
+# ROOM BATCHES
+# A BATCH frame carries several delivered CHATs of one room in delivery order.
+# Message.vector_clock holds the batch's clock base, the element-wise minimum
+# of all entry clocks; every entry only carries the components above that
+# base, so the common part of the clocks is sent once per batch.
+
+def _clock_base(clocks: List[Dict[NodeId, int]]) -> Dict[NodeId, int]:
+    base = dict(clocks[0])
+    for clock in clocks[1:]:
+        for node in list(base):
+            if node not in clock:
+                del base[node]
+            elif clock[node] < base[node]:
+                base[node] = clock[node]
+    return base
+
+
+def pack_batch(room_id: str, messages: List[Message], sender_id: NodeId = "") -> Message:
+    base = _clock_base([m.vector_clock.timestamps for m in messages])
+    entries = []
+    for m in messages:
+        delta = {
+            node: count for node, count in m.vector_clock.timestamps.items()
+            if base.get(node) != count
+        }
+        entries.append({"id": m.message_id, "from": m.sender_id, "content": m.content, "clock": delta})
+
+    return Message(
+        type=MessageType.BATCH,
+        sender_id=sender_id,
+        room_id=room_id,
+        content=json.dumps(entries, separators=(",", ":")),
+        vector_clock=VectorClock(base),
+    )
+
+
+def unpack_batch(batch: Message) -> List[Message]:
+    """Returns the CHATs of a BATCH frame in the order the room delivered them."""
+    base = batch.vector_clock.timestamps
+    return [
+        Message(
+            type=MessageType.CHAT,
+            message_id=entry["id"],
+            content=entry["content"],
+            sender_id=entry["from"],
+            room_id=batch.room_id,
+            vector_clock=VectorClock({**base, **entry["clock"]}),
+        )
+        for entry in json.loads(batch.content)
+    ]
@@ -0,0 +1,303 @@
+from enum import Enum
+from typing import Any, ClassVar, Dict, List, Optional
+from dataclasses import dataclass, field, asdict
+import json
+
+from .models import Message, MessageType, NodeId
+
+# Typed payloads for the server <-> server control plane.
+# Every payload is carried as JSON in Message.content, so the frame format on the
+# wire does not change; only the content is schema'd instead of free text.
+
+class ElectionKind(Enum):
+    PROBE = "Election"
+    REPLY = "Reply"
+    LEADER = "Leader Announcement"
+    DOUBLING = "Doubling"
+
+class MetadataAction(Enum):
+    UPDATE_ROOM = "UPDATE_ROOM"
+    UPDATE_CONNECTION = "UPDATE_CONNECTION"
+    SYNC_ROOMS = "SYNC_ROOMS"
+    SYNC_CONNECTIONS = "SYNC_CONNECTIONS"
+    ROOM_STATS = "ROOM_STATS"
+
+class NeighbourSide(Enum):
+    LEFT = "left"
+    RIGHT = "right"
+
+class FederationAction(Enum):
+    SUBSCRIBE = "SUBSCRIBE"
+    UNSUBSCRIBE = "UNSUBSCRIBE"
+
+class ThrottleAction(Enum):
+    REJECTED = "rejected"
+    DELAYED = "delayed"
+
+class ThrottleScope(Enum):
+    CLIENT = "client"
+    ROOM = "room"
+    NODE = "node"
+
+class AdminCommand(Enum):
+    TIMING_ON = "timing_on"
+    TIMING_OFF = "timing_off"
+    PROFILE_START = "profile_start"
+    PROFILE_STOP = "profile_stop"
+    PROFILE_DUMP = "profile_dump"
+    STATUS = "status"
+
+class SnapshotAction(Enum):
+    REQUEST = "request"
+    CHUNK = "chunk"
+    ACK = "ack"
+    END = "end"
+    ABORT = "abort"
+
+class AckKind(Enum):
+    STORED = "stored"
+    DELIVERED = "delivered"
+
+class HeartbeatRole(Enum):
+    SERVER = "server"
+    CLIENT = "client"
+
+
+def _plain(value: Any) -> Any:
+    if isinstance(value, Enum):
+        return value.value
+    return value
+
+
+@dataclass
+class ControlPayload:
+    MESSAGE_TYPE: ClassVar[MessageType]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {key: _plain(value) for key, value in asdict(self).items()}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'ControlPayload':
+        return cls(**data)
+
+    def encode(self) -> str:
+        return json.dumps(self.to_dict(), separators=(",", ":"))
+
+    @classmethod
+    def decode(cls, content: str) -> 'ControlPayload':
+        return cls.from_dict(json.loads(content))
+
+    @classmethod
+    def from_message(cls, msg: Message) -> 'ControlPayload':
+        return cls.decode(msg.content)
+
+    def to_message(self, sender_id: NodeId) -> Message:
+        return Message(type=self.MESSAGE_TYPE, content=self.encode(), sender_id=sender_id)
+
+
+@dataclass
+class ElectionPayload(ControlPayload):
+    MESSAGE_TYPE: ClassVar[MessageType] = MessageType.ELECTION
+
+    kind: ElectionKind
+    mid: NodeId
+    k: int = 0
+    d: int = 0
+    # election epoch and the members it runs over; only used by the recursive
+    # doubling mode (k = -1 announces a term without a candidate)
+    term: int = 0
+    ring: List[NodeId] = field(default_factory=list)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'ElectionPayload':
+        data = dict(data)
+        data["kind"] = ElectionKind(data["kind"])
+        return cls(**data)
+
+
+@dataclass
+class MetadataPayload(ControlPayload):
+    MESSAGE_TYPE: ClassVar[MessageType] = MessageType.METADATA_UPDATE
+
+    action: MetadataAction
+    room_id: str = ""
+    # room_id -> hosting server_id
+    rooms: Dict[str, NodeId] = field(default_factory=dict)
+    # server_id -> {"ip": ..., "port": ...}
+    peers: Dict[NodeId, Dict[str, Any]] = field(default_factory=dict)
+    # read lease granted by the leader with a SYNC_ROOMS, in seconds
+    lease: float = 0.0
+    # room_id -> members: the sender's local counts (ROOM_STATS) or the
+    # cluster totals (SYNC_ROOMS)
+    members: Dict[str, int] = field(default_factory=dict)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'MetadataPayload':
+        data = dict(data)
+        data["action"] = MetadataAction(data["action"])
+        return cls(**data)
+
+
+@dataclass
+class NeighbourPayload(ControlPayload):
+    MESSAGE_TYPE: ClassVar[MessageType] = MessageType.UPDATE_NEIGHBOUR
+
+    side: NeighbourSide
+    node_id: NodeId
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'NeighbourPayload':
+        data = dict(data)
+        data["side"] = NeighbourSide(data["side"])
+        return cls(**data)
+
+
+@dataclass
+class HeartbeatPayload(ControlPayload):
+    MESSAGE_TYPE: ClassVar[MessageType] = MessageType.HEARTBEAT
+
+    role: HeartbeatRole
+    sent_at: float = 0.0
+    # echo of a peer's heartbeat; sent_at is the original sender's, for RTT
+    echo: bool = False
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'HeartbeatPayload':
+        data = dict(data)
+        data["role"] = HeartbeatRole(data["role"])
+        return cls(**data)
+
+
+@dataclass
+class FederationPayload(ControlPayload):
+    MESSAGE_TYPE: ClassVar[MessageType] = MessageType.ROOM_FEDERATION
+
+    action: FederationAction
+    room_id: str
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'FederationPayload':
+        data = dict(data)
+        data["action"] = FederationAction(data["action"])
+        return cls(**data)
+
+
+@dataclass
+class ThrottlePayload(ControlPayload):
+    """Server -> client notice that a CHAT hit a rate limit."""
+    MESSAGE_TYPE: ClassVar[MessageType] = MessageType.THROTTLED
+
+    action: ThrottleAction
+    scope: ThrottleScope
+    message_id: str
+    room_id: str = ""
+    # seconds until the limiting bucket has a token again
+    retry_after: float = 0.0
+    # sent by a room's owner through an edge: the edge's client it is for
+    client_id: Optional[NodeId] = None
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'ThrottlePayload':
+        data = dict(data)
+        data["action"] = ThrottleAction(data["action"])
+        data["scope"] = ThrottleScope(data["scope"])
+        return cls(**data)
+
+
+@dataclass
+class AdminPayload(ControlPayload):
+    """Operator command to a node, and the node's reply (same command, with result)."""
+    MESSAGE_TYPE: ClassVar[MessageType] = MessageType.ADMIN
+
+    command: AdminCommand
+    # PROFILE_START: sampling interval in seconds (0: profiler default)
+    interval: float = 0.0
+    result: Dict[str, Any] = field(default_factory=dict)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'AdminPayload':
+        data = dict(data)
+        data["command"] = AdminCommand(data["command"])
+        return cls(**data)
+
+
+@dataclass
+class DirectoryPayload(ControlPayload):
+    """
+    Room directory page. A request carries the query fields; the reply echoes
+    them with the page filled in. The reply's rooms/servers keys match the
+    AVAILABLE_ROOMS format, which is the same payload sent over UDP.
+    """
+    MESSAGE_TYPE: ClassVar[MessageType] = MessageType.ROOM_DIRECTORY
+
+    prefix: str = ""
+    offset: int = 0
+    limit: int = 0
+    order: str = "popular"
+    # room_id -> owner server_id, in the requested order
+    rooms: Dict[str, NodeId] = field(default_factory=dict)
+    # room_id -> members, for the rooms of this page
+    members: Dict[str, int] = field(default_factory=dict)
+    # server_id -> {"ip": ..., "port": ...} for the owners on this page
+    servers: Dict[NodeId, Dict[str, Any]] = field(default_factory=dict)
+    total: int = 0
+    # offset of the next page; None on the last one
+    next_offset: Optional[int] = None
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'DirectoryPayload':
+        fields = cls.__dataclass_fields__
+        return cls(**{key: value for key, value in data.items() if key in fields})
+
+
+@dataclass
+class SnapshotPayload(ControlPayload):
+    """One step of a room state transfer between servers, see server/snapshot.py."""
+    MESSAGE_TYPE: ClassVar[MessageType] = MessageType.SNAPSHOT
+
+    action: SnapshotAction
+    room_id: str
+    transfer_id: str = ""
+    # CHUNK: index of the chunk; ACK: next chunk expected (all below arrived);
+    # END: number of chunks
+    seq: int = 0
+    # CHUNK: base64 of the chunk's bytes
+    data: str = ""
+    # CHUNK: crc32 of the chunk; END: sha256 hex of the whole stream
+    checksum: str = ""
+    # END: stream length in bytes, and the room clock it ends at
+    size: int = 0
+    clock: Dict[NodeId, int] = field(default_factory=dict)
+    # REQUEST: most recent messages of history to include (0: the default bound)
+    history: int = 0
+    # ACK: the chunk at seq arrived damaged or out of order, resend from there
+    resend: bool = False
+    reason: str = ""
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'SnapshotPayload':
+        data = dict(data)
+        data["action"] = SnapshotAction(data["action"])
+        return cls(**data)
+
+
+@dataclass
+class AckPayload(ControlPayload):
+    """Cumulative acknowledgement for one room, see server/acks.py."""
+    MESSAGE_TYPE: ClassVar[MessageType] = MessageType.ACK
+
+    # STORED: server -> sender, the room holds everything up to clock;
+    # DELIVERED: member -> server, the member has delivered up to clock
+    kind: AckKind
+    room_id: str
+    clock: Dict[NodeId, int] = field(default_factory=dict)
+    # DELIVERED: member's wall time of the latest delivery the ack covers
+    delivered_at: float = 0.0
+    # STORED sent through an edge: the edge's client it is for
+    client_id: Optional[NodeId] = None
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'AckPayload':
+        data = dict(data)
+        data["kind"] = AckKind(data["kind"])
+        return cls(**data)
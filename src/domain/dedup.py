@@ -0,0 +1,69 @@
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Dict, Set
+if TYPE_CHECKING:
+    from .models import Message, NodeId
+
+# DUPLICATE SUPPRESSION
+# Remembers which CHATs a room has already accepted, so a client that retries
+# after a reconnect (or a frame that arrives twice) is neither delivered nor
+# fanned out again. A sender's messages are numbered by its own clock entry:
+# everything up to the room's delivered value for that sender is known, and a
+# window of the numbers above it (accepted, still held back) is kept per
+# sender. Messages without a number, or too far ahead of the window, are
+# matched by message_id in a bounded LRU instead.
+
+class DedupCache:
+    WINDOW = 1024
+    LRU_SIZE = 4096
+
+    def __init__(self, window: int = WINDOW, lru_size: int = LRU_SIZE):
+        self.window = window
+        self.lru_size = lru_size
+        # sender -> clock values accepted above what the room has delivered
+        self.pending: Dict['NodeId', Set[int]] = {}
+        self.ids: "OrderedDict[str, None]" = OrderedDict()
+        self.duplicates = 0
+
+    def seen(self, msg: 'Message', delivered: int) -> bool:
+        """
+        True if `msg` was accepted before; otherwise records it and returns
+        False. `delivered` is the room clock's entry for the sender.
+        """
+        seq = msg.vector_clock.timestamps.get(msg.sender_id, 0)
+        if seq <= 0 or seq > delivered + self.window:
+            return self._seen_id(msg.message_id)
+
+        if seq <= delivered:
+            self.duplicates += 1
+            return True
+        pending = self.pending.setdefault(msg.sender_id, set())
+        # the window slides with the room clock
+        for done in [s for s in pending if s <= delivered]:
+            pending.discard(done)
+        if seq in pending or msg.message_id in self.ids:
+            self.duplicates += 1
+            return True
+        pending.add(seq)
+        return False
+
+    def _seen_id(self, message_id: str) -> bool:
+        if message_id in self.ids:
+            self.ids.move_to_end(message_id)
+            self.duplicates += 1
+            return True
+        self.ids[message_id] = None
+        if len(self.ids) > self.lru_size:
+            self.ids.popitem(last=False)
+        return False
+
+    def forget(self, sender_id: 'NodeId'):
+        self.pending.pop(sender_id, None)
+
+    def __len__(self) -> int:
+        return sum(len(p) for p in self.pending.values()) + len(self.ids)
+
+    def copy(self) -> 'DedupCache':
+        other = DedupCache(self.window, self.lru_size)
+        other.pending = {sender: set(p) for sender, p in self.pending.items()}
+        other.ids = OrderedDict(self.ids)
+        return other
@@ -0,0 +1,73 @@
+from typing import Dict, Iterable, Iterator, Set, TYPE_CHECKING
+if TYPE_CHECKING:
+    from .models import NodeId
+
+# ROOM MEMBERSHIP
+# A room's members as an insertion-ordered set (dict keys), so join, leave and
+# membership checks are O(1) while fan-out still goes out in join order. The
+# node-wide MembershipIndex maps each client back to its rooms, so a client
+# that goes away is removed from exactly the rooms it was in instead of every
+# room being scanned.
+
+class MemberSet:
+    def __init__(self, members: Iterable['NodeId'] = ()):
+        self._members: Dict['NodeId', None] = dict.fromkeys(members)
+
+    def add(self, member: 'NodeId') -> bool:
+        """True if `member` was not in the set yet."""
+        if member in self._members:
+            return False
+        self._members[member] = None
+        return True
+
+    def discard(self, member: 'NodeId') -> bool:
+        """True if `member` was in the set."""
+        return self._members.pop(member, False) is None
+
+    def copy(self) -> 'MemberSet':
+        return MemberSet(self._members)
+
+    def __len__(self) -> int:
+        return len(self._members)
+
+    def __iter__(self) -> Iterator['NodeId']:
+        # a snapshot, so a join or leave on another connection's thread does
+        # not break a fan-out in progress
+        return iter(list(self._members))
+
+    def __contains__(self, member) -> bool:
+        return member in self._members
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (MemberSet, list)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"MemberSet({list(self._members)!r})"
+
+
+class MembershipIndex:
+    """client -> ids of the rooms it is a member of on this node, hosted or served as an edge."""
+    def __init__(self):
+        self._rooms: Dict['NodeId', Set[str]] = {}
+
+    def add(self, client_id: 'NodeId', room_id: str):
+        self._rooms.setdefault(client_id, set()).add(room_id)
+
+    def remove(self, client_id: 'NodeId', room_id: str):
+        rooms = self._rooms.get(client_id)
+        if rooms is None:
+            return
+        rooms.discard(room_id)
+        if not rooms:
+            del self._rooms[client_id]
+
+    def rooms_of(self, client_id: 'NodeId') -> Set[str]:
+        return set(self._rooms.get(client_id, ()))
+
+    def pop_client(self, client_id: 'NodeId') -> Set[str]:
+        return self._rooms.pop(client_id, set())
+
+    def __len__(self) -> int:
+        return len(self._rooms)
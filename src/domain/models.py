@@ -1,10 +1,14 @@
 from enum import Enum, auto
-from typing import Dict, List, Optional, TYPE_CHECKING
+from typing import Any, Dict, List, Optional, TYPE_CHECKING
 if TYPE_CHECKING:
     from src.server.server_node import ServerNode
 import uuid
 import json
+import threading
 from dataclasses import dataclass, field, asdict
+from .causal import HoldBackBuffer
+from .dedup import DedupCache
+from .membership import MemberSet
 class MessageType(Enum):
     CLIENT_JOIN = "CLIENT_JOIN"
     SERVER_JOIN = "SERVER_JOIN"
@@ -21,6 +25,14 @@ class MessageType(Enum):
     UPDATE_NEIGHBOUR = "UPDATE_NEIGHBOUR"
     AVAILABLE_ROOMS = "AVAILABLE_ROOMS"
     RING_STABILIZED = "RING_STABILIZED"
+    ROOM_FEDERATION = "ROOM_FEDERATION"
+    ROOM_DELIVER = "ROOM_DELIVER"
+    BATCH = "BATCH"
+    THROTTLED = "THROTTLED"
+    ADMIN = "ADMIN"
+    ROOM_DIRECTORY = "ROOM_DIRECTORY"
+    SNAPSHOT = "SNAPSHOT"
+    ACK = "ACK"
 
 
 NodeId = str
@@ -113,17 +125,22 @@ class Message:
     room_id: str = ""
     vector_clock: VectorClock = field(default_factory=VectorClock)
     sender_addr: Optional[tuple[str,int]] = None
+    # optional transport/routing metadata; only put on the wire when set
+    headers: Dict[str, Any] = field(default_factory=dict)
 
     def serialize(self) -> str:
         # Skeleton implementation
-        return json.dumps({
+        obj = {
             "type": self.type.value,
             "message_id": self.message_id,
             "content": self.content,
             "sender_id": self.sender_id,
             "room_id": self.room_id,
             "vector_clock": self.vector_clock.timestamps
-        }).encode("utf-8")
+        }
+        if self.headers:
+            obj["headers"] = self.headers
+        return json.dumps(obj).encode("utf-8")
 
     @staticmethod
     def deserialize(data: str) -> 'Message':
@@ -140,25 +157,51 @@ class Message:
             room_id=obj.get("room_id", ""),
             vector_clock=VectorClock(
                 timestamps=obj.get("vector_clock", {})
+            ),
+            headers=obj.get("headers", {}),
         )
-    )
 
 @dataclass
 class Room:
-    host: 'ServerNode'
-    room_id: str
-    client_ids: List[NodeId] = field(default_factory=list)
+    # None for a room used on its own, without a hosting node (tests, tools)
+    host: Optional['ServerNode'] = None
+    room_id: str = ""
+    client_ids: MemberSet = field(default_factory=MemberSet)
     message_history: List[Message] = field(default_factory=list)
     vector_clock: VectorClock = field(default_factory=VectorClock)
-    hold_back_queue: List[Message] = field(default_factory=list)
-
-    def add_client(self, client_id: NodeId):
-        if client_id not in self.client_ids:
-            self.client_ids.append(client_id)
-
-    def remove_client(self, client_id: NodeId):
-        if client_id in self.client_ids:
-            self.client_ids.remove(client_id)
+    hold_back_queue: HoldBackBuffer = field(default_factory=HoldBackBuffer)
+    # CHATs already accepted, so retransmissions are dropped before delivery
+    dedup: DedupCache = field(default_factory=DedupCache, repr=False, compare=False)
+    # servers with local members of this room; each gets one ROOM_DELIVER per message
+    edge_subscribers: List[NodeId] = field(default_factory=list)
+    # 0: send to every edge directly; k > 0: relay through a k-ary tree of edges
+    relay_fanout: int = 0
+    delivery_seq: int = 0
+    # opt-in batching: deliveries to local members are collected for up to
+    # batch_interval seconds or batch_size messages and sent as one BATCH
+    batch_interval: float = 0.0
+    batch_size: int = 0
+    pending_batch: List[Message] = field(default_factory=list)
+    batch_timer: Any = field(default=None, repr=False, compare=False)
+    # held while delivering, flushing a batch or sequencing edge deliveries:
+    # reader threads and timer threads both get here
+    lock: Any = field(default_factory=threading.RLock, repr=False, compare=False)
+
+    def __post_init__(self):
+        if not isinstance(self.client_ids, MemberSet):
+            self.client_ids = MemberSet(self.client_ids)
+
+    @property
+    def batching(self) -> bool:
+        return self.batch_interval > 0 or self.batch_size > 1
+
+    def add_client(self, client_id: NodeId) -> bool:
+        """True if the client was not a member yet."""
+        return self.client_ids.add(client_id)
+
+    def remove_client(self, client_id: NodeId) -> bool:
+        """True if the client was a member."""
+        return self.client_ids.discard(client_id)
 
     def add_message(self, msg: Message):
         self.message_history.append(msg)
@@ -171,5 +214,12 @@ class Room:
             client_ids=self.client_ids.copy(),
             message_history=self.message_history.copy(),
             vector_clock=self.vector_clock.copy(),
-            hold_back_queue=self.hold_back_queue.copy()
+            hold_back_queue=self.hold_back_queue.copy(),
+            dedup=self.dedup.copy(),
+            edge_subscribers=self.edge_subscribers.copy(),
+            relay_fanout=self.relay_fanout,
+            delivery_seq=self.delivery_seq,
+            batch_interval=self.batch_interval,
+            batch_size=self.batch_size,
+            pending_batch=self.pending_batch.copy()
         )
@@ -0,0 +1,47 @@
+import threading
+import timeit
+from typing import Callable
+
+from ..observability.log import get_logger
+
+# CLOCK
+# Time source and timer scheduling for server components. SystemClock is the
+# real one; src/sim swaps in a virtual-time clock so timers run inside the
+# simulator instead of on threads.
+
+log = get_logger("clock")
+
+class SystemClock:
+    def now(self) -> float:
+        return timeit.default_timer()
+
+    def call_later(self, delay: float, fn: Callable[[], None]):
+        """Runs fn on a daemon timer thread. The returned handle has cancel()."""
+        timer = threading.Timer(max(0.0, delay), fn)
+        timer.daemon = True
+        timer.start()
+        return timer
+
+    def call_every(self, interval: float, fn: Callable[[], None]) -> 'PeriodicTask':
+        """Runs fn every `interval` seconds on one daemon thread until cancel()."""
+        return PeriodicTask(interval, fn)
+
+
+class PeriodicTask:
+    def __init__(self, interval: float, fn: Callable[[], None]):
+        self.interval = interval
+        self.fn = fn
+        self._stopped = threading.Event()
+        threading.Thread(target=self._loop, daemon=True).start()
+
+    def _loop(self):
+        while not self._stopped.wait(self.interval):
+            # one failed run must not stop the task: heartbeats and failure
+            # detection run on it
+            try:
+                self.fn()
+            except Exception as exc:
+                log.error("periodic_task_failed", fn=getattr(self.fn, "__qualname__", self.fn), error=repr(exc))
+
+    def cancel(self):
+        self._stopped.set()
@@ -0,0 +1,73 @@
+import zlib
+
+from .constants import COMPRESS_LEVEL, COMPRESS_MIN_SIZE
+
+# FRAME COMPRESSION
+# Large frames (metadata syncs, directory pages, history batches, snapshot
+# chunks) are repetitive JSON and shrink several times under zlib; chat and
+# control frames are small and go out as they are. Compression is per
+# connection and per direction: each end keeps one zlib stream, primed with
+# FRAME_DICTIONARY and flushed after every frame, so a frame also reuses what
+# the frames before it on the same connection had in common with it.
+#
+# A compressed frame has COMPRESSED_FLAG set in its 4-byte length prefix;
+# frames are far below 2 GiB, so the bit is free and old frames stay valid.
+# An end only compresses once it knows the other end can read it: the
+# connecting side says so with COMPRESS_HEADER in its CLIENT_JOIN or
+# SERVER_JOIN, the accepting side by sending a compressed frame.
+
+COMPRESSED_FLAG = 0x80000000
+LENGTH_MASK = 0x7FFFFFFF
+# join header value: the codec this end can decode
+COMPRESS_HEADER = "compress"
+CODEC = "zlib"
+
+# strings every frame repeats; zlib favours matches near the end of the dictionary
+FRAME_DICTIONARY = "".join((
+    '\\"members\\":{', '\\"lease\\":', '\\"peers\\":{', '\\"ip\\":\\"', '\\"port\\":',
+    '\\"rooms\\":{', '\\"action\\":\\"SYNC_ROOMS\\"', '\\"room_id\\":\\"',
+    '"servers": {', '"rooms": {', '"total": ', '"next_offset": ', '"offset": ',
+    '\\"id\\":\\"', '\\"from\\":\\"', '\\"clock\\":{', '\\"content\\":\\"',
+    '{"type": "SNAPSHOT", ', '{"type": "METADATA_UPDATE", ', '{"type": "AVAILABLE_ROOMS", ',
+    '{"type": "ROOM_DELIVER", ', '{"type": "BATCH", ', '{"type": "CHAT", ',
+    '", "message_id": "', '", "content": "', '", "sender_id": "', '", "room_id": "',
+    '", "vector_clock": {', '}, "headers": {',
+)).encode("utf-8")
+
+
+class FrameCompressor:
+    def __init__(self, level: int = COMPRESS_LEVEL, min_size: int = COMPRESS_MIN_SIZE):
+        self.min_size = min_size
+        self._stream = zlib.compressobj(level, zdict=FRAME_DICTIONARY)
+        # stats
+        self.frames = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def compress(self, payload: bytes):
+        """Returns (bytes to send, compressed?). Small frames are left alone."""
+        if len(payload) < self.min_size:
+            return payload, False
+        data = self._stream.compress(payload) + self._stream.flush(zlib.Z_SYNC_FLUSH)
+        self.frames += 1
+        self.bytes_in += len(payload)
+        self.bytes_out += len(data)
+        return data, True
+
+
+class FrameDecompressor:
+    def __init__(self):
+        self._stream = zlib.decompressobj(zdict=FRAME_DICTIONARY)
+
+    def decompress(self, data: bytes) -> bytes:
+        return self._stream.decompress(data)
+
+
+def frame_header(length: int, compressed: bool) -> bytes:
+    return (length | COMPRESSED_FLAG if compressed else length).to_bytes(4, "big")
+
+
+def parse_header(header: bytes):
+    """Returns (length, compressed?) of a 4-byte length prefix."""
+    value = int.from_bytes(header, "big")
+    return value & LENGTH_MASK, bool(value & COMPRESSED_FLAG)
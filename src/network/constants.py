@@ -1,3 +1,80 @@
 DISCOVERY_PORT = 6000
 DISCOVERY_RETRIES = 3
-DISCOVERY_INTERVAL = 0.2
\ No newline at end of file
+DISCOVERY_INTERVAL = 0.2
+# multicast discovery backend: administratively scoped group, TTL 1 = one subnet
+MULTICAST_GROUP = "239.255.42.99"
+MULTICAST_TTL = 1
+# client discovery: handler threads per node, and how long a repeat of the
+# same client's request (same attempt, e.g. via two interfaces) is ignored
+DISCOVERY_WORKERS = 2
+DISCOVERY_DEDUP_WINDOW = 0.1
+DISCOVERY_DEDUP_MAX = 4096
+# file registry: how often a server refreshes its entry, and how old an entry
+# may get before it is taken for a server that died without unregistering
+REGISTRY_REFRESH = 10.0
+REGISTRY_TTL = 30.0
+
+# room directory listings: default page, largest page over TCP, and the byte
+# budget of a page sent as one UDP datagram (the page shrinks to fit)
+DIRECTORY_PAGE_SIZE = 50
+DIRECTORY_MAX_PAGE = 1000
+DIRECTORY_MAX_DATAGRAM = 8192
+# how long a follower collects member count changes before reporting them
+DIRECTORY_REPORT_INTERVAL = 1.0
+UDP_RECV_SIZE = 65535
+
+CONNECT_TIMEOUT = 2.0
+# peer links: reconnect backoff (seconds), outbound buffer while reconnecting
+PEER_BACKOFF_BASE = 0.05
+PEER_BACKOFF_MAX = 5.0
+PEER_MAX_ATTEMPTS = 20
+PEER_BUFFER_SIZE = 1024
+
+# room snapshots: chunk size, chunks in flight per transfer (the window bounds
+# how much snapshot data can sit ahead of a heartbeat on the peer link), the
+# default history bound, and the retry timeout and limit for a stalled transfer.
+# A receiver drops a transfer that got nothing for SNAPSHOT_STALL_TIMEOUT; the
+# sender has given up by then (SNAPSHOT_RETRY * (SNAPSHOT_MAX_RETRIES + 1))
+SNAPSHOT_CHUNK_SIZE = 64 * 1024
+SNAPSHOT_WINDOW = 8
+SNAPSHOT_HISTORY = 10000
+SNAPSHOT_RETRY = 2.0
+SNAPSHOT_MAX_RETRIES = 5
+SNAPSHOT_STALL_TIMEOUT = 15.0
+
+# room federation: how long an edge waits for a missing delivery from a room's
+# host before it resubscribes, and how many later deliveries it holds meanwhile
+FEDERATION_GAP_TIMEOUT = 1.0
+# CHAT header naming the edge that forwarded it; notices for the client go there
+EDGE_HEADER = "edge"
+FEDERATION_PENDING_MAX = 1024
+
+# delivery acks: how long acks are coalesced before one goes out per room, and
+# how many send timestamps a room keeps for its delivery-latency histogram
+ACK_INTERVAL = 0.05
+ACK_TRACKED = 4096
+# CLIENT_JOIN header asking for STORED acks; CHAT header with the send time;
+# CHAT header naming the edge that forwarded it for a client that asked for acks
+ACK_HEADER = "acks"
+SENT_AT_HEADER = "sent_at"
+ACK_VIA_HEADER = "ack_via"
+
+# frame compression, see compression.py: frames smaller than this are sent
+# as they are; zlib level for the rest (see benchmarks/compression.py)
+COMPRESS_MIN_SIZE = 1024
+COMPRESS_LEVEL = 6
+
+# ingress rate limits for client CHATs: token refill per second and bucket size
+CLIENT_RATE = 100.0
+CLIENT_BURST = 200
+ROOM_RATE = 2000.0
+ROOM_BURST = 4000
+NODE_RATE = 10000.0
+NODE_BURST = 20000
+# delay policy: CHATs queued per client before further ones are rejected
+THROTTLE_QUEUE_SIZE = 256
+# how often buckets that have refilled completely (idle) are dropped
+THROTTLE_SWEEP_INTERVAL = 60.0
+
+# metrics HTTP endpoint of a node listens on its TCP port + this offset
+METRICS_PORT_OFFSET = 1000
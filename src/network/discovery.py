@@ -0,0 +1,248 @@
+import json
+import os
+import socket
+import struct
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from ..domain.models import Message
+from .constants import DISCOVERY_PORT, MULTICAST_GROUP, MULTICAST_TTL, REGISTRY_TTL
+from .transport import UDPHandler
+
+# DISCOVERY BACKENDS
+# How servers find each other (SERVER_DISCOVERY) and clients find a server
+# (DISCOVERY_REQUEST). Picked with a spec string, e.g. from CHAT_DISCOVERY:
+#
+#   broadcast                      subnet broadcast on DISCOVERY_PORT (default)
+#   seeds:10.0.0.5,10.0.0.6:6001   unicast to a static seed list
+#   multicast:239.255.42.99:6000/2 IP multicast group, port and TTL
+#   file:/var/run/chat/peers.json  local registry file, no UDP between servers
+#
+# A client request under seeds/file goes to one server per attempt, marked
+# "direct" so that server answers itself instead of deferring to the ring's
+# designated responder.
+
+Addr = Tuple[str, int]
+
+
+class DiscoveryBackend:
+    port = DISCOVERY_PORT
+    # set when a request reaches a single server rather than all of them
+    direct = False
+
+    def listen(self, udp: UDPHandler, callback: Callable[[Message], None]):
+        udp.listen(self.port, callback)
+
+    def announce(self, udp: UDPHandler, msg: Message):
+        """Sends a server's SERVER_DISCOVERY to the other servers."""
+
+    def request(self, udp: UDPHandler, msg: Message, attempt: int):
+        """Sends a client's DISCOVERY_REQUEST for the given retry attempt."""
+
+    def register(self, server_id, ip: str, port: int):
+        """Records (or refreshes) a server's own TCP address where the backend keeps one."""
+
+    def unregister(self, server_id):
+        """Removes what register() recorded, on shutdown."""
+
+    def peers(self) -> Dict[str, Dict]:
+        """server_id -> {"ip", "port"} known without any UDP; empty for most backends."""
+        return {}
+
+    def probe_host(self) -> str:
+        """An address whose route picks the interface servers are reached on."""
+        return "255.255.255.255"
+
+
+class BroadcastDiscovery(DiscoveryBackend):
+    def __init__(self, port: int = DISCOVERY_PORT):
+        self.port = port
+
+    def announce(self, udp: UDPHandler, msg: Message):
+        udp.broadcast(msg, self.port)
+
+    def request(self, udp: UDPHandler, msg: Message, attempt: int):
+        udp.broadcast(msg, self.port)
+
+
+class SeedDiscovery(DiscoveryBackend):
+    direct = True
+
+    def __init__(self, seeds: List[Addr], port: int = DISCOVERY_PORT):
+        self.seeds = seeds
+        self.port = port
+
+    def announce(self, udp: UDPHandler, msg: Message):
+        # a seed that hears us connects back; the leader's sync then fills in the rest
+        for addr in self.seeds:
+            udp.send_to(msg, addr)
+
+    def request(self, udp: UDPHandler, msg: Message, attempt: int):
+        if self.seeds:
+            udp.send_to(msg, self.seeds[attempt % len(self.seeds)])
+
+    def probe_host(self) -> str:
+        return self.seeds[0][0] if self.seeds else super().probe_host()
+
+
+class MulticastDiscovery(DiscoveryBackend):
+    def __init__(self, group: str = MULTICAST_GROUP, port: int = DISCOVERY_PORT, ttl: int = MULTICAST_TTL):
+        self.group = group
+        self.port = port
+        self.ttl = ttl
+
+    def listen(self, udp: UDPHandler, callback: Callable[[Message], None]):
+        udp.listen(self.port, callback)
+        membership = struct.pack("4s4s", socket.inet_aton(self.group), socket.inet_aton("0.0.0.0"))
+        udp.socket.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+
+    def _send(self, udp: UDPHandler, msg: Message):
+        udp.socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, self.ttl)
+        udp.send_to(msg, (self.group, self.port))
+
+    def announce(self, udp: UDPHandler, msg: Message):
+        self._send(udp, msg)
+
+    def request(self, udp: UDPHandler, msg: Message, attempt: int):
+        self._send(udp, msg)
+
+    def probe_host(self) -> str:
+        return self.group
+
+
+def _lock_file(f, locked: bool):
+    """Exclusive lock on an open file, across processes: flock on POSIX, msvcrt on Windows."""
+    try:
+        import fcntl
+    except ImportError:
+        import msvcrt
+        # msvcrt locks a byte range from the current position; byte 0 stands for the file
+        f.seek(0)
+        if not locked:
+            msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            return
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                # LK_LOCK gives up after ten seconds of retries
+                continue
+    fcntl.flock(f, fcntl.LOCK_EX if locked else fcntl.LOCK_UN)
+
+
+class FileRegistryDiscovery(DiscoveryBackend):
+    """
+    Servers on one host (or a shared filesystem) list themselves in a JSON
+    file. Each entry carries the wall-clock time of its last register(); a
+    server re-registers every REGISTRY_REFRESH seconds and unregisters on
+    shutdown, and entries older than `ttl` (a server that was killed) are
+    ignored and dropped on the next register().
+    """
+    direct = True
+
+    def __init__(self, path: str, port: int = DISCOVERY_PORT, ttl: float = REGISTRY_TTL):
+        self.path = path
+        self.port = port
+        self.ttl = ttl
+
+    def _live(self, entries: Dict) -> Dict:
+        oldest = time.time() - self.ttl
+        # entries written before timestamps were kept have none; they count as live
+        return {key: entry for key, entry in entries.items() if entry.get("seen", oldest) >= oldest}
+
+    def _update(self, fn: Callable[[Dict], None]) -> Dict:
+        with open(self.path, "a+") as f:
+            _lock_file(f, True)
+            try:
+                f.seek(0)
+                raw = f.read()
+                entries = json.loads(raw) if raw.strip() else {}
+                if fn is not None:
+                    fn(entries)
+                    f.seek(0)
+                    f.truncate()
+                    json.dump(entries, f)
+                return entries
+            finally:
+                _lock_file(f, False)
+
+    def register(self, server_id, ip: str, port: int):
+        entry = {"id": server_id, "ip": ip, "port": port, "discovery_port": self.port, "seen": time.time()}
+
+        def update(entries):
+            live = self._live(entries)
+            entries.clear()
+            entries.update(live)
+            entries[str(server_id)] = entry
+        self._update(update)
+
+    def unregister(self, server_id):
+        self._update(lambda entries: entries.pop(str(server_id), None))
+
+    def peers(self) -> Dict[str, Dict]:
+        if not os.path.exists(self.path):
+            return {}
+        # JSON keys are strings; "id" keeps the server's own id type
+        return {
+            entry.get("id", key): {"ip": entry["ip"], "port": entry["port"]}
+            for key, entry in self._live(self._update(None)).items()
+        }
+
+    def request(self, udp: UDPHandler, msg: Message, attempt: int):
+        if not os.path.exists(self.path):
+            return
+        entries = list(self._live(self._update(None)).values())
+        if entries:
+            entry = entries[attempt % len(entries)]
+            udp.send_to(msg, (entry["ip"], entry.get("discovery_port", self.port)))
+
+    def probe_host(self) -> str:
+        return "127.0.0.1"
+
+
+def discovery_from_spec(spec: Optional[str]) -> DiscoveryBackend:
+    spec = (spec or "broadcast").strip()
+    kind, _, arg = spec.partition(":")
+    if kind == "broadcast":
+        return BroadcastDiscovery(int(arg) if arg else DISCOVERY_PORT)
+    if kind == "seeds":
+        seeds = []
+        for item in filter(None, arg.split(",")):
+            host, _, port = item.partition(":")
+            seeds.append((host, int(port) if port else DISCOVERY_PORT))
+        return SeedDiscovery(seeds)
+    if kind == "multicast":
+        arg, _, ttl = arg.partition("/")
+        group, _, port = arg.partition(":")
+        return MulticastDiscovery(group or MULTICAST_GROUP, int(port) if port else DISCOVERY_PORT, int(ttl) if ttl else MULTICAST_TTL)
+    if kind == "file":
+        return FileRegistryDiscovery(arg)
+    raise ValueError(f"unknown discovery backend: {spec}")
+
+
+def local_ip(probe_host: str, override: Optional[str] = None) -> str:
+    """
+    The address to advertise: CHAT_ADVERTISE_IP if set, else the source address
+    the kernel would use towards `probe_host`. Connecting a UDP socket only
+    looks up a route, nothing is sent; with no route we fall back to the
+    hostname's address and then loopback, so startup never waits on the network.
+    """
+    override = override or os.environ.get("CHAT_ADVERTISE_IP")
+    if override:
+        return override
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        s.connect((probe_host, 9))
+        ip = s.getsockname()[0]
+        if ip != "0.0.0.0":
+            return ip
+    except OSError:
+        pass
+    finally:
+        s.close()
+    try:
+        return socket.gethostbyname(socket.gethostname())
+    except OSError:
+        return "127.0.0.1"
@@ -0,0 +1,33 @@
+from ..domain.models import MessageType
+
+# PEER LANES
+# Traffic between two servers is split over two TCP connections. The control
+# lane is the link's first connection and carries heartbeats, elections and
+# ring changes. The data lane is opened right after it and carries room
+# traffic, metadata syncs and snapshots. Each lane has its own socket, send
+# lock and reader thread. A long write or a slow handler on the data lane then
+# never holds up a heartbeat, which would otherwise look like a failed peer
+# and start an election. Frames keep their order within a lane, not across
+# lanes. A peer link holds data frames back while its data lane is down
+# rather than send them on the control lane (see peer_links.py). A server
+# with no link of its own to the peer, which only accepted its connections,
+# answers on the control lane until the data lane has arrived.
+
+CONTROL = "control"
+DATA = "data"
+# SERVER_JOIN header that marks a connection as a peer's data lane
+LANE_HEADER = "lane"
+
+DATA_TYPES = frozenset({
+    MessageType.CHAT,
+    MessageType.BATCH,
+    MessageType.SYNC,
+    MessageType.ROOM_FEDERATION,
+    MessageType.ROOM_DELIVER,
+    MessageType.METADATA_UPDATE,
+    MessageType.SNAPSHOT,
+})
+
+
+def lane_of(msg_type: MessageType) -> str:
+    return DATA if msg_type in DATA_TYPES else CONTROL
@@ -0,0 +1,272 @@
+import random
+import threading
+from collections import deque
+from typing import Deque, Dict, Optional
+
+from ..domain.models import Message, MessageType
+from .compression import CODEC, COMPRESS_HEADER
+from .lanes import DATA, LANE_HEADER, lane_of
+from .constants import (
+    PEER_BACKOFF_BASE,
+    PEER_BACKOFF_MAX,
+    PEER_BUFFER_SIZE,
+    PEER_MAX_ATTEMPTS,
+)
+
+# PEER LINKS
+# A PeerLink is the managed, long-lived link to one peer server. The TCP
+# connection behind it is opened lazily on first use and re-opened in the
+# background with exponential backoff. While no connection is up, outgoing
+# frames wait in a bounded buffer and are flushed in order once it is back.
+# Data frames go over a second connection, the data lane (see lanes.py), and
+# only there: while it is down they wait in a buffer of their own, so a data
+# frame never overtakes an earlier one by taking the other lane.
+
+class PeerLink:
+    RTT_SMOOTHING = 0.2
+
+    def __init__(self, manager, node_id: str, ip: str, port: int, buffer_size: int = PEER_BUFFER_SIZE):
+        self.manager = manager
+        self.node_id = node_id
+        self.ip = ip
+        self.port = port
+        self.buffer: Deque[Message] = deque()
+        self.data_buffer: Deque[Message] = deque()
+        self.buffer_size = buffer_size
+        self.connecting = False
+        self.data_opening = False
+        self.closed = False
+        self.attempts = 0
+        self.data_attempts = 0
+        self._lock = threading.RLock()
+
+        # stats
+        self.connects = 0
+        self.failures = 0
+        self.frames_sent = 0
+        self.frames_buffered = 0
+        self.frames_dropped = 0
+        self.data_frames_sent = 0
+        self.rtt_last: Optional[float] = None
+        self.rtt_avg: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    @property
+    def conn(self):
+        return self.manager.active_connections_peer_to_peer.get(self.node_id)
+
+    def healthy(self) -> bool:
+        return self.conn is not None and not self.connecting and self.attempts == 0
+
+    # ---------- sending ----------
+
+    @property
+    def data_conn(self):
+        return self.manager.data_connections.get(self.node_id)
+
+    def send(self, msg: Message) -> bool:
+        with self._lock:
+            if lane_of(msg.type) == DATA:
+                # behind frames already waiting, never ahead of them
+                if not self.data_buffer and self._send_data(msg):
+                    return True
+                self._buffer(self.data_buffer, msg)
+                self._open_data_lane()
+            else:
+                conn = self.conn
+                if conn is not None and not self.connecting:
+                    # implementations that return None are treated as sent
+                    if conn.send(msg) is not False:
+                        self.frames_sent += 1
+                        return True
+                    self._connection_lost(conn, "send failed")
+                self._buffer(self.buffer, msg)
+        self.connect()
+        return False
+
+    def _send_data(self, msg: Message) -> bool:
+        data = self.data_conn
+        if data is None:
+            return False
+        if data.send(msg) is not False:
+            self.frames_sent += 1
+            self.data_frames_sent += 1
+            return True
+        self.manager.drop_data_connection(self.node_id, data)
+        return False
+
+    def _open_data_lane(self):
+        """Opens the data lane in the background; data frames wait for it meanwhile."""
+        if self.data_opening or self.closed or self.conn is None or self.data_conn is not None:
+            return
+        self.data_opening = True
+        self.manager.clock.call_later(0, self._attempt_data_lane)
+
+    def _attempt_data_lane(self):
+        with self._lock:
+            if self.closed or self.data_conn is not None or self.conn is None:
+                # a control lane that comes back opens it again
+                self.data_opening = False
+                return
+        try:
+            conn = self.manager.connect_to(self.ip, self.port)
+            conn.send(Message(
+                type=MessageType.SERVER_JOIN,
+                sender_id=self.manager.node_id,
+                headers={LANE_HEADER: DATA, COMPRESS_HEADER: CODEC},
+            ))
+        except Exception as e:
+            with self._lock:
+                self.data_attempts += 1
+                self.last_error = f"data lane: {e}"
+                if self.data_attempts >= PEER_MAX_ATTEMPTS:
+                    # give up for now; the next data frame starts a fresh round
+                    self.data_attempts = 0
+                    self.data_opening = False
+                    return
+                delay = min(PEER_BACKOFF_MAX, PEER_BACKOFF_BASE * 2 ** (self.data_attempts - 1))
+            self.manager.clock.call_later(delay * random.uniform(0.8, 1.2), self._attempt_data_lane)
+            return
+
+        with self._lock:
+            self.data_attempts = 0
+            self.manager.data_connections[self.node_id] = conn
+            self.manager.listen_to_connection(
+                conn,
+                self.manager.on_peer_message,
+                on_close=lambda: self.manager.drop_data_connection(self.node_id, conn),
+            )
+            self.data_opening = False
+            self._flush_data()
+
+    def _buffer(self, buffer: Deque[Message], msg: Message):
+        if len(buffer) >= self.buffer_size:
+            buffer.popleft()
+            self.frames_dropped += 1
+        buffer.append(msg)
+        self.frames_buffered += 1
+
+    def _flush(self):
+        with self._lock:
+            conn = self.conn
+            while self.buffer and conn is not None:
+                msg = self.buffer[0]
+                if conn.send(msg) is False:
+                    self._connection_lost(conn, "send failed during flush")
+                    break
+                self.buffer.popleft()
+                self.frames_sent += 1
+
+    def _flush_data(self):
+        with self._lock:
+            while self.data_buffer:
+                if not self._send_data(self.data_buffer[0]):
+                    self._open_data_lane()
+                    break
+                self.data_buffer.popleft()
+
+    # ---------- connection management ----------
+
+    def connect(self):
+        """Starts a background (re)connect unless one is already running."""
+        with self._lock:
+            if self.closed or self.connecting:
+                return
+            if self.conn is not None and not self.buffer:
+                return
+            self.connecting = True
+            self.attempts = 0
+        self.manager.clock.call_later(0, self._attempt)
+
+    def _attempt(self):
+        if self.closed:
+            return
+        reconnect = self.connects > 0 or self.conn is not None
+        try:
+            conn = self.manager.connect_to(self.ip, self.port)
+        except Exception as e:
+            with self._lock:
+                self.failures += 1
+                self.attempts += 1
+                self.last_error = str(e)
+                if self.attempts >= PEER_MAX_ATTEMPTS:
+                    # give up for now; the next send starts a fresh round
+                    self.connecting = False
+                    return
+                delay = min(PEER_BACKOFF_MAX, PEER_BACKOFF_BASE * 2 ** (self.attempts - 1))
+            self.manager.clock.call_later(delay * random.uniform(0.8, 1.2), self._attempt)
+            return
+
+        with self._lock:
+            self.connects += 1
+            self.attempts = 0
+            self.manager.active_connections_peer_to_peer[self.node_id] = conn
+            self.manager.listen_to_connection(
+                conn,
+                self.manager.on_peer_message,
+                on_close=lambda: self.connection_lost(conn),
+            )
+            # the owner sends its handshake before anything buffered goes out
+            if self.manager.on_peer_connected is not None:
+                self.manager.on_peer_connected(self.node_id, conn, reconnect)
+            self.connecting = False
+            self._open_data_lane()
+            self._flush()
+
+    def connection_lost(self, conn, reason: str = "connection closed"):
+        with self._lock:
+            if self.closed or conn is not self.conn:
+                return
+            self._connection_lost(conn, reason)
+
+    def _connection_lost(self, conn, reason: str):
+        """Forgets a dead connection and its data lane, and starts the backoff reconnect."""
+        self.last_error = reason
+        self.failures += 1
+        peers = self.manager.active_connections_peer_to_peer
+        if peers.get(self.node_id) is conn:
+            del peers[self.node_id]
+        for dead in (conn, self.data_conn):
+            if dead is None:
+                continue
+            if dead is not conn:
+                self.manager.drop_data_connection(self.node_id, dead)
+            try:
+                dead.close()
+            except Exception:
+                pass
+        self.connect()
+
+    def close(self):
+        with self._lock:
+            self.closed = True
+            self.buffer.clear()
+            self.data_buffer.clear()
+
+    # ---------- stats ----------
+
+    def record_rtt(self, rtt: float):
+        self.rtt_last = rtt
+        if self.rtt_avg is None:
+            self.rtt_avg = rtt
+        else:
+            self.rtt_avg += self.RTT_SMOOTHING * (rtt - self.rtt_avg)
+
+    def stats(self) -> Dict:
+        return {
+            "ip": self.ip,
+            "port": self.port,
+            "connected": self.conn is not None and not self.connecting,
+            "healthy": self.healthy(),
+            "connects": self.connects,
+            "failures": self.failures,
+            "frames_sent": self.frames_sent,
+            "frames_buffered": self.frames_buffered,
+            "frames_dropped": self.frames_dropped,
+            "data_lane": self.data_conn is not None,
+            "data_frames_sent": self.data_frames_sent,
+            "buffered": len(self.buffer) + len(self.data_buffer),
+            "rtt_last": self.rtt_last,
+            "rtt_avg": self.rtt_avg,
+            "last_error": self.last_error,
+        }
@@ -1,9 +1,20 @@
 import socket
 import threading
 import json
+import timeit
 from typing import Callable, Dict, Optional
 
-from ..domain.models import Message
+from ..domain.models import Message, MessageType
+from .clock import SystemClock
+from .constants import CONNECT_TIMEOUT, UDP_RECV_SIZE
+from .compression import FrameCompressor, FrameDecompressor, frame_header, parse_header
+from .lanes import DATA, lane_of
+from .peer_links import PeerLink
+from ..observability.log import get_logger
+from ..observability.metrics import NULL, MetricsRegistry
+from ..observability.profiler import HandlerTimer
+
+log = get_logger("transport")
 
 # UDP TRANSPORT
 class UDPHandler:
@@ -24,7 +35,7 @@ class UDPHandler:
 
         def loop():
             while True:
-                data, addr = self.socket.recvfrom(4096)
+                data, addr = self.socket.recvfrom(UDP_RECV_SIZE)
                 msg = Message.deserialize(data)
                 msg.sender_addr = addr
                 callback(msg)
@@ -35,20 +46,60 @@ class UDPHandler:
         data = msg.serialize()
         self.socket.sendto(data, addr)
 
+    def send_bytes(self, data: bytes, addr):
+        """Sends an already serialized message, e.g. a cached response."""
+        self.socket.sendto(data, addr)
+
 # TCP CONNECTION
+def _no_delay(sock: socket.socket):
+    # frames are written whole; Nagle would only hold small ones (heartbeats) back
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    except OSError:
+        pass
+
 class TCPConnection:
-    def __init__(self, sock: socket.socket, ip = '127.0.0.1', port = 5001):
+    def __init__(self, sock: socket.socket, ip = '127.0.0.1', port = 5001, metrics: MetricsRegistry = NULL):
         self.socket = sock
         self.ip = ip
         self.port = port
+        # several connection threads may multicast to the same socket
+        self._send_lock = threading.Lock()
+        # set once the other end is known to read compressed frames
+        self.compressor: Optional[FrameCompressor] = None
+        self._decompressor: Optional[FrameDecompressor] = None
+        self.use_metrics(metrics)
+
+    def use_metrics(self, metrics: MetricsRegistry):
+        self.frames_out = metrics.counter("frames_out")
+        self.bytes_out = metrics.counter("bytes_out")
+        self.frames_in = metrics.counter("frames_in_total")
+        self.bytes_in = metrics.counter("bytes_in")
+        self.frames_compressed = metrics.counter("frames_compressed")
+        self.bytes_saved = metrics.counter("compression_bytes_saved")
+        self.serialize_time = metrics.histogram("serialize_seconds")
+        self.deserialize_time = metrics.histogram("deserialize_seconds")
 
-    def send(self, msg: Message):
+    def send(self, msg: Message) -> bool:
         try:
+            start = timeit.default_timer()
             payload = msg.serialize()
-            length = len(payload).to_bytes(4, "big")
-            self.socket.sendall(length + payload)
+            self.serialize_time.observe(timeit.default_timer() - start)
+            with self._send_lock:
+                # inside the lock: compressed frames must leave in stream order
+                data, compressed = payload, False
+                if self.compressor is not None:
+                    data, compressed = self.compressor.compress(payload)
+                self.socket.sendall(frame_header(len(data), compressed) + data)
+            self.frames_out.inc()
+            self.bytes_out.inc(len(data) + 4)
+            if compressed:
+                self.frames_compressed.inc()
+                self.bytes_saved.inc(len(payload) - len(data))
+            return True
         except Exception as e:
-            print("[TCPConnection] send failed:", e)
+            log.warning("send_failed", peer=self.stringify(), error=e)
+            return False
 
     def receive(self) -> Optional[Message]:
         try:
@@ -56,15 +107,30 @@ class TCPConnection:
             if not length_bytes:
                 return None
 
-            length = int.from_bytes(length_bytes, "big")
+            length, compressed = parse_header(length_bytes)
             payload = self._recv_exact(length)
             if payload is None:
                 return None
+            if compressed:
+                if self._decompressor is None:
+                    self._decompressor = FrameDecompressor()
+                    # the other end compresses, so it decompresses as well
+                    self.enable_compression()
+                payload = self._decompressor.decompress(payload)
 
-            return Message.deserialize(payload)
+            start = timeit.default_timer()
+            msg = Message.deserialize(payload)
+            self.deserialize_time.observe(timeit.default_timer() - start)
+            self.frames_in.inc()
+            self.bytes_in.inc(length + 4)
+            return msg
         except Exception:
             return None
 
+    def enable_compression(self):
+        if self.compressor is None:
+            self.compressor = FrameCompressor()
+
     def _recv_exact(self, size: int) -> Optional[bytes]:
         data = b""
         while len(data) < size:
@@ -85,6 +151,23 @@ class ConnectionManager:
     def __init__(self):
         self.active_connections_peer_to_peer: Dict[str, TCPConnection] = {}
         self.active_connections_server_to_client: Dict[str, TCPConnection] = {}
+        # managed links to peers whose address we know, see peer_links.py
+        self.peer_links: Dict[str, PeerLink] = {}
+        # second connection per peer for bulk frames, see lanes.py
+        self.data_connections: Dict[str, TCPConnection] = {}
+        # set by the owner; sent in the SERVER_JOIN that opens a data lane
+        self.node_id = None
+        self.clock = SystemClock()
+        self.undeliverable = 0
+        self.metrics: MetricsRegistry = NULL
+        # HandlerTimer of the owner; when enabled the read loops time their
+        # receive (wait + read + deserialize) and dispatch steps
+        self.timer: Optional[HandlerTimer] = None
+
+        # set by the owner: frames arriving on peer links, and a hook that runs
+        # when a link (re)connects so the owner can send its handshake first
+        self.on_peer_message: Optional[Callable[[Message], None]] = None
+        self.on_peer_connected: Optional[Callable[[str, TCPConnection, bool], None]] = None
 
     # stringify to transmit the object to other peers
     def stringify(self):
@@ -93,15 +176,69 @@ class ConnectionManager:
             modified[i] = self.active_connections_peer_to_peer[i].stringify()
         return json.dumps(modified)
 
+    def peer_addresses(self) -> Dict[str, Dict]:
+        return {
+            node_id: {"ip": conn.ip, "port": conn.port}
+            for node_id, conn in self.active_connections_peer_to_peer.items()
+        }
+
     # ---------- connection helpers ----------
 
     def wrap_socket(self, sock: socket.socket, ip = '127.0.0.1', port = 5001) -> TCPConnection:
-        return TCPConnection(sock,ip,port)
+        _no_delay(sock)
+        return TCPConnection(sock, ip, port, self.metrics)
     
-    def connect_to(self, ip: str, port: int) -> TCPConnection:
+    def connect_to(self, ip: str, port: int, timeout: float = CONNECT_TIMEOUT) -> TCPConnection:
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.connect((ip, port))
-        return TCPConnection(sock,ip,port)
+        sock.settimeout(timeout)
+        try:
+            sock.connect((ip, port))
+        except Exception:
+            sock.close()
+            raise
+        sock.settimeout(None)
+        _no_delay(sock)
+        return TCPConnection(sock, ip, port, self.metrics)
+
+    # ---------- peer links ----------
+
+    def register_peer(self, node_id: str, ip: str, port: int) -> PeerLink:
+        """Remembers a peer's address. Nothing is opened until the link is used."""
+        link = self.peer_links.get(node_id)
+        if link is None or (link.ip, link.port) != (ip, int(port)):
+            if link is not None:
+                link.close()
+            link = PeerLink(self, node_id, ip, int(port))
+            self.peer_links[node_id] = link
+        return link
+
+    def forget_peer(self, node_id: str):
+        link = self.peer_links.pop(node_id, None)
+        if link is not None:
+            link.close()
+        data = self.data_connections.pop(node_id, None)
+        if data is not None:
+            data.close()
+
+    def drop_data_connection(self, node_id: str, conn: TCPConnection):
+        if self.data_connections.get(node_id) is conn:
+            del self.data_connections[node_id]
+
+    def connection_for(self, node_id: str, msg_type: MessageType) -> Optional[TCPConnection]:
+        """The connection a frame of `msg_type` goes out on to a peer: the data lane for data frames, if one is up."""
+        if lane_of(msg_type) == DATA:
+            conn = self.data_connections.get(node_id)
+            if conn is not None:
+                return conn
+        return self.active_connections_peer_to_peer.get(node_id)
+
+    def record_rtt(self, node_id: str, rtt: float):
+        link = self.peer_links.get(node_id)
+        if link is not None:
+            link.record_rtt(rtt)
+
+    def link_stats(self) -> Dict[str, Dict]:
+        return {node_id: link.stats() for node_id, link in list(self.peer_links.items())}
 
     # ---------- async receive ----------
 
@@ -109,31 +246,47 @@ class ConnectionManager:
         self,
         conn: TCPConnection,
         callback: Callable[[Message], None],
+        on_close: Optional[Callable[[], None]] = None,
     ):
         def loop():
             try:
                 while True:
+                    timer = self.timer
+                    if timer is not None and timer.enabled:
+                        msg = timer.run("read_loop", "receive", conn.receive)
+                        if msg is None:
+                            break
+                        timer.run("read_loop", "dispatch", callback, msg)
+                        continue
                     msg = conn.receive()
                     if msg is None:
                         break
                     callback(msg)
             except Exception as e:
-                print("[ConnectionManager] connection error:", e)
+                log.warning("connection_error", peer=conn.stringify(), error=e)
             finally:
                 try:
                     conn.close()
                 except:
                     pass
+                if on_close is not None:
+                    on_close()
 
         threading.Thread(target=loop, daemon=True).start()
 
     # ---------- messaging ----------
 
     def send_to_node(self, node_id: str, msg: Message):
-        conn = self.active_connections_peer_to_peer.get(node_id)
+        link = self.peer_links.get(node_id)
+        if link is not None:
+            link.send(msg)
+            return
+        conn = self.connection_for(node_id, msg.type)
         if conn:
             conn.send(msg)
+        else:
+            self.undeliverable += 1
 
     def broadcast_to_all(self, msg: Message):
-        for conn in self.active_connections_peer_to_peer.values():
-            conn.send(msg)
+        for node_id in set(self.active_connections_peer_to_peer) | set(self.peer_links):
+            self.send_to_node(node_id, msg)
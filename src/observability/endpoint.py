@@ -0,0 +1,76 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional
+
+from .metrics import MetricsRegistry
+
+# STATS ENDPOINT
+# Local HTTP endpoint for a node's metrics:
+#   GET /metrics       Prometheus text format
+#   GET /metrics.json  registry snapshot plus the extra sections, as JSON
+#   GET <page>         any extra plain-text page, e.g. /profile
+# Binds to 127.0.0.1 by default; it is meant for operators on the host.
+
+class MetricsEndpoint:
+    def __init__(
+        self,
+        registry: MetricsRegistry,
+        port: int,
+        host: str = "127.0.0.1",
+        extra: Optional[Dict[str, Callable[[], Dict]]] = None,
+        pages: Optional[Dict[str, Callable[[], str]]] = None,
+    ):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        # section name -> callable, e.g. {"links": cm.link_stats}
+        self.extra = extra or {}
+        # path -> callable returning text, e.g. {"/profile": profiler.collapsed}
+        self.pages = pages or {}
+        self.server: Optional[ThreadingHTTPServer] = None
+
+    def start(self) -> 'MetricsEndpoint':
+        endpoint = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body = endpoint.registry.prometheus().encode()
+                    content_type = "text/plain; version=0.0.4"
+                elif self.path == "/metrics.json":
+                    body = json.dumps(endpoint.snapshot(), default=str).encode()
+                    content_type = "application/json"
+                elif self.path in endpoint.pages:
+                    body = endpoint.pages[self.path]().encode()
+                    content_type = "text/plain"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                return
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def snapshot(self) -> Dict:
+        data = self.registry.snapshot()
+        for name, fn in self.extra.items():
+            try:
+                data[name] = fn()
+            except Exception as e:
+                data[name] = {"error": str(e)}
+        return data
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
@@ -0,0 +1,80 @@
+import logging
+import sys
+import threading
+import timeit
+from typing import Dict, Optional, Tuple
+
+# LOGGING
+# Leveled, rate-limited, key=value logging on top of the standard logging
+# module. Disabled levels cost one isEnabledFor() check, so debug calls can
+# stay on the per-message path. Every event name gets a token bucket; records
+# over the budget are dropped and counted, and the next record of that event
+# that gets through carries suppressed=<n>.
+
+ROOT = "chat"
+
+
+class StructuredLogger:
+    RATE = 10.0   # records per second per event
+    BURST = 20
+
+    def __init__(self, name: str, rate: float = RATE, burst: float = BURST, **context):
+        self.logger = logging.getLogger(f"{ROOT}.{name}")
+        self.rate = rate
+        self.burst = burst
+        self.context = context
+        # event -> (tokens, last refill, suppressed since last emit)
+        self._budget: Dict[str, Tuple[float, float, int]] = {}
+        self._lock = threading.Lock()
+
+    def bind(self, **context) -> 'StructuredLogger':
+        """Same logger with extra fields on every record, e.g. node=<id>."""
+        return StructuredLogger(self.logger.name[len(ROOT) + 1:], self.rate, self.burst, **{**self.context, **context})
+
+    def debug(self, event: str, **fields):
+        self._log(logging.DEBUG, event, fields)
+
+    def info(self, event: str, **fields):
+        self._log(logging.INFO, event, fields)
+
+    def warning(self, event: str, **fields):
+        self._log(logging.WARNING, event, fields)
+
+    def error(self, event: str, **fields):
+        self._log(logging.ERROR, event, fields)
+
+    def _admit(self, event: str) -> Optional[int]:
+        now = timeit.default_timer()
+        with self._lock:
+            tokens, last, suppressed = self._budget.get(event, (self.burst, now, 0))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens < 1:
+                self._budget[event] = (tokens, now, suppressed + 1)
+                return None
+            self._budget[event] = (tokens - 1, now, 0)
+            return suppressed
+
+    def _log(self, level: int, event: str, fields: Dict):
+        if not self.logger.isEnabledFor(level):
+            return
+        suppressed = self._admit(event)
+        if suppressed is None:
+            return
+        if suppressed:
+            fields = {**fields, "suppressed": suppressed}
+        parts = [event] + [f"{k}={v}" for k, v in {**self.context, **fields}.items()]
+        self.logger.log(level, " ".join(parts))
+
+
+def get_logger(name: str, **context) -> StructuredLogger:
+    return StructuredLogger(name, **context)
+
+
+def configure_logging(level: str = "INFO", stream=None):
+    """Sets up the chat.* loggers for a server process (no-op for libraries/tests)."""
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+    root = logging.getLogger(ROOT)
+    root.handlers[:] = [handler]
+    root.setLevel(level.upper())
+    root.propagate = False
@@ -0,0 +1,225 @@
+import math
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+# METRICS
+# Small in-process metrics registry: counters, gauges and log-linear ("HDR
+# style") histograms. Recording is a dict lookup plus an addition under the
+# metric's own lock, cheap enough for the per-frame path; reader threads,
+# timers and the HTTP endpoint all record and read concurrently, and readers
+# copy a metric under its lock before they look at it. Every ServerNode owns
+# a registry; transport objects get a reference to it. The NULL registry is the default everywhere,
+# so code that records metrics works without one.
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, object]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+
+class Gauge:
+    def __init__(self, fn: Optional[Callable[[], float]] = None):
+        self.value = 0.0
+        self.fn = fn
+
+    def set(self, value: float):
+        self.value = value
+
+    def read(self) -> float:
+        if self.fn is not None:
+            try:
+                return self.fn()
+            except Exception:
+                return float("nan")
+        return self.value
+
+
+class Histogram:
+    """
+    Log-linear histogram: every power of two is split into SUB_BUCKETS linear
+    buckets, so any recorded value is known to within 1/SUB_BUCKETS (about
+    3% with 32) at constant memory, from LOWEST up to any magnitude.
+    """
+    SUB_BUCKETS = 32
+    LOWEST = 1e-6  # values are seconds by convention; 1us resolution
+
+    def __init__(self):
+        self.buckets: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def _index(self, value: float) -> int:
+        if value < self.LOWEST:
+            return 0
+        scaled = value / self.LOWEST
+        exponent = int(math.log2(scaled))
+        sub = int((scaled / (1 << exponent) - 1) * self.SUB_BUCKETS)
+        return 1 + exponent * self.SUB_BUCKETS + sub
+
+    def _upper(self, index: int) -> float:
+        if index == 0:
+            return self.LOWEST
+        exponent, sub = divmod(index - 1, self.SUB_BUCKETS)
+        return self.LOWEST * (1 << exponent) * (1 + (sub + 1) / self.SUB_BUCKETS)
+
+    def observe(self, value: float):
+        index = self._index(value)
+        with self._lock:
+            self.buckets[index] = self.buckets.get(index, 0) + 1
+            self.count += 1
+            self.total += value
+            if value < self.min:
+                self.min = value
+            if value > self.max:
+                self.max = value
+
+    def copy(self) -> 'Histogram':
+        """A consistent copy, safe to read while this one keeps recording."""
+        other = Histogram()
+        with self._lock:
+            other.buckets = dict(self.buckets)
+            other.count, other.total, other.min, other.max = self.count, self.total, self.min, self.max
+        return other
+
+    def percentile(self, p: float) -> float:
+        return self.copy()._percentile(p)
+
+    def _percentile(self, p: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(self.count * p))
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(self._upper(index), self.max)
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        h = self.copy()
+        return {
+            "count": h.count,
+            "sum": h.total,
+            "min": h.min if h.count else 0.0,
+            "max": h.max,
+            "p50": h._percentile(0.50),
+            "p90": h._percentile(0.90),
+            "p99": h._percentile(0.99),
+            "p999": h._percentile(0.999),
+        }
+
+
+class MetricsRegistry:
+    def __init__(self, **const_labels):
+        # labels put on every metric of this registry, e.g. node=<server_id>
+        self.const_labels = _labels(const_labels)
+        self.counters: Dict[Tuple[str, Labels], Counter] = {}
+        self.gauges: Dict[Tuple[str, Labels], Gauge] = {}
+        self.histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, table, factory, name: str, labels: Dict[str, object]):
+        key = (name, _labels(labels))
+        metric = table.get(key)
+        if metric is None:
+            with self._lock:
+                metric = table.setdefault(key, factory())
+        return metric
+
+    def counter(self, name: str, **labels) -> Counter:
+        return self._get(self.counters, Counter, name, labels)
+
+    def gauge(self, name: str, fn: Optional[Callable[[], float]] = None, **labels) -> Gauge:
+        """A settable gauge, or with fn a gauge that is computed when read."""
+        gauge = self._get(self.gauges, Gauge, name, labels)
+        if fn is not None:
+            gauge.fn = fn
+        return gauge
+
+    def histogram(self, name: str, **labels) -> Histogram:
+        return self._get(self.histograms, Histogram, name, labels)
+
+    # ---------- export ----------
+
+    def _items(self, table):
+        # metrics are added by other threads while an export runs
+        with self._lock:
+            return list(table.items())
+
+    def snapshot(self) -> Dict:
+        def key(name, labels):
+            labels = self.const_labels + labels
+            if not labels:
+                return name
+            return name + "{" + ",".join(f"{k}={v}" for k, v in labels) + "}"
+
+        return {
+            "counters": {key(n, l): c.value for (n, l), c in self._items(self.counters)},
+            "gauges": {key(n, l): g.read() for (n, l), g in self._items(self.gauges)},
+            "histograms": {key(n, l): h.summary() for (n, l), h in self._items(self.histograms)},
+        }
+
+    def prometheus(self) -> str:
+        """Prometheus text format; histograms are exported as summaries."""
+        def fmt(labels, extra=()):
+            labels = self.const_labels + labels + tuple(extra)
+            if not labels:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+        lines: List[str] = []
+        for (name, labels), c in sorted(self._items(self.counters), key=lambda item: item[0]):
+            lines.append(f"{name}{fmt(labels)} {c.value}")
+        for (name, labels), g in sorted(self._items(self.gauges), key=lambda item: item[0]):
+            lines.append(f"{name}{fmt(labels)} {g.read()}")
+        for (name, labels), h in sorted(self._items(self.histograms), key=lambda item: item[0]):
+            h = h.copy()
+            for q in (0.5, 0.9, 0.99, 0.999):
+                lines.append(f"{name}{fmt(labels, [('quantile', str(q))])} {h._percentile(q)}")
+            lines.append(f"{name}_sum{fmt(labels)} {h.total}")
+            lines.append(f"{name}_count{fmt(labels)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+
+class _NullMetric:
+    value = 0
+
+    def inc(self, amount: float = 1):
+        pass
+
+    def set(self, value: float):
+        pass
+
+    def observe(self, value: float):
+        pass
+
+
+class NullRegistry(MetricsRegistry):
+    """Drops everything; the default for objects created without a registry."""
+    _metric = _NullMetric()
+
+    def counter(self, name: str, **labels):
+        return self._metric
+
+    def gauge(self, name: str, fn=None, **labels):
+        return self._metric
+
+    def histogram(self, name: str, **labels):
+        return self._metric
+
+
+NULL = NullRegistry()
@@ -0,0 +1,125 @@
+import collections
+import sys
+import threading
+import time
+from typing import Counter, Dict, Optional, Tuple
+
+from .metrics import MetricsRegistry
+
+# PROFILING
+# Two opt-in tools for a slow node:
+# - HandlerTimer: wall and CPU time per MessageType and handler, recorded into
+#   the node's metrics registry (handler_wall_seconds / handler_cpu_seconds).
+#   CPU time is the handling thread's own, so wall - cpu is time spent waiting
+#   (locks, blocking sends).
+# - SamplingProfiler: a thread that snapshots every other thread's stack at a
+#   fixed interval and counts them. collapsed() returns the folded-stack format
+#   ("frame;frame;frame count") that flamegraph.pl and speedscope read. The
+#   counts are read from other threads (the metrics endpoint, ADMIN), so they
+#   are only touched under the profiler's lock.
+
+class HandlerTimer:
+    def __init__(self, metrics: MetricsRegistry):
+        self.metrics = metrics
+        self.enabled = False
+        self._series: Dict[Tuple[str, str], tuple] = {}
+
+    def series(self, kind: str, name: str):
+        key = (kind, name)
+        pair = self._series.get(key)
+        if pair is None:
+            pair = self._series[key] = (
+                self.metrics.histogram("handler_wall_seconds", type=kind, handler=name),
+                self.metrics.histogram("handler_cpu_seconds", type=kind, handler=name),
+            )
+        return pair
+
+    def run(self, kind: str, name: str, fn, *args):
+        wall, cpu = self.series(kind, name)
+        w0 = time.perf_counter()
+        c0 = time.thread_time()
+        try:
+            return fn(*args)
+        finally:
+            cpu.observe(time.thread_time() - c0)
+            wall.observe(time.perf_counter() - w0)
+
+
+def _frame_name(code) -> str:
+    module = code.co_filename.rsplit("/", 1)[-1]
+    return f"{code.co_name} ({module}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    INTERVAL = 0.005
+    MAX_DEPTH = 64
+
+    def __init__(self, interval: float = INTERVAL):
+        self.interval = interval
+        self.samples: Counter[str] = collections.Counter()
+        self.sample_count = 0
+        self.started_at: Optional[float] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval: Optional[float] = None):
+        if self.running:
+            return
+        if interval:
+            self.interval = interval
+        self._stop.clear()
+        self.started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._loop, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def reset(self):
+        with self._lock:
+            self.samples.clear()
+            self.sample_count = 0
+
+    def _loop(self):
+        me = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        while not self._stop.wait(self.interval):
+            stacks = []
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                if ident not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stacks.append(self._fold(names.get(ident, str(ident)), frame))
+            with self._lock:
+                self.samples.update(stacks)
+                self.sample_count += 1
+
+    def _fold(self, thread_name: str, frame) -> str:
+        stack = []
+        while frame is not None and len(stack) < self.MAX_DEPTH:
+            stack.append(_frame_name(frame.f_code))
+            frame = frame.f_back
+        # thread pools are named name-1, name-2...; keep them on one root
+        stack.append(thread_name.split("-")[0] if thread_name[-1:].isdigit() else thread_name)
+        return ";".join(reversed(stack))
+
+    def collapsed(self) -> str:
+        with self._lock:
+            samples = self.samples.most_common()
+        return "".join(f"{stack} {count}\n" for stack, count in samples)
+
+    def dump(self, path: str) -> int:
+        """Writes the folded stacks to `path`; returns the number of distinct stacks."""
+        text = self.collapsed()
+        with open(path, "w") as f:
+            f.write(text)
+        return text.count("\n")
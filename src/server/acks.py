@@ -0,0 +1,151 @@
+from collections import OrderedDict
+from typing import Dict, Set, Tuple
+
+from ..domain.models import Message, NodeId, Room
+from ..domain.control import AckKind, AckPayload
+from ..network.constants import ACK_INTERVAL, ACK_TRACKED, ACK_VIA_HEADER, SENT_AT_HEADER
+
+# DELIVERY ACKS
+# Optional, cumulative acknowledgements between a room host and its clients.
+# Both directions carry a clock rather than message ids, so one ack covers
+# every message up to it and acks stay cheap at any message rate.
+#
+# STORED (host -> sender): the room has accepted and stored the sender's
+# messages up to the clock's entry for it; the client stops keeping them for
+# retransmission. Sent only to clients that asked for acks in CLIENT_JOIN,
+# coalesced per client and room for ACK_INTERVAL.
+#
+# DELIVERED (member -> host): the member has delivered everything up to the
+# clock, the latest at delivered_at. Senders stamp their CHATs with sent_at,
+# and the host records delivered_at - sent_at for each message an ack newly
+# covers in the room's delivery_latency histogram. Both stamps are client wall
+# clocks, so the histogram includes any skew between the two clients, and a
+# message is credited with the ack's delivered_at, which is at most one ack
+# interval late.
+#
+# Clients of an edge (see federation.py) get both as well. The edge passes a
+# member's DELIVERED on to the room's owner unchanged, and marks the CHATs it
+# forwards for a client that asked for acks with its own id; the owner sends
+# that client's STORED acks to the edge, addressed to the client, and the
+# edge hands them over.
+
+SeqKey = Tuple[NodeId, int]
+
+
+class AckTracker:
+    def __init__(self, node, interval: float = ACK_INTERVAL, tracked: int = ACK_TRACKED):
+        self.node = node
+        self.interval = interval
+        self.tracked = tracked
+        # clients that asked for STORED acks
+        self.subscribers: Set[NodeId] = set()
+        # room -> (sender, sender's clock value) -> sent_at, oldest first
+        self.sent_at: Dict[str, "OrderedDict[SeqKey, float]"] = {}
+        # client -> room -> the last clock it acked as delivered
+        self.member_clocks: Dict[NodeId, Dict[str, Dict[NodeId, int]]] = {}
+        # client -> rooms with a STORED ack due
+        self.due: Dict[NodeId, Set[str]] = {}
+        # client of another server -> the edge its STORED acks go through
+        self.edges: Dict[NodeId, NodeId] = {}
+        self._timer = None
+
+    def subscribe(self, client_id: NodeId):
+        self.subscribers.add(client_id)
+
+    def forget(self, client_id: NodeId):
+        self.subscribers.discard(client_id)
+        self.member_clocks.pop(client_id, None)
+        self.due.pop(client_id, None)
+
+    def forget_server(self, server_id: NodeId):
+        """Drops the clients of an edge that failed; they are learned again from their next CHAT."""
+        for client_id in [c for c, edge in self.edges.items() if edge == server_id]:
+            del self.edges[client_id]
+            self.member_clocks.pop(client_id, None)
+            self.due.pop(client_id, None)
+
+    # ---------- host side of a delivery ----------
+
+    def delivered(self, room: Room, msg: Message):
+        """Called for every CHAT the room delivers, in delivery order."""
+        seq = msg.vector_clock.timestamps.get(msg.sender_id, 0)
+        sent_at = msg.headers.get(SENT_AT_HEADER)
+        if sent_at is not None:
+            table = self.sent_at.setdefault(room.room_id, OrderedDict())
+            table[(msg.sender_id, seq)] = float(sent_at)
+            if len(table) > self.tracked:
+                table.popitem(last=False)
+
+        edge = msg.headers.get(ACK_VIA_HEADER)
+        if edge is not None:
+            self.edges[msg.sender_id] = edge
+        if msg.sender_id in self.subscribers or edge is not None:
+            self.due.setdefault(msg.sender_id, set()).add(room.room_id)
+            if self._timer is None:
+                self._timer = self.node.clock.call_later(self.interval, self.flush)
+
+    def flush(self):
+        """Sends one STORED ack per client and room that delivered something since the last flush."""
+        self._timer = None
+        due, self.due = self.due, {}
+        clients = self.node.connection_manager.active_connections_server_to_client
+        for client_id, rooms in due.items():
+            conn = clients.get(client_id)
+            edge = self.edges.get(client_id) if conn is None else None
+            if conn is None and edge is None:
+                continue
+            for room_id in rooms:
+                room = self.node.managed_rooms.get(room_id)
+                if room is None:
+                    continue
+                clock = dict(room.vector_clock.timestamps)
+                if conn is not None:
+                    conn.send(AckPayload(AckKind.STORED, room_id, clock=clock).to_message(self.node.server_id))
+                else:
+                    ack = AckPayload(AckKind.STORED, room_id, clock=clock, client_id=client_id)
+                    self.node.connection_manager.send_to_node(edge, ack.to_message(self.node.server_id))
+                self.node.metrics.counter("acks_sent").inc()
+
+    # ---------- acks from members ----------
+
+    def handle_message(self, msg: Message, from_client: bool = False):
+        payload = AckPayload.from_message(msg)
+        if payload.kind == AckKind.STORED:
+            # only a room's owner sends these, never a client
+            if not from_client:
+                self._pass_stored(msg, payload)
+            return
+        if payload.room_id not in self.node.managed_rooms:
+            owner = self.node.federation.owner_of(payload.room_id)
+            if owner is not None:
+                # a member of a room hosted elsewhere: the owner keeps the histogram
+                self.node.connection_manager.send_to_node(owner, msg)
+                self.node.metrics.counter("acks_forwarded").inc()
+            return
+        self.node.metrics.counter("acks_received").inc()
+        rooms = self.member_clocks.setdefault(msg.sender_id, {})
+        last = rooms.get(payload.room_id, {})
+        rooms[payload.room_id] = dict(payload.clock)
+
+        table = self.sent_at.get(payload.room_id)
+        if not table or not payload.delivered_at:
+            return
+        histogram = self.node.metrics.histogram("delivery_latency", room=payload.room_id)
+        for sender, upto in payload.clock.items():
+            if sender == msg.sender_id:
+                continue
+            # only the newly covered part, and no further back than the table reaches
+            start = max(last.get(sender, 0), upto - self.tracked) + 1
+            for seq in range(start, upto + 1):
+                sent_at = table.get((sender, seq))
+                if sent_at is not None:
+                    histogram.observe(max(0.0, payload.delivered_at - sent_at))
+
+    def _pass_stored(self, msg: Message, payload: AckPayload):
+        """Edge side: a STORED ack from a room's owner for one of our clients."""
+        if payload.client_id is None:
+            return
+        conn = self.node.connection_manager.active_connections_server_to_client.get(payload.client_id)
+        if conn is not None:
+            conn.send(msg)
+            self.node.metrics.counter("acks_forwarded").inc()
@@ -0,0 +1,113 @@
+import bisect
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from ..domain.models import NodeId
+
+# ROOM DIRECTORY
+# Index over the cluster's rooms for discovery listings: owner per room, a
+# sorted name list for prefix search, and member counts for a popularity
+# ordering. Kept up to date incrementally by MetadataStore as rooms are
+# created, synced and their member counts reported; a listing is a page of it
+# rather than the whole room_locations map.
+#
+# Member counts are per reporting node (a room's members can be spread over
+# its host and edge nodes) and summed. Followers take the leader's totals,
+# kept under the "" node; a follower that becomes leader drops those and sums
+# the nodes' own reports again.
+
+ORDER_POPULAR = "popular"
+ORDER_NAME = "name"
+
+Entry = Tuple[str, NodeId, int]  # room_id, owner, members
+
+
+class RoomDirectory:
+    def __init__(self):
+        self.owners: Dict[str, NodeId] = {}
+        self._names: List[str] = []
+        # room_id -> reporting node -> local member count
+        self._counts: Dict[str, Dict[NodeId, int]] = {}
+        self._totals: Dict[str, int] = {}
+        # popularity order, rebuilt on the first query after a change
+        self._popular: Optional[List[str]] = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.owners)
+
+    def set_room(self, room_id: str, owner: NodeId):
+        with self._lock:
+            if room_id not in self.owners:
+                bisect.insort(self._names, room_id)
+                self._popular = None
+            self.owners[room_id] = owner
+
+    def set_members(self, room_id: str, node_id: NodeId, count: int) -> bool:
+        """Records `node_id`'s local member count; True if the room's total changed."""
+        with self._lock:
+            counts = self._counts.setdefault(room_id, {})
+            if count:
+                counts[node_id] = count
+            else:
+                counts.pop(node_id, None)
+            return self._set_total(room_id, sum(counts.values()))
+
+    def drop_node(self, node_id: NodeId) -> bool:
+        """Forgets every count `node_id` reported; True if any room's total changed."""
+        with self._lock:
+            changed = False
+            for room_id, counts in self._counts.items():
+                if counts.pop(node_id, None) is not None:
+                    changed = self._set_total(room_id, sum(counts.values())) or changed
+            return changed
+
+    def set_totals(self, totals: Dict[str, int]) -> bool:
+        """Replaces all member totals with ones computed elsewhere (the leader's); True if any changed."""
+        with self._lock:
+            changed = False
+            for room_id in set(totals) | set(self._totals):
+                total = totals.get(room_id, 0)
+                self._counts[room_id] = {"": total} if total else {}
+                changed = self._set_total(room_id, total) or changed
+            return changed
+
+    def _set_total(self, room_id: str, total: int) -> bool:
+        if self._totals.get(room_id, 0) == total:
+            return False
+        if total:
+            self._totals[room_id] = total
+        else:
+            self._totals.pop(room_id, None)
+        self._popular = None
+        return True
+
+    def members(self, room_id: str) -> int:
+        return self._totals.get(room_id, 0)
+
+    def totals(self) -> Dict[str, int]:
+        return dict(self._totals)
+
+    # ---------- queries ----------
+
+    def _by_name(self, prefix: str) -> List[str]:
+        start = bisect.bisect_left(self._names, prefix)
+        end = bisect.bisect_left(self._names, prefix + "\uffff") if prefix else len(self._names)
+        return self._names[start:end]
+
+    def _by_popularity(self, prefix: str) -> List[str]:
+        if self._popular is None:
+            self._popular = sorted(self._names, key=lambda room_id: -self._totals.get(room_id, 0))
+        if not prefix:
+            return self._popular
+        return [room_id for room_id in self._popular if room_id.startswith(prefix)]
+
+    def page(self, prefix: str = "", offset: int = 0, limit: int = 50, order: str = ORDER_POPULAR) -> Tuple[List[Entry], int]:
+        """Rooms matching `prefix` in the given order: (entries[offset:offset+limit], total matches)."""
+        with self._lock:
+            rooms = self._by_popularity(prefix) if order == ORDER_POPULAR else self._by_name(prefix)
+            entries = [
+                (room_id, self.owners[room_id], self._totals.get(room_id, 0))
+                for room_id in rooms[offset:offset + limit]
+            ]
+            return entries, len(rooms)
@@ -1,122 +1,312 @@
 from ..domain.models import Message, MessageType
+from ..domain.control import ElectionKind, ElectionPayload, NeighbourPayload, NeighbourSide
 from .server_state import ServerState
-import ast
+from ..observability.log import get_logger
+from ..observability.metrics import NULL
 import time
 
+log = get_logger("election")
+
 class ElectionModule:
     Node = None
     reply_counter = 0
-    def __init__(self,Node=None):
+
+    # Hirschberg-Sinclair: probes of 2**k hops, O(N) time in the last phase
+    MODE_HS = "hs"
+    # Recursive doubling over the ring: in round r every node sends the best id it
+    # knows to the node 2**r positions further on. After ceil(log2 N) rounds every
+    # node knows the maximum, so no announcement round is needed.
+    MODE_DOUBLING = "doubling"
+    # how long each doubling round may take before the term is restarted
+    ROUND_TIMEOUT = 1.0
+
+    def __init__(self,Node=None, mode=MODE_HS):
         self.Node = Node
+        self.mode = mode
+        self._handlers = {
+            ElectionKind.PROBE: self._handle_probe,
+            ElectionKind.REPLY: self._handle_reply,
+            ElectionKind.LEADER: self._handle_leader_announcement,
+            ElectionKind.DOUBLING: self._handle_doubling,
+        }
+
+        # recursive doubling state. A term is one election attempt; a higher
+        # term always wins, and a restart for an unchanged ring is suppressed.
+        self.term = 0
+        self.term_ring = ()
+        self.in_progress = False
+        self.round = 0
+        self.best = None
+        self.early = {}  # (term, ring, round) -> candidate that arrived before we got there
+        self.started_term_at = 0.0
+        self.suppressed = 0
+        self.restarts = 0
+        # when the running election started, for the election_seconds histogram
+        self.started_at = None
+
+    def _election_started(self):
+        if self.started_at is None:
+            self.started_at = self.Node.clock.now()
+
+    def _leader_known(self):
+        me = self.Node
+        log.info("leader_known", node=me.server_id, leader=me.leader_id, term=self.term)
+        me.on_leader_known()
+        if self.started_at is not None:
+            getattr(me, "metrics", NULL).histogram("election_seconds").observe(me.clock.now() - self.started_at)
+            self.started_at = None
 
     def ConstructElectionMessage(self, id, k, d):
-        dec = {'k' : k, 'd' : d, 'type' : 'Election', 'mid' : id}
-        m = Message(content = str(dec), sender_id = self.Node.server_id, type = MessageType.ELECTION)
-        return m
+        return ElectionPayload(ElectionKind.PROBE, id, k, d).to_message(self.Node.server_id)
 
     def ConstructReplyMessage(self, id, k):
         #Dummy d
-        dec = {'k' : k, 'd' : 0, 'type' : 'Reply', 'mid' : id}
-        m = Message(content = str(dec),sender_id = self.Node.server_id, type = MessageType.ELECTION)
-        return m
+        return ElectionPayload(ElectionKind.REPLY, id, k, 0).to_message(self.Node.server_id)
 
     def ConstructLeaderAnnouncementMessage(self, id):
-        dec = {'k' : 0, 'd' : 0, 'type' : 'Leader Announcement', 'mid' : id}
-        m = Message(content = str(dec),sender_id = self.Node.server_id, type = MessageType.ELECTION)
-        return m
+        return ElectionPayload(ElectionKind.LEADER, id).to_message(self.Node.server_id)
 
-    def ParseMessage(self, message):
-        stringlit = message.content
-        dec = ast.literal_eval(stringlit)
-        return dec
+    def ParseMessage(self, message) -> ElectionPayload:
+        return ElectionPayload.from_message(message)
 
     def handle_message(self, message, ConnectionManagerObject,MetadataStoreObject):
         dec = self.ParseMessage(message)
+        self._handlers[dec.kind](dec, message, ConnectionManagerObject, MetadataStoreObject)
+
+    def _handle_probe(self, dec, message, ConnectionManagerObject, MetadataStoreObject):
+        me = self.Node
+        #print('received election from ', dec.mid)
+        #print('Election params d , k', (dec.d,dec.k))
+        if int(me.server_id) < int(dec.mid) and dec.d < 2**dec.k:
+            m = self.ConstructElectionMessage(dec.mid, dec.k, dec.d + 1)
+            #Send it forward
+            if message.sender_id == me.right_neighbor.id:
+                ConnectionManagerObject.send_to_node(me.left_neighbor.id, m)
+            elif message.sender_id == me.left_neighbor.id:
+                ConnectionManagerObject.send_to_node(me.right_neighbor.id, m)
+            #print('Sending it forward for ' + str(dec.mid) + ' with k ' + str(dec.k))
+        elif int(me.server_id) < int(dec.mid) and dec.d == 2**dec.k:
+            m = self.ConstructReplyMessage(dec.mid, dec.k)
+            #Send it back
+            """if message.sender_id == me.left_neighbor.id:
+                ConnectionManagerObject.send_to_node(me.left_neighbor.id, m)
+            elif message.sender_id == me.right_neighbor.id:
+                ConnectionManagerObject.send_to_node(me.right_neighbor.id, m)"""
+            ConnectionManagerObject.send_to_node(dec.mid, m)
+            #print('Sending reply for ' +str(dec.mid) + ' back to ' +  str(message.sender_id))
+        elif me.server_id == dec.mid:
+            if me.leader_id != me.server_id:
+                m = self.ConstructLeaderAnnouncementMessage(me.server_id)
+                me.leader_id = me.server_id
+                for i in list(ConnectionManagerObject.active_connections_peer_to_peer.keys()):
+                    if i != int(me.server_id):
+                        ConnectionManagerObject.send_to_node(i, m)
+                print('I AM THE LEADER NOW')
+                me.state = ServerState.LEADER
+                self._leader_known()
+
+                #Remove self from the ring
+                right = NeighbourPayload(NeighbourSide.LEFT, str(me.left_neighbor.id)).to_message(me.server_id)
+                left = NeighbourPayload(NeighbourSide.RIGHT, str(me.right_neighbor.id)).to_message(me.server_id)
+                ConnectionManagerObject.send_to_node(me.left_neighbor.id, left)
+                ConnectionManagerObject.send_to_node(me.right_neighbor.id, right)
+                me.right_neighbor.id = 0
+                me.left_neighbor.id = 0
+                #To be handled in server_node
+
+    def _handle_reply(self, dec, message, ConnectionManagerObject, MetadataStoreObject):
+        me = self.Node
+        #print('received reply from ', message.sender_id)
+        #print('Reply params d , k', (dec.d,dec.k))
+        if me.server_id != dec.mid:
+            if message.sender_id == me.right_neighbor.id:
+                ConnectionManagerObject.send_to_node(me.left_neighbor.id, message)
+                #print('Sending reply for ' +str(dec.mid) + ' to ' +  str(me.left_neighbor.id,))
+            elif message.sender_id == me.left_neighbor.id:
+                ConnectionManagerObject.send_to_node(me.right_neighbor.id, message)
+                #print('Sending reply for ' +str(dec.mid) + ' to ' +  str(me.right_neighbor.id,))
+        else:
+            self.reply_counter += 1
+            if self.reply_counter == 2:
+                self.start_election(ConnectionManagerObject, dec.k + 1)
+
+    def _handle_leader_announcement(self, dec, message, ConnectionManagerObject, MetadataStoreObject):
         me = self.Node
-        #Convert it to switch case
-        if dec['type'] == 'Election':
-            #print('received election from ', dec['mid'])
-            #print('Election params d , k', (dec['d'],dec['k']))
-            if int(me.server_id) < int(dec['mid']) and dec['d'] < 2**dec['k']:
-                m = self.ConstructElectionMessage(dec['mid'], dec['k'], dec['d'] + 1)
-                #Send it forward
-                if message.sender_id == me.right_neighbor.id:
-                    ConnectionManagerObject.send_to_node(me.left_neighbor.id, m)
-                elif message.sender_id == me.left_neighbor.id:
-                    ConnectionManagerObject.send_to_node(me.right_neighbor.id, m)
-                #print('Sending it forward for ' + str(dec['mid']) + ' with k ' + str(dec['k']))
-            elif int(me.server_id) < int(dec['mid']) and dec['d'] == 2**dec['k']:
-                m = self.ConstructReplyMessage(dec['mid'], dec['k'])
-                #Send it back
-                """if message.sender_id == me.left_neighbor.id:
-                    ConnectionManagerObject.send_to_node(me.left_neighbor.id, m)
-                elif message.sender_id == me.right_neighbor.id:
-                    ConnectionManagerObject.send_to_node(me.right_neighbor.id, m)"""
-                ConnectionManagerObject.send_to_node(dec['mid'], m)
-                #print('Sending reply for ' +str(dec['mid']) + ' back to ' +  str(message.sender_id))
-            elif me.server_id == dec['mid']:
-                if me.leader_id != me.server_id:
-                    m = self.ConstructLeaderAnnouncementMessage(me.server_id)
-                    me.leader_id = me.server_id
-                    print('My connection manager has')
-                    for i in ConnectionManagerObject.active_connections_peer_to_peer.keys():
-                        if i != int(me.server_id):
-                            ConnectionManagerObject.active_connections_peer_to_peer[i].send(m)
-                            print(i)
-                    print('I AM THE LEADER NOW')
-                    me.state = ServerState.LEADER
-
-                    #Remove self from the ring
-                    right = Message(content = 'left ' + str(me.left_neighbor.id),sender_id = me.server_id, type = MessageType.UPDATE_NEIGHBOUR)
-                    left = Message(content = 'right ' + str(me.right_neighbor.id),sender_id = me.server_id, type = MessageType.UPDATE_NEIGHBOUR)
-                    ConnectionManagerObject.send_to_node(me.left_neighbor.id, left)
-                    ConnectionManagerObject.send_to_node(me.right_neighbor.id, right)
-                    me.right_neighbor.id = 0
-                    me.left_neighbor.id = 0
-                    #To be handled in server_node
-
-        elif dec['type'] == 'Reply':
-            #print('received reply from ', message.sender_id)
-            #print('Reply params d , k', (dec['d'],dec['k']))
-            if me.server_id != dec['mid']:
-                if message.sender_id == me.right_neighbor.id:
-                    ConnectionManagerObject.send_to_node(me.left_neighbor.id, message)
-                    #print('Sending reply for ' +str(dec['mid']) + ' to ' +  str(me.left_neighbor.id,))
-                elif message.sender_id == me.left_neighbor.id:
-                    ConnectionManagerObject.send_to_node(me.right_neighbor.id, message)
-                    #print('Sending reply for ' +str(dec['mid']) + ' to ' +  str(me.right_neighbor.id,))
+        me.leader_id = dec.mid
+        log.debug("leader_announcement", node=me.server_id, left=me.left_neighbor.id, right=me.right_neighbor.id,
+                  peers=list(ConnectionManagerObject.active_connections_peer_to_peer))
+        me.state = ServerState.FOLLOWER
+        self._leader_known()
+        #Sync with leader for rooms
+        #for peer_id, conn in ConnectionManagerObject.active_connections_peer_to_peer.items():
+        #    me.metadata_store.sync_with_leader(conn, me.server_id, ConnectionManagerObject)
+        for i in MetadataStoreObject.room_locations.keys():
+            MetadataStoreObject.update_metadata(i, me)
+
+
+
+
+    # ---------- recursive doubling mode ----------
+    #
+    # Every DOUBLING message carries its term and the ring the term runs over,
+    # so all members pair up the same way whatever their own view of the
+    # cluster is. Elections are ordered by term, then by ring: of two rings
+    # for the same term the smaller one (more failures seen) wins. A node
+    # adopts any election above its own, ring as-is, and answers one below
+    # its own with a term announcement (k = -1) so the sender catches up.
+    # A new term is started when:
+    #   - this node is left out of a ring: the ring plus this node
+    #   - a round's candidate is late: the ring without the node that owed it
+    # and is announced to every node of the old and the new ring.
+    #
+    # Ring members travel as str; _peer maps them back to the id the
+    # connection manager keys the peer by (main_server uses the int pid).
+
+    def _epoch(self, term, ring):
+        return (term, -len(ring), ring)
+
+    def _peer(self, ConnectionManagerObject, node_id):
+        for known in (ConnectionManagerObject.peer_links, ConnectionManagerObject.active_connections_peer_to_peer):
+            for key in list(known):
+                if str(key) == str(node_id):
+                    return key
+        return node_id
+
+    def _handle_doubling(self, dec, message, ConnectionManagerObject, MetadataStoreObject):
+        me = self.Node
+        ring = tuple(str(i) for i in dec.ring) or self.term_ring
+        epoch = self._epoch(dec.term, ring)
+        current = self._epoch(self.term, self.term_ring)
+        if epoch < current:
+            self._announce(ConnectionManagerObject, [message.sender_id])
+            return
+        if str(me.server_id) not in ring:
+            self._restart(tuple(sorted(ring + (str(me.server_id),))), ConnectionManagerObject, dec.term)
+            return
+        if epoch > current:
+            self._join_term(dec.term, ring, ConnectionManagerObject)
+        if dec.k >= 0:
+            key = (dec.term, ring, dec.k)
+            if key in self.early:
+                self.early[key] = max(self.early[key], dec.mid, key=int)
             else:
-                self.reply_counter += 1
-                if self.reply_counter == 2:
-                    self.start_election(ConnectionManagerObject, dec['k'] + 1)
-
-        #Also handle the Leader Announcement message
-        elif dec['type'] == 'Leader Announcement':
-            print('received leader announcement')
-            me.leader_id = dec['mid']
-            print('left ', me.left_neighbor.id)
-            print('right ', me.right_neighbor.id)
-            print('My connection manager has')
-            for i in ConnectionManagerObject.active_connections_peer_to_peer.keys():
-                print(i)
-            me.state = ServerState.FOLLOWER
-            #Sync with leader for rooms
-            #for peer_id, conn in ConnectionManagerObject.active_connections_peer_to_peer.items():
-            #    me.metadata_store.sync_with_leader(conn, me.server_id, ConnectionManagerObject)
-            for i in MetadataStoreObject.room_locations.keys():
-                MetadataStoreObject.update_metadata(i, me)
-            print('sent my room locations')
+                self.early[key] = dec.mid
+        self._drain_rounds(ConnectionManagerObject)
+
+    def _start_doubling(self, ConnectionManagerObject):
+        me = self.Node
+        me._recompute_ring()
+        ring = tuple(str(i) for i in me.ring)
+        if ring == self.term_ring and (self.in_progress or str(me.leader_id) in ring):
+            # same membership as the running (or finished) term: nothing new to decide
+            self.suppressed += 1
+            return
+        self._join_term(self.term + 1, ring, ConnectionManagerObject)
+        self._drain_rounds(ConnectionManagerObject)
+
+    def _restart(self, ring, ConnectionManagerObject, term=0):
+        """Starts a term above both ours and `term` over `ring`, and announces it."""
+        old = self.term_ring
+        self.restarts += 1
+        log.info("restart_term", node=self.Node.server_id, term=max(self.term, term) + 1, ring=list(ring))
+        self._join_term(max(self.term, term) + 1, ring, ConnectionManagerObject, announce=old)
+        self._drain_rounds(ConnectionManagerObject)
 
+    def _announce(self, ConnectionManagerObject, to):
+        me = self.Node
+        m = ElectionPayload(ElectionKind.DOUBLING, self.best, k=-1, term=self.term,
+                            ring=list(self.term_ring)).to_message(me.server_id)
+        for i in to:
+            if str(i) != str(me.server_id):
+                ConnectionManagerObject.send_to_node(self._peer(ConnectionManagerObject, i), m)
+
+    def _join_term(self, term, ring, ConnectionManagerObject, announce=None):
+        me = self.Node
+        log.debug("join_term", node=me.server_id, term=term)
+        self._election_started()
+        self.term = term
+        self.term_ring = tuple(ring)
+        self.in_progress = True
+        self.round = 0
+        self.best = me.server_id
+        self.started_term_at = me.clock.now()
+        self.early = {key: mid for key, mid in self.early.items() if key[0] >= term}
+        me.state = ServerState.ELECTION_IN_PROGRESS
+        me.leader_id = '0'
+        if announce is not None:
+            self._announce(ConnectionManagerObject, dict.fromkeys(str(i) for i in announce + self.term_ring))
+        if len(self.term_ring) <= 1:
+            self._finish_doubling()
+        else:
+            self._send_round(ConnectionManagerObject)
 
+    def _send_round(self, ConnectionManagerObject):
+        me = self.Node
+        ring = self.term_ring
+        idx = ring.index(str(me.server_id))
+        partner = ring[(idx + 2**self.round) % len(ring)]
+        m = ElectionPayload(ElectionKind.DOUBLING, self.best, k=self.round, term=self.term,
+                            ring=list(ring)).to_message(me.server_id)
+        ConnectionManagerObject.send_to_node(self._peer(ConnectionManagerObject, partner), m)
+        # round r is due r + 1 timeouts into the term, so a node stuck behind a
+        # slow one gives up after the node that waits on the culprit itself
+        term, round = self.term, self.round
+        delay = self.started_term_at + self.ROUND_TIMEOUT * (round + 1) - me.clock.now()
+        me.clock.call_later(delay, lambda: self._round_timeout(term, ring, round, ConnectionManagerObject))
+
+    def _round_timeout(self, term, ring, round, ConnectionManagerObject):
+        if not self.in_progress or (self.term, self.term_ring, self.round) != (term, ring, round):
+            return
+        ring = self.term_ring
+        # the node that should have sent this round's candidate is gone or cut off
+        silent = ring[(ring.index(str(self.Node.server_id)) - 2**round) % len(ring)]
+        log.info("round_timeout", node=self.Node.server_id, term=term, round=round, silent=silent)
+        self._restart(tuple(i for i in ring if i != silent), ConnectionManagerObject)
+
+    def _drain_rounds(self, ConnectionManagerObject):
+        while self.in_progress and (self.term, self.term_ring, self.round) in self.early:
+            candidate = self.early.pop((self.term, self.term_ring, self.round))
+            self.best = max(self.best, candidate, key=int)
+            self.round += 1
+            if 2**self.round >= len(self.term_ring):
+                self._finish_doubling()
+            else:
+                self._send_round(ConnectionManagerObject)
+
+    def _finish_doubling(self):
+        me = self.Node
+        self.in_progress = False
+        me.leader_id = self.best
+        if str(self.best) == str(me.server_id):
+            print('I AM THE LEADER NOW (term ' + str(self.term) + ')')
+            me.state = ServerState.LEADER
+            me.right_neighbor.id = 0
+            me.left_neighbor.id = 0
+            self._leader_known()
+            # the room map for the new term in one snapshot per follower; the
+            # followers report their member counts from _leader_known
+            me.connection_manager.broadcast_to_all(me.metadata_store.sync_message(me.server_id))
+            return
 
+        # every node knows the leader, so each one takes it out of its own ring
+        # view instead of waiting for UPDATE_NEIGHBOUR from the leader
+        ring = [i for i in self.term_ring if i != str(self.best)]
+        idx = ring.index(str(me.server_id))
+        me.left_neighbor.id = self._peer(me.connection_manager, ring[(idx + 1) % len(ring)])
+        me.right_neighbor.id = self._peer(me.connection_manager, ring[(idx - 1) % len(ring)])
+        me.state = ServerState.FOLLOWER
+        self._leader_known()
 
     def start_election(self, ConnectionManagerObject, k = 0):
-        print('Starting Election ',k)
+        if self.mode == self.MODE_DOUBLING:
+            return self._start_doubling(ConnectionManagerObject)
+        log.debug("start_election", node=self.Node.server_id, k=k)
+        self._election_started()
         if len(ConnectionManagerObject.active_connections_peer_to_peer) == 0:
             me = self.Node
             me.leader_id = me.server_id
             me.state = ServerState.LEADER
-            print('I am leader')
+            self._leader_known()
             return
         self.Node.state = ServerState.ELECTION_IN_PROGRESS
         self.reply_counter = 0
@@ -1,45 +1,87 @@
 from typing import Dict, Any
 from enum import Enum
 from ..domain.models import Message, MessageType
+from ..domain.control import HeartbeatPayload, HeartbeatRole, NeighbourPayload, NeighbourSide
 from ..network.transport import ConnectionManager
 from .server_state import ServerState
 from .election import ElectionModule
-import timeit
+from ..observability.log import get_logger
+from ..observability.metrics import NULL
+from ..network.clock import SystemClock
+
+log = get_logger("failure_detector")
+_SYSTEM_CLOCK = SystemClock()
 
 
 class FailureDetector:
     Node = None
     type = 'server'
     PERIOD = 2
+    # how often tick() runs: the resolution of timeouts and heartbeat sends
+    TICK = 0.1
     timers = {}
     def __init__(self, Node = None, type = 'server'):
         self.Node = Node
         self.type = type
+        self.paused = False
+        self.last_sent = 0.0
+
+    # the node's clock, so timeouts run in virtual time inside src/sim
+    def now(self) -> float:
+        return getattr(self.Node, "clock", _SYSTEM_CLOCK).now()
+
+    # one step of the detection loop, run every TICK by the node's clock
+    def tick(self):
+        me = self.Node
+        ConnectionManagerObject = me.connection_manager
+        if me.state == ServerState.ELECTION_IN_PROGRESS or me.state == ServerState.LOOKING:
+            # the ring is changing; restart the timers once it settles
+            self.paused = True
+            self.last_sent = self.now()
+            return
+        if self.paused:
+            self.start_monitoring(ConnectionManagerObject)
+            self.paused = False
+        self.check_timeouts(ConnectionManagerObject)
+        if self.now() - self.last_sent > self.PERIOD:
+            self.send_heartbeat(ConnectionManagerObject, me.metadata_store)
+            self.last_sent = self.now()
 
     def handle_heartbeat(self, message):
-        if message.content == 'Server Heartbeat':
-            self.resetTimer(message.sender_id, 'server')
-        elif message.content == 'Client Heartbeat':
-            self.resetTimer(message.sender_id, 'client')
+        payload = HeartbeatPayload.from_message(message)
+        self.resetTimer(message.sender_id, payload.role.value)
+        if payload.role != HeartbeatRole.SERVER:
+            return
+        ConnectionManagerObject = self.Node.connection_manager
+        if payload.echo:
+            rtt = self.now() - payload.sent_at
+            ConnectionManagerObject.record_rtt(message.sender_id, rtt)
+            getattr(self.Node, "metrics", NULL).histogram("heartbeat_rtt_seconds").observe(rtt)
+        else:
+            echo = HeartbeatPayload(HeartbeatRole.SERVER, payload.sent_at, echo=True).to_message(self.Node.server_id)
+            ConnectionManagerObject.send_to_node(message.sender_id, echo)
 
     #sends the heartbeat. and if it is the leader, it also sends the new metadata to all other servers
     def send_heartbeat(self, ConnectionManagerObject, MetadataStoreObject):
         me = self.Node
         if self.type == 'server':
-            m = Message(content = 'Server Heartbeat', sender_id = me.server_id, type = MessageType.HEARTBEAT)
+            m = HeartbeatPayload(HeartbeatRole.SERVER, self.now()).to_message(me.server_id)
             if me.state != ServerState.LEADER:
                 ConnectionManagerObject.send_to_node(me.right_neighbor.id,m)
                 ConnectionManagerObject.send_to_node(me.left_neighbor.id,m)
                 ConnectionManagerObject.send_to_node(me.leader_id,m)
-                print('Sent heartbeats to neighbors')
+                log.debug("heartbeat_sent", node=me.server_id, to="neighbours")
             else:
-                for i in ConnectionManagerObject.active_connections_peer_to_peer.keys():
+                for i in list(ConnectionManagerObject.active_connections_peer_to_peer.keys()):
                     if i != me.leader_id:
-                        ConnectionManagerObject.active_connections_peer_to_peer[i].send(m)
-                        MetadataStoreObject.sync_with_leader(ConnectionManagerObject.active_connections_peer_to_peer[i], me.server_id, ConnectionManagerObject)
-                        print('Sent heartbeats to every node')
+                        ConnectionManagerObject.send_to_node(i, m)
+                        # a failed send drops the peer's connection; its timer catches it
+                        peer = ConnectionManagerObject.connection_for(i, MessageType.METADATA_UPDATE)
+                        if peer is not None:
+                            MetadataStoreObject.sync_with_leader(peer, me.server_id, ConnectionManagerObject)
+                        log.debug("heartbeat_sent", node=me.server_id, to=i)
         else:
-            m = Message(content = 'Client Heartbeat', sender_id = me.client_id, type = MessageType.HEARTBEAT)
+            m = HeartbeatPayload(HeartbeatRole.CLIENT, self.now()).to_message(me.client_id)
             me.server_connection.send(m)
         #print('Sent heartbeats')
 
@@ -52,25 +94,24 @@ class FailureDetector:
         if me.state != ServerState.LEADER:
             #Start the timers
             if me.right_neighbor.id!='0' and str(me.right_neighbor.id) != str(me.server_id):
-                self.timers[('server',str(me.right_neighbor.id))] = timeit.default_timer()
+                self.timers[('server',str(me.right_neighbor.id))] = self.now()
             if me.left_neighbor.id!='0' and str(me.left_neighbor.id) != str(me.server_id):
-                self.timers[('server',str(me.left_neighbor.id))]= timeit.default_timer()
+                self.timers[('server',str(me.left_neighbor.id))]= self.now()
             if me.leader_id!='0':
                 print('leader', me.leader_id)
-                self.timers[('server',str(me.leader_id))] = timeit.default_timer()
+                self.timers[('server',str(me.leader_id))] = self.now()
         else:
             #If leader, start the timer for all the other servers
             for i in ConnectionManagerObject.active_connections_peer_to_peer.keys():
                 if i != me.server_id:
-                    print('Starting timer for all others')
-                    self.timers[('server',str(i))] = timeit.default_timer()
-        print(self.timers)
+                    self.timers[('server',str(i))] = self.now()
+        log.debug("monitoring", node=me.server_id, timers=list(self.timers))
 
     def start_monitoring_clients():
         #Start the monitoring for the clients
         for i in me.managed_rooms.keys():
             for j in me.managed_rooms[i].client_ids:
-                self.timers[('client',j)] = timeit.default_timer()
+                self.timers[('client',j)] = self.now()
 
     #To be called whenever a heartbeat is received for a particular server
     def resetTimer(self, id, type):
@@ -78,12 +119,12 @@ class FailureDetector:
         for i in self.timers.keys():
             if i[1] == id:
                 if type == 'server':
-                    print('Resetting timer for server ', id)
-                    self.timers[('server',id)] = timeit.default_timer()
+                    log.debug("heartbeat_received", node=self.Node.server_id, peer=id)
+                    self.timers[('server',id)] = self.now()
                     return
                 elif type == 'client':
                     #print('Resetting timer for client ', id)
-                    self.timers[('client',id)] = timeit.default_timer()
+                    self.timers[('client',id)] = self.now()
                     return
         return
 
@@ -97,15 +138,27 @@ class FailureDetector:
             if id == me.leader_id:
                 #spawn a new process here. So that there is failure detection during elections
                 #Test them individually first. Then make it concurrent
-                if id in ConnectionManagerObject.active_connections_peer_to_peer.keys():
-                    ConnectionManagerObject.active_connections_peer_to_peer.pop(id)
+                # a peer link drops its connection when the socket closes, so the
+                # peer may be known only by its link by now
+                if id in ConnectionManagerObject.active_connections_peer_to_peer or id in ConnectionManagerObject.peer_links:
+                    ConnectionManagerObject.active_connections_peer_to_peer.pop(id, None)
+                    ConnectionManagerObject.forget_peer(id)
+                    me.federation.forget_server(id)
+                    me.acks.forget_server(id)
+                    me.metadata_store.drop_node(id)
                     print('left ', me.left_neighbor.id)
                     print('right ', me.right_neighbor.id)
                     me.election_module.start_election(ConnectionManagerObject)
             else:
                 #Consider what happens when only a few servers are available
-                if id in ConnectionManagerObject.active_connections_peer_to_peer.keys():
-                    ConnectionManagerObject.active_connections_peer_to_peer.pop(id)
+                # a peer link drops its connection when the socket closes, so the
+                # peer may be known only by its link by now
+                if id in ConnectionManagerObject.active_connections_peer_to_peer or id in ConnectionManagerObject.peer_links:
+                    ConnectionManagerObject.active_connections_peer_to_peer.pop(id, None)
+                    ConnectionManagerObject.forget_peer(id)
+                    me.federation.forget_server(id)
+                    me.acks.forget_server(id)
+                    me.metadata_store.drop_node(id)
                     #Fix the ring
                     #Elections are to be triggered newly after ring formation
                     print('Server ' + str(id) + ' has crashed!')
@@ -117,8 +170,8 @@ class FailureDetector:
                         leftOfCrashed = me.ring[((crashed + 1)%len(me.ring))]
                         rightOfCrashed = me.ring[((crashed - 1)%len(me.ring))]
                         print('The left and right of crashed are ' + str(leftOfCrashed) + ' ' + str(rightOfCrashed))
-                        right = Message(content = 'left ' + str(leftOfCrashed),sender_id = me.server_id, type = MessageType.UPDATE_NEIGHBOUR)
-                        left = Message(content = 'right ' + str(rightOfCrashed),sender_id = me.server_id, type = MessageType.UPDATE_NEIGHBOUR)
+                        right = NeighbourPayload(NeighbourSide.LEFT, str(leftOfCrashed)).to_message(me.server_id)
+                        left = NeighbourPayload(NeighbourSide.RIGHT, str(rightOfCrashed)).to_message(me.server_id)
                         ConnectionManagerObject.send_to_node(rightOfCrashed, right)
                         ConnectionManagerObject.send_to_node(leftOfCrashed, left)
                     """me._recompute_ring()
@@ -130,13 +183,14 @@ class FailureDetector:
                         me.left_neighbor = me.left_neighbor.left_neighbor
                     """
         elif type == 'client':
-            if id in ConnectionManagerObject.active_connections_server_to_client.keys():
-                ConnectionManagerObject.active_connections_server_to_client.pop(id)
+            self.timers.pop(typeid, None)
+            me.drop_client(id)
 
     #A ServerNodeObject checks the timeouts of its connections and additionally the clients to check if they are active.
     def check_timeouts(self, ConnectionManagerObject):
         #print('Checking timeouts')
-        for i in self.timers.keys():
-            if timeit.default_timer() - self.timers[i] > 2*(self.PERIOD):
+        now = self.now()
+        for i, last in list(self.timers.items()):
+            if now - last > 2*(self.PERIOD):
                 #print('failure ' + str(i))
                 self.on_failure_detected(i, ConnectionManagerObject)
@@ -0,0 +1,258 @@
+from dataclasses import replace
+from typing import Dict, List, Optional, Tuple
+
+from ..domain.models import Message, MessageType, Room, NodeId, VectorClock
+from ..domain.control import FederationAction, FederationPayload
+from ..domain.membership import MemberSet
+from ..network.constants import ACK_VIA_HEADER, EDGE_HEADER, FEDERATION_GAP_TIMEOUT, FEDERATION_PENDING_MAX
+from ..observability.log import get_logger
+
+log = get_logger("federation")
+
+def split_subtree(relays: List[NodeId], fanout: int) -> List[Tuple[NodeId, List[NodeId]]]:
+    """
+    Splits an ordered list of relays into at most `fanout` contiguous chunks.
+    The head of each chunk is a direct child, the rest is that child's subtree.
+    """
+    if fanout <= 0:
+        return [(relay, []) for relay in relays]
+    chunks = []
+    size, extra = divmod(len(relays), fanout)
+    start = 0
+    for i in range(min(fanout, len(relays))):
+        end = start + size + (1 if i < extra else 0)
+        chunks.append((relays[start], relays[start + 1:end]))
+        start = end
+    return chunks
+
+
+def relay_plan(room: Room) -> List[Tuple[NodeId, List[NodeId]]]:
+    """First hop of a room's dissemination tree, built over the ring order after the host."""
+    if room.relay_fanout <= 0:
+        return [(server_id, []) for server_id in room.edge_subscribers]
+
+    ring = [str(i) for i in room.host.ring]
+    host = str(room.host.server_id)
+    def ring_distance(server_id):
+        if host not in ring or str(server_id) not in ring:
+            return len(ring)
+        return (ring.index(str(server_id)) - ring.index(host)) % len(ring)
+
+    ordered = sorted(room.edge_subscribers, key=lambda s: (ring_distance(s), str(s)))
+    return split_subtree(ordered, room.relay_fanout)
+
+
+class RoomFederation:
+    """
+    Lets a server terminate client connections for rooms hosted elsewhere.
+
+    The edge (this node) keeps the local members of each remote room and
+    subscribes to the room's owner. CHATs from local members are forwarded
+    over the peer link to the owner, which does the causal ordering. The owner
+    sends one ROOM_DELIVER per subscribed edge and each edge fans it out to
+    its own members.
+
+    The owner's SYNC after a SUBSCRIBE carries the room's last delivery seq;
+    the edge relays from the one after it and holds whatever arrives before
+    the SYNC (deliveries and SYNC can take different lanes).
+
+    A delivery that is still missing after `gap_timeout`, or more than
+    `pending_max` deliveries held behind it, makes the edge give up on it:
+    what it holds goes out in order and the edge subscribes again, so its
+    members are synced past the gap.
+    """
+    def __init__(self, node, gap_timeout: float = FEDERATION_GAP_TIMEOUT,
+                 pending_max: int = FEDERATION_PENDING_MAX):
+        self.node = node
+        self.gap_timeout = gap_timeout
+        self.pending_max = pending_max
+        # room_id -> local client ids, for rooms this node does not host
+        self.edge_members: Dict[str, MemberSet] = {}
+        # relay state per room: next delivery seq from the host, and deliveries
+        # that arrived ahead of it
+        self.next_seq: Dict[str, int] = {}
+        self.pending: Dict[str, Dict[int, Message]] = {}
+        # room_id -> timer running while a room waits on a missing delivery
+        self.gap_timers: Dict[str, object] = {}
+        # merge of everything delivered per room, what a joining client is synced to
+        self.room_clocks: Dict[str, VectorClock] = {}
+        self.forwarded = 0
+        self.delivered = 0
+        self.relayed = 0
+        self.resyncs = 0
+
+    def owner_of(self, room_id: str) -> Optional[NodeId]:
+        owner = self.node.metadata_store.room_locations.get(room_id)
+        if owner is None or str(owner) == str(self.node.server_id):
+            return None
+        return owner
+
+    def is_remote(self, room_id: str) -> bool:
+        return room_id in self.edge_members or self.owner_of(room_id) is not None
+
+    # ---------- edge side ----------
+
+    def local_join(self, room_id: str, client_id: NodeId):
+        members = self.edge_members.setdefault(room_id, MemberSet())
+        if not members.add(client_id):
+            return
+        if len(members) == 1:
+            # the owner answers with a SYNC, which is passed on to the client
+            self._send_to_owner(room_id, FederationAction.SUBSCRIBE)
+        else:
+            conn = self.node.connection_manager.active_connections_server_to_client.get(client_id)
+            if conn is not None:
+                conn.send(self._sync_message(room_id, self.room_clocks.get(room_id, VectorClock())))
+
+    def local_leave(self, room_id: str, client_id: NodeId):
+        members = self.edge_members.get(room_id)
+        if not members or not members.discard(client_id):
+            return
+        if not members:
+            del self.edge_members[room_id]
+            self.next_seq.pop(room_id, None)
+            self.pending.pop(room_id, None)
+            self._cancel_gap_timer(room_id)
+            self.room_clocks.pop(room_id, None)
+            self._send_to_owner(room_id, FederationAction.UNSUBSCRIBE)
+
+    def forward_chat(self, msg: Message):
+        owner = self.owner_of(msg.room_id)
+        if owner is None:
+            log.warning("no_room_owner", node=self.node.server_id, room=msg.room_id)
+            return
+        headers = {**msg.headers, EDGE_HEADER: self.node.server_id}
+        if msg.sender_id in self.node.acks.subscribers:
+            # the owner sends the client's STORED acks back through us
+            headers[ACK_VIA_HEADER] = self.node.server_id
+        msg = replace(msg, headers=headers)
+        self.node.connection_manager.send_to_node(owner, msg)
+        self.forwarded += 1
+
+    def handle_delivery(self, msg: Message):
+        seq = msg.headers.get("seq")
+        if seq is None:
+            self._deliver(msg)
+            return
+
+        # forward strictly in the host's delivery order, so relays never
+        # reorder what the host delivered causally
+        room_id = msg.room_id
+        expected = self.next_seq.get(room_id)
+        if expected is not None and seq < expected:
+            return
+        self.pending.setdefault(room_id, {})[seq] = msg
+        self._release(room_id)
+
+    def _release(self, room_id: str):
+        """Delivers what is next in order; nothing until the owner's SYNC has set where that starts."""
+        pending = self.pending.get(room_id, {})
+        if room_id in self.next_seq:
+            while self.next_seq[room_id] in pending:
+                ready = pending.pop(self.next_seq[room_id])
+                self.next_seq[room_id] += 1
+                self._deliver(ready)
+
+        if not pending:
+            self._cancel_gap_timer(room_id)
+        elif len(pending) > self.pending_max:
+            self._resync(room_id)
+        elif room_id not in self.gap_timers:
+            expected = self.next_seq.get(room_id)
+            self.gap_timers[room_id] = self.node.clock.call_later(
+                self.gap_timeout, lambda: self._gap_timeout(room_id, expected))
+
+    def _gap_timeout(self, room_id: str, expected: int):
+        self.gap_timers.pop(room_id, None)
+        if self.next_seq.get(room_id) == expected and self.pending.get(room_id):
+            self._resync(room_id)
+
+    def _cancel_gap_timer(self, room_id: str):
+        timer = self.gap_timers.pop(room_id, None)
+        if timer is not None:
+            timer.cancel()
+
+    def _resync(self, room_id: str):
+        """Skips the missing deliveries of a room and subscribes again; the owner's SYNC covers the gap."""
+        self._cancel_gap_timer(room_id)
+        pending = self.pending.pop(room_id, {})
+        log.warning("delivery_gap", node=self.node.server_id, room=room_id,
+                    missing=self.next_seq.get(room_id), held=len(pending))
+        for seq in sorted(pending):
+            self.next_seq[room_id] = seq + 1
+            self._deliver(pending[seq])
+        self.resyncs += 1
+        self._send_to_owner(room_id, FederationAction.SUBSCRIBE)
+
+    def _deliver(self, msg: Message):
+        subtree = msg.headers.get("subtree")
+        if subtree:
+            for child, child_subtree in split_subtree(subtree, msg.headers.get("fanout", 0)):
+                relay = replace(msg, headers={**msg.headers, "subtree": child_subtree})
+                self.node.connection_manager.send_to_node(child, relay)
+                self.relayed += 1
+
+        self.room_clocks.setdefault(msg.room_id, VectorClock()).merge(msg.vector_clock)
+        chat = replace(msg, type=MessageType.CHAT, headers={})
+        clients = self.node.connection_manager.active_connections_server_to_client
+        for client_id in self.edge_members.get(msg.room_id, []):
+            conn = clients.get(client_id)
+            if conn is not None:
+                conn.send(chat)
+        self.delivered += 1
+
+    def handle_sync(self, msg: Message):
+        """Room clock and last delivery seq from the owner after a SUBSCRIBE; the clock is passed on to the local members."""
+        room_id = msg.room_id
+        clock = self.room_clocks.setdefault(room_id, VectorClock())
+        clock.merge(msg.vector_clock)
+        clients = self.node.connection_manager.active_connections_server_to_client
+        for client_id in self.edge_members.get(room_id, []):
+            conn = clients.get(client_id)
+            if conn is not None:
+                conn.send(self._sync_message(room_id, clock))
+
+        seq = msg.headers.get("seq")
+        if seq is None or room_id not in self.edge_members:
+            return
+        # what the SYNC covers is in its clock
+        self.next_seq[room_id] = max(self.next_seq.get(room_id, 0), seq + 1)
+        pending = self.pending.get(room_id, {})
+        for stale in [s for s in pending if s < self.next_seq[room_id]]:
+            del pending[stale]
+        self._release(room_id)
+
+    def _sync_message(self, room_id: str, clock: VectorClock, seq: Optional[int] = None) -> Message:
+        headers = {"seq": seq} if seq is not None else {}
+        return Message(type=MessageType.SYNC, sender_id=self.node.server_id, room_id=room_id,
+                       vector_clock=clock.copy(), headers=headers)
+
+    def _send_to_owner(self, room_id: str, action: FederationAction):
+        owner = self.owner_of(room_id)
+        if owner is None:
+            return
+        m = FederationPayload(action, room_id).to_message(self.node.server_id)
+        self.node.connection_manager.send_to_node(owner, m)
+
+    # ---------- owner side ----------
+
+    def forget_server(self, server_id: NodeId):
+        """Stops delivering to an edge that failed; it subscribes again if it comes back."""
+        for room in self.node.managed_rooms.values():
+            if server_id in room.edge_subscribers:
+                room.edge_subscribers.remove(server_id)
+
+    def handle_control(self, msg: Message):
+        payload = FederationPayload.from_message(msg)
+        room: Room = self.node.managed_rooms.get(payload.room_id)
+        if room is None:
+            return
+        with room.lock:
+            if payload.action == FederationAction.SUBSCRIBE:
+                self.node.multicast_handler.flush_batch(room)
+                if msg.sender_id not in room.edge_subscribers:
+                    room.edge_subscribers.append(msg.sender_id)
+                sync = self._sync_message(room.room_id, room.vector_clock, seq=room.delivery_seq)
+                self.node.connection_manager.send_to_node(msg.sender_id, sync)
+            elif msg.sender_id in room.edge_subscribers:
+                room.edge_subscribers.remove(msg.sender_id)
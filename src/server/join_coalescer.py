@@ -0,0 +1,60 @@
+import threading
+from typing import Set
+
+from .server_state import ServerState
+
+class JoinCoalescer:
+    """
+    Batches ring membership changes during cluster join.
+
+    Every discovered or joining peer is noted here instead of restarting the
+    election straight away. Once no new peer has shown up for WINDOW seconds
+    (or MAX_DELAY after the first pending peer, whichever is earlier) the ring
+    is recomputed once and a single election is started.
+    """
+    WINDOW = 0.3
+    MAX_DELAY = 2.0
+
+    def __init__(self, node, window: float = None, max_delay: float = None):
+        self.node = node
+        self.window = self.WINDOW if window is None else window
+        self.max_delay = self.MAX_DELAY if max_delay is None else max_delay
+        self.pending: Set[str] = set()
+        self.first_pending_at = None
+        self.flushes = 0
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def note_join(self, peer_id: str):
+        clock = self.node.clock
+        with self._lock:
+            self.node.state = ServerState.LOOKING
+            self.pending.add(peer_id)
+            now = clock.now()
+            if self.first_pending_at is None:
+                self.first_pending_at = now
+
+            if self._timer is not None:
+                self._timer.cancel()
+            delay = min(self.window, self.first_pending_at + self.max_delay - now)
+            if delay <= 0:
+                self._timer = None
+            else:
+                self._timer = clock.call_later(delay, self.flush)
+                return
+        self.flush()
+
+    def flush(self):
+        with self._lock:
+            if not self.pending:
+                return
+            peers = sorted(self.pending, key=str)
+            self.pending.clear()
+            self.first_pending_at = None
+            self._timer = None
+            self.flushes += 1
+
+        node = self.node
+        print(f"[Server {node.server_id}] settling ring after {len(peers)} join(s): {peers}")
+        node._recompute_ring()
+        node.election_module.start_election(node.connection_manager)
@@ -1,6 +1,10 @@
 import sys
 import os
+import signal
 from src.server.server_node import ServerNode
+from src.server.election import ElectionModule
+from src.observability.log import configure_logging
+from src.network.discovery import discovery_from_spec
 import uuid
 
 if __name__ == "__main__":
@@ -11,11 +15,22 @@ if __name__ == "__main__":
     # server_id = sys.argv[1]
     port = int(sys.argv[1])
     rooms = int(sys.argv[2]) if len(sys.argv) > 2 else 1 #Default 1 room
+    configure_logging(os.environ.get("CHAT_LOG_LEVEL", "INFO"))
 
     server = ServerNode(
         server_id=os.getpid(), # It was os.getpid() uuid.uuid4()
         ip_address="0.0.0.0",
         port=port,
         number_of_rooms=rooms,
+        # broadcast (default), seeds:<host[:port],...>, multicast:<group[:port][/ttl]> or file:<path>
+        discovery=discovery_from_spec(os.environ.get("CHAT_DISCOVERY")),
+        # hs (default) or doubling
+        election_mode=os.environ.get("CHAT_ELECTION", ElectionModule.MODE_HS),
+        # reject (default) or delay, then limits: e.g. delay,client=50/100,room=1000/2000,node=5000/10000,queue=128
+        rate_limit=os.environ.get("CHAT_RATE_LIMIT"),
     )
+    server.admin_enabled = os.environ.get("CHAT_ADMIN") == "1"
+    server.timer.enabled = os.environ.get("CHAT_PROFILE") == "1"
+    # unwind through ServerNode.start() on kill as well, so it unregisters
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
     server.start()
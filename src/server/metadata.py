@@ -1,70 +1,138 @@
 from typing import Dict, Any
 from ..domain.models import Message, MessageType
+from ..domain.control import MetadataAction, MetadataPayload
 from ..network.transport import ConnectionManager
+from ..network.clock import SystemClock
+from .directory import RoomDirectory
 from .server_state import ServerState
-import ast
-import json
-import socket
 class MetadataStore:
     #room_locations = {}
 
-    def __init__(self, room_locations = {}):
+    # How long a follower may answer client discovery from its replica after the
+    # last SYNC_ROOMS from the leader. The leader re-syncs with every heartbeat
+    # (FailureDetector.PERIOD = 2s), so a follower's answer is at most this old.
+    READ_LEASE = 6.0
+
+    def __init__(self, room_locations = {}, servers = None, clock = None):
         self.room_locations = room_locations or {}
+        # the owning node's clock, so leases expire in virtual time under src/sim
+        self.clock = clock or SystemClock()
+        # server_id -> {ip, port}; shared with ServerNode.servers
+        self.servers = servers if servers is not None else {}
+        self.lease_until = 0.0
+        self.last_sync = None
+        # bumped on every change to room_locations / servers / member counts;
+        # keys the node's pre-encoded AVAILABLE_ROOMS response
+        self.version = 0
+        self.directory = RoomDirectory()
+        for room_id, owner in self.room_locations.items():
+            self.directory.set_room(room_id, owner)
+        self._handlers = {
+            MetadataAction.UPDATE_ROOM: self._on_update_room,
+            MetadataAction.UPDATE_CONNECTION: self._on_update_connection,
+            MetadataAction.SYNC_ROOMS: self._on_sync_rooms,
+            MetadataAction.SYNC_CONNECTIONS: self._on_sync_connections,
+            MetadataAction.ROOM_STATS: self._on_room_stats,
+        }
 
     #To be called by the process_message method if the message type is METADATA_UPDATE
     def handle_message(self,message, ConnectionManagerObject):
-        m = message.content
-
-        if "Update" in m:
-            if 'Room' in m:
-                m = m.split()
-                room_id = m[2]
-                self.room_locations[room_id] = message.sender_id
-            elif 'Connections' in m:
-                m = m.split()
-                server_id = m[2]
-                ip = m[2]
-                port = m[3]
-                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                ConnectionManagerObject.active_connections_peer_to_peer[server_id] = ConnectionManagerObject.wrap_socket(sock,ip,port)
-            #print(self.room_locations)
-        elif "Sync " in m:
-            if "Room" in m:
-                m = m[9:]
-                incoming = ast.literal_eval(m)
-                self.room_locations.update(incoming)
-            elif "Connections" in m:
-                m = m[16:]
-                ConnectionManagerObject.active_connections_peer_to_peer = json.loads(m)
-                for i in ConnectionManagerObject.active_connections_peer_to_peer.keys():
-                    ipport = ConnectionManagerObject.active_connections_peer_to_peer[i].split()
-                    ip = ipport[0]
-                    port = ipport[1]
-                    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                    #Store it as a TCPConnection object instead of ip and port
-                    ConnectionManagerObject.active_connections_peer_to_peer[i] = ConnectionManagerObject.wrap_socket(sock,ip,port)
-
-            #print(self.room_locations)
-            #print(ConnectionManagerObject.active_connections_peer_to_peer)
+        payload = MetadataPayload.from_message(message)
+        self._handlers[payload.action](payload, message, ConnectionManagerObject)
+
+    def _on_update_room(self, payload, message, ConnectionManagerObject):
+        self.set_room(payload.room_id, message.sender_id)
+
+    def set_room(self, room_id, owner):
+        if self.room_locations.get(room_id) == owner and room_id in self.directory.owners:
+            return
+        self.room_locations[room_id] = owner
+        self.directory.set_room(room_id, owner)
+        self.touch()
+
+    # a node's local member counts; the leader sums them over nodes
+    def _on_room_stats(self, payload, message, ConnectionManagerObject):
+        self.set_members(payload.members, message.sender_id)
+
+    def set_members(self, counts, node_id):
+        changed = False
+        for room_id, count in counts.items():
+            changed = self.directory.set_members(room_id, node_id, count) or changed
+        if changed:
+            self.touch()
+
+    def drop_node(self, node_id):
+        """Forgets a node's member counts: it failed, or ("") the old leader's totals are superseded."""
+        if self.directory.drop_node(node_id):
+            self.touch()
+
+    # Peer addresses only register a lazy link; it is opened on first use.
+    def _on_update_connection(self, payload, message, ConnectionManagerObject):
+        for server_id, addr in payload.peers.items():
+            ConnectionManagerObject.register_peer(server_id, addr["ip"], addr["port"])
+
+    def _on_sync_rooms(self, payload, message, ConnectionManagerObject):
+        # the leader re-sends the full map every heartbeat; most are no-ops
+        changed = any(self.room_locations.get(room_id) != owner for room_id, owner in payload.rooms.items())
+        self.room_locations.update(payload.rooms)
+        if changed:
+            for room_id, owner in payload.rooms.items():
+                self.directory.set_room(room_id, owner)
+        changed = self.directory.set_totals(payload.members) or changed
+        for server_id, addr in payload.peers.items():
+            # our own view of a peer (from discovery) beats the leader's
+            if server_id not in self.servers:
+                self.servers[server_id] = addr
+                changed = True
+        if changed:
+            self.touch()
+        self.last_sync = self.clock.now()
+        if payload.lease:
+            self.lease_until = self.last_sync + payload.lease
+
+    def touch(self):
+        self.version += 1
+
+    def lease_valid(self) -> bool:
+        return self.clock.now() < self.lease_until
+
+    def staleness(self):
+        if self.last_sync is None:
+            return None
+        return self.clock.now() - self.last_sync
+
+    def _on_sync_connections(self, payload, message, ConnectionManagerObject):
+        for server_id, addr in payload.peers.items():
+            ConnectionManagerObject.register_peer(server_id, addr["ip"], addr["port"])
 
     #send the new room that is added to the leader
     #To be called when a new room is added by the server. Through Discovery.
     def update_metadata(self, room_id, server):
         ConnectionManagerObject = server.connection_manager
         #Update within the server instance first. Will be also done redundantly with the sync_with_leader() function
-        self.room_locations[room_id] = server.server_id
+        self.set_room(room_id, server.server_id)
         if server.state != ServerState.LEADER:
-            m = Message(content = "Update Room " + str(room_id), sender_id = server.server_id, type = MessageType.METADATA_UPDATE)
+            m = MetadataPayload(MetadataAction.UPDATE_ROOM, room_id=str(room_id)).to_message(server.server_id)
             ConnectionManagerObject.send_to_node(server.leader_id, m)
 
     def update_globalview(self, ConnectionManagerObject, server, server_id):
         if server.state != ServerState.LEADER:
-            m = Message(content = "Update Connections " + str(server_id) + ' ' + ConnectionManagerObject.active_connections_peer_to_peer[server_id].stringify(), sender_id = server.server_id, type = MessageType.METADATA_UPDATE)
+            conn = ConnectionManagerObject.active_connections_peer_to_peer[server_id]
+            peers = {server_id: {"ip": conn.ip, "port": conn.port}}
+            m = MetadataPayload(MetadataAction.UPDATE_CONNECTION, peers=peers).to_message(server.server_id)
             ConnectionManagerObject.send_to_node(server.leader_id, m)
 
     #To be called by the leader server
+    def sync_message(self, id) -> Message:
+        return MetadataPayload(
+            MetadataAction.SYNC_ROOMS,
+            rooms=dict(self.room_locations),
+            peers=dict(self.servers),
+            lease=self.READ_LEASE,
+            members=self.directory.totals(),
+        ).to_message(id)
+
     def sync_with_leader(self, peer, id, ConnectionManagerObject):
-        m = Message(content = "Sync Room" + str(self.room_locations), sender_id = id, type = MessageType.METADATA_UPDATE)
-        peer.send(m)
-        #m = Message(content = "Sync Connections" + ConnectionManagerObject.stringify(), sender_id = id, type = MessageType.METADATA_UPDATE)
+        peer.send(self.sync_message(id))
+        #m = MetadataPayload(MetadataAction.SYNC_CONNECTIONS, peers=ConnectionManagerObject.peer_addresses()).to_message(id)
         #peer.send(m)
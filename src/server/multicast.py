@@ -1,5 +1,12 @@
 from typing import List
-from ..domain.models import VectorClock, Message, Room
+from dataclasses import replace
+import timeit
+from ..domain.models import VectorClock, Message, MessageType, Room
+from ..domain.batch import pack_batch
+from .federation import relay_plan
+from ..observability.log import get_logger
+
+log = get_logger("multicast")
 
 class CausalMulticastHandler:
     def __init__(self):
@@ -11,15 +18,16 @@ class CausalMulticastHandler:
         Main entry point for handling a CHAT message.
         Checks for causal readiness and either multicasts or holds back.
         """
-        # 1. Check if causally ready
-        if room.vector_clock.is_causally_ready(msg.vector_clock, msg.sender_id):
-            self._deliver_and_multicast(msg, room)
-            
-            # 2. Check hold back queue for any now-ready messages
-            self._check_queue_recursively(room)
-        else:
-            print(f"[Server] Holding back message {msg.message_id} from {msg.sender_id}")
-            room.hold_back_queue.append(msg)
+        with room.lock:
+            # 1. Check if causally ready
+            if room.vector_clock.is_causally_ready(msg.vector_clock, msg.sender_id):
+                self._deliver_and_multicast(msg, room)
+
+                # 2. Check hold back queue for any now-ready messages
+                self._check_queue_recursively(room)
+            else:
+                log.debug("hold_back", room=room.room_id, message=msg.message_id, sender=msg.sender_id)
+                room.hold_back_queue.append(msg)
 
     def _deliver_and_multicast(self, msg: Message, room: Room):
         """
@@ -30,32 +38,88 @@ class CausalMulticastHandler:
         
         # Add to history
         room.add_message(msg)
+        acks = getattr(room.host, "acks", None)
+        if acks is not None:
+            acks.delivered(room, msg)
         
         # Multicast
-        self.multicast(msg, room)
+        if room.batching:
+            self._add_to_batch(msg, room)
+        else:
+            self.multicast(msg, room)
+
+    def _add_to_batch(self, msg: Message, room: Room):
+        """
+        Queues a delivered message for the room's next BATCH. The batch is
+        flushed when it reaches batch_size or batch_interval after its first
+        message, whichever comes first.
+        """
+        room.pending_batch.append(msg)
+        if room.batch_size and len(room.pending_batch) >= room.batch_size:
+            self.flush_batch(room)
+        elif room.batch_timer is None:
+            delay = room.batch_interval if room.batch_interval > 0 else 0
+            room.batch_timer = room.host.clock.call_later(delay, lambda: self.flush_batch(room))
+
+    def flush_batch(self, room: Room):
+        # runs on the batch timer's thread as well as in delivery
+        with room.lock:
+            if room.batch_timer is not None:
+                room.batch_timer.cancel()
+                room.batch_timer = None
+            batch, room.pending_batch = room.pending_batch, []
+            if not batch:
+                return
+
+            start = timeit.default_timer()
+            frame = batch[0] if len(batch) == 1 else pack_batch(room.room_id, batch, room.host.server_id)
+            self._send_to_members(frame, room)
+            # edges keep their per-message, sequenced deliveries
+            for msg in batch:
+                self._send_to_edges(msg, room)
+            self._observe_fanout(room, start)
 
     def _check_queue_recursively(self, room: Room):
         """
-        Checks the hold back queue for any messages that are now ready.
-        Repeats until no more messages can be delivered.
-        """
-        progress = True
-        while progress:
-            progress = False
-            # Iterate through a copy of the list to allow modification
-            for msg in room.hold_back_queue[:]:
-                if room.vector_clock.is_causally_ready(msg.vector_clock, msg.sender_id):
-                    room.hold_back_queue.remove(msg)
-                    self._deliver_and_multicast(msg, room)
-                    progress = True
-                    # Break inner loop to restart iteration on modified list (safer)
-                    break 
+        Delivers held-back messages that are now ready, until none is left.
+        """
+        room.hold_back_queue.drain(room.vector_clock, lambda msg: self._deliver_and_multicast(msg, room))
 
     def multicast(self, msg: Message, room: Room):
         """
         Sends the message to all clients in the room.
         """
-        # use TCP connection to send the message to all participant of the room
+        start = timeit.default_timer()
+        self._send_to_members(msg, room)
+        self._send_to_edges(msg, room)
+        self._observe_fanout(room, start)
+
+    def _observe_fanout(self, room: Room, start: float):
+        metrics = getattr(room.host, "metrics", None)
+        if metrics is not None:
+            metrics.histogram("fanout_seconds").observe(timeit.default_timer() - start)
+
+    def _send_to_members(self, msg: Message, room: Room):
+        # use TCP connection to send the message to all participant of the room;
+        # a member whose connection is already gone is skipped until the
+        # failure detector drops it from the room
+        clients = room.host.connection_manager.active_connections_server_to_client
         for client_id in room.client_ids:
-            room.host.connection_manager.active_connections_server_to_client[client_id].send(msg)
+            conn = clients.get(client_id)
+            if conn is not None:
+                conn.send(msg)
+
+    def _send_to_edges(self, msg: Message, room: Room):
+        # one frame per edge server (or per first-level relay with a relay
+        # tree), which fans out to its own members and relays further down
+        if room.edge_subscribers:
+            room.delivery_seq += 1
+            for server_id, subtree in relay_plan(room):
+                delivery = replace(msg, type=MessageType.ROOM_DELIVER, headers={
+                    **msg.headers,
+                    "seq": room.delivery_seq,
+                    "subtree": subtree,
+                    "fanout": room.relay_fanout,
+                })
+                room.host.connection_manager.send_to_node(server_id, delivery)
 
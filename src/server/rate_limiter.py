@@ -0,0 +1,305 @@
+import threading
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from ..domain.models import Message, NodeId
+from ..domain.control import ThrottleAction, ThrottleScope, ThrottlePayload
+from ..network.constants import (
+    CLIENT_RATE,
+    CLIENT_BURST,
+    EDGE_HEADER,
+    ROOM_RATE,
+    ROOM_BURST,
+    NODE_RATE,
+    NODE_BURST,
+    THROTTLE_QUEUE_SIZE,
+    THROTTLE_SWEEP_INTERVAL,
+)
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = now
+
+    def _refill(self, now: float):
+        if now > self.updated:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def available(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= 1
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def full(self, now: float) -> bool:
+        """True once the bucket has refilled completely: a new one would be the same."""
+        self._refill(now)
+        return self.tokens >= self.burst
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until the bucket holds a whole token again."""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """
+    Token-bucket admission control for client CHATs, checked before causal
+    processing. A CHAT needs a token from its client's, its room's and the
+    node's bucket. The client and node buckets are those of the node the
+    client is connected to; the room bucket is the room owner's, so a room
+    with members on several edges is held to one limit. When one of them is
+    empty:
+
+    reject: the CHAT is dropped and the client gets a THROTTLED notice with
+            retry_after; it is expected to resend it with the same clock.
+    delay:  the CHAT is queued (per client, in order) and admitted once all
+            buckets have a token; the client is told it was delayed. A full
+            queue falls back to reject.
+
+    A CHAT forwarded by an edge server only needs the room's token here, and
+    the notice goes back through the edge. Buckets that have refilled
+    completely are dropped every THROTTLE_SWEEP_INTERVAL, with the client's
+    or room's throttle counts.
+    """
+    POLICY_REJECT = "reject"
+    POLICY_DELAY = "delay"
+
+    def __init__(
+        self,
+        node,
+        policy: str = POLICY_REJECT,
+        client_rate: float = CLIENT_RATE,
+        client_burst: float = CLIENT_BURST,
+        room_rate: float = ROOM_RATE,
+        room_burst: float = ROOM_BURST,
+        node_rate: float = NODE_RATE,
+        node_burst: float = NODE_BURST,
+        queue_size: int = THROTTLE_QUEUE_SIZE,
+        sweep_interval: float = THROTTLE_SWEEP_INTERVAL,
+    ):
+        self.node = node
+        self.policy = policy
+        self.client_limits = (client_rate, client_burst)
+        self.room_limits = (room_rate, room_burst)
+        self.queue_size = queue_size
+        self.node_bucket: Optional[TokenBucket] = None
+        self.node_limits = (node_rate, node_burst)
+        self.client_buckets: Dict[NodeId, TokenBucket] = {}
+        self.room_buckets: Dict[str, TokenBucket] = {}
+        # client_id -> CHATs waiting for tokens (delay policy)
+        self.delayed: Dict[NodeId, Deque[Message]] = {}
+        self._timers = {}
+        self._lock = threading.RLock()
+        self.sweep_interval = sweep_interval
+        self._swept = None
+
+        # counters
+        self.admitted = 0
+        self.rejected = 0
+        self.delayed_total = 0
+        self.throttled_by_scope: Dict[str, int] = {scope.value: 0 for scope in ThrottleScope}
+        self.throttled_by_client: Dict[NodeId, int] = {}
+        self.throttled_by_room: Dict[str, int] = {}
+
+    # ---------- buckets ----------
+
+    def _local(self, msg: Message) -> bool:
+        return msg.sender_id in self.node.connection_manager.active_connections_server_to_client
+
+    def _buckets(self, msg: Message, now: float) -> List[Tuple[ThrottleScope, TokenBucket]]:
+        buckets = []
+        if self._local(msg):
+            client = self.client_buckets.get(msg.sender_id)
+            if client is None:
+                client = self.client_buckets[msg.sender_id] = TokenBucket(*self.client_limits, now)
+            buckets.append((ThrottleScope.CLIENT, client))
+        # a room hosted elsewhere is limited by its owner
+        if msg.room_id in self.node.managed_rooms:
+            room = self.room_buckets.get(msg.room_id)
+            if room is None:
+                room = self.room_buckets[msg.room_id] = TokenBucket(*self.room_limits, now)
+            buckets.append((ThrottleScope.ROOM, room))
+        if self._local(msg):
+            if self.node_bucket is None:
+                self.node_bucket = TokenBucket(*self.node_limits, now)
+            buckets.append((ThrottleScope.NODE, self.node_bucket))
+        return buckets
+
+    def _sweep(self, now: float):
+        """Drops buckets that have refilled completely, unless CHATs wait on them."""
+        if self._swept is not None and now - self._swept < self.sweep_interval:
+            return
+        self._swept = now
+        queued_rooms = {msg.room_id for queue in self.delayed.values() for msg in queue}
+        for buckets, counts, busy in (
+            (self.client_buckets, self.throttled_by_client, self.delayed),
+            (self.room_buckets, self.throttled_by_room, queued_rooms),
+        ):
+            for key in [key for key, bucket in buckets.items() if key not in busy and bucket.full(now)]:
+                del buckets[key]
+                counts.pop(key, None)
+
+    def _limit(self, buckets, now: float) -> Tuple[Optional[ThrottleScope], float]:
+        """The empty bucket that is slowest to refill, as (scope, wait); (None, 0.0) if none is empty."""
+        empty = [(bucket.wait_time(now), scope) for scope, bucket in buckets if not bucket.available(now)]
+        if empty:
+            wait, scope = max(empty, key=lambda e: e[0])
+            return scope, wait
+        return None, 0.0
+
+    def _try_take(self, msg: Message, now: float) -> Tuple[Optional[ThrottleScope], float]:
+        """Takes one token from every bucket, or none. Returns (limiting scope, wait) on failure."""
+        buckets = self._buckets(msg, now)
+        scope, wait = self._limit(buckets, now)
+        if scope is not None:
+            return scope, wait
+        for _, bucket in buckets:
+            bucket.take(now)
+        return None, 0.0
+
+    # ---------- admission ----------
+
+    def admit(self, msg: Message, deliver) -> bool:
+        """
+        Returns True when msg may be processed now. Otherwise the CHAT has been
+        rejected or queued; queued CHATs are passed to deliver(msg) later.
+        """
+        if not self._local(msg) and msg.room_id not in self.node.managed_rooms:
+            return True
+
+        with self._lock:
+            now = self.node.clock.now()
+            self._sweep(now)
+            queue = self.delayed.get(msg.sender_id)
+            # a client with queued CHATs keeps its order: new ones wait behind
+            # them, for whichever bucket holds up the head of the queue
+            if queue:
+                scope, wait = self._limit(self._buckets(queue[0], now), now)
+                if scope is None:
+                    # the head goes out as soon as the drain runs
+                    scope = ThrottleScope.CLIENT
+            else:
+                scope, wait = self._try_take(msg, now)
+                if scope is None:
+                    self.admitted += 1
+                    return True
+
+            self._count(msg, scope)
+            if self.policy == self.POLICY_DELAY and (queue is None or len(queue) < self.queue_size):
+                self.delayed.setdefault(msg.sender_id, deque()).append(msg)
+                self.delayed_total += 1
+                self._schedule_drain(msg.sender_id, wait, deliver)
+                action = ThrottleAction.DELAYED
+            else:
+                self.rejected += 1
+                action = ThrottleAction.REJECTED
+
+        self._notify(msg, action, scope, wait)
+        return False
+
+    def _schedule_drain(self, client_id: NodeId, wait: float, deliver):
+        if client_id in self._timers:
+            return
+        self._timers[client_id] = self.node.clock.call_later(wait, lambda: self._drain(client_id, deliver))
+
+    def _drain(self, client_id: NodeId, deliver):
+        ready = []
+        with self._lock:
+            self._timers.pop(client_id, None)
+            queue = self.delayed.get(client_id)
+            now = self.node.clock.now()
+            wait = 0.0
+            while queue:
+                scope, wait = self._try_take(queue[0], now)
+                if scope is not None:
+                    break
+                ready.append(queue.popleft())
+                self.admitted += 1
+            if queue:
+                self._schedule_drain(client_id, wait, deliver)
+            else:
+                self.delayed.pop(client_id, None)
+        for msg in ready:
+            deliver(msg)
+
+    def _count(self, msg: Message, scope: ThrottleScope):
+        self.throttled_by_scope[scope.value] += 1
+        self.throttled_by_client[msg.sender_id] = self.throttled_by_client.get(msg.sender_id, 0) + 1
+        self.throttled_by_room[msg.room_id] = self.throttled_by_room.get(msg.room_id, 0) + 1
+
+    def _notify(self, msg: Message, action: ThrottleAction, scope: ThrottleScope, wait: float):
+        conn = self.node.connection_manager.active_connections_server_to_client.get(msg.sender_id)
+        if conn is not None:
+            notice = ThrottlePayload(action, scope, msg.message_id, msg.room_id, round(wait, 4))
+            conn.send(notice.to_message(self.node.server_id))
+            return
+        edge = msg.headers.get(EDGE_HEADER)
+        if edge is not None:
+            notice = ThrottlePayload(action, scope, msg.message_id, msg.room_id, round(wait, 4), client_id=msg.sender_id)
+            self.node.connection_manager.send_to_node(edge, notice.to_message(self.node.server_id))
+
+    def handle_message(self, msg: Message, from_client: bool = False):
+        """Edge side: a room owner's notice for one of our clients. Clients never send these."""
+        if from_client:
+            return
+        notice = ThrottlePayload.from_message(msg)
+        if notice.client_id is None:
+            return
+        conn = self.node.connection_manager.active_connections_server_to_client.get(notice.client_id)
+        if conn is not None:
+            conn.send(msg)
+
+    def forget_client(self, client_id: NodeId):
+        with self._lock:
+            self.client_buckets.pop(client_id, None)
+            self.throttled_by_client.pop(client_id, None)
+            self.delayed.pop(client_id, None)
+            timer = self._timers.pop(client_id, None)
+            if timer is not None:
+                timer.cancel()
+
+    # ---------- stats ----------
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "policy": self.policy,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "delayed": self.delayed_total,
+                "queued": sum(len(q) for q in self.delayed.values()),
+                "by_scope": dict(self.throttled_by_scope),
+                "by_client": dict(self.throttled_by_client),
+                "by_room": dict(self.throttled_by_room),
+            }
+
+
+def rate_limiter_from_spec(node, spec: Optional[str]) -> RateLimiter:
+    """
+    Builds a node's RateLimiter from a spec string such as CHAT_RATE_LIMIT:
+    the policy, then optional limits, e.g. "delay,client=50/100,room=1000/2000,
+    node=5000/10000,queue=128" (refill per second / bucket size).
+    """
+    policy, *options = [part.strip() for part in (spec or RateLimiter.POLICY_REJECT).split(",")]
+    if policy not in (RateLimiter.POLICY_REJECT, RateLimiter.POLICY_DELAY):
+        raise ValueError(f"unknown rate limit policy: {policy}")
+    kwargs = {}
+    for option in filter(None, options):
+        key, _, value = option.partition("=")
+        if key in ("client", "room", "node"):
+            rate, _, burst = value.partition("/")
+            kwargs[f"{key}_rate"] = float(rate)
+            kwargs[f"{key}_burst"] = float(burst) if burst else 2 * float(rate)
+        elif key == "queue":
+            kwargs["queue_size"] = int(value)
+        else:
+            raise ValueError(f"unknown rate limit option: {option}")
+    return RateLimiter(node, policy, **kwargs)
@@ -1,4 +1,6 @@
 from typing import Dict, Optional
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 import socket
 import os
@@ -7,16 +9,62 @@ import threading
 import time
 import secrets
 import string
-import timeit
-
-from ..domain.models import Room, Message, MessageType
+import zlib
+
+from ..domain.models import Room, Message, MessageType, NodeId
+from ..domain.membership import MemberSet, MembershipIndex
+from ..domain.control import (
+    AdminCommand,
+    AdminPayload,
+    DirectoryPayload,
+    MetadataAction,
+    MetadataPayload,
+    NeighbourPayload,
+    NeighbourSide,
+)
 from ..network.transport import ConnectionManager, UDPHandler
+from ..network.clock import SystemClock
+from ..network.discovery import BroadcastDiscovery, DiscoveryBackend, local_ip
+from ..network.compression import CODEC, COMPRESS_HEADER
+from ..network.lanes import DATA, LANE_HEADER
 from .election import ElectionModule
 from .failure_detector import FailureDetector
 from .metadata import MetadataStore
 from .multicast import CausalMulticastHandler
+from .join_coalescer import JoinCoalescer
+from .federation import RoomFederation
+from .snapshot import SnapshotTransfer
+from .acks import AckTracker
+from .rate_limiter import rate_limiter_from_spec
 from .server_state import ServerState
-from ..network.constants import DISCOVERY_PORT
+from ..network.constants import (
+    ACK_HEADER,
+    DISCOVERY_DEDUP_MAX,
+    DISCOVERY_DEDUP_WINDOW,
+    DISCOVERY_WORKERS,
+    DIRECTORY_MAX_DATAGRAM,
+    DIRECTORY_MAX_PAGE,
+    DIRECTORY_PAGE_SIZE,
+    DIRECTORY_REPORT_INTERVAL,
+    METRICS_PORT_OFFSET,
+    REGISTRY_REFRESH,
+)
+from ..observability.log import get_logger
+from ..observability.metrics import MetricsRegistry
+from ..observability.endpoint import MetricsEndpoint
+from ..observability.profiler import HandlerTimer, SamplingProfiler
+
+def _discovery_request(msg: Message) -> Dict:
+    """
+    Fields of a DISCOVERY_REQUEST: the client's retry counter ("attempt"),
+    "direct" for a follow-up sent to one server, and a directory query.
+    Older clients send no content.
+    """
+    try:
+        data = json.loads(msg.content)
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
 
 @dataclass
 class RingNeighbor:
@@ -25,8 +73,22 @@ class RingNeighbor:
     port: int
 
 class ServerNode:
-    def __init__(self, server_id: str, ip_address: str, port: int, number_of_rooms: int):
+    # pause after an UPDATE_NEIGHBOUR before the node acts as a follower again
+    RING_SETTLE = 0.1
+
+    def __init__(
+        self,
+        server_id: str,
+        ip_address: str,
+        port: int,
+        number_of_rooms: int = 1,
+        election_mode: str = ElectionModule.MODE_HS,
+        discovery: Optional[DiscoveryBackend] = None,
+        rate_limit: Optional[str] = None,
+    ):
         self.server_id = server_id
+        # how peers and clients find this node; see network/discovery.py
+        self.discovery = discovery or BroadcastDiscovery()
         self.ip_address = self._get_local_ip() # It was "127.0.0.1" force_loopback=True
         self.port = port
         self.servers: Dict[str, Dict] = {} # server_id -> {ip, port}
@@ -37,12 +99,6 @@ class ServerNode:
         self.ring = []
         self.number_of_rooms = number_of_rooms
 
-        self.receivedDiscoveryResponses = 0
-        self.goAhead = False
-
-        self.receivedDiscoveryResponses = 0
-        self.goAhead = False
-
         # logical state
         self.state = ServerState.LEADER
         self.leader_id = '0'
@@ -54,14 +110,71 @@ class ServerNode:
 
         # rooms
         self.managed_rooms: Dict[str, Room] = {}
+        # client -> the rooms it is in on this node, hosted or served as an edge
+        self.memberships = MembershipIndex()
 
         # components
+        self.log = get_logger("server", node=server_id)
+        self.metrics = MetricsRegistry(node=server_id)
+        self.metrics_endpoint = None
+        self._duplicates = self.metrics.counter("chat_duplicates")
+        self._frames_in = {}
+        # opt-in profiling, switched on by ADMIN messages from a local client
+        # once admin_enabled is set (CHAT_ADMIN=1 for main_server)
+        self.admin_enabled = False
+        self.timer = HandlerTimer(self.metrics)
+        self.profiler = SamplingProfiler()
+        self._handler_names = {}
+        self.clock = SystemClock()
         self.connection_manager = ConnectionManager()
+        self.connection_manager.node_id = server_id
+        self.connection_manager.metrics = self.metrics
+        self.connection_manager.timer = self.timer
+        # client discovery runs on a small pool; repeats are dropped before it
+        self.discovery_pool = ThreadPoolExecutor(max_workers=DISCOVERY_WORKERS, thread_name_prefix="discovery")
+        self._discovery_seen: "OrderedDict[tuple, float]" = OrderedDict()
+        # serialized AVAILABLE_ROOMS pages for the current metadata version
+        self._rooms_frames_version = None
+        self._rooms_frames: Dict[tuple, bytes] = {}
+        # member count changes not yet reported to the leader
+        self._member_reports: Dict[str, int] = {}
+        self._member_report_timer = None
         self.udp_handler = UDPHandler()
-        self.election_module = ElectionModule(self)
+        self.election_module = ElectionModule(self, election_mode)
         self.failure_detector = FailureDetector(self)
-        self.metadata_store = MetadataStore()
+        self.metadata_store = MetadataStore(servers=self.servers, clock=self.clock)
         self.multicast_handler = CausalMulticastHandler()
+        self.join_coalescer = JoinCoalescer(self)
+        self.federation = RoomFederation(self)
+        # room state transfer: standby copies and their restore (see snapshot.py)
+        self.snapshots = SnapshotTransfer(self)
+        self.acks = AckTracker(self)
+        # CHAT admission control; see rate_limiter_from_spec for the spec
+        self.rate_limiter = rate_limiter_from_spec(self, rate_limit)
+        self.connection_manager.on_peer_message = self.process_message
+        self.connection_manager.on_peer_connected = self._on_peer_link_up
+        self._register_gauges()
+
+        # message type -> handler, used by process_message
+        self._dispatch = {
+            MessageType.CHAT: self._handle_chat,
+            MessageType.ELECTION: lambda msg: self.election_module.handle_message(msg, self.connection_manager, self.metadata_store),
+            MessageType.HEARTBEAT: self.failure_detector.handle_heartbeat,
+            MessageType.JOIN_ROOM: self._handle_join_room,
+            MessageType.LEAVE_ROOM: self._handle_leave_room,
+            MessageType.ROOM_FEDERATION: self.federation.handle_control,
+            MessageType.ROOM_DELIVER: self.federation.handle_delivery,
+            MessageType.SYNC: self.federation.handle_sync,
+            MessageType.UPDATE_NEIGHBOUR: self.update_neighbour_id,
+            MessageType.AVAILABLE_ROOMS: self._handle_available_rooms_request,
+            MessageType.METADATA_UPDATE: self._handle_metadata,
+            # only honoured on a client connection, see _handle_client_join
+            MessageType.ADMIN: lambda msg: self._handle_admin(msg, None),
+            MessageType.ROOM_DIRECTORY: self._handle_directory_request,
+            MessageType.SNAPSHOT: self.snapshots.handle_message,
+            MessageType.ACK: self.acks.handle_message,
+            MessageType.THROTTLED: self.rate_limiter.handle_message,
+        }
 
         # TODO: create room through server prompt, for now this works.
         # create a room in each server with name being a random 4 char string
@@ -72,6 +185,36 @@ class ServerNode:
             #add room to managed rooms
             self.managed_rooms[random_id] = temp_room
 
+    def _register_gauges(self):
+        m = self.metrics
+        m.gauge("holdback_depth", lambda: sum(len(r.hold_back_queue) for r in list(self.managed_rooms.values())))
+        m.gauge("rooms", lambda: len(self.managed_rooms))
+        m.gauge("clients", lambda: len(self.connection_manager.active_connections_server_to_client))
+        m.gauge("peers", lambda: len(self.connection_manager.active_connections_peer_to_peer))
+        m.gauge("undeliverable", lambda: self.connection_manager.undeliverable)
+        m.gauge("throttled_rejected", lambda: self.rate_limiter.rejected)
+        m.gauge("throttled_delayed", lambda: self.rate_limiter.delayed_total)
+
+    def start_metrics_endpoint(self, port: Optional[int] = None) -> MetricsEndpoint:
+        """Serves /metrics and /metrics.json on localhost (default: our port + METRICS_PORT_OFFSET)."""
+        self.metrics_endpoint = MetricsEndpoint(
+            self.metrics,
+            self.port + METRICS_PORT_OFFSET if port is None else port,
+            extra={
+                "links": self.connection_manager.link_stats,
+                "rate_limiter": self.rate_limiter.stats,
+                "federation": lambda: {
+                    "forwarded": self.federation.forwarded,
+                    "delivered": self.federation.delivered,
+                    "relayed": self.federation.relayed,
+                    "resyncs": self.federation.resyncs,
+                },
+                "profiler": self.profile_status,
+            },
+            pages={"/profile": self.profiler.collapsed},
+        ).start()
+        return self.metrics_endpoint
+
     # lifecycle
     def start(self):
         self.run()
@@ -89,21 +232,9 @@ class ServerNode:
 
 
     def StartFailureDetection(self):
-        start = 0
-        init = 1
+        """Starts the failure detector's periodic tick on the node's clock; returns the task."""
         self.failure_detector.start_monitoring(self.connection_manager)
-        while(True):
-            if self.state == ServerState.ELECTION_IN_PROGRESS or self.state == ServerState.LOOKING:
-                init = 1
-                start = timeit.default_timer()
-            else:
-                if init == 1:
-                    self.failure_detector.start_monitoring(self.connection_manager)
-                    init = 0
-                self.failure_detector.check_timeouts(self.connection_manager)
-                if timeit.default_timer() - start > self.failure_detector.PERIOD:
-                    self.failure_detector.send_heartbeat(self.connection_manager, self.metadata_store)
-                    start = timeit.default_timer()
+        return self.clock.call_every(self.failure_detector.TICK, self.failure_detector.tick)
 
     def run(self):
         # ---- TCP listener ----
@@ -119,9 +250,18 @@ class ServerNode:
             f"listening on {self.ip_address}:{self.port}"
         )
 
+        try:
+            self.start_metrics_endpoint()
+            print(f"[Server {self.server_id}] metrics on 127.0.0.1:{self.metrics_endpoint.port}")
+        except OSError as e:
+            print(f"[Server {self.server_id}] metrics endpoint not started:", e)
+
         # ---- UDP listener (shared) ----
-        self.udp_handler.listen(DISCOVERY_PORT, self._handle_udp_message)
-        print(f"[Server {self.server_id}] UDP discovery listening on {DISCOVERY_PORT}")
+        self.discovery.register(self.server_id, self.ip_address, self.port)
+        # keeps a registry entry fresh; see FileRegistryDiscovery
+        self.clock.call_every(REGISTRY_REFRESH, lambda: self.discovery.register(self.server_id, self.ip_address, self.port))
+        self.discovery.listen(self.udp_handler, self._handle_udp_message)
+        print(f"[Server {self.server_id}] UDP discovery listening on {self.discovery.port} ({type(self.discovery).__name__})")
 
         time.sleep(0.5) # delay for clusters to start listeners
         # self._start_server_gossip()
@@ -138,17 +278,19 @@ class ServerNode:
         t1 = threading.Thread(target=acceptTCP, daemon=True)
         t1.start()
 
-        t2 = threading.Thread(target=self.StartFailureDetection, daemon=True)
-        t2.start()
+        self.StartFailureDetection()
 
         #t3 = threading.Thread(target=self.InitRoom, daemon=True)
         #t3.start()
-        t1.join()
+        try:
+            t1.join()
+        finally:
+            self.discovery.unregister(self.server_id)
 
     # UDP handling
     def _handle_udp_message(self, msg: Message):
         if msg.type != MessageType.SERVER_DISCOVERY: # To reduce spam
-            print(f"[Server {self.server_id}] UDP received {msg.type}")
+            self.log.debug("udp_received", type=msg.type.value)
         #if msg.sender_id == self.server_id:
         #    return
 
@@ -159,8 +301,10 @@ class ServerNode:
 
             # -------- client → server discovery --------
             case MessageType.DISCOVERY_REQUEST:
-                #run handle client discovery inside of a thread to prevent responding when election is happening
-                threading.Thread(target=self._handle_client_discovery, args=(msg,)).start()
+                if self._discovery_duplicate(msg):
+                    return
+                # off the UDP thread: forwarding to the leader may block on TCP
+                self.discovery_pool.submit(self._handle_client_discovery, msg)
 
             case MessageType.DISCOVERY_RESPONSE:
                 return
@@ -168,16 +312,8 @@ class ServerNode:
     # server ↔ server discovery
 
     def _get_local_ip(self, force_loopback=True):
-        #if force_loopback:
-        #    return "127.0.0.1"
-
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        try:
-            s.connect(("8.8.8.8", 80))
-            ip = s.getsockname()[0]
-        finally:
-            s.close()
-        return ip
+        # route lookup towards the discovery target, no external host involved
+        return local_ip(self.discovery.probe_host())
 
     """ Gossip for server discovery used
     def _start_server_gossip(self):
@@ -205,7 +341,17 @@ class ServerNode:
             "port": self.port
             }),
         )
-        self.udp_handler.broadcast(msg, DISCOVERY_PORT)
+        self.discovery.announce(self.udp_handler, msg)
+
+        # backends like the file registry know peers without any UDP exchange
+        for server_id, addr in self.discovery.peers().items():
+            if str(server_id) == str(self.server_id):
+                continue
+            self._handle_server_discovery(Message(
+                type=MessageType.SERVER_DISCOVERY,
+                sender_id=server_id,
+                content=json.dumps(addr),
+            ))
 
     def _handle_server_discovery(self, msg: Message):
 
@@ -215,11 +361,13 @@ class ServerNode:
         if msg.sender_id in self.connection_manager.active_connections_peer_to_peer:
             return
 
+        if msg.sender_id in self.connection_manager.peer_links:
+            return
+
         # Only higher-ID server connects to solve win10013 error
         #if str(self.server_id) < str(msg.sender_id):
         #    return
 
-        self.state = ServerState.LOOKING
         print(f"[Server {self.server_id}] discovered peer server {msg.sender_id}")
 
         try:
@@ -231,50 +379,92 @@ class ServerNode:
                 "ip": peer_ip,
                 "port": peer_port,
             }
+            self.metadata_store.touch()
 
-            conn = self.connection_manager.connect_to(peer_ip, peer_port)
+            # connects in the background; _on_peer_link_up runs once it is up
+            self.connection_manager.register_peer(msg.sender_id, peer_ip, peer_port).connect()
 
-            self.connection_manager.active_connections_peer_to_peer[msg.sender_id] = conn
-
-            print(
-                f"[Server {self.server_id}] TCP connected to peer "
-                f"{msg.sender_id} at {peer_ip}:{peer_port}"
-            )
-
-            join_msg = Message(
-                type=MessageType.SERVER_JOIN,
-                content= str(len(self.connection_manager.active_connections_peer_to_peer)),
-                sender_id=self.server_id,
-            )
-
-            print("Ring size actually ", len(self.connection_manager.active_connections_peer_to_peer))
-            conn.send(join_msg)
-
-            self.connection_manager.listen_to_connection(conn, self.process_message)
+        except Exception as e:
+            print(f"[Server {self.server_id}] could not connect to peer:", e)
 
-            while (self.goAhead == False):
-                a = 1
-            self.goAhead = False
+    def _on_peer_link_up(self, node_id, conn, reconnect):
+        print(
+            f"[Server {self.server_id}] TCP connected to peer "
+            f"{node_id} at {conn.ip}:{conn.port}"
+        )
 
-            self._recompute_ring()
-            #time.sleep(1)
-            self.election_module.start_election(self.connection_manager)
+        join_msg = Message(
+            type=MessageType.SERVER_JOIN,
+            content= str(len(self.connection_manager.active_connections_peer_to_peer)),
+            sender_id=self.server_id,
+            headers={COMPRESS_HEADER: CODEC},
+        )
 
-        except Exception as e:
-            print(f"[Server {self.server_id}] could not connect to peer:", e)
+        print("Ring size actually ", len(self.connection_manager.active_connections_peer_to_peer))
+        conn.send(join_msg)
 
+        # a link coming back after a blip is the same member, the ring is unchanged
+        if not reconnect:
+            # ring recompute + election happen once per join window, not per peer
+            self.join_coalescer.note_join(node_id)
 
     # client → server discovery
 
+    def _discovery_duplicate(self, msg: Message) -> bool:
+        """True for a repeat of a request from the same client within DISCOVERY_DEDUP_WINDOW."""
+        now = self.clock.now()
+        seen = self._discovery_seen
+        while seen:
+            at = next(iter(seen.values()))
+            if now - at < DISCOVERY_DEDUP_WINDOW and len(seen) < DISCOVERY_DEDUP_MAX:
+                break
+            seen.popitem(last=False)
+        # the content holds the attempt and query; a new page is not a repeat
+        key = (msg.sender_id, msg.sender_addr, msg.content)
+        if key in seen:
+            self.metrics.counter("discovery_requests", result="duplicate").inc()
+            return True
+        seen[key] = now
+        return False
+
+    def _discovery_responder(self, msg: Message) -> Optional[str]:
+        """
+        The ring member that answers this client, so one node replies to a
+        broadcast instead of all of them. A retry (higher attempt) moves to the
+        next member in case the previous one is down. None while this node is
+        not in a ring yet; then it answers as before.
+        """
+        if len(self.ring) < 2 or self.server_id not in self.ring:
+            return None
+        request = _discovery_request(msg)
+        if request.get("direct"):
+            return self.server_id
+        key = zlib.crc32(str(msg.sender_id).encode()) + int(request.get("attempt", 0))
+        return self.ring[key % len(self.ring)]
+
     def _handle_client_discovery(self, msg: Message):
-        print(f"[Server {self.server_id}] client discovery from {msg.sender_id}")
+        self.log.debug("client_discovery", client=msg.sender_id)
 
-        #block until election is done
-        while self.state == ServerState.LOOKING:
-            time.sleep(0.1)
+        responder = self._discovery_responder(msg)
+        if responder is not None and responder != self.server_id:
+            self.metrics.counter("discovery_requests", result="other_responder").inc()
+            return
+        self.metrics.counter("discovery_requests", result="handled").inc()
 
+        query = DirectoryPayload.from_dict(_discovery_request(msg))
         if self.state == ServerState.LEADER:
-            self._send_rooms_to_client(msg.sender_addr)
+            self._send_rooms_to_client(msg.sender_addr, query)
+            return
+
+        # Followers answer from their replicated room_locations while the read
+        # lease from the last leader sync holds, even during an election.
+        if self.metadata_store.lease_valid():
+            self._send_rooms_to_client(msg.sender_addr, query)
+            return
+
+        # No fresh replica: hand the lookup to the leader. If there is none yet
+        # the request is dropped and the client's discovery retry picks it up.
+        if self.leader_id == '0':
             return
 
         forward = Message(
@@ -283,6 +473,7 @@ class ServerNode:
             content=json.dumps({
                 "client_ip": msg.sender_addr[0],
                 "client_port": msg.sender_addr[1],
+                "query": query.to_dict(),
             }),
         )
 
@@ -297,47 +488,88 @@ class ServerNode:
             )
             #print('Received address ' + str(addr[0]) + ' ' + str(addr[1]))
             msg = conn.receive()
+            self.handle_join_message(msg, conn)
+
+        except Exception as e:
+            print(f"[Server {self.server_id}] join error:", e)
+
+    # first frame on a freshly accepted connection decides what the peer is
+    def handle_join_message(self, msg: Message, conn):
+        try:
+            # the joining side reads compressed frames, see compression.py
+            if msg.headers.get(COMPRESS_HEADER) == CODEC:
+                conn.enable_compression()
 
             if msg.type == MessageType.CLIENT_JOIN:
                 self._handle_client_join(msg, conn)
 
+            elif msg.type == MessageType.SERVER_JOIN and msg.headers.get(LANE_HEADER) == DATA:
+                self._handle_data_lane(msg, conn)
+
             elif msg.type == MessageType.SERVER_JOIN:
-                self.state = ServerState.LOOKING
+                reconnect = msg.sender_id in self.connection_manager.active_connections_peer_to_peer
                 self._handle_server_join(msg, conn)
-                self.receivedDiscoveryResponses = self.receivedDiscoveryResponses + 1
-                print('Received Ring size ', str(msg.content))
-                if self.receivedDiscoveryResponses >= int(msg.content):
-                    print("Ring Actually done")
-                    self.receivedDiscoveryResponses = 0
-                    GoAhead = Message(type = MessageType.RING_STABILIZED, sender_id = self.server_id)
-                    for i in self.connection_manager.active_connections_peer_to_peer.keys():
-                        self.connection_manager.send_to_node(i,GoAhead)
-                    self._recompute_ring()
-                    #time.sleep(2)
-                    self.election_module.start_election(self.connection_manager)
+                self.log.debug("server_join", peer=msg.sender_id, ring_size=msg.content)
+                if not reconnect:
+                    self.join_coalescer.note_join(msg.sender_id)
 
         except Exception as e:
             print(f"[Server {self.server_id}] join error:", e)
 
     def _handle_client_join(self, msg: Message, conn):
         self.connection_manager.active_connections_server_to_client[msg.sender_id] = conn
-        print(f"[Server {self.server_id}] client joined: {msg.sender_id}")
+        self.log.info("client_joined", client=msg.sender_id)
+        if msg.headers.get(ACK_HEADER):
+            self.acks.subscribe(msg.sender_id)
+
+        def on_close():
+            # a reconnect under the same id has replaced this connection already
+            if self.connection_manager.active_connections_server_to_client.get(msg.sender_id) is conn:
+                self.drop_client(msg.sender_id)
+
+        def on_message(m: Message):
+            # ADMIN is authorized by the connection it came in on, never by
+            # the sender_id it claims
+            if m.type == MessageType.ADMIN:
+                self._handle_admin(m, conn)
+            elif m.type == MessageType.ACK:
+                self.acks.handle_message(m, from_client=True)
+            elif m.type == MessageType.THROTTLED:
+                self.rate_limiter.handle_message(m, from_client=True)
+            else:
+                self.process_message(m)
 
-        self.connection_manager.listen_to_connection(conn, self.process_message)
+        self.connection_manager.listen_to_connection(conn, on_message, on_close=on_close)
 
-        print(self.managed_rooms)
         #self.failure_detector.start_monitoring_clients()
 
+    def _handle_data_lane(self, msg: Message, conn):
+        # a known peer's second connection, for data frames; no ring change
+        cm = self.connection_manager
+        cm.data_connections[msg.sender_id] = conn
+        self.log.debug("data_lane_up", peer=msg.sender_id)
+        cm.listen_to_connection(conn, self.process_message, on_close=lambda: cm.drop_data_connection(msg.sender_id, conn))
+
     def _handle_server_join(self, msg: Message, conn):
         self.connection_manager.active_connections_peer_to_peer[msg.sender_id] = conn
         print(f"[Server {self.server_id}] peer joined: {msg.sender_id}")
 
+        # with a known address the link can be re-opened from this side as well
+        if msg.sender_id in self.servers:
+            addr = self.servers[msg.sender_id]
+            self.connection_manager.register_peer(msg.sender_id, addr["ip"], addr["port"])
+
         """self.servers[msg.sender_id] = {
             "ip": conn.ip,
             "port": conn.port,
         }"""
 
-        self.connection_manager.listen_to_connection(conn, self.process_message)
+        def on_close():
+            link = self.connection_manager.peer_links.get(msg.sender_id)
+            if link is not None:
+                link.connection_lost(conn)
+
+        self.connection_manager.listen_to_connection(conn, self.process_message, on_close=on_close)
 
         if self.state == ServerState.LEADER:
             self.metadata_store.sync_with_leader(
@@ -346,30 +578,122 @@ class ServerNode:
                 self.connection_manager
             )
 
-    def _send_rooms_to_client(self, addr):
-        print(
-            f"[Leader {self.server_id}] sending rooms:",
-            self.metadata_store.room_locations
-        )
-
-        for i in self.connection_manager.active_connections_peer_to_peer.keys():
-            ip = self.connection_manager.active_connections_peer_to_peer[i].ip
-            port = self.connection_manager.active_connections_peer_to_peer[i].port
-            self.servers[i] = {'ip' : ip, 'port' : port}
-            print(self.connection_manager.active_connections_peer_to_peer[i].stringify())
-
-        response = Message(
-            type=MessageType.AVAILABLE_ROOMS,
-            sender_id=self.server_id,
-            content=json.dumps({
-                "rooms": self.metadata_store.room_locations,
-                "servers": self.servers,
-            }),
+    def _send_rooms_to_client(self, addr, query: Optional[DirectoryPayload] = None):
+        for i in list(self.connection_manager.active_connections_peer_to_peer.keys()):
+            # accepted links carry the peer's ephemeral port, so only fill gaps
+            if i in self.servers:
+                continue
+            conn = self.connection_manager.active_connections_peer_to_peer.get(i)
+            if conn is None:
+                continue
+            self.servers[i] = {'ip' : conn.ip, 'port' : conn.port}
+            self.metadata_store.touch()
+
+        self.log.debug("send_rooms", client=addr, rooms=len(self.metadata_store.room_locations))
+        self.udp_handler.send_bytes(self._available_rooms_frame(query or DirectoryPayload()), addr)
+
+    def directory_page(self, query: DirectoryPayload, max_page: int = DIRECTORY_MAX_PAGE) -> DirectoryPayload:
+        """One page of the room directory for `query`, with the owners' addresses."""
+        limit = min(query.limit or DIRECTORY_PAGE_SIZE, max_page)
+        offset = max(0, query.offset)
+        entries, total = self.metadata_store.directory.page(query.prefix, offset, limit, query.order)
+        page = DirectoryPayload(query.prefix, offset, limit, query.order, total=total)
+        for room_id, owner, members in entries:
+            page.rooms[room_id] = owner
+            page.members[room_id] = members
+            if owner in self.servers:
+                page.servers[owner] = self.servers[owner]
+        if offset + len(entries) < total:
+            page.next_offset = offset + len(entries)
+        return page
+
+    def _available_rooms_frame(self, query: DirectoryPayload) -> bytes:
+        """
+        AVAILABLE_ROOMS datagram with one directory page. Pages are encoded
+        once per metadata version, and shrunk until they fit
+        DIRECTORY_MAX_DATAGRAM; the client asks for the rest by offset.
+        """
+        # read the version first: a change during encoding then only causes a re-encode
+        version = self.metadata_store.version
+        if version != self._rooms_frames_version:
+            self._rooms_frames = {}
+            self._rooms_frames_version = version
+        key = (query.prefix, query.offset, query.limit, query.order)
+        frame = self._rooms_frames.get(key)
+        if frame is not None:
+            return frame
+
+        max_page = DIRECTORY_MAX_PAGE
+        while True:
+            page = self.directory_page(query, max_page)
+            frame = Message(
+                type=MessageType.AVAILABLE_ROOMS,
+                sender_id=self.server_id,
+                content=page.encode(),
+            ).serialize()
+            if len(frame) <= DIRECTORY_MAX_DATAGRAM or len(page.rooms) <= 1:
+                break
+            max_page = len(page.rooms) // 2
+        if len(self._rooms_frames) < 64:
+            self._rooms_frames[key] = frame
+        self.metrics.counter("available_rooms_encoded").inc()
+        return frame
+
+    def _handle_directory_request(self, msg: Message):
+        """ROOM_DIRECTORY from a connected client: a page over TCP, up to DIRECTORY_MAX_PAGE rooms."""
+        conn = self.connection_manager.active_connections_server_to_client.get(msg.sender_id)
+        if conn is None:
+            return
+        page = self.directory_page(DirectoryPayload.from_message(msg))
+        conn.send(page.to_message(self.server_id))
 
-        )
-        print("GLOBAL METADATA:", self.metadata_store.room_locations)
+    # ---------- member counts for the directory ----------
 
-        self.udp_handler.send_to(response, addr)
+    def _note_members(self, room_id: str):
+        room = self.managed_rooms.get(room_id)
+        if room is not None:
+            count = len(room.client_ids)
+        else:
+            count = len(self.federation.edge_members.get(room_id, ()))
+        if self.state == ServerState.LEADER:
+            self.metadata_store.set_members({room_id: count}, self.server_id)
+            return
+        # followers report to the leader, at most once per interval
+        self._member_reports[room_id] = count
+        if self._member_report_timer is None:
+            self._member_report_timer = self.clock.call_later(DIRECTORY_REPORT_INTERVAL, self._report_members)
+
+    def _local_member_counts(self) -> Dict[str, int]:
+        counts = {room_id: len(room.client_ids) for room_id, room in self.managed_rooms.items() if room.client_ids}
+        for room_id, members in self.federation.edge_members.items():
+            counts[room_id] = len(members)
+        return counts
+
+    def on_leader_known(self):
+        """
+        Called by the election module once the leader is known. The leader
+        sums member counts from the nodes' own reports, so a new leader drops
+        the totals it held as a follower and every node reports all of its
+        rooms to it again.
+        """
+        counts = self._local_member_counts()
+        if self.state == ServerState.LEADER:
+            self.metadata_store.drop_node("")
+            self.metadata_store.set_members(counts, self.server_id)
+        elif counts and self.leader_id != '0':
+            report = MetadataPayload(MetadataAction.ROOM_STATS, members=counts).to_message(self.server_id)
+            self.connection_manager.send_to_node(self.leader_id, report)
+
+    def _report_members(self):
+        self._member_report_timer = None
+        counts, self._member_reports = self._member_reports, {}
+        if not counts:
+            return
+        if self.state == ServerState.LEADER:
+            self.metadata_store.set_members(counts, self.server_id)
+        elif self.leader_id != '0':
+            report = MetadataPayload(MetadataAction.ROOM_STATS, members=counts).to_message(self.server_id)
+            self.connection_manager.send_to_node(self.leader_id, report)
 
     #Neighbor lookup
     def get_neighbors(self, my_id):
@@ -385,12 +709,23 @@ class ServerNode:
 
     # chat / control plane
 
-    def create_room(self, room_id: str) -> Room:
-        """Creates a new room with this node as the host."""
+    def create_room(self, room_id: str, relay_fanout: int = 0, batch_interval: float = 0.0, batch_size: int = 0) -> Room:
+        """
+        Creates a new room with this node as the host. With relay_fanout > 0,
+        deliveries to edge servers go through a relay tree of that width
+        instead of one frame per edge. batch_interval (seconds) / batch_size
+        turn on BATCH frames to local members.
+        """
         if room_id not in self.managed_rooms:
-            self.managed_rooms[room_id] = Room(host=self, room_id=room_id)
+            self.managed_rooms[room_id] = Room(
+                host=self,
+                room_id=room_id,
+                relay_fanout=relay_fanout,
+                batch_interval=batch_interval,
+                batch_size=batch_size,
+            )
             print(f"[Server {self.server_id}] created room {room_id}")
-            self.metadata_store.room_locations[room_id] = self.server_id
+            self.metadata_store.set_room(room_id, self.server_id)
             #if self.leader_id is not None:
             #    self.metadata_store.update_metadata(room_id, self, self.connection_manager)
 
@@ -407,15 +742,63 @@ class ServerNode:
         room_id = msg.room_id
         client_id = msg.sender_id
 
+        # hosted elsewhere: serve it from here as an edge
+        if room_id not in self.managed_rooms and self.federation.owner_of(room_id) is not None:
+            self.federation.local_join(room_id, client_id)
+            self.memberships.add(client_id, room_id)
+            self._note_members(room_id)
+            self.log.info("joined_remote_room", client=client_id, room=room_id)
+            return
+
         if room_id not in self.managed_rooms:
             self.managed_rooms[room_id] = Room(self, room_id) # Added self
             print(f"[Server {self.server_id}] created room {room_id}")
 
-        self.managed_rooms[room_id].add_client(client_id)
-
-        print(
-            f"[Server {self.server_id}] client {client_id} joined room {room_id}"
-        )
+        room = self.managed_rooms[room_id]
+        with room.lock:
+            # deliveries still waiting in a batch are covered by the room clock
+            self.multicast_handler.flush_batch(room)
+            room.add_client(client_id)
+            self.memberships.add(client_id, room_id)
+            self._note_members(room_id)
+
+            # tell the client where the room's history starts, so its hold-back
+            # buffer does not wait for messages delivered before it joined
+            conn = self.connection_manager.active_connections_server_to_client.get(client_id)
+            if conn is not None:
+                conn.send(Message(
+                    type=MessageType.SYNC,
+                    sender_id=self.server_id,
+                    room_id=room_id,
+                    vector_clock=room.vector_clock.copy(),
+                ))
+
+        self.log.info("joined_room", client=client_id, room=room_id)
+
+    def _handle_leave_room(self, msg: Message):
+        self.memberships.remove(msg.sender_id, msg.room_id)
+        self._remove_member(msg.room_id, msg.sender_id)
+
+    def _remove_member(self, room_id: str, client_id):
+        if room_id in self.managed_rooms:
+            self.managed_rooms[room_id].remove_client(client_id)
+        else:
+            self.federation.local_leave(room_id, client_id)
+        self._note_members(room_id)
+
+    def drop_client(self, client_id):
+        """
+        Forgets a client whose connection closed or timed out: the connection,
+        its rate limit state and its memberships, found through the reverse
+        index rather than by scanning every room.
+        """
+        self.connection_manager.active_connections_server_to_client.pop(client_id, None)
+        self.rate_limiter.forget_client(client_id)
+        self.acks.forget(client_id)
+        rooms = self.memberships.pop_client(client_id)
+        for room_id in rooms:
+            self._remove_member(room_id, client_id)
+        self.log.info("client_dropped", client=client_id, rooms=len(rooms))
 
     def _recompute_ring(self):
         members = [self.server_id]
@@ -439,80 +822,162 @@ class ServerNode:
         print(" members:", self.ring)
         print(" left:", left)
         print(" right:", right)
+        self._sync_standby_rooms()
+
+    def _handle_metadata(self, msg: Message):
+        self.metadata_store.handle_message(msg, self.connection_manager)
+        self._sync_standby_rooms()
+
+    # standby copies of rooms (see snapshot.py)
+
+    def _standby_of(self, server_id) -> Optional[NodeId]:
+        """The server keeping standby copies of `server_id`'s rooms: its left neighbour in the ring."""
+        ring = [str(i) for i in self.ring]
+        if len(ring) < 2 or str(server_id) not in ring:
+            return None
+        return self.ring[(ring.index(str(server_id)) + 1) % len(ring)]
+
+    def _sync_standby_rooms(self):
+        """
+        Run when the room map or the ring changes. A room of ours in the map
+        that we do not host was lost when this node went down; it is restored
+        from our standby. A room whose host we are the standby of gets copied.
+        """
+        me = str(self.server_id)
+        for room_id, owner in list(self.metadata_store.room_locations.items()):
+            if room_id in self.managed_rooms or self.snapshots.pending(room_id):
+                continue
+            if str(owner) == me:
+                standby = self._standby_of(owner)
+                if standby is not None:
+                    self.snapshots.request(room_id, standby, on_complete=self._restore_room)
+            elif room_id not in self.snapshots.replicas and str(self._standby_of(owner)) == me:
+                self.snapshots.request(room_id, owner)
+
+    def _restore_room(self, room: Room):
+        if room.room_id in self.managed_rooms:
+            return
+        # its members were connected to this node before it went down; they join again
+        room.client_ids = MemberSet()
+        self.managed_rooms[room.room_id] = room
+        print(f"[Server {self.server_id}] restored room {room.room_id} ({len(room.message_history)} messages)")
 
     def _handle_available_rooms(self, msg: Message):
         data = json.loads(msg.content)
 
         client_ip = data["client_ip"]
         client_port = data["client_port"]
+        query = DirectoryPayload.from_dict(data.get("query", {}))
 
-        response = Message(
-            type=MessageType.AVAILABLE_ROOMS,
-            sender_id=self.server_id,
-            content=json.dumps({
-                "rooms": self.metadata_store.room_locations,
-                "servers": self.servers,
-            }),
-        )
-        print('sending the following to the client')
-        print(self.metadata_store.room_locations)
-        print(self.servers)
-
-        self.udp_handler.send_to(response, (client_ip, client_port))
+        self.log.debug("send_rooms", client=(client_ip, client_port), rooms=len(self.metadata_store.room_locations))
+        self.udp_handler.send_bytes(self._available_rooms_frame(query), (client_ip, client_port))
 
 
     def update_neighbour_id(self, msg: Message):
-        con = msg.content.split()
-        #print(con)
-        command = con[0]
-        id = con[1]
-        if command == 'left':
-            self.left_neighbor.id = id
-            print('Updated my left to ', id)
-        elif command == 'right':
-            self.right_neighbor.id = id
-            print('Updated my right to ', id)
+        payload = NeighbourPayload.from_message(msg)
+        if payload.side == NeighbourSide.LEFT:
+            self.left_neighbor.id = payload.node_id
+            print('Updated my left to ', payload.node_id)
+        elif payload.side == NeighbourSide.RIGHT:
+            self.right_neighbor.id = payload.node_id
+            print('Updated my right to ', payload.node_id)
         self.state = ServerState.ELECTION_IN_PROGRESS
-        time.sleep(0.1)
+        self.clock.call_later(self.RING_SETTLE, self._ring_settled)
+
+    def _ring_settled(self):
         self.state = ServerState.FOLLOWER
 
+    def _handle_chat(self, msg: Message):
+        # a copy of a delivered message is dropped before it costs a token;
+        # read-only, the dedup cache proper runs once the message is admitted
+        room = self.managed_rooms.get(msg.room_id)
+        if room is not None:
+            seq = msg.vector_clock.timestamps.get(msg.sender_id, 0)
+            if 0 < seq <= room.vector_clock.timestamps.get(msg.sender_id, 0):
+                self._duplicate(msg)
+                return
+        # admission control before any causal processing
+        if not self.rate_limiter.admit(msg, self._process_chat):
+            return
+        self._process_chat(msg)
+
+    def _process_chat(self, msg: Message):
+        # reached from reader threads and from the rate limiter's drain timer;
+        # the room lock puts both in one order
+        if msg.room_id in self.managed_rooms:
+            room = self.managed_rooms[msg.room_id]
+            with room.lock:
+                if room.dedup.seen(msg, room.vector_clock.timestamps.get(msg.sender_id, 0)):
+                    self._duplicate(msg)
+                    return
+                self.multicast_handler.handle_chat_message(msg, room)
+        elif self.federation.is_remote(msg.room_id):
+            self.federation.forward_chat(msg)
+        else:
+            self.log.warning("room_not_found", room=msg.room_id, sender=msg.sender_id)
+
+    def _duplicate(self, msg: Message):
+        self._duplicates.inc()
+        self.log.debug("duplicate_chat", room=msg.room_id, sender=msg.sender_id, message=msg.message_id)
+
+    def _handle_available_rooms_request(self, msg: Message):
+        if self.state == ServerState.LEADER:
+            self._handle_available_rooms(msg)
+
     def process_message(self, msg: Message):
-        match msg.type:
-            case MessageType.CHAT:
-                if msg.room_id in self.managed_rooms:
-                    room = self.managed_rooms[msg.room_id]
-                    self.multicast_handler.handle_chat_message(msg, room)
-                else:
-                    print(
-                        f"[Server {self.server_id}] "
-                        f"room {msg.room_id} not found"
-                    )
-
-            case MessageType.ELECTION:
-                self.election_module.handle_message(msg, self.connection_manager, self.metadata_store)
-
-            case MessageType.HEARTBEAT:
-                self.failure_detector.handle_heartbeat(msg)
-
-            case MessageType.JOIN_ROOM:
-                self._handle_join_room(msg)
-
-            case MessageType.UPDATE_NEIGHBOUR:
-                self.update_neighbour_id(msg)
-
-            case MessageType.AVAILABLE_ROOMS:
-                if self.state == ServerState.LEADER:
-                    self._handle_available_rooms(msg)
-
-            case MessageType.METADATA_UPDATE:
-                self.metadata_store.handle_message(msg, self.connection_manager)
-
-            case MessageType.RING_STABILIZED:
-                print('Received Go Ahead')
-                self.goAhead = True
-
-            case _:
-                print(
-                    f"[Server {self.server_id}] "
-                    f"unknown message type: {msg.type}"
-                )
+        counter = self._frames_in.get(msg.type)
+        if counter is None:
+            counter = self._frames_in[msg.type] = self.metrics.counter("frames_in", type=msg.type.value)
+        counter.inc()
+
+        handler = self._dispatch.get(msg.type)
+        if handler is None:
+            self.log.warning("unknown_message_type", type=msg.type)
+            return
+        if self.timer.enabled:
+            self.timer.run(msg.type.value, self._handler_name(msg.type, handler), handler, msg)
+            return
+        handler(msg)
+
+    def _handler_name(self, kind: MessageType, handler) -> str:
+        name = self._handler_names.get(kind)
+        if name is None:
+            # lambdas in the dispatch table delegate to a component
+            name = handler.__name__
+            if name == "<lambda>":
+                name = kind.value.lower()
+            self._handler_names[kind] = name
+        return name
+
+    # ---------- admin / profiling ----------
+
+    def _handle_admin(self, msg: Message, conn):
+        if not self.admin_enabled or conn is None or not str(conn.ip).startswith("127."):
+            self.log.warning("admin_refused", sender=msg.sender_id, peer=conn.stringify() if conn else None)
+            return
+        payload = AdminPayload.from_message(msg)
+        result = self.admin(payload.command, payload.interval)
+        conn.send(AdminPayload(payload.command, result=result).to_message(self.server_id))
+
+    def admin(self, command: AdminCommand, interval: float = 0.0) -> Dict:
+        if command == AdminCommand.TIMING_ON:
+            self.timer.enabled = True
+        elif command == AdminCommand.TIMING_OFF:
+            self.timer.enabled = False
+        elif command == AdminCommand.PROFILE_START:
+            self.profiler.reset()
+            self.profiler.start(interval)
+        elif command == AdminCommand.PROFILE_STOP:
+            self.profiler.stop()
+        elif command == AdminCommand.PROFILE_DUMP:
+            # the stacks go back in the reply; src.client.admin writes them out
+            return {"collapsed": self.profiler.collapsed()}
+        self.log.info("admin", command=command.value)
+        return self.profile_status()
+
+    def profile_status(self) -> Dict:
+        return {
+            "timing": self.timer.enabled,
+            "sampling": self.profiler.running,
+            "samples": self.profiler.sample_count,
+        }
@@ -0,0 +1,365 @@
+import base64
+import binascii
+import hashlib
+import json
+import threading
+import uuid
+import zlib
+from collections import OrderedDict
+from typing import Callable, Dict, Iterator, List, Optional
+
+from ..domain.models import Message, NodeId, Room, VectorClock
+from ..domain.control import SnapshotAction, SnapshotPayload
+from ..network.constants import (
+    SNAPSHOT_CHUNK_SIZE,
+    SNAPSHOT_HISTORY,
+    SNAPSHOT_MAX_RETRIES,
+    SNAPSHOT_RETRY,
+    SNAPSHOT_STALL_TIMEOUT,
+    SNAPSHOT_WINDOW,
+)
+from ..observability.log import get_logger
+
+log = get_logger("snapshot")
+
+# ROOM SNAPSHOTS
+# Copies a room's state from its host to another server over their peer link.
+# The node uses it for standby copies: the host's left neighbour in the ring
+# takes a copy of each of its rooms when it learns of them, and a node that
+# comes back under its old id and finds its rooms in the room map restores
+# them from that standby (ServerNode._sync_standby_rooms). A standby copy is
+# as recent as the transfer that made it. A server serves a request from the
+# rooms it hosts or, failing that, from its standby copies.
+#
+# The state is a byte stream of JSON lines: a header (room clock, members,
+# settings) and then one line per message, the most recent `history` ones at
+# snapshot time followed by the log tail: what the room delivered while those
+# were being sent. The tail ends there, so a room that delivers faster than
+# the link drains cannot keep a transfer open; END's clock says how far the
+# copy reaches. The stream is produced lazily and cut into
+# SNAPSHOT_CHUNK_SIZE chunks, each with a crc32; END carries the chunk count
+# and a sha256 of the whole stream.
+#
+# Flow control is a sliding window: at most SNAPSHOT_WINDOW chunks are unacked,
+# the receiver acks cumulatively (seq = next chunk expected) and every ack lets
+# the sender put more on the link. A large history therefore goes out in small
+# steps between other frames, and heartbeats on the same link never queue
+# behind more than a window of snapshot data. A damaged or missing chunk is
+# asked for again with resend; a stalled transfer resends its window after
+# SNAPSHOT_RETRY and gives up after SNAPSHOT_MAX_RETRIES; the receiver drops a
+# transfer that got nothing for SNAPSHOT_STALL_TIMEOUT.
+
+OnComplete = Callable[[Room], None]
+
+
+def _crc(data: bytes) -> str:
+    return format(zlib.crc32(data), "08x")
+
+
+class _Outgoing:
+    def __init__(self, transfer_id: str, room: Room, target: NodeId, history: int):
+        self.transfer_id = transfer_id
+        self.room = room
+        self.target = target
+        self.clock = VectorClock()
+        self.chunks = self._chunks(history)
+        self.unacked: "OrderedDict[int, Message]" = OrderedDict()
+        self.next_seq = 0
+        self.size = 0
+        self.sha = hashlib.sha256()
+        self.exhausted = False
+        self.end: Optional[Message] = None
+        self.end_seq = 0
+        self.retries = 0
+        self.progress = 0
+        self.timer = None
+
+    def _lines(self, history: int) -> Iterator[bytes]:
+        room = self.room
+        messages = room.message_history
+        start = max(0, len(messages) - history)
+        self.clock = room.vector_clock.copy()
+        yield json.dumps({
+            "room_id": room.room_id,
+            "clock": self.clock.timestamps,
+            "members": list(room.client_ids),
+            "delivery_seq": room.delivery_seq,
+            "relay_fanout": room.relay_fanout,
+            "batch_interval": room.batch_interval,
+            "batch_size": room.batch_size,
+        }).encode("utf-8")
+        # the snapshot, then once the log tail: what was delivered meanwhile
+        i = start
+        for _ in range(2):
+            end = len(messages)
+            while i < end:
+                msg = messages[i]
+                self.clock.merge(msg.vector_clock)
+                yield msg.serialize()
+                i += 1
+
+    def _chunks(self, history: int) -> Iterator[bytes]:
+        buf = bytearray()
+        for line in self._lines(history):
+            buf += line
+            buf += b"\n"
+            while len(buf) >= SNAPSHOT_CHUNK_SIZE:
+                yield bytes(buf[:SNAPSHOT_CHUNK_SIZE])
+                del buf[:SNAPSHOT_CHUNK_SIZE]
+        if buf:
+            yield bytes(buf)
+
+
+class _Incoming:
+    def __init__(self, transfer_id: str, room_id: str, source: NodeId, on_complete: Optional[OnComplete]):
+        self.transfer_id = transfer_id
+        self.room_id = room_id
+        self.source = source
+        self.on_complete = on_complete
+        self.expected = 0
+        self.size = 0
+        self.sha = hashlib.sha256()
+        self.partial = bytearray()
+        self.header: Optional[Dict] = None
+        self.history: List[Message] = []
+        self.progress = 0
+        self.timer = None
+
+    def feed(self, data: bytes):
+        self.size += len(data)
+        self.sha.update(data)
+        self.partial += data
+        *lines, rest = self.partial.split(b"\n")
+        self.partial = bytearray(rest)
+        for line in lines:
+            if self.header is None:
+                self.header = json.loads(line)
+            else:
+                self.history.append(Message.deserialize(line))
+
+
+class SnapshotTransfer:
+    """Sender and receiver side of room snapshots for one node."""
+    def __init__(self, node, window: int = SNAPSHOT_WINDOW, retry: float = SNAPSHOT_RETRY,
+                 stall_timeout: float = SNAPSHOT_STALL_TIMEOUT):
+        self.node = node
+        self.window = window
+        self.retry = retry
+        self.stall_timeout = stall_timeout
+        self.outgoing: Dict[str, _Outgoing] = {}
+        self.incoming: Dict[str, _Incoming] = {}
+        # rooms received without an on_complete callback, e.g. standby replicas
+        self.replicas: Dict[str, Room] = {}
+        self._lock = threading.RLock()
+
+    def _send(self, target: NodeId, payload: SnapshotPayload):
+        self.node.connection_manager.send_to_node(target, payload.to_message(self.node.server_id))
+
+    # ---------- receiver ----------
+
+    def request(self, room_id: str, source: NodeId, on_complete: Optional[OnComplete] = None, history: int = 0) -> str:
+        """Asks `source` (the room's host) for a snapshot of `room_id`; returns the transfer id."""
+        transfer_id = str(uuid.uuid4())
+        t = _Incoming(transfer_id, room_id, source, on_complete)
+        with self._lock:
+            self.incoming[transfer_id] = t
+        self._send(source, SnapshotPayload(SnapshotAction.REQUEST, room_id, transfer_id, history=history))
+        self._arm_incoming(t)
+        return transfer_id
+
+    def pending(self, room_id: str) -> bool:
+        """True while a transfer of `room_id` to this node is running."""
+        with self._lock:
+            return any(t.room_id == room_id for t in self.incoming.values())
+
+    def _arm_incoming(self, t: _Incoming):
+        seen = t.progress
+
+        def check():
+            with self._lock:
+                if t.transfer_id not in self.incoming:
+                    return
+            if t.progress == seen:
+                self._abort(t.source, t.room_id, t.transfer_id, "receiver timed out")
+                self._finish_incoming(t, None, "timeout")
+                return
+            self._arm_incoming(t)
+
+        t.timer = self.node.clock.call_later(self.stall_timeout, check)
+
+    def _on_chunk(self, p: SnapshotPayload, t: _Incoming):
+        t.progress += 1
+        if p.seq < t.expected:
+            # a resent chunk we already have: the ack was lost or is in flight
+            self._ack(t)
+            return
+        try:
+            data = base64.b64decode(p.data)
+        except binascii.Error:
+            data = None
+        if p.seq > t.expected or data is None or _crc(data) != p.checksum:
+            self.node.metrics.counter("snapshot_chunks_rejected").inc()
+            self._ack(t, resend=True)
+            return
+        t.feed(data)
+        t.expected += 1
+        self._ack(t)
+
+    def _ack(self, t: _Incoming, resend: bool = False):
+        self._send(t.source, SnapshotPayload(SnapshotAction.ACK, t.room_id, t.transfer_id, seq=t.expected, resend=resend))
+
+    def _on_end(self, p: SnapshotPayload, t: _Incoming):
+        t.progress += 1
+        if p.seq != t.expected:
+            self._ack(t, resend=True)
+            return
+        if p.size != t.size or p.checksum != t.sha.hexdigest() or t.partial or t.header is None:
+            self._abort(t.source, t.room_id, t.transfer_id, "checksum mismatch")
+            self._finish_incoming(t, None)
+            return
+        # acking past the last chunk tells the sender it can forget the transfer
+        t.expected += 1
+        self._ack(t)
+
+        header = t.header
+        clock = VectorClock(dict(header["clock"]))
+        for msg in t.history:
+            clock.merge(msg.vector_clock)
+        clock.merge(VectorClock(dict(p.clock)))
+        room = Room(
+            host=self.node,
+            room_id=t.room_id,
+            client_ids=header["members"],
+            message_history=t.history,
+            vector_clock=clock,
+            delivery_seq=header["delivery_seq"],
+            relay_fanout=header["relay_fanout"],
+            batch_interval=header["batch_interval"],
+            batch_size=header["batch_size"],
+        )
+        self._finish_incoming(t, room)
+
+    def _finish_incoming(self, t: _Incoming, room: Optional[Room], result: str = ""):
+        with self._lock:
+            self.incoming.pop(t.transfer_id, None)
+        if t.timer is not None:
+            t.timer.cancel()
+        result = result or ("ok" if room is not None else "failed")
+        self.node.metrics.counter("snapshots_received", result=result).inc()
+        log.info("snapshot_received", node=self.node.server_id, room=t.room_id, result=result,
+                 bytes=t.size, messages=len(t.history))
+        if room is None:
+            return
+        if t.on_complete is not None:
+            t.on_complete(room)
+        else:
+            self.replicas[room.room_id] = room
+
+    # ---------- sender ----------
+
+    def _on_request(self, p: SnapshotPayload, source: NodeId):
+        room = self.node.managed_rooms.get(p.room_id) or self.replicas.get(p.room_id)
+        if room is None:
+            self._abort(source, p.room_id, p.transfer_id, "room not hosted here")
+            return
+        t = _Outgoing(p.transfer_id, room, source, p.history or SNAPSHOT_HISTORY)
+        with self._lock:
+            self.outgoing[p.transfer_id] = t
+            self._fill(t)
+        self._arm(t)
+
+    def _on_ack(self, p: SnapshotPayload, t: _Outgoing):
+        with self._lock:
+            if t.end is not None and p.seq > t.end_seq:
+                self._finish_outgoing(t, "ok")
+                return
+            for seq in [seq for seq in t.unacked if seq < p.seq]:
+                del t.unacked[seq]
+            t.progress += 1
+            t.retries = 0
+            if p.resend:
+                self._resend(t)
+            self._fill(t)
+
+    def _fill(self, t: _Outgoing):
+        while len(t.unacked) < self.window and not t.exhausted:
+            data = next(t.chunks, None)
+            if data is None:
+                t.exhausted = True
+                break
+            t.sha.update(data)
+            t.size += len(data)
+            chunk = SnapshotPayload(SnapshotAction.CHUNK, t.room.room_id, t.transfer_id, seq=t.next_seq,
+                                    data=base64.b64encode(data).decode("ascii"), checksum=_crc(data))
+            msg = chunk.to_message(self.node.server_id)
+            t.unacked[t.next_seq] = msg
+            t.next_seq += 1
+            self.node.connection_manager.send_to_node(t.target, msg)
+            self.node.metrics.counter("snapshot_chunks_sent").inc()
+            self.node.metrics.counter("snapshot_bytes_sent").inc(len(data))
+        if t.exhausted and not t.unacked and t.end is None:
+            t.end_seq = t.next_seq
+            t.end = SnapshotPayload(SnapshotAction.END, t.room.room_id, t.transfer_id, seq=t.next_seq,
+                                    checksum=t.sha.hexdigest(), size=t.size,
+                                    clock=dict(t.clock.timestamps)).to_message(self.node.server_id)
+            self.node.connection_manager.send_to_node(t.target, t.end)
+
+    def _resend(self, t: _Outgoing):
+        self.node.metrics.counter("snapshot_resends").inc()
+        for msg in t.unacked.values():
+            self.node.connection_manager.send_to_node(t.target, msg)
+        if not t.unacked and t.end is not None:
+            self.node.connection_manager.send_to_node(t.target, t.end)
+
+    def _arm(self, t: _Outgoing):
+        seen = t.progress
+
+        def check():
+            with self._lock:
+                if t.transfer_id not in self.outgoing:
+                    return
+                if t.progress == seen:
+                    t.retries += 1
+                    if t.retries > SNAPSHOT_MAX_RETRIES:
+                        self._abort(t.target, t.room.room_id, t.transfer_id, "receiver stopped acking")
+                        self._finish_outgoing(t, "timeout")
+                        return
+                    self._resend(t)
+            self._arm(t)
+
+        t.timer = self.node.clock.call_later(self.retry, check)
+
+    def _finish_outgoing(self, t: _Outgoing, result: str):
+        with self._lock:
+            self.outgoing.pop(t.transfer_id, None)
+        if t.timer is not None:
+            t.timer.cancel()
+        self.node.metrics.counter("snapshots_sent", result=result).inc()
+        log.info("snapshot_sent", node=self.node.server_id, room=t.room.room_id, to=t.target,
+                 result=result, bytes=t.size, chunks=t.next_seq)
+
+    def _abort(self, target: NodeId, room_id: str, transfer_id: str, reason: str):
+        self._send(target, SnapshotPayload(SnapshotAction.ABORT, room_id, transfer_id, reason=reason))
+
+    # ---------- dispatch ----------
+
+    def handle_message(self, msg: Message):
+        p = SnapshotPayload.from_message(msg)
+        if p.action == SnapshotAction.REQUEST:
+            self._on_request(p, msg.sender_id)
+            return
+        with self._lock:
+            incoming = self.incoming.get(p.transfer_id)
+            outgoing = self.outgoing.get(p.transfer_id)
+        if p.action == SnapshotAction.CHUNK and incoming is not None:
+            self._on_chunk(p, incoming)
+        elif p.action == SnapshotAction.END and incoming is not None:
+            self._on_end(p, incoming)
+        elif p.action == SnapshotAction.ACK and outgoing is not None:
+            self._on_ack(p, outgoing)
+        elif p.action == SnapshotAction.ABORT:
+            log.warning("snapshot_aborted", node=self.node.server_id, room=p.room_id, reason=p.reason)
+            if incoming is not None:
+                self._finish_incoming(incoming, None)
+            if outgoing is not None:
+                self._finish_outgoing(outgoing, "aborted")
@@ -0,0 +1,312 @@
+import heapq
+import itertools
+import random
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from ..domain.models import Message, MessageType
+from ..network.transport import ConnectionManager, TCPConnection, UDPHandler
+
+# LOOPBACK TRANSPORT
+# In-process stand-in for the TCP peer links, UDP discovery and node timers so
+# many ServerNodes can run in one process. Frames are serialized exactly like on
+# a real socket, queued with a one-way latency and delivered by
+# LoopbackNetwork.run() on the calling thread, in virtual time. No sockets and
+# no threads are involved.
+#
+# Faults are injected per network and are reproducible from `seed`:
+#   jitter     extra uniform [0, jitter) delay per frame; links stay FIFO
+#   loss       probability that a datagram is dropped, or that a frame needs a
+#              retransmission (it then arrives `rto` later, like on TCP)
+#   partition  frames and datagrams between different groups are dropped
+#   crash      a node stops sending, receiving and running timers
+
+class LoopbackConnection(TCPConnection):
+    def __init__(self, network: 'LoopbackNetwork', ip: str, port: int, label: str = ""):
+        super().__init__(None, ip, port)
+        self.network = network
+        self.label = label  # who sends on this end, for per-source traffic counters
+        self.peer: Optional['LoopbackConnection'] = None
+        self.callback: Optional[Callable[[Message], None]] = None
+        self.closed = False
+        # arrival time of the last frame queued to this end, keeps it FIFO
+        self.last_arrival = 0.0
+
+    def send(self, msg: Message) -> bool:
+        if self.closed or self.peer is None or self.peer.closed:
+            return False
+        self.network.transmit(self.peer, msg)
+        return True
+
+    def receive(self) -> Optional[Message]:
+        raise RuntimeError("LoopbackConnection is push based, use listen_to_connection")
+
+    def deliver(self, msg: Message):
+        if self.callback is not None and not self.closed:
+            self.callback(msg)
+
+    def close(self):
+        self.closed = True
+
+
+class LoopbackConnectionManager(ConnectionManager):
+    def __init__(self, network: 'LoopbackNetwork', node):
+        super().__init__()
+        self.network = network
+        self.node = node
+        self.clock = LoopbackClock(network)
+
+    def connect_to(self, ip: str, port: int, timeout: float = None) -> TCPConnection:
+        remote = self.network.nodes.get(port)
+        if remote is None:
+            raise ConnectionRefusedError(f"no loopback node on port {port}")
+
+        local_end = LoopbackConnection(self.network, ip, port, label=str(self.node.server_id))
+        remote_end = LoopbackConnection(self.network, self.node.ip_address, self.node.port, label=str(remote.server_id))
+        local_end.peer, remote_end.peer = remote_end, local_end
+        # like accept(): the first frame on the new link goes to the join handler
+        remote_end.callback = lambda msg: remote.handle_join_message(msg, remote_end)
+        return local_end
+
+    def listen_to_connection(self, conn: TCPConnection, callback: Callable[[Message], None], on_close=None):
+        conn.callback = callback
+
+
+class LoopbackUDPHandler(UDPHandler):
+    """Broadcasts reach every attached node; send_to reaches the node listening on that port."""
+    def __init__(self, network: 'LoopbackNetwork', node):
+        self.network = network
+        self.node = node
+        self.bound = True
+
+    def broadcast(self, msg: Message, port: int):
+        for node in list(self.network.nodes.values()):
+            self.network.transmit_datagram(node._handle_udp_message, msg, (self.node.ip_address, self.node.port), str(self.node.server_id), str(node.server_id))
+
+    def listen(self, port: int, callback: Callable[[Message], None]):
+        return
+
+    def send_to(self, msg: Message, addr):
+        sink = self.network.datagram_sinks.get(addr[1])
+        if sink is not None:
+            target = self.network.nodes.get(addr[1])
+            self.network.transmit_datagram(sink, msg, (self.node.ip_address, self.node.port), str(self.node.server_id),
+                                           str(target.server_id) if target is not None else "")
+
+    def send_bytes(self, data: bytes, addr):
+        self.send_to(Message.deserialize(data), addr)
+
+
+class InlineExecutor:
+    """Runs submitted work immediately, so node worker pools stay in virtual time."""
+    def submit(self, fn, *args):
+        fn(*args)
+
+
+class LoopbackTimer:
+    def __init__(self):
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class LoopbackClock:
+    """Virtual-time clock backed by the network's event queue."""
+    def __init__(self, network: 'LoopbackNetwork'):
+        self.network = network
+        # set when the owning node crashes: its pending and future timers never fire
+        self.stopped = False
+
+    def now(self) -> float:
+        return self.network.now
+
+    def call_later(self, delay: float, fn: Callable[[], None]) -> LoopbackTimer:
+        def fire():
+            if not self.stopped:
+                fn()
+        return self.network.call_later(delay, fire)
+
+    def call_every(self, interval: float, fn: Callable[[], None]) -> LoopbackTimer:
+        task = LoopbackTimer()
+        def tick():
+            if task.cancelled:
+                return
+            fn()
+            self.call_later(interval, tick)
+        self.call_later(interval, tick)
+        return task
+
+
+class LoopbackNetwork:
+    def __init__(
+        self,
+        latency: float = 0.001,
+        frame_cost: float = 0.0,
+        jitter: float = 0.0,
+        loss: float = 0.0,
+        rto: float = 0.2,
+        seed: int = 0,
+    ):
+        if not 0 <= loss < 1:
+            raise ValueError("loss must be in [0, 1)")
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.rto = rto
+        self.random = random.Random(seed)
+        # server_id / client_id -> partition group; empty when fully connected
+        self._groups: Dict[str, int] = {}
+        self.crashed: Set[str] = set()
+        self.dropped = 0
+        self.retransmitted = 0
+        # time a sender's uplink is busy per frame; with frame_cost > 0 frames
+        # from one source are serialized, so fan-out width shows up as delay
+        self.frame_cost = frame_cost
+        self._egress_free_at: Dict[str, float] = {}
+        self.now = 0.0
+        self.nodes: Dict[int, object] = {}  # port -> ServerNode
+        self.datagram_sinks: Dict[int, Callable[[Message], None]] = {}  # port -> UDP callback
+        self._events: List[Tuple[float, int, Callable[[], None]]] = []
+        self._seq = itertools.count()
+
+        # traffic counters, per message type and per sending node / client
+        self.frames_sent: Dict[MessageType, int] = {}
+        self.bytes_sent: Dict[MessageType, int] = {}
+        self.frames_by_source: Dict[str, int] = {}
+        self.bytes_by_source: Dict[str, int] = {}
+
+    def attach(self, node) -> LoopbackConnectionManager:
+        """Registers a ServerNode and swaps its connection manager, UDP handler and clock for loopback ones."""
+        self.nodes[node.port] = node
+        hooks = node.connection_manager
+        node.connection_manager = LoopbackConnectionManager(self, node)
+        node.connection_manager.on_peer_message = hooks.on_peer_message
+        node.connection_manager.on_peer_connected = hooks.on_peer_connected
+        node.connection_manager.node_id = hooks.node_id
+        node.connection_manager.metrics = hooks.metrics
+        node.connection_manager.timer = hooks.timer
+        node.udp_handler = LoopbackUDPHandler(self, node)
+        node.clock = node.connection_manager.clock
+        node.metadata_store.clock = node.clock
+        node.discovery_pool = InlineExecutor()
+        return node.connection_manager
+
+    def connect(self, a, b):
+        """Opens a peer link between two attached nodes without the SERVER_JOIN handshake."""
+        conn = a.connection_manager.connect_to(b.ip_address, b.port)
+        a.connection_manager.active_connections_peer_to_peer[b.server_id] = conn
+        b.connection_manager.active_connections_peer_to_peer[a.server_id] = conn.peer
+        a.connection_manager.listen_to_connection(conn, a.process_message)
+        b.connection_manager.listen_to_connection(conn.peer, b.process_message)
+
+    def open_client(self, node, client_id: str, on_message: Callable[[Message], None], headers: Optional[dict] = None) -> LoopbackConnection:
+        """Connects a simulated client to `node` and sends its CLIENT_JOIN."""
+        client_end = LoopbackConnection(self, node.ip_address, node.port, label=client_id)
+        server_end = LoopbackConnection(self, "127.0.0.1", 0, label=str(node.server_id))
+        client_end.peer, server_end.peer = server_end, client_end
+        server_end.callback = lambda msg: node.handle_join_message(msg, server_end)
+        client_end.callback = on_message
+        client_end.send(Message(type=MessageType.CLIENT_JOIN, sender_id=client_id, headers=headers or {}))
+        return client_end
+
+    # ---------- faults ----------
+
+    def partition(self, *groups: Iterable[str]):
+        """Splits the listed ids into groups that cannot reach each other. Unlisted ids reach everyone."""
+        self._groups = {str(member): index for index, group in enumerate(groups) for member in group}
+
+    def heal(self):
+        self._groups = {}
+
+    def crash(self, node):
+        """Stops a node: its timers stop, it is unreachable and nothing it sent earlier still arrives."""
+        self.crashed.add(str(node.server_id))
+        self.nodes.pop(node.port, None)
+        node.clock.stopped = True
+
+    def _reachable(self, source: str, target: str) -> bool:
+        if source in self.crashed or target in self.crashed:
+            return False
+        a = self._groups.get(source)
+        b = self._groups.get(target)
+        return a is None or b is None or a == b
+
+    # ---------- scheduling ----------
+
+    def call_later(self, delay: float, fn: Callable[[], None]) -> LoopbackTimer:
+        timer = LoopbackTimer()
+        def fire():
+            if not timer.cancelled:
+                fn()
+        heapq.heappush(self._events, (self.now + delay, next(self._seq), fire))
+        return timer
+
+    def _count(self, msg: Message, payload: bytes, source: str = ""):
+        self.frames_sent[msg.type] = self.frames_sent.get(msg.type, 0) + 1
+        self.bytes_sent[msg.type] = self.bytes_sent.get(msg.type, 0) + len(payload)
+        self.frames_by_source[source] = self.frames_by_source.get(source, 0) + 1
+        self.bytes_by_source[source] = self.bytes_by_source.get(source, 0) + len(payload)
+
+    def _egress_delay(self, source: str) -> float:
+        if self.frame_cost <= 0:
+            return self.latency
+        start = max(self.now, self._egress_free_at.get(source, 0.0))
+        self._egress_free_at[source] = start + self.frame_cost
+        return start + self.frame_cost - self.now + self.latency
+
+    def _jitter(self) -> float:
+        return self.random.uniform(0, self.jitter) if self.jitter > 0 else 0.0
+
+    def transmit(self, dest: LoopbackConnection, msg: Message):
+        payload = msg.serialize()
+        source = dest.peer.label if dest.peer else ""
+        self._count(msg, payload, source)
+        if not self._reachable(source, dest.label):
+            self.dropped += 1
+            return
+        delay = self._egress_delay(source) + self._jitter()
+        while self.loss > 0 and self.random.random() < self.loss:
+            self.retransmitted += 1
+            delay += self.rto
+        # a stream never overtakes itself, whatever the jitter
+        arrival = max(self.now + delay, dest.last_arrival)
+        dest.last_arrival = arrival
+        def deliver():
+            if self._reachable(source, dest.label):
+                dest.deliver(Message.deserialize(payload))
+        self.call_later(arrival - self.now, deliver)
+
+    def transmit_datagram(self, callback: Callable[[Message], None], msg: Message, sender_addr, source: str = "", target: str = ""):
+        payload = msg.serialize()
+        self._count(msg, payload, source)
+        if not self._reachable(source, target) or (self.loss > 0 and self.random.random() < self.loss):
+            self.dropped += 1
+            return
+        def deliver():
+            if not self._reachable(source, target):
+                return
+            received = Message.deserialize(payload)
+            received.sender_addr = sender_addr
+            callback(received)
+        self.call_later(self._egress_delay(source) + self._jitter(), deliver)
+
+    def run(self, until: Optional[float] = None, max_events: Optional[int] = None) -> int:
+        """Delivers queued events in time order until idle (or `until`). Returns events processed."""
+        processed = 0
+        while self._events:
+            if until is not None and self._events[0][0] > until:
+                self.now = until
+                break
+            if max_events is not None and processed >= max_events:
+                break
+            at, _, fn = heapq.heappop(self._events)
+            self.now = at
+            fn()
+            processed += 1
+        else:
+            if until is not None and self.now < until:
+                self.now = until
+        return processed
+
+    def idle(self) -> bool:
+        return not self._events
@@ -0,0 +1,83 @@
+import unittest
+import asyncio
+import contextlib
+import io
+import socket
+import threading
+from unittest.mock import patch
+from src.client.async_client import AsyncChatClient
+from src.domain.models import MessageType
+from src.server.rate_limiter import RateLimiter
+from src.server.server_node import ServerNode
+
+class TestAsyncChatClient(unittest.TestCase):
+    def setUp(self):
+        with patch('src.server.server_node.ServerNode._get_local_ip', return_value="127.0.0.1"):
+            self.node = ServerNode("1", "127.0.0.1", 0, 0)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.node.create_room("lobby")
+
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen()
+        self.port = self.listener.getsockname()[1]
+        threading.Thread(target=self.accept, daemon=True).start()
+        self.stdout = contextlib.redirect_stdout(io.StringIO())
+        self.stdout.__enter__()
+
+    def tearDown(self):
+        self.stdout.__exit__(None, None, None)
+        self.listener.close()
+
+    def accept(self):
+        while True:
+            try:
+                sock, addr = self.listener.accept()
+            except OSError:
+                return
+            self.node.handle_join(sock, addr)
+
+    async def client(self, client_id, **kwargs):
+        client = AsyncChatClient(client_id, client_id=client_id, **kwargs)
+        await client.connect("127.0.0.1", self.port)
+        await client.join_room("lobby")
+        return client
+
+    def test_pipelined_sends_are_acked_in_order(self):
+        async def scenario():
+            seen = []
+            listener = await self.client("listener", on_message=lambda m: seen.append(m.content))
+            sender = await self.client("sender", max_in_flight=16)
+            await asyncio.sleep(0.1)
+
+            acks = [await sender.send_message(f"m{i}") for i in range(1, 101)]
+            delivered = await asyncio.wait_for(asyncio.gather(*acks), 5)
+            await asyncio.sleep(0.1)
+            await sender.close()
+            await listener.close()
+            return sender, seen, delivered
+
+        sender, seen, delivered = asyncio.run(scenario())
+        self.assertEqual([m.content for m in delivered], [f"m{i}" for i in range(1, 101)])
+        self.assertEqual(seen, [f"m{i}" for i in range(1, 101)])
+        self.assertEqual(sender.rooms.session("lobby").clock.timestamps["sender"], 100)
+        self.assertEqual(sender.stats()["acked"], 100)
+
+    def test_throttled_chats_are_resent(self):
+        self.node.rate_limiter = RateLimiter(self.node, client_rate=200, client_burst=5)
+
+        async def scenario():
+            sender = await self.client("sender")
+            await asyncio.sleep(0.1)
+            acks = [await sender.send_message(f"m{i}") for i in range(1, 21)]
+            delivered = await asyncio.wait_for(asyncio.gather(*acks), 5)
+            await sender.close()
+            return sender, delivered
+
+        sender, delivered = asyncio.run(scenario())
+        self.assertEqual(sorted(int(m.content[1:]) for m in delivered), list(range(1, 21)))
+        self.assertGreater(sender.stats()["resent"], 0)
+        self.assertEqual(self.node.managed_rooms["lobby"].vector_clock.timestamps["sender"], 20)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,159 @@
+import unittest
+import contextlib
+import io
+from unittest.mock import patch
+from src.client.chat_client import ChatClient
+from src.domain.control import AckKind, AckPayload
+from src.server.server_node import ServerNode
+from src.sim.loopback import LoopbackNetwork
+
+class TestDeliveryAcks(unittest.TestCase):
+    def setUp(self):
+        self.network = LoopbackNetwork()
+        with patch('src.server.server_node.ServerNode._get_local_ip', return_value="127.0.0.1"):
+            self.node = ServerNode("1", "127.0.0.1", 7401, 0)
+        self.network.attach(self.node)
+        self.stdout = contextlib.redirect_stdout(io.StringIO())
+        self.stdout.__enter__()
+        self.node.create_room("lobby")
+        # client wall clock, for the send and delivery stamps
+        self.wall = patch('src.client.chat_client.time.time', return_value=100.0)
+        self.time = self.wall.start()
+
+    def tearDown(self):
+        self.wall.stop()
+        self.stdout.__exit__(None, None, None)
+
+    def connect(self, client_id, acks=True):
+        client = ChatClient(client_id, client_id=client_id, acks=acks)
+        headers = {"acks": True} if acks else None
+        client.server_connection = self.network.open_client(self.node, client_id, client.receive_message, headers)
+        client.join_room("lobby")
+        self.network.run()
+        return client
+
+    def flush_acks(self, client):
+        # sends what the ack timer would, without waiting for it
+        if client._ack_timer is not None:
+            client._ack_timer.cancel()
+        client._send_acks()
+        self.network.run()
+
+    def test_sender_learns_what_is_stored(self):
+        x = self.connect("x")
+        for i in range(3):
+            x.send_message(f"m{i}", "lobby")
+        self.network.run()
+
+        self.assertEqual(x.stored, {"lobby": 4})
+        self.assertTrue(x.is_stored(self.node.managed_rooms["lobby"].message_history[-1]))
+        # stored messages are not kept for retransmission
+        self.assertEqual(len(x.outbox), 0)
+        # one coalesced ack for the join line, one for the burst
+        self.assertEqual(self.node.metrics.counter("acks_sent").value, 2)
+        self.flush_acks(x)
+
+    def test_delivery_latency_histogram(self):
+        x = self.connect("x")
+        y = self.connect("y")
+        self.flush_acks(y)
+        for i in range(3):
+            x.send_message(f"m{i}", "lobby")
+        self.time.return_value = 100.25
+        self.network.run()
+        self.flush_acks(x)
+        self.flush_acks(y)
+
+        histogram = self.node.metrics.histogram("delivery_latency", room="lobby")
+        # y acks x's join line and three messages, x acks y's join line;
+        # nobody's acks of their own messages count
+        self.assertEqual(histogram.count, 5)
+        self.assertAlmostEqual(histogram.percentile(99), 0.25, delta=0.01)
+        self.assertEqual(histogram.min, 0.0)
+        # a repeated cumulative ack adds nothing
+        y._ack_delivered("lobby")
+        self.flush_acks(y)
+        self.assertEqual(histogram.count, 5)
+        self.assertEqual(self.node.acks.member_clocks["y"]["lobby"]["x"], 4)
+
+    def test_acks_are_opt_in(self):
+        x = self.connect("x", acks=False)
+        x.send_message("m", "lobby")
+        self.network.run()
+        self.assertEqual(x.stored, {})
+        self.assertEqual(self.node.metrics.counter("acks_sent").value, 0)
+        self.assertTrue(all("sent_at" not in m.headers for m in x.outbox.values()))
+
+class TestEdgeAcks(unittest.TestCase):
+    def setUp(self):
+        self.network = LoopbackNetwork()
+        with patch('src.server.server_node.ServerNode._get_local_ip', return_value="127.0.0.1"):
+            self.owner = ServerNode("1", "127.0.0.1", 7411, 0)
+            self.edge = ServerNode("2", "127.0.0.1", 7412, 0)
+        for node in (self.owner, self.edge):
+            self.network.attach(node)
+        self.network.connect(self.owner, self.edge)
+        self.stdout = contextlib.redirect_stdout(io.StringIO())
+        self.stdout.__enter__()
+        self.owner.create_room("lobby")
+        self.edge.metadata_store.room_locations["lobby"] = "1"
+        self.wall = patch('src.client.chat_client.time.time', return_value=100.0)
+        self.time = self.wall.start()
+
+    def tearDown(self):
+        self.wall.stop()
+        self.stdout.__exit__(None, None, None)
+
+    def connect(self, client_id, node):
+        client = ChatClient(client_id, client_id=client_id, acks=True)
+        client.server_connection = self.network.open_client(node, client_id, client.receive_message, {"acks": True})
+        client.join_room("lobby")
+        self.network.run()
+        return client
+
+    def flush_acks(self, client):
+        if client._ack_timer is not None:
+            client._ack_timer.cancel()
+        client._send_acks()
+        self.network.run()
+
+    def test_stored_acks_reach_clients_of_an_edge(self):
+        x = self.connect("x", self.edge)
+        for i in range(3):
+            x.send_message(f"m{i}", "lobby")
+        self.network.run()
+
+        self.assertEqual(x.stored, {"lobby": 4})
+        self.assertEqual(len(x.outbox), 0)
+        self.assertEqual(self.edge.metrics.counter("acks_forwarded").value, 2)
+        self.flush_acks(x)
+
+    def test_delivered_acks_from_an_edge_reach_the_owner(self):
+        x = self.connect("x", self.edge)
+        y = self.connect("y", self.owner)
+        for i in range(3):
+            y.send_message(f"m{i}", "lobby")
+        self.time.return_value = 100.25
+        self.network.run()
+        self.flush_acks(x)
+        self.flush_acks(y)
+
+        self.assertEqual(self.owner.acks.member_clocks["x"]["lobby"]["y"], 4)
+        histogram = self.owner.metrics.histogram("delivery_latency", room="lobby")
+        # x acks y's join line and three messages, y acks x's join line
+        self.assertEqual(histogram.count, 5)
+        self.assertAlmostEqual(histogram.percentile(99), 0.25, delta=0.01)
+        self.assertNotIn("x", self.edge.acks.member_clocks)
+
+    def test_clients_cannot_send_stored_acks(self):
+        x = self.connect("x", self.edge)
+        y = self.connect("y", self.edge)
+        forged = AckPayload(AckKind.STORED, "lobby", clock={"x": 99}, client_id="x")
+        y.server_connection.send(forged.to_message("1"))
+        self.network.run()
+        self.assertEqual(x.stored.get("lobby", 0), 1)
+        self.flush_acks(x)
+        self.flush_acks(y)
+
+if __name__ == "__main__":
+    unittest.main()
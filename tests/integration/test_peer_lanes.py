@@ -0,0 +1,56 @@
+import unittest
+import contextlib
+import io
+from unittest.mock import patch
+from src.domain.models import Message, MessageType
+from src.server.server_node import ServerNode
+from src.sim.loopback import LoopbackNetwork
+
+class TestPeerLanes(unittest.TestCase):
+    def setUp(self):
+        self.network = LoopbackNetwork(latency=0.001)
+        with patch('src.server.server_node.ServerNode._get_local_ip', return_value="127.0.0.1"):
+            self.a = ServerNode("1", "127.0.0.1", 7301, 0)
+            self.b = ServerNode("2", "127.0.0.1", 7302, 0)
+        for node in (self.a, self.b):
+            self.network.attach(node)
+        self.received = []
+        for t in (MessageType.HEARTBEAT, MessageType.CHAT):
+            self.b._dispatch[t] = self.received.append
+        # opened by A like any other peer: SERVER_JOIN on the first connection, then the data lane
+        self.a.connection_manager.register_peer("2", "127.0.0.1", 7302)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.a.connection_manager.send_to_node("2", Message(type=MessageType.HEARTBEAT, sender_id="1"))
+            self.network.run()
+
+    def test_data_lane_is_opened_after_the_join(self):
+        control = self.b.connection_manager.active_connections_peer_to_peer["1"]
+        data = self.b.connection_manager.data_connections["1"]
+        self.assertIsNot(control, data)
+        self.assertIs(self.a.connection_manager.data_connections["2"].peer, data)
+        # the data lane is not a ring member of its own
+        self.assertEqual(list(self.b.connection_manager.active_connections_peer_to_peer), ["1"])
+
+    def test_frames_are_routed_by_lane(self):
+        cm = self.a.connection_manager
+        cm.send_to_node("2", Message(type=MessageType.CHAT, sender_id="1", content="hello"))
+        cm.send_to_node("2", Message(type=MessageType.HEARTBEAT, sender_id="1"))
+        self.network.run()
+
+        self.assertEqual([m.type for m in self.received][-2:], [MessageType.CHAT, MessageType.HEARTBEAT])
+        link = cm.peer_links["2"]
+        self.assertEqual(link.stats()["data_frames_sent"], 1)
+        self.assertIs(cm.connection_for("2", MessageType.CHAT), cm.data_connections["2"])
+        self.assertIs(cm.connection_for("2", MessageType.HEARTBEAT), cm.active_connections_peer_to_peer["2"])
+
+    def test_replies_use_the_data_lane_from_the_accepting_side(self):
+        got = []
+        self.a._dispatch[MessageType.CHAT] = got.append
+        cm = self.b.connection_manager
+        self.assertIs(cm.connection_for("1", MessageType.CHAT), cm.data_connections["1"])
+        cm.send_to_node("1", Message(type=MessageType.CHAT, sender_id="2", content="back"))
+        self.network.run()
+        self.assertEqual([m.content for m in got], ["back"])
+
+if __name__ == "__main__":
+    unittest.main()
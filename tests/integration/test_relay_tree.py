@@ -0,0 +1,81 @@
+import unittest
+import contextlib
+import io
+from unittest.mock import patch
+from src.domain.models import Message, MessageType, VectorClock
+from src.server.federation import split_subtree
+from src.server.server_node import ServerNode
+from src.sim.loopback import LoopbackNetwork
+
+class TestRelayTree(unittest.TestCase):
+    def setUp(self):
+        self.network = LoopbackNetwork()
+        with patch('src.server.server_node.ServerNode._get_local_ip', return_value="127.0.0.1"):
+            self.nodes = [ServerNode(str(i), "127.0.0.1", 7300 + i, 0) for i in range(1, 6)]
+        for node in self.nodes:
+            self.network.attach(node)
+            node.ring = [str(i) for i in range(1, 6)]
+        for i, a in enumerate(self.nodes):
+            for b in self.nodes[i + 1:]:
+                self.network.connect(a, b)
+
+        self.host = self.nodes[0]
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.host.create_room("stage", relay_fanout=2)
+        for node in self.nodes[1:]:
+            node.metadata_store.room_locations["stage"] = "1"
+
+        self.inbox = {}
+        self.clients = {}
+        for node in self.nodes:
+            client_id = f"client-{node.server_id}"
+            self.inbox[client_id] = []
+            conn = self.network.open_client(node, client_id, self.inbox[client_id].append)
+            conn.send(Message(type=MessageType.JOIN_ROOM, sender_id=client_id, room_id="stage"))
+            self.clients[client_id] = conn
+        self.settle()
+
+    def settle(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.network.run()
+
+    def test_split_subtree(self):
+        self.assertEqual(split_subtree(["a", "b", "c", "d", "e"], 2), [("a", ["b", "c"]), ("d", ["e"])])
+        self.assertEqual(split_subtree(["a", "b"], 0), [("a", []), ("b", [])])
+        self.assertEqual(split_subtree(["a"], 3), [("a", [])])
+
+    def test_host_sends_to_fanout_relays_only(self):
+        for seq, content in enumerate(["one", "two", "three"], start=1):
+            self.clients["client-1"].send(Message(
+                type=MessageType.CHAT, sender_id="client-1", room_id="stage",
+                content=content, vector_clock=VectorClock({"client-1": seq}),
+            ))
+        self.settle()
+
+        for client_id, inbox in self.inbox.items():
+            chats = [m.content for m in inbox if m.type == MessageType.CHAT]
+            self.assertEqual(chats, ["one", "two", "three"], client_id)
+        # 4 edges, fanout 2: the host sends 2 deliveries, relays forward the other 2
+        self.assertEqual(self.network.frames_sent[MessageType.ROOM_DELIVER], 3 * 4)
+        self.assertEqual(sum(node.federation.relayed for node in self.nodes), 3 * 2)
+
+    def test_relay_forwards_in_host_delivery_order(self):
+        relay = self.nodes[1]
+        relay.federation.handle_delivery(self.delivery(1, "first"))
+        relay.federation.handle_delivery(self.delivery(3, "third"))
+        relay.federation.handle_delivery(self.delivery(2, "second"))
+        relay.federation.handle_delivery(self.delivery(2, "second"))
+        self.settle()
+
+        for client_id in ("client-2", "client-3"):
+            chats = [m.content for m in self.inbox[client_id] if m.type == MessageType.CHAT]
+            self.assertEqual(chats, ["first", "second", "third"], client_id)
+
+    def delivery(self, seq, content):
+        return Message(
+            type=MessageType.ROOM_DELIVER, sender_id="client-1", room_id="stage", content=content,
+            headers={"seq": seq, "subtree": ["3"], "fanout": 2},
+        )
+
+if __name__ == "__main__":
+    unittest.main()
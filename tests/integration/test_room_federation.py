@@ -0,0 +1,162 @@
+import unittest
+import contextlib
+import io
+from unittest.mock import patch
+from src.domain.control import ThrottleAction, ThrottlePayload, ThrottleScope
+from src.domain.models import Message, MessageType, VectorClock
+from src.server.rate_limiter import RateLimiter
+from src.server.server_node import ServerNode
+from src.sim.loopback import LoopbackNetwork
+
+class TestRoomFederation(unittest.TestCase):
+    def setUp(self):
+        self.network = LoopbackNetwork()
+        with patch('src.server.server_node.ServerNode._get_local_ip', return_value="127.0.0.1"):
+            self.owner = ServerNode("1", "127.0.0.1", 7201, 0)
+            self.edge = ServerNode("2", "127.0.0.1", 7202, 0)
+        for node in (self.owner, self.edge):
+            self.network.attach(node)
+        self.network.connect(self.owner, self.edge)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.owner.create_room("lobby")
+        self.edge.metadata_store.room_locations["lobby"] = "1"
+
+        self.inbox = {}
+        self.clients = {}
+        self.connect("local", self.owner)
+        self.connect("remote-1", self.edge)
+        self.connect("remote-2", self.edge)
+
+    def connect(self, client_id, node):
+        self.inbox[client_id] = []
+        conn = self.network.open_client(node, client_id, self.inbox[client_id].append)
+        conn.send(Message(type=MessageType.JOIN_ROOM, sender_id=client_id, room_id="lobby"))
+        self.clients[client_id] = conn
+        self.settle()
+
+    def settle(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.network.run()
+
+    def chat(self, client_id, seq, content):
+        self.clients[client_id].send(Message(
+            type=MessageType.CHAT, sender_id=client_id, room_id="lobby",
+            content=content, vector_clock=VectorClock({client_id: seq}),
+        ))
+
+    def test_edge_subscribes_once(self):
+        room = self.owner.managed_rooms["lobby"]
+        self.assertEqual(room.edge_subscribers, ["2"])
+        self.assertEqual(room.client_ids, ["local"])
+        self.assertEqual(self.edge.federation.edge_members["lobby"], ["remote-1", "remote-2"])
+        self.assertNotIn("lobby", self.edge.managed_rooms)
+
+    def test_chat_from_edge_is_ordered_by_owner_and_fanned_out(self):
+        self.chat("remote-1", 1, "hello")
+        self.chat("remote-1", 2, "again")
+        self.settle()
+
+        for client_id in ("local", "remote-1", "remote-2"):
+            chats = [m.content for m in self.inbox[client_id] if m.type == MessageType.CHAT]
+            self.assertEqual(chats, ["hello", "again"], client_id)
+        self.assertEqual(self.owner.managed_rooms["lobby"].vector_clock.timestamps, {"remote-1": 2})
+
+        # owner -> edge: one frame per message, not one per edge member
+        self.assertEqual(self.network.frames_sent[MessageType.ROOM_DELIVER], 2)
+
+    def test_owner_holds_all_edges_to_one_room_limit(self):
+        self.owner.rate_limiter = RateLimiter(self.owner, room_rate=0.001, room_burst=2)
+        self.chat("remote-1", 1, "a")
+        self.chat("remote-2", 1, "b")
+        self.chat("remote-2", 2, "c")
+        self.settle()
+        self.chat("local", 1, "d")
+        self.settle()
+
+        self.assertEqual([m.content for m in self.inbox["local"] if m.type == MessageType.CHAT], ["a", "b"])
+        self.assertEqual(self.owner.rate_limiter.throttled_by_room, {"lobby": 2})
+        # the notice for an edge client goes back through its edge
+        notices = [ThrottlePayload.from_message(m) for m in self.inbox["remote-2"] if m.type == MessageType.THROTTLED]
+        self.assertEqual([(n.action, n.scope, n.client_id) for n in notices],
+                         [(ThrottleAction.REJECTED, ThrottleScope.ROOM, "remote-2")])
+        self.assertFalse([m for m in self.inbox["remote-1"] if m.type == MessageType.THROTTLED])
+        self.assertEqual(len([m for m in self.inbox["local"] if m.type == MessageType.THROTTLED]), 1)
+
+    def test_last_leave_unsubscribes(self):
+        for client_id in ("remote-1", "remote-2"):
+            self.clients[client_id].send(Message(type=MessageType.LEAVE_ROOM, sender_id=client_id, room_id="lobby"))
+        self.settle()
+        self.assertEqual(self.owner.managed_rooms["lobby"].edge_subscribers, [])
+        self.assertNotIn("lobby", self.edge.federation.edge_members)
+
+    def delivery(self, seq, content):
+        return Message(
+            type=MessageType.ROOM_DELIVER, sender_id="local", room_id="lobby", content=content,
+            vector_clock=VectorClock({"local": seq}), headers={"seq": seq},
+        )
+
+    def edge_chats(self):
+        return [m.content for m in self.inbox["remote-1"] if m.type == MessageType.CHAT]
+
+    def test_missing_delivery_times_out_and_resubscribes(self):
+        federation = self.edge.federation
+        federation.handle_delivery(self.delivery(1, "one"))
+        federation.handle_delivery(self.delivery(3, "three"))
+        subscribes = self.network.frames_sent[MessageType.ROOM_FEDERATION]
+        self.network.run(until=self.network.now + federation.gap_timeout / 2)
+        self.assertEqual(self.edge_chats(), ["one"])
+
+        self.settle()
+        self.assertEqual(self.edge_chats(), ["one", "three"])
+        self.assertEqual(federation.resyncs, 1)
+        self.assertEqual(federation.next_seq["lobby"], 4)
+        self.assertEqual(self.network.frames_sent[MessageType.ROOM_FEDERATION], subscribes + 1)
+        self.assertEqual(self.owner.managed_rooms["lobby"].edge_subscribers, ["2"])
+
+        # the missing one turning up late is not delivered out of order
+        federation.handle_delivery(self.delivery(2, "two"))
+        self.settle()
+        self.assertEqual(self.edge_chats(), ["one", "three"])
+
+    def test_deliveries_wait_for_the_owners_sync(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.owner.create_room("hall")
+        # the room has delivered to another edge before this one subscribes
+        self.owner.managed_rooms["hall"].delivery_seq = 5
+        self.edge.metadata_store.room_locations["hall"] = "1"
+        federation = self.edge.federation
+        federation.local_join("hall", "remote-1")
+
+        # deliveries can overtake the SYNC on the data lane
+        for seq, content in ((7, "seven"), (6, "six")):
+            federation.handle_delivery(Message(
+                type=MessageType.ROOM_DELIVER, sender_id="local", room_id="hall", content=content,
+                vector_clock=VectorClock({"local": seq}), headers={"seq": seq},
+            ))
+        self.assertEqual(self.edge_chats(), [])
+
+        self.settle()
+        self.assertEqual(self.edge_chats(), ["six", "seven"])
+        self.assertEqual(federation.next_seq["hall"], 8)
+        self.assertEqual(federation.resyncs, 0)
+
+    def test_pending_deliveries_are_capped(self):
+        federation = self.edge.federation
+        federation.pending_max = 3
+        federation.handle_delivery(self.delivery(1, "one"))
+        for seq in range(3, 7):
+            federation.handle_delivery(self.delivery(seq, str(seq)))
+        self.settle()
+        self.assertEqual(self.edge_chats(), ["one", "3", "4", "5", "6"])
+        self.assertEqual(federation.pending, {})
+        self.assertEqual(federation.resyncs, 1)
+
+    def test_failed_edge_is_pruned(self):
+        self.owner._recompute_ring()
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.owner.failure_detector.on_failure_detected(("server", "2"), self.owner.connection_manager)
+        self.assertEqual(self.owner.managed_rooms["lobby"].edge_subscribers, [])
+
+if __name__ == "__main__":
+    unittest.main()
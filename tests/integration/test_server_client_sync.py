@@ -24,19 +24,19 @@ class TestServerClientSync(unittest.TestCase):
         multicast_handler.multicast = MagicMock()
 
         print("\n--- Server/Client Sync Test ---")
-        print(f"Initial Client A clock: {client_a.client_clock.timestamps}")
-        print(f"Initial Client B clock: {client_b.client_clock.timestamps}")
+        print(f"Initial Client A clock: {client_a.rooms.session('test_room').clock.timestamps}")
+        print(f"Initial Client B clock: {client_b.rooms.session('test_room').clock.timestamps}")
         print(f"Initial Server Room clock: {room.vector_clock.timestamps}")
 
         # 2. Client A sends a message
         # In reality, Client A increments its clock and sends to Server
-        client_a.client_clock.increment("client_A")
+        client_a.rooms.session('test_room').clock.increment("client_A")
         msg_from_a = Message(
             type=MessageType.CHAT,
             content="Hello from A",
             sender_id="client_A",
             room_id="test_room",
-            vector_clock=client_a.client_clock.copy()
+            vector_clock=client_a.rooms.session('test_room').clock.copy()
         )
         print(f"\nClient A sends message with clock: {msg_from_a.vector_clock.timestamps}")
 
@@ -53,17 +53,17 @@ class TestServerClientSync(unittest.TestCase):
         # Here we manually call receive_message on Client B
         client_b.receive_message(msg_from_a)
         
-        print(f"Client B clock after receiving A's message: {client_b.client_clock.timestamps}")
-        self.assertEqual(client_b.client_clock.timestamps["client_A"], 1)
+        print(f"Client B clock after receiving A's message: {client_b.rooms.session('test_room').clock.timestamps}")
+        self.assertEqual(client_b.rooms.session('test_room').clock.timestamps["client_A"], 1)
 
         # 5. Client B replies
-        client_b.client_clock.increment("client_B")
+        client_b.rooms.session('test_room').clock.increment("client_B")
         msg_from_b = Message(
             type=MessageType.CHAT,
             content="Hi from B",
             sender_id="client_B",
             room_id="test_room",
-            vector_clock=client_b.client_clock.copy()
+            vector_clock=client_b.rooms.session('test_room').clock.copy()
         )
         print(f"\nClient B replies with clock: {msg_from_b.vector_clock.timestamps}")
 
@@ -75,8 +75,8 @@ class TestServerClientSync(unittest.TestCase):
 
         # 7. Client A receives B's reply
         client_a.receive_message(msg_from_b)
-        print(f"Client A clock after receiving B's reply: {client_a.client_clock.timestamps}")
-        self.assertEqual(client_a.client_clock.timestamps["client_B"], 1)
+        print(f"Client A clock after receiving B's reply: {client_a.rooms.session('test_room').clock.timestamps}")
+        self.assertEqual(client_a.rooms.session('test_room').clock.timestamps["client_B"], 1)
         
         print("--- Sync Test Complete ---")
 
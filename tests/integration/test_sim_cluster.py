@@ -0,0 +1,85 @@
+import unittest
+import contextlib
+import io
+from unittest.mock import patch
+from src.domain.models import Message, MessageType
+from src.server.server_node import ServerNode
+from src.server.server_state import ServerState
+from src.sim.loopback import LoopbackNetwork
+
+class TestSimulatedCluster(unittest.TestCase):
+    def build(self, network, n=5):
+        with patch('src.server.server_node.ServerNode._get_local_ip', return_value="127.0.0.1"):
+            nodes = [ServerNode(str(i), "127.0.0.1", 7900 + i, 0) for i in range(1, n + 1)]
+        for node in nodes:
+            network.attach(node)
+        for i, a in enumerate(nodes):
+            for b in nodes[i + 1:]:
+                network.connect(a, b)
+        return nodes
+
+    def elect(self, network, nodes):
+        with contextlib.redirect_stdout(io.StringIO()):
+            for node in nodes:
+                node._recompute_ring()
+                node.election_module.start_election(node.connection_manager)
+            network.run()
+
+    def run_for(self, network, seconds):
+        with contextlib.redirect_stdout(io.StringIO()):
+            network.run(until=network.now + seconds)
+
+    def test_leader_failover_in_virtual_time(self):
+        network = LoopbackNetwork(latency=0.002, jitter=0.001, seed=7)
+        nodes = self.build(network)
+        self.elect(network, nodes)
+        self.assertTrue(all(node.leader_id == "5" for node in nodes))
+
+        for node in nodes:
+            node.StartFailureDetection()
+        self.run_for(network, 5)
+        network.crash(nodes[4])
+        self.run_for(network, 10)
+
+        survivors = nodes[:4]
+        self.assertTrue(all(node.leader_id == "4" for node in survivors))
+        self.assertEqual(nodes[3].state, ServerState.LEADER)
+        # timeouts are 2 * PERIOD of virtual time, not of wall-clock time
+        self.assertLess(network.now, 30)
+
+    def test_partition_drops_and_heal_restores(self):
+        network = LoopbackNetwork()
+        a, b, c = self.build(network, 3)
+        received = []
+        c._dispatch[MessageType.CHAT] = received.append
+        network.partition(["1", "2"], ["3"])
+
+        a.connection_manager.send_to_node("3", Message(type=MessageType.CHAT, sender_id="1"))
+        b.connection_manager.send_to_node("3", Message(type=MessageType.CHAT, sender_id="2"))
+        network.run()
+        self.assertEqual(received, [])
+        self.assertEqual(network.dropped, 2)
+
+        network.heal()
+        a.connection_manager.send_to_node("3", Message(type=MessageType.CHAT, sender_id="1"))
+        network.run()
+        self.assertEqual([msg.sender_id for msg in received], ["1"])
+
+    def test_jitter_and_loss_keep_links_fifo_and_reproducible(self):
+        def deliveries(seed):
+            network = LoopbackNetwork(jitter=0.01, loss=0.2, seed=seed)
+            a, b = self.build(network, 2)
+            received = []
+            b._dispatch[MessageType.CHAT] = lambda msg: received.append(int(msg.content))
+            for i in range(200):
+                a.connection_manager.send_to_node("2", Message(type=MessageType.CHAT, sender_id="1", content=str(i)))
+            network.run()
+            return received, network.retransmitted, network.now
+
+        received, retransmitted, finished = deliveries(3)
+        self.assertEqual(received, list(range(200)))
+        self.assertGreater(retransmitted, 0)
+        self.assertEqual(deliveries(3), (received, retransmitted, finished))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,202 @@
+import unittest
+import contextlib
+import io
+import json
+from unittest.mock import patch
+from src.domain.control import SnapshotAction, SnapshotPayload
+from src.domain.models import Message, MessageType, VectorClock
+from src.server.server_node import ServerNode
+from src.sim.loopback import LoopbackNetwork
+
+class TestSnapshotTransfer(unittest.TestCase):
+    def setUp(self):
+        self.network = LoopbackNetwork(latency=0.001, frame_cost=0.001)
+        with patch('src.server.server_node.ServerNode._get_local_ip', return_value="127.0.0.1"):
+            self.host = ServerNode("1", "127.0.0.1", 7201, 0)
+            self.replica = ServerNode("2", "127.0.0.1", 7202, 0)
+        for node in (self.host, self.replica):
+            self.network.attach(node)
+        self.network.connect(self.host, self.replica)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.room = self.host.create_room("lobby")
+        self.room.add_client("alice")
+        self.room.add_client("bob")
+        for i in range(1, 2001):
+            self.deliver(f"message {i:05d} " + "x" * 200)
+        self.chunk_size = patch('src.server.snapshot.SNAPSHOT_CHUNK_SIZE', 4096)
+        self.chunk_size.start()
+
+    def tearDown(self):
+        self.chunk_size.stop()
+
+    def deliver(self, content):
+        clock = self.room.vector_clock
+        clock.increment("alice")
+        self.room.add_message(Message(type=MessageType.CHAT, sender_id="alice", room_id="lobby",
+                                      content=content, vector_clock=clock.copy()))
+
+    def test_snapshot_with_log_tail(self):
+        done = []
+        self.replica.snapshots.request("lobby", "1", on_complete=done.append)
+        self.network.run(until=self.network.now + 0.02)
+        # delivered while the transfer runs: sent as the log tail
+        for i in range(5):
+            self.deliver(f"tail {i}")
+        self.network.run()
+
+        room = done[0]
+        self.assertEqual(len(room.message_history), 2005)
+        self.assertEqual(room.message_history[-1].content, "tail 4")
+        self.assertEqual(room.vector_clock.timestamps, self.room.vector_clock.timestamps)
+        self.assertEqual(room.client_ids, ["alice", "bob"])
+        self.assertIs(room.host, self.replica)
+        self.assertEqual(self.host.metrics.counter("snapshots_sent", result="ok").value, 1)
+        self.assertEqual(self.host.snapshots.outgoing, {})
+
+    def test_busy_room_does_not_hold_the_transfer_open(self):
+        done = []
+
+        def burst():
+            # faster than the link drains
+            for _ in range(50):
+                self.deliver("busy")
+        timer = self.host.clock.call_every(0.001, burst)
+        self.replica.snapshots.request("lobby", "1", on_complete=done.append)
+        self.network.run(until=self.network.now + 5.0)
+        timer.cancel()
+
+        self.assertEqual(len(done), 1)
+        room = done[0]
+        self.assertLess(len(room.message_history), len(self.room.message_history))
+        self.assertEqual(room.vector_clock.timestamps["alice"], len(room.message_history))
+        self.assertEqual(self.host.snapshots.outgoing, {})
+
+    def test_history_bound(self):
+        self.replica.snapshots.request("lobby", "1", history=10)
+        self.network.run()
+        room = self.replica.snapshots.replicas["lobby"]
+        self.assertEqual([m.content[:13] for m in room.message_history][0], "message 01991")
+        self.assertEqual(room.vector_clock.timestamps["alice"], 2000)
+
+    def test_heartbeats_do_not_queue_behind_the_snapshot(self):
+        received = {}
+        self.replica._dispatch[MessageType.CHAT] = lambda msg: received.setdefault(msg.content, self.network.now)
+        self.replica.snapshots.request("lobby", "1")
+        self.network.run(until=self.network.now + 0.05)
+        self.assertTrue(self.host.snapshots.outgoing)
+
+        sent_at = self.network.now
+        self.host.connection_manager.send_to_node("2", Message(type=MessageType.CHAT, sender_id="1", content="ping"))
+        self.network.run()
+        # at most one window of chunks is ahead of it on the link, not the whole room
+        window = self.host.snapshots.window
+        self.assertLess(received["ping"] - sent_at, (window + 2) * self.network.frame_cost + self.network.latency)
+        self.assertIn("lobby", self.replica.snapshots.replicas)
+
+    def test_damaged_chunk_is_resent(self):
+        handle = self.replica.snapshots.handle_message
+        damaged = []
+
+        def corrupt(msg):
+            payload = SnapshotPayload.from_message(msg)
+            if payload.action == SnapshotAction.CHUNK and payload.seq == 3 and not damaged:
+                damaged.append(payload.seq)
+                payload.data = payload.data[::-1]
+                msg = payload.to_message(msg.sender_id)
+            handle(msg)
+
+        self.replica._dispatch[MessageType.SNAPSHOT] = corrupt
+        self.replica.snapshots.request("lobby", "1")
+        self.network.run()
+
+        self.assertEqual(damaged, [3])
+        self.assertGreater(self.host.metrics.counter("snapshot_resends").value, 0)
+        room = self.replica.snapshots.replicas["lobby"]
+        self.assertEqual(len(room.message_history), 2000)
+        self.assertEqual(room.message_history[1999].content, self.room.message_history[1999].content)
+
+    def test_unknown_room_aborts(self):
+        self.replica.snapshots.request("nowhere", "1")
+        self.network.run()
+        self.assertEqual(self.replica.snapshots.incoming, {})
+        self.assertEqual(self.replica.metrics.counter("snapshots_received", result="failed").value, 1)
+
+    def test_receiver_drops_a_stalled_transfer(self):
+        self.replica.snapshots.request("lobby", "1")
+        self.network.run(until=self.network.now + 0.02)
+        self.network.crash(self.host)
+        self.network.run(until=self.network.now + self.replica.snapshots.stall_timeout * 2)
+
+        self.assertEqual(self.replica.snapshots.incoming, {})
+        self.assertFalse(self.replica.snapshots.pending("lobby"))
+        self.assertEqual(self.replica.metrics.counter("snapshots_received", result="timeout").value, 1)
+
+
+class TestStandbyRooms(unittest.TestCase):
+    def setUp(self):
+        self.network = LoopbackNetwork()
+        self.nodes = {}
+        for i in ("1", "2", "3"):
+            self.start(i, 7230 + int(i))
+        for a, b in (("1", "2"), ("2", "3"), ("1", "3")):
+            self.network.connect(self.nodes[a], self.nodes[b])
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.room = self.nodes["1"].create_room("lobby")
+        for i in range(1, 51):
+            self.room.vector_clock.increment("alice")
+            self.room.add_message(Message(type=MessageType.CHAT, sender_id="alice", room_id="lobby",
+                                          content=f"m{i}", vector_clock=self.room.vector_clock.copy()))
+        self.room.add_client("alice")
+        self.form_ring()
+        # "3" leads and knows where the room is
+        self.nodes["3"].metadata_store.set_room("lobby", "1")
+        self.sync_rooms()
+
+    def start(self, server_id, port):
+        with patch('src.server.server_node.ServerNode._get_local_ip', return_value="127.0.0.1"):
+            node = ServerNode(server_id, "127.0.0.1", port, 0)
+        self.network.attach(node)
+        self.nodes[server_id] = node
+        return node
+
+    def form_ring(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            for node in self.nodes.values():
+                node._recompute_ring()
+
+    def sync_rooms(self):
+        leader = self.nodes["3"]
+        with contextlib.redirect_stdout(io.StringIO()):
+            leader.connection_manager.broadcast_to_all(leader.metadata_store.sync_message("3"))
+            self.network.run()
+
+    def test_hosts_left_neighbour_keeps_a_standby_copy(self):
+        standby = self.nodes["2"].snapshots.replicas["lobby"]
+        self.assertEqual([m.content for m in standby.message_history], [f"m{i}" for i in range(1, 51)])
+        self.assertEqual(self.nodes["3"].snapshots.replicas, {})
+        self.assertEqual(self.nodes["1"].snapshots.replicas, {})
+
+        # later syncs leave the copy alone
+        self.sync_rooms()
+        self.assertEqual(self.nodes["2"].metrics.counter("snapshots_received", result="ok").value, 1)
+
+    def test_node_back_under_its_id_restores_its_rooms(self):
+        self.network.crash(self.nodes["1"])
+        self.network.run(until=self.network.now + 1.0)
+        # the same id comes back in a new process, with nothing of its rooms
+        self.network.crashed.discard("1")
+        node = self.start("1", 7241)
+        self.network.connect(node, self.nodes["2"])
+        self.network.connect(node, self.nodes["3"])
+        self.form_ring()
+        self.assertNotIn("lobby", node.managed_rooms)
+
+        self.sync_rooms()
+        room = node.managed_rooms["lobby"]
+        self.assertIs(room.host, node)
+        self.assertEqual([m.content for m in room.message_history], [f"m{i}" for i in range(1, 51)])
+        self.assertEqual(room.vector_clock.timestamps, self.room.vector_clock.timestamps)
+        self.assertEqual(room.client_ids, [])
+
+if __name__ == "__main__":
+    unittest.main()
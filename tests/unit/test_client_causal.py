@@ -17,13 +17,14 @@ class TestClientCausalCheck(unittest.TestCase):
             type=MessageType.CHAT,
             content="Hello",
             sender_id=self.other_id,
+            room_id="room1",
             vector_clock=msg_vc
         )
         
         self.client.receive_message(msg)
         
-        self.assertEqual(self.client.client_clock.timestamps.get(self.other_id), 1)
-        self.assertEqual(len(self.client.hold_back_queue), 0)
+        self.assertEqual(self.client.rooms.session("room1").clock.timestamps.get(self.other_id), 1)
+        self.assertEqual(len(self.client.rooms.session("room1").hold_back), 0)
 
     def test_hold_back_delivery(self):
         """Test that an out-of-order message is held back and then delivered."""
@@ -35,14 +36,15 @@ class TestClientCausalCheck(unittest.TestCase):
             type=MessageType.CHAT,
             content="Future Message",
             sender_id=self.other_id,
+            room_id="room1",
             vector_clock=msg_vc_2
         )
         
         self.client.receive_message(msg_2)
         
         # Should be in queue
-        self.assertEqual(len(self.client.hold_back_queue), 1)
-        self.assertEqual(self.client.client_clock.timestamps.get(self.other_id, 0), 0)
+        self.assertEqual(len(self.client.rooms.session("room1").hold_back), 1)
+        self.assertEqual(self.client.rooms.session("room1").clock.timestamps.get(self.other_id, 0), 0)
 
         # 2. Correct message arrives: {client_B: 1}
         msg_vc_1 = VectorClock(timestamps={self.other_id: 1})
@@ -50,14 +52,15 @@ class TestClientCausalCheck(unittest.TestCase):
             type=MessageType.CHAT,
             content="First Message",
             sender_id=self.other_id,
+            room_id="room1",
             vector_clock=msg_vc_1
         )
         
         self.client.receive_message(msg_1)
         
         # Both should be delivered now
-        self.assertEqual(self.client.client_clock.timestamps.get(self.other_id), 2)
-        self.assertEqual(len(self.client.hold_back_queue), 0)
+        self.assertEqual(self.client.rooms.session("room1").clock.timestamps.get(self.other_id), 2)
+        self.assertEqual(len(self.client.rooms.session("room1").hold_back), 0)
 
     def test_self_message_echo(self):
         """Test that the client's own messages are delivered immediately (skipping check)."""
@@ -65,7 +68,7 @@ class TestClientCausalCheck(unittest.TestCase):
         self.client.send_message("My Message", "room1")
         # Clock is now {client_A: 1}
         
-        self.assertEqual(self.client.client_clock.timestamps.get(self.client_id), 1)
+        self.assertEqual(self.client.rooms.session("room1").clock.timestamps.get(self.client_id), 1)
         
         # Server echoes it back
         msg_vc = VectorClock(timestamps={self.client_id: 1})
@@ -73,6 +76,7 @@ class TestClientCausalCheck(unittest.TestCase):
             type=MessageType.CHAT,
             content="My Message",
             sender_id=self.client_id,
+            room_id="room1",
             vector_clock=msg_vc
         )
         
@@ -80,8 +84,8 @@ class TestClientCausalCheck(unittest.TestCase):
         # But we skip the check for self-messages.
         self.client.receive_message(echo_msg)
         
-        self.assertEqual(self.client.client_clock.timestamps.get(self.client_id), 1)
-        self.assertEqual(len(self.client.hold_back_queue), 0)
+        self.assertEqual(self.client.rooms.session("room1").clock.timestamps.get(self.client_id), 1)
+        self.assertEqual(len(self.client.rooms.session("room1").hold_back), 0)
 
 if __name__ == '__main__':
     unittest.main()
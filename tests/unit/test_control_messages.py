@@ -0,0 +1,68 @@
+import unittest
+from unittest.mock import MagicMock
+from src.domain.models import Message, MessageType
+from src.domain.control import (
+    ElectionKind, ElectionPayload,
+    MetadataAction, MetadataPayload,
+    NeighbourPayload, NeighbourSide,
+    HeartbeatPayload, HeartbeatRole,
+)
+from src.server.metadata import MetadataStore
+from src.server.server_state import ServerState
+
+class TestControlPayloads(unittest.TestCase):
+    def roundtrip(self, payload):
+        # Goes through the full wire format, like a real TCP frame would
+        msg = Message.deserialize(payload.to_message("server-1").serialize())
+        self.assertEqual(msg.type, payload.MESSAGE_TYPE)
+        self.assertEqual(msg.sender_id, "server-1")
+        return type(payload).from_message(msg)
+
+    def test_election_roundtrip(self):
+        payload = ElectionPayload(ElectionKind.PROBE, "42", k=3, d=5)
+        self.assertEqual(self.roundtrip(payload), payload)
+
+    def test_metadata_roundtrip(self):
+        payload = MetadataPayload(
+            MetadataAction.SYNC_ROOMS,
+            rooms={"abcd": "1", "efgh": "2"},
+        )
+        self.assertEqual(self.roundtrip(payload), payload)
+
+    def test_neighbour_and_heartbeat_roundtrip(self):
+        neighbour = NeighbourPayload(NeighbourSide.LEFT, "7")
+        heartbeat = HeartbeatPayload(HeartbeatRole.CLIENT, 12.5)
+        self.assertEqual(self.roundtrip(neighbour), neighbour)
+        self.assertEqual(self.roundtrip(heartbeat), heartbeat)
+
+class TestMetadataDispatch(unittest.TestCase):
+    def setUp(self):
+        self.store = MetadataStore()
+        self.cm = MagicMock()
+
+    def test_update_room(self):
+        msg = MetadataPayload(MetadataAction.UPDATE_ROOM, room_id="abcd").to_message("server-2")
+        self.store.handle_message(msg, self.cm)
+        self.assertEqual(self.store.room_locations, {"abcd": "server-2"})
+
+    def test_sync_rooms_merges(self):
+        self.store.room_locations["local"] = "server-1"
+        msg = MetadataPayload(MetadataAction.SYNC_ROOMS, rooms={"abcd": "server-2"}).to_message("server-2")
+        self.store.handle_message(msg, self.cm)
+        self.assertEqual(self.store.room_locations, {"local": "server-1", "abcd": "server-2"})
+
+    def test_follower_sends_typed_update(self):
+        server = MagicMock()
+        server.server_id = "server-3"
+        server.leader_id = "server-1"
+        server.state = ServerState.FOLLOWER
+        self.store.update_metadata("wxyz", server)
+
+        node_id, sent = server.connection_manager.send_to_node.call_args[0]
+        self.assertEqual(node_id, "server-1")
+        payload = MetadataPayload.from_message(sent)
+        self.assertEqual(payload.action, MetadataAction.UPDATE_ROOM)
+        self.assertEqual(payload.room_id, "wxyz")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+import contextlib
+import io
+from src.domain.dedup import DedupCache
+from src.domain.models import Message, MessageType, VectorClock
+from src.server.server_node import ServerNode
+
+def chat(sender, seq, room="lobby", **kw):
+    clock = VectorClock({sender: seq}) if seq else VectorClock()
+    return Message(type=MessageType.CHAT, sender_id=sender, room_id=room, vector_clock=clock, **kw)
+
+class TestDedupCache(unittest.TestCase):
+    def test_delivered_and_pending_numbers_are_duplicates(self):
+        cache = DedupCache(window=8)
+        self.assertTrue(cache.seen(chat("a", 3), delivered=3))
+        self.assertFalse(cache.seen(chat("a", 5), delivered=3))
+        # same number, new id: a retry of the held-back message
+        self.assertTrue(cache.seen(chat("a", 5), delivered=3))
+        self.assertFalse(cache.seen(chat("a", 4), delivered=3))
+        self.assertFalse(cache.seen(chat("b", 4), delivered=3))
+        self.assertEqual(cache.duplicates, 2)
+
+    def test_window_slides_with_the_room_clock(self):
+        cache = DedupCache(window=8)
+        for seq in range(2, 9):
+            cache.seen(chat("a", seq), delivered=1)
+        self.assertEqual(len(cache.pending["a"]), 7)
+        self.assertFalse(cache.seen(chat("a", 9), delivered=8))
+        self.assertEqual(cache.pending["a"], {9})
+
+    def test_lru_fallback(self):
+        cache = DedupCache(window=4, lru_size=2)
+        first = chat("a", 0)
+        self.assertFalse(cache.seen(first, delivered=0))
+        self.assertTrue(cache.seen(first, delivered=0))
+        # beyond the window: matched by id, also once the window has caught up
+        far = chat("a", 50)
+        self.assertFalse(cache.seen(far, delivered=0))
+        self.assertTrue(cache.seen(far, delivered=49))
+        for _ in range(2):
+            cache.seen(chat("a", 0), delivered=0)
+        self.assertFalse(cache.seen(first, delivered=0))
+        self.assertEqual(len(cache.ids), 2)
+
+class TestServerDedup(unittest.TestCase):
+    def setUp(self):
+        self.server = ServerNode("server-1", "127.0.0.1", 5000)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.room = self.server.create_room("lobby")
+
+    def test_retransmissions_are_delivered_once(self):
+        first, second, third = chat("alice", 1), chat("alice", 2), chat("alice", 3)
+        for msg in (first, third, first, third, second, second, third):
+            self.server._process_chat(msg)
+        self.assertEqual([m.vector_clock.timestamps["alice"] for m in self.room.message_history], [1, 2, 3])
+        self.assertEqual(len(self.room.hold_back_queue), 0)
+        self.assertEqual(self.server.metrics.counter("chat_duplicates").value, 4)
+
+    def test_room_copy_keeps_the_cache(self):
+        self.server._process_chat(chat("alice", 2))
+        copy = self.room.copy()
+        self.assertTrue(copy.dedup.seen(chat("alice", 2), delivered=0))
+        self.assertFalse(self.room.dedup.seen(chat("alice", 3), delivered=0))
+        self.assertNotIn(3, copy.dedup.pending["alice"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+import unittest
+import json
+import os
+import sys
+import tempfile
+from unittest.mock import patch, MagicMock
+from src.domain.models import Message, MessageType
+from src.network.constants import DISCOVERY_PORT, MULTICAST_GROUP
+from src.network.discovery import (BroadcastDiscovery, FileRegistryDiscovery, MulticastDiscovery,
+                                   SeedDiscovery, discovery_from_spec, local_ip)
+from src.server.server_node import ServerNode
+
+def request(attempt=0):
+    return Message(type=MessageType.DISCOVERY_REQUEST, sender_id="client", content=json.dumps({"attempt": attempt}))
+
+class TestDiscoveryBackends(unittest.TestCase):
+    def test_spec_parsing(self):
+        self.assertIsInstance(discovery_from_spec(None), BroadcastDiscovery)
+        self.assertEqual(discovery_from_spec("broadcast:6100").port, 6100)
+
+        seeds = discovery_from_spec("seeds:10.0.0.5,10.0.0.6:6001")
+        self.assertIsInstance(seeds, SeedDiscovery)
+        self.assertEqual(seeds.seeds, [("10.0.0.5", DISCOVERY_PORT), ("10.0.0.6", 6001)])
+        self.assertTrue(seeds.direct)
+
+        multicast = discovery_from_spec("multicast::6002/4")
+        self.assertIsInstance(multicast, MulticastDiscovery)
+        self.assertEqual((multicast.group, multicast.port, multicast.ttl), (MULTICAST_GROUP, 6002, 4))
+
+        self.assertEqual(discovery_from_spec("file:/tmp/peers.json").path, "/tmp/peers.json")
+        with self.assertRaises(ValueError):
+            discovery_from_spec("gossip")
+
+    def test_seed_requests_rotate_by_attempt(self):
+        backend = SeedDiscovery([("10.0.0.5", 6000), ("10.0.0.6", 6000)])
+        udp = MagicMock()
+        for attempt in range(3):
+            backend.request(udp, request(attempt), attempt)
+        self.assertEqual([c[0][1] for c in udp.send_to.call_args_list],
+                         [("10.0.0.5", 6000), ("10.0.0.6", 6000), ("10.0.0.5", 6000)])
+        backend.announce(udp, request())
+        udp.broadcast.assert_not_called()
+
+    def test_file_registry(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            backend = FileRegistryDiscovery(os.path.join(tmp, "peers.json"))
+            self.assertEqual(backend.peers(), {})
+            backend.register(1234, "127.0.0.1", 5001)
+            backend.register("abc", "127.0.0.1", 5002)
+            # ids come back with the type they were registered with
+            self.assertEqual(backend.peers(), {1234: {"ip": "127.0.0.1", "port": 5001},
+                                               "abc": {"ip": "127.0.0.1", "port": 5002}})
+            udp = MagicMock()
+            backend.request(udp, request(1), 1)
+            self.assertEqual(udp.send_to.call_args[0][1], ("127.0.0.1", DISCOVERY_PORT))
+            backend.unregister(1234)
+            self.assertEqual(list(backend.peers()), ["abc"])
+
+    def test_file_registry_without_fcntl_locks_with_msvcrt(self):
+        msvcrt = MagicMock(LK_LOCK=1, LK_UNLCK=0)
+        msvcrt.locking.side_effect = [OSError("busy"), None, None, None, None]
+        with tempfile.TemporaryDirectory() as tmp, patch.dict(sys.modules, {"fcntl": None, "msvcrt": msvcrt}):
+            backend = FileRegistryDiscovery(os.path.join(tmp, "peers.json"))
+            backend.register("abc", "127.0.0.1", 5002)
+            self.assertEqual(list(backend.peers()), ["abc"])
+        # a lock held by another server is waited for; every lock is released
+        self.assertEqual([c.args[1:] for c in msvcrt.locking.call_args_list], [(1, 1), (1, 1), (0, 1), (1, 1), (0, 1)])
+
+    def test_file_registry_expires_dead_servers(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "peers.json")
+            backend = FileRegistryDiscovery(path, ttl=30)
+            with patch("time.time", return_value=1000.0):
+                FileRegistryDiscovery(path, port=6999).register("dead", "127.0.0.1", 5001)
+                backend.register("alive", "127.0.0.1", 5002)
+            with patch("time.time", return_value=1025.0):
+                backend.register("alive", "127.0.0.1", 5002)
+            with patch("time.time", return_value=1040.0):
+                # "dead" never refreshed its entry: not offered to peers or clients
+                self.assertEqual(list(backend.peers()), ["alive"])
+                udp = MagicMock()
+                for attempt in range(2):
+                    backend.request(udp, request(attempt), attempt)
+                self.assertEqual([call[0][1] for call in udp.send_to.call_args_list], [("127.0.0.1", DISCOVERY_PORT)] * 2)
+                backend.register("new", "127.0.0.1", 5003)
+            with open(path) as f:
+                self.assertEqual(sorted(json.load(f)), ["alive", "new"])
+
+    def test_local_ip_needs_no_external_host(self):
+        self.assertEqual(local_ip("127.0.0.1", override="10.1.2.3"), "10.1.2.3")
+        with patch.dict(os.environ, {"CHAT_ADVERTISE_IP": "10.9.9.9"}):
+            self.assertEqual(local_ip("127.0.0.1"), "10.9.9.9")
+        with patch("socket.socket") as sock:
+            sock.return_value.connect.side_effect = OSError("no route")
+            with patch("socket.gethostbyname", side_effect=OSError):
+                self.assertEqual(local_ip("255.255.255.255"), "127.0.0.1")
+        self.assertNotIn("8.8.8.8", str(sock.return_value.connect.call_args))
+
+    def test_node_connects_to_registered_peers(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "peers.json")
+            FileRegistryDiscovery(path).register("2", "127.0.0.1", 7702)
+            with patch('src.server.server_node.ServerNode._get_local_ip', return_value="127.0.0.1"):
+                node = ServerNode("1", "127.0.0.1", 7701, 0, discovery=FileRegistryDiscovery(path))
+            node.discovery.register(node.server_id, node.ip_address, node.port)
+            node.udp_handler = MagicMock()
+            node.connection_manager.register_peer = MagicMock()
+            node._broadcast_server_discovery()
+
+        node.udp_handler.broadcast.assert_not_called()
+        node.connection_manager.register_peer.assert_called_once_with("2", "127.0.0.1", 7702)
+        self.assertEqual(node.servers["2"], {"ip": "127.0.0.1", "port": 7702})
+
+if __name__ == "__main__":
+    unittest.main()
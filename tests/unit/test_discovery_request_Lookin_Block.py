@@ -1,10 +1,10 @@
 import unittest
 import json
-import time
 import threading
 from unittest.mock import patch, MagicMock
 from src.server.server_node import ServerNode
 from src.domain.models import Message, MessageType, generate_node_id
+from src.domain.control import MetadataAction, MetadataPayload
 from src.server.server_state import ServerState
 
 class TestDiscoveryRequestLookingBlock(unittest.TestCase):
@@ -13,28 +13,29 @@ class TestDiscoveryRequestLookingBlock(unittest.TestCase):
         # leader_id isn't initialized in __init__ because it's just a type annotation
         with patch('src.server.server_node.ServerNode.create_room'):
             self.server = ServerNode("server-1", "127.0.0.1", 5000, 0)
-        
+
         # Manually set leader_id and other requirements
-        self.server.leader_id = "server-1" 
+        self.server.leader_id = "server-2"
         self.server.state = ServerState.LOOKING
-        
+
         # Mock connection manager and udp handler to avoid network side effects
         self.server.connection_manager.send_to_node = MagicMock()
         self.server.udp_handler.send_to = MagicMock()
+        self.server.udp_handler.send_bytes = MagicMock()
 
         # Now we can create rooms safely
         for _ in range(5):
             self.server.create_room(generate_node_id())
 
         # set metadata for one specific room
-        self.server.metadata_store.update_metadata("room-1", self.server, self.server.connection_manager)   
+        self.server.metadata_store.update_metadata("room-1", self.server)
+        self.server.connection_manager.send_to_node.reset_mock()
 
     def set_server_state(self, state: ServerState):
         self.server.state = state
 
-    def test_discovery_request_looking_block(self):
-        # Create a discovery request message
-        msg = Message(
+    def discovery_request(self):
+        return Message(
             type=MessageType.DISCOVERY_REQUEST,
             sender_id="client-1",
             content=json.dumps({
@@ -44,32 +45,53 @@ class TestDiscoveryRequestLookingBlock(unittest.TestCase):
             sender_addr=("127.0.0.1", 5001)
         )
 
-        # The handler blocks while in LOOKING state, so we run it in a thread
-        thread = threading.Thread(target=self.server._handle_client_discovery, args=(msg,))
+    def grant_lease(self):
+        sync = MetadataPayload(
+            MetadataAction.SYNC_ROOMS,
+            rooms={"remote": "server-2"},
+            peers={"server-2": {"ip": "127.0.0.1", "port": 5002}},
+            lease=5.0,
+        ).to_message("server-2")
+        self.server.metadata_store.handle_message(sync, self.server.connection_manager)
+
+    def run_handler(self):
+        # The handler used to spin while LOOKING; it must now return promptly
+        thread = threading.Thread(target=self.server._handle_client_discovery, args=(self.discovery_request(),))
         thread.start()
+        thread.join(timeout=1)
+        self.assertFalse(thread.is_alive(), "Handler must not block while in LOOKING state")
 
-        # Give it a moment to enter the while loop
-        time.sleep(0.5)
+    def test_discovery_request_looking_block(self):
+        # Follower with a valid read lease answers from its replica during the election
+        self.grant_lease()
+        self.run_handler()
 
-        # Verify that the server is still in LOOKING state and thread is waiting
-        self.assertTrue(thread.is_alive(), "Handler should be blocked while in LOOKING state")
         self.assertEqual(self.server.state, ServerState.LOOKING)
-        print(f"State before: {self.server.state}, should be LOOKING")
-        
-        # Wait a bit more to simulate "election time"
-        time.sleep(1)
+        self.server.connection_manager.send_to_node.assert_not_called()
+        frame, addr = self.server.udp_handler.send_bytes.call_args[0]
+        self.assertEqual(addr, ("127.0.0.1", 5001))
+        data = json.loads(Message.deserialize(frame).content)
+        self.assertEqual(data["rooms"]["remote"], "server-2")
+        self.assertIn("room-1", data["rooms"])
+        self.assertEqual(data["servers"]["server-2"]["port"], 5002)
 
-        # Change state to trigger the end of the loop
+    def test_expired_lease_forwards_to_leader(self):
+        self.grant_lease()
+        self.server.metadata_store.lease_until = 0.0
         self.set_server_state(ServerState.FOLLOWER)
-        print(f"Set state to: {self.server.state}")
+        self.run_handler()
+
+        self.server.udp_handler.send_bytes.assert_not_called()
+        node_id, forward = self.server.connection_manager.send_to_node.call_args[0]
+        self.assertEqual(node_id, "server-2")
+        self.assertEqual(forward.type, MessageType.AVAILABLE_ROOMS)
+
+    def test_no_lease_and_no_leader_drops(self):
+        self.server.leader_id = '0'
+        self.run_handler()
 
-        # Wait for thread to finish correctly
-        thread.join(timeout=2)
-        self.assertFalse(thread.is_alive(), "Handler should have unblocked after state change")
-        
-        # Verify that it tried to forward the request to the leader
-        self.server.connection_manager.send_to_node.assert_called()
-        print(f"State after: {self.server.state}, should be FOLLOWER")
+        self.server.udp_handler.send_bytes.assert_not_called()
+        self.server.connection_manager.send_to_node.assert_not_called()
 
 if __name__ == "__main__":
-    unittest.main()
\ No newline at end of file
+    unittest.main()
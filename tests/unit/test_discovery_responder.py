@@ -0,0 +1,69 @@
+import unittest
+import json
+from unittest.mock import patch, MagicMock
+from src.domain.models import Message, MessageType
+from src.server.server_node import ServerNode
+from src.server.server_state import ServerState
+from src.sim.loopback import InlineExecutor
+
+def discovery_request(client_id, attempt=0, port=5001):
+    return Message(
+        type=MessageType.DISCOVERY_REQUEST,
+        sender_id=client_id,
+        content=json.dumps({"attempt": attempt}),
+        sender_addr=("127.0.0.1", port),
+    )
+
+class TestDiscoveryResponder(unittest.TestCase):
+    def setUp(self):
+        with patch('src.server.server_node.ServerNode._get_local_ip', return_value="127.0.0.1"):
+            self.nodes = [ServerNode(str(i), "127.0.0.1", 7600 + i, 0) for i in range(1, 4)]
+        for node in self.nodes:
+            node.ring = ["1", "2", "3"]
+            node.leader_id = "3"
+            node.state = ServerState.FOLLOWER
+            node.metadata_store.lease_until = float("inf")
+            node.metadata_store.set_room("lobby", "1")
+            node.discovery_pool = InlineExecutor()
+            node.udp_handler.send_bytes = MagicMock()
+            node.connection_manager.send_to_node = MagicMock()
+        self.nodes[2].state = ServerState.LEADER
+
+    def answered_by(self, msg):
+        for node in self.nodes:
+            node._handle_udp_message(msg)
+        return [node.server_id for node in self.nodes if node.udp_handler.send_bytes.called]
+
+    def test_one_designated_responder_per_attempt(self):
+        first = self.answered_by(discovery_request("client-a"))
+        self.assertEqual(len(first), 1)
+        for node in self.nodes:
+            node.udp_handler.send_bytes.reset_mock()
+        retry = self.answered_by(discovery_request("client-a", attempt=1))
+        self.assertEqual(len(retry), 1)
+        self.assertNotEqual(first, retry)
+
+    def test_repeats_are_dropped_within_window(self):
+        node = self.nodes[0]
+        node.ring = []
+        for _ in range(5):
+            node._handle_udp_message(discovery_request("client-a"))
+        node._handle_udp_message(discovery_request("client-b", port=5002))
+        self.assertEqual(node.udp_handler.send_bytes.call_count, 2)
+        self.assertEqual(node.metrics.counter("discovery_requests", result="duplicate").value, 4)
+
+    def test_response_encoded_once_per_metadata_version(self):
+        node = self.nodes[0]
+        node.ring = []
+        for i in range(10):
+            node._handle_udp_message(discovery_request(f"client-{i}"))
+        self.assertEqual(node.metrics.counter("available_rooms_encoded").value, 1)
+
+        node.metadata_store.set_room("hall", "2")
+        node._handle_udp_message(discovery_request("client-new"))
+        self.assertEqual(node.metrics.counter("available_rooms_encoded").value, 2)
+        frame, addr = node.udp_handler.send_bytes.call_args[0]
+        self.assertEqual(json.loads(Message.deserialize(frame).content)["rooms"], {"lobby": "1", "hall": "2"})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,140 @@
+import unittest
+import contextlib
+import io
+from unittest.mock import patch
+from src.domain.models import MessageType
+from src.server.election import ElectionModule
+from src.server.server_node import ServerNode
+from src.server.server_state import ServerState
+from src.sim.loopback import LoopbackNetwork
+
+class TestDoublingElection(unittest.TestCase):
+    def setUp(self):
+        self.network = LoopbackNetwork()
+        self.nodes = []
+        with patch('src.server.server_node.ServerNode._get_local_ip', return_value="127.0.0.1"):
+            for i in range(8):
+                node = ServerNode(str(100 + i), "127.0.0.1", 7000 + i, 0, election_mode=ElectionModule.MODE_DOUBLING)
+                self.network.attach(node)
+                self.nodes.append(node)
+        for i, a in enumerate(self.nodes):
+            for b in self.nodes[i + 1:]:
+                self.network.connect(a, b)
+
+    def run_election(self, starters):
+        with contextlib.redirect_stdout(io.StringIO()):
+            for node in starters:
+                node.election_module.start_election(node.connection_manager)
+            self.network.run()
+
+    def test_all_nodes_agree_on_highest_id(self):
+        self.run_election(self.nodes)
+
+        for node in self.nodes:
+            self.assertEqual(node.leader_id, "107")
+            self.assertEqual(node.election_module.term, 1)
+        self.assertEqual(self.nodes[-1].state, ServerState.LEADER)
+        self.assertTrue(all(n.state == ServerState.FOLLOWER for n in self.nodes[:-1]))
+
+        # log2(8) = 3 rounds, one frame per node per round
+        self.assertEqual(self.network.frames_sent[MessageType.ELECTION], 8 * 3)
+
+    def test_single_starter_pulls_everyone_into_the_term(self):
+        self.run_election(self.nodes[:1])
+        self.assertTrue(all(n.leader_id == "107" for n in self.nodes))
+
+    def test_duplicate_start_is_suppressed(self):
+        self.run_election(self.nodes)
+        sent = self.network.frames_sent[MessageType.ELECTION]
+
+        # same membership again: no new term, no traffic
+        self.run_election(self.nodes)
+        self.assertEqual(self.network.frames_sent[MessageType.ELECTION], sent)
+        self.assertEqual(self.nodes[0].election_module.suppressed, 1)
+
+    def test_leader_excised_from_follower_ring(self):
+        self.run_election(self.nodes)
+        for node in self.nodes[:-1]:
+            self.assertNotEqual(node.left_neighbor.id, "107")
+            self.assertNotEqual(node.right_neighbor.id, "107")
+
+    def forget(self, node, peer_id):
+        # what the failure detector does before it starts the election
+        node.connection_manager.active_connections_peer_to_peer.pop(peer_id, None)
+
+    def test_mismatched_views_settle_on_smaller_ring(self):
+        self.network.crash(self.nodes[-1])
+        self.forget(self.nodes[0], "107")
+        # node 103 has not noticed the crash yet and starts the same term over all 8
+        self.run_election([self.nodes[0], self.nodes[3]])
+
+        for node in self.nodes[:-1]:
+            self.assertEqual(node.leader_id, "106")
+            self.assertNotIn("107", node.election_module.term_ring)
+            self.assertEqual(node.election_module.term, 1)
+        # the smaller ring wins the term without waiting out 107's rounds
+        self.assertTrue(all(n.election_module.restarts == 0 for n in self.nodes[:-1]))
+
+    def test_silent_partner_times_out(self):
+        # nobody has detected the crash: every node's ring still holds 107
+        self.network.crash(self.nodes[-1])
+        self.run_election(self.nodes[:-1])
+
+        for node in self.nodes[:-1]:
+            self.assertEqual(node.leader_id, "106")
+            self.assertFalse(node.election_module.in_progress)
+        self.assertEqual(self.nodes[-2].state, ServerState.LEADER)
+        # only 100, which waits on 107 in round 0, gives up on it
+        self.assertEqual([n.election_module.restarts for n in self.nodes[:-1]], [1, 0, 0, 0, 0, 0, 0])
+
+    def test_node_left_out_of_a_term_rejoins(self):
+        # the others hold an election while their links to 100 are down
+        links = {}
+        for node in self.nodes[1:]:
+            links[node] = node.connection_manager.active_connections_peer_to_peer["100"]
+            self.forget(node, "100")
+        self.run_election(self.nodes[1:2])
+        for node, conn in links.items():
+            node.connection_manager.active_connections_peer_to_peer["100"] = conn
+
+        # 100 starts a term that loses to the smaller ring, learns it was left out and gets itself back in
+        self.run_election(self.nodes[:1])
+        for node in self.nodes:
+            self.assertEqual(node.leader_id, "107")
+            self.assertIn("100", node.election_module.term_ring)
+
+    def test_room_map_is_synced_once_per_follower(self):
+        for node in self.nodes:
+            for i in range(5):
+                node.metadata_store.set_room(f"room-{i}", str(100 + i))
+        self.run_election(self.nodes)
+
+        # one SYNC_ROOMS per follower, and nobody claims rooms it does not host
+        self.assertEqual(self.network.frames_sent[MessageType.METADATA_UPDATE], 7)
+        for node in self.nodes:
+            self.assertEqual(node.metadata_store.room_locations, {f"room-{i}": str(100 + i) for i in range(5)})
+
+    def test_int_ids_as_main_server_uses_them(self):
+        network = LoopbackNetwork()
+        nodes = []
+        with patch('src.server.server_node.ServerNode._get_local_ip', return_value="127.0.0.1"):
+            for i in range(4):
+                node = ServerNode(100 + i, "127.0.0.1", 7100 + i, 0, election_mode=ElectionModule.MODE_DOUBLING)
+                network.attach(node)
+                nodes.append(node)
+        for i, a in enumerate(nodes):
+            for b in nodes[i + 1:]:
+                network.connect(a, b)
+        with contextlib.redirect_stdout(io.StringIO()):
+            for node in nodes:
+                node.election_module.start_election(node.connection_manager)
+            network.run()
+
+        self.assertEqual([n.state for n in nodes], [ServerState.FOLLOWER] * 3 + [ServerState.LEADER])
+        self.assertTrue(all(str(n.leader_id) == "103" for n in nodes))
+        self.assertTrue(all(n.connection_manager.undeliverable == 0 for n in nodes))
+        # neighbours are the keys the connection manager knows the peers by
+        self.assertIn(nodes[0].left_neighbor.id, nodes[0].connection_manager.active_connections_peer_to_peer)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+import threading
+import contextlib
+import io
+from unittest.mock import patch
+from src.domain.models import MessageType
+from src.network.clock import PeriodicTask
+from src.server.server_node import ServerNode
+from src.server.server_state import ServerState
+
+class Peer:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, msg):
+        self.sent.append(msg)
+
+
+class TestLeaderHeartbeat(unittest.TestCase):
+    def setUp(self):
+        with patch('src.server.server_node.ServerNode._get_local_ip', return_value="127.0.0.1"):
+            self.node = ServerNode("1", "127.0.0.1", 7601, 0)
+        self.node.state = ServerState.LEADER
+        self.node.leader_id = "1"
+        self.peers = {"2": Peer(), "3": Peer()}
+        self.node.connection_manager.active_connections_peer_to_peer.update(self.peers)
+
+    def test_peer_dropped_by_its_heartbeat_is_not_synced(self):
+        manager = self.node.connection_manager
+        send = manager.send_to_node
+        def failing_send(node_id, msg):
+            if node_id == "2":
+                # the socket is gone: the send drops the connection
+                manager.active_connections_peer_to_peer.pop("2")
+                return
+            send(node_id, msg)
+
+        with patch.object(manager, "send_to_node", side_effect=failing_send), contextlib.redirect_stdout(io.StringIO()):
+            self.node.failure_detector.send_heartbeat(manager, self.node.metadata_store)
+
+        self.assertEqual(self.peers["2"].sent, [])
+        self.assertEqual([m.type for m in self.peers["3"].sent], [MessageType.HEARTBEAT, MessageType.METADATA_UPDATE])
+
+
+class TestPeriodicTask(unittest.TestCase):
+    def test_keeps_ticking_after_a_failed_run(self):
+        runs = []
+        done = threading.Event()
+        def tick():
+            runs.append(len(runs))
+            if len(runs) == 1:
+                raise RuntimeError("boom")
+            if len(runs) == 3:
+                done.set()
+
+        task = PeriodicTask(0.001, tick)
+        with self.assertLogs("chat.clock", level="ERROR") as logs:
+            self.assertTrue(done.wait(2.0))
+        task.cancel()
+        self.assertIn("periodic_task_failed", logs.output[0])
+        self.assertIn("boom", logs.output[0])
+
+if __name__ == "__main__":
+    unittest.main()
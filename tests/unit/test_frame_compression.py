@@ -0,0 +1,80 @@
+import unittest
+import socket
+from unittest.mock import MagicMock
+from src.domain.control import MetadataAction, MetadataPayload
+from src.domain.models import Message, MessageType
+from src.network.compression import FrameCompressor, FrameDecompressor, parse_header
+from src.network.transport import TCPConnection
+from src.server.server_node import ServerNode
+
+def sync_rooms(n=200):
+    rooms = {f"room-{i:04d}": str(i % 5) for i in range(n)}
+    peers = {str(i): {"ip": f"10.0.0.{i}", "port": 5000 + i} for i in range(5)}
+    return MetadataPayload(MetadataAction.SYNC_ROOMS, rooms=rooms, peers=peers).to_message("1")
+
+class TestFrameCompression(unittest.TestCase):
+    def setUp(self):
+        a, b = socket.socketpair()
+        self.a = TCPConnection(a)
+        self.b = TCPConnection(b)
+
+    def tearDown(self):
+        self.a.close()
+        self.b.close()
+
+    def raw_header(self, conn):
+        # peeks at the next frame's length prefix without consuming it
+        return parse_header(conn.socket.recv(4, socket.MSG_PEEK))
+
+    def test_uncompressed_until_negotiated(self):
+        self.a.send(sync_rooms())
+        length, compressed = self.raw_header(self.b)
+        self.assertFalse(compressed)
+        self.assertEqual(self.b.receive().type, MessageType.METADATA_UPDATE)
+
+    def test_large_frames_compressed_small_ones_not(self):
+        self.a.enable_compression()
+        big = sync_rooms()
+        self.a.send(Message(type=MessageType.CHAT, sender_id="x", content="hi"))
+        self.a.send(big)
+
+        self.assertFalse(self.raw_header(self.b)[1])
+        self.assertEqual(self.b.receive().content, "hi")
+        length, compressed = self.raw_header(self.b)
+        self.assertTrue(compressed)
+        self.assertLess(length * 3, len(big.serialize()))
+        self.assertEqual(self.b.receive().content, big.content)
+
+    def test_receiving_a_compressed_frame_enables_compression_back(self):
+        self.b.enable_compression()
+        self.b.send(sync_rooms())
+        self.a.receive()
+        self.assertIsNotNone(self.a.compressor)
+        self.a.send(sync_rooms(300))
+        self.assertTrue(self.raw_header(self.b)[1])
+        self.assertEqual(len(MetadataPayload.from_message(self.b.receive()).rooms), 300)
+
+    def test_stream_reuses_earlier_frames(self):
+        compressor, decompressor = FrameCompressor(), FrameDecompressor()
+        frames = [sync_rooms().serialize() for _ in range(3)]
+        sizes = []
+        for frame in frames:
+            data, compressed = compressor.compress(frame)
+            self.assertTrue(compressed)
+            self.assertEqual(decompressor.decompress(data), frame)
+            sizes.append(len(data))
+        # only the message id differs from the frame before
+        self.assertLess(sizes[1] * 4, sizes[0])
+
+class TestCompressionNegotiation(unittest.TestCase):
+    def test_join_header_enables_compression(self):
+        server = ServerNode("server-1", "127.0.0.1", 5000)
+        server.connection_manager.listen_to_connection = MagicMock()
+        plain, compressing = MagicMock(), MagicMock()
+        server.handle_join_message(Message(type=MessageType.CLIENT_JOIN, sender_id="old"), plain)
+        server.handle_join_message(Message(type=MessageType.CLIENT_JOIN, sender_id="new", headers={"compress": "zlib"}), compressing)
+        plain.enable_compression.assert_not_called()
+        compressing.enable_compression.assert_called_once()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+import contextlib
+import io
+from unittest.mock import patch
+from src.client.chat_client import ChatClient
+from src.domain.causal import HoldBackBuffer
+from src.domain.models import Message, MessageType, VectorClock
+from src.server.server_node import ServerNode
+from src.sim.loopback import LoopbackNetwork
+
+def chat(sender, content, **clock):
+    return Message(type=MessageType.CHAT, sender_id=sender, room_id="r", content=content, vector_clock=VectorClock(clock))
+
+class TestHoldBackBuffer(unittest.TestCase):
+    def test_drain_delivers_in_causal_order(self):
+        buffer = HoldBackBuffer()
+        a2 = chat("a", "a2", a=2)
+        b1 = chat("b", "b1", a=2, b=1)
+        a1 = chat("a", "a1", a=1)
+        for msg in (b1, a2, a1):
+            buffer.append(msg)
+        self.assertEqual(len(buffer), 3)
+        self.assertIn(a2, buffer)
+
+        clock = VectorClock()
+        delivered = []
+        def deliver(msg):
+            clock.merge(msg.vector_clock)
+            delivered.append(msg.content)
+        self.assertEqual(buffer.drain(clock, deliver), 3)
+        self.assertEqual(delivered, ["a1", "a2", "b1"])
+        self.assertEqual(buffer, [])
+
+    def test_waits_for_gap_and_drops_duplicates(self):
+        buffer = HoldBackBuffer([chat("a", "a3", a=3), chat("a", "a1-dup", a=1)])
+        clock = VectorClock({"a": 1})
+        self.assertEqual(buffer.drain(clock, lambda m: clock.merge(m.vector_clock)), 0)
+        self.assertEqual([m.content for m in buffer], ["a3"])
+        self.assertEqual(buffer.stale, 1)
+
+    def test_copy_and_list_compat(self):
+        msg = chat("a", "a2", a=2)
+        buffer = HoldBackBuffer([msg])
+        copy = buffer.copy()
+        copy.remove(msg)
+        self.assertEqual(len(buffer), 1)
+        self.assertEqual(copy, [])
+
+
+class TestClientJoinSync(unittest.TestCase):
+    def test_late_joiner_is_synced_and_orders_deliveries(self):
+        network = LoopbackNetwork()
+        with patch('src.server.server_node.ServerNode._get_local_ip', return_value="127.0.0.1"):
+            node = ServerNode("1", "127.0.0.1", 7601, 0)
+        network.attach(node)
+        with contextlib.redirect_stdout(io.StringIO()):
+            node.create_room("lobby")
+            early = network.open_client(node, "early", lambda msg: None)
+            early.send(Message(type=MessageType.JOIN_ROOM, sender_id="early", room_id="lobby"))
+            for seq in (1, 2):
+                early.send(Message(type=MessageType.CHAT, sender_id="early", room_id="lobby",
+                                   content=f"e{seq}", vector_clock=VectorClock({"early": seq})))
+            network.run()
+
+            client = ChatClient("late", client_id="late")
+            late = network.open_client(node, "late", client.receive_message)
+            late.send(Message(type=MessageType.JOIN_ROOM, sender_id="late", room_id="lobby"))
+            early.send(Message(type=MessageType.CHAT, sender_id="early", room_id="lobby",
+                               content="e3", vector_clock=VectorClock({"early": 3})))
+            network.run()
+
+        self.assertEqual(client.rooms.session("lobby").clock.timestamps, {"early": 3})
+        self.assertEqual(len(client.rooms.session("lobby").hold_back), 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+import contextlib
+import io
+from unittest.mock import patch, MagicMock
+from src.domain.models import MessageType
+from src.server.election import ElectionModule
+from src.server.server_node import ServerNode
+from src.server.server_state import ServerState
+from src.sim.loopback import LoopbackNetwork
+
+class TestJoinCoalescer(unittest.TestCase):
+    def setUp(self):
+        self.network = LoopbackNetwork()
+        self.nodes = []
+        with patch('src.server.server_node.ServerNode._get_local_ip', return_value="127.0.0.1"):
+            for i in range(5):
+                node = ServerNode(str(200 + i), "127.0.0.1", 7100 + i, 0, election_mode=ElectionModule.MODE_DOUBLING)
+                self.network.attach(node)
+                self.nodes.append(node)
+
+    def test_burst_of_joins_settles_once(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            for i, node in enumerate(self.nodes):
+                self.network.call_later(i * 0.01, node._broadcast_server_discovery)
+            self.network.run()
+
+        for node in self.nodes:
+            # one ring recompute and one election per node for the whole burst
+            self.assertEqual(node.join_coalescer.flushes, 1)
+            self.assertEqual(len(node.ring), 5)
+            self.assertEqual(node.leader_id, "204")
+        self.assertEqual(self.nodes[-1].state, ServerState.LEADER)
+
+    def test_window_is_debounced(self):
+        node = self.nodes[0]
+        node.election_module.start_election = MagicMock()
+
+        node.join_coalescer.note_join("a")
+        self.network.run(until=0.2)
+        node.join_coalescer.note_join("b")
+        self.network.run(until=0.45)
+        # second join pushed the flush out to 0.5
+        node.election_module.start_election.assert_not_called()
+        self.assertEqual(node.state, ServerState.LOOKING)
+
+        self.network.run()
+        node.election_module.start_election.assert_called_once()
+        self.assertEqual(node.join_coalescer.pending, set())
+
+    def test_max_delay_bounds_the_window(self):
+        node = self.nodes[0]
+        node.election_module.start_election = MagicMock()
+        node.join_coalescer.max_delay = 0.5
+
+        # a join every 0.2s would keep a pure debounce open forever
+        for i in range(10):
+            self.network.call_later(i * 0.2, lambda i=i: node.join_coalescer.note_join(str(i)))
+        self.network.run(until=0.6)
+        node.election_module.start_election.assert_called_once()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+import unittest
+import contextlib
+import io
+import json
+import logging
+import threading
+import urllib.request
+from unittest.mock import patch
+from src.domain.models import Message, MessageType, VectorClock
+from src.observability.endpoint import MetricsEndpoint
+from src.observability.log import StructuredLogger
+from src.observability.metrics import Histogram, MetricsRegistry
+from src.server.server_node import ServerNode
+from src.sim.loopback import LoopbackNetwork
+
+class TestHistogram(unittest.TestCase):
+    def test_percentiles_within_bucket_resolution(self):
+        h = Histogram()
+        for i in range(1, 10001):
+            h.observe(i * 1e-5)  # 10us .. 100ms
+        for p, exact in ((0.5, 0.05), (0.99, 0.099), (0.999, 0.0999)):
+            self.assertAlmostEqual(h.percentile(p), exact, delta=exact / Histogram.SUB_BUCKETS * 1.5)
+        self.assertEqual(h.count, 10000)
+        self.assertAlmostEqual(h.max, 0.1)
+        self.assertLess(len(h.buckets), 400)
+
+    def test_registry_export(self):
+        m = MetricsRegistry(node="n1")
+        m.counter("frames_in", type="CHAT").inc(3)
+        m.gauge("rooms", lambda: 2)
+        m.histogram("fanout_seconds").observe(0.001)
+        snap = m.snapshot()
+        self.assertEqual(snap["counters"]["frames_in{node=n1,type=CHAT}"], 3)
+        self.assertEqual(snap["gauges"]["rooms{node=n1}"], 2)
+        self.assertEqual(snap["histograms"]["fanout_seconds{node=n1}"]["count"], 1)
+        text = m.prometheus()
+        self.assertIn('frames_in{node="n1",type="CHAT"} 3', text)
+        self.assertIn('fanout_seconds_count{node="n1"} 1', text)
+
+    def test_concurrent_recording_and_export(self):
+        m = MetricsRegistry()
+        errors = []
+
+        def record(worker):
+            for i in range(20000):
+                m.counter("frames_in").inc()
+                m.histogram("latency", worker=worker).observe((i % 5000 + 1) * 1e-6)
+
+        def export():
+            try:
+                for _ in range(50):
+                    m.snapshot()
+                    m.prometheus()
+            except RuntimeError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=record, args=(w,)) for w in range(4)] + [threading.Thread(target=export)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(m.counter("frames_in").value, 80000)
+        self.assertEqual(sum(m.histogram("latency", worker=w).count for w in range(4)), 80000)
+
+
+class TestStructuredLogger(unittest.TestCase):
+    def test_rate_limited_and_counts_suppressed(self):
+        log = StructuredLogger("test.ratelimit", rate=0.001, burst=2)
+        with self.assertLogs("chat.test.ratelimit", level="INFO") as captured:
+            for i in range(5):
+                log.info("hot_event", i=i)
+            log._budget["hot_event"] = (1, log._budget["hot_event"][1], log._budget["hot_event"][2])
+            log.info("hot_event", i=5)
+        self.assertEqual(len(captured.records), 3)
+        self.assertEqual(captured.records[-1].getMessage(), "hot_event i=5 suppressed=3")
+
+    def test_disabled_level_is_skipped(self):
+        log = StructuredLogger("test.disabled")
+        logging.getLogger("chat.test.disabled").setLevel(logging.WARNING)
+        log.debug("quiet")
+        self.assertEqual(log._budget, {})
+
+
+class TestNodeMetrics(unittest.TestCase):
+    def test_hot_path_metrics_and_endpoint(self):
+        network = LoopbackNetwork()
+        with patch('src.server.server_node.ServerNode._get_local_ip', return_value="127.0.0.1"):
+            node = ServerNode("1", "127.0.0.1", 7701, 0)
+        network.attach(node)
+        with contextlib.redirect_stdout(io.StringIO()):
+            node.create_room("lobby")
+            conn = network.open_client(node, "a", lambda msg: None)
+            conn.send(Message(type=MessageType.JOIN_ROOM, sender_id="a", room_id="lobby"))
+            conn.send(Message(type=MessageType.CHAT, sender_id="a", room_id="lobby", vector_clock=VectorClock({"a": 2})))
+            conn.send(Message(type=MessageType.CHAT, sender_id="a", room_id="lobby", vector_clock=VectorClock({"a": 1})))
+            network.run()
+
+        self.assertEqual(node.metrics.counter("frames_in", type="CHAT").value, 2)
+        self.assertEqual(node.metrics.histogram("fanout_seconds").count, 2)
+
+        endpoint = node.start_metrics_endpoint(port=0)
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{endpoint.port}/metrics.json", timeout=5) as r:
+                data = json.loads(r.read())
+            with urllib.request.urlopen(f"http://127.0.0.1:{endpoint.port}/metrics", timeout=5) as r:
+                text = r.read().decode()
+        finally:
+            endpoint.stop()
+        self.assertEqual(data["counters"]["frames_in{node=1,type=CHAT}"], 2)
+        self.assertEqual(data["gauges"]["holdback_depth{node=1}"], 0)
+        self.assertIn("rate_limiter", data)
+        self.assertIn('fanout_seconds_count{node="1"} 2', text)
+
+if __name__ == "__main__":
+    unittest.main()
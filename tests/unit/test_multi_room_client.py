@@ -0,0 +1,140 @@
+import unittest
+import contextlib
+import io
+from unittest.mock import patch
+from src.client.chat_client import ChatClient
+from src.domain.models import MessageType
+from src.server.server_node import ServerNode
+from src.sim.loopback import LoopbackNetwork
+
+class TestMultiRoomClient(unittest.TestCase):
+    def setUp(self):
+        self.network = LoopbackNetwork()
+        with patch('src.server.server_node.ServerNode._get_local_ip', return_value="127.0.0.1"):
+            self.node = ServerNode("1", "127.0.0.1", 7301, 0)
+        self.network.attach(self.node)
+        self.stdout = contextlib.redirect_stdout(io.StringIO())
+        self.stdout.__enter__()
+        for room_id in ("a", "b", "c"):
+            self.node.create_room(room_id)
+
+    def tearDown(self):
+        self.stdout.__exit__(None, None, None)
+
+    def connect(self, client_id):
+        client = ChatClient(client_id, client_id=client_id)
+        delivered = []
+        deliver = client._deliver
+        client._deliver = lambda msg: (delivered.append((msg.room_id, msg.content)), deliver(msg))
+        client.server_connection = self.network.open_client(self.node, client_id, client.receive_message)
+        return client, delivered
+
+    def test_rooms_share_one_connection_with_own_clocks(self):
+        x, _ = self.connect("x")
+        y, seen = self.connect("y")
+        for client in (x, y):
+            client.join_room("a")
+            client.join_room("b")
+        self.network.run()
+
+        for i in range(3):
+            x.send_message(f"a{i}", "a")
+        for i in range(2):
+            x.send_message(f"b{i}", "b")
+        self.network.run()
+
+        rooms = self.node.managed_rooms
+        # a shared clock would have sent b0 as x:5, held back forever by room b
+        self.assertEqual(rooms["a"].vector_clock.timestamps["x"], 4)
+        self.assertEqual(rooms["b"].vector_clock.timestamps["x"], 3)
+        self.assertEqual(len(rooms["b"].hold_back_queue), 0)
+        self.assertEqual([content for room_id, content in seen if room_id == "b" and content.startswith("b")], ["b0", "b1"])
+        self.assertEqual([content for room_id, content in seen if room_id == "a" and content.startswith("a")], ["a0", "a1", "a2"])
+        self.assertEqual(len(y.rooms.session("a").hold_back), 0)
+        self.assertEqual(self.node.memberships.rooms_of("x"), {"a", "b"})
+
+    def test_leave_one_room_keeps_the_others(self):
+        x, seen = self.connect("x")
+        for room_id in ("a", "b", "c"):
+            x.join_room(room_id)
+        x.leave_room("c")
+        self.network.run()
+
+        self.assertEqual(x.current_room, "a")
+        self.assertEqual(list(x.rooms), ["a", "b"])
+        self.assertEqual(self.node.managed_rooms["c"].client_ids, [])
+        self.assertEqual(self.node.memberships.rooms_of("x"), {"a", "b"})
+
+        x.send_message("still here")
+        self.network.run()
+        self.assertIn(("a", "still here"), seen)
+        self.assertFalse(x.switch_room("c"))
+
+    def test_reconnect_retransmits_and_room_drops_copies(self):
+        x, _ = self.connect("x")
+        x.join_room("a")
+        x.send_message("m0", "a")
+        # m1 is lost with the old connection
+        send = x.server_connection.send
+        x.server_connection.send = lambda msg: None if msg.content == "m1" else send(msg)
+        x.send_message("m1", "a")
+        x.send_message("m2", "a")
+        self.network.run()
+        room = self.node.managed_rooms["a"]
+        self.assertEqual(len(room.hold_back_queue), 1)
+
+        x.connection_manager.connect_to = lambda ip, port: self.network.open_client(self.node, "x", x.receive_message)
+        x.connection_manager.listen_to_connection = lambda conn, callback: None
+        x.start("127.0.0.1", 7301)
+        self.network.run()
+
+        self.assertEqual([m.content for m in room.message_history], ["joined room ", "m0", "m1", "m2"])
+        self.assertEqual(len(room.hold_back_queue), 0)
+        # only what the SYNC did not cover is resent: m1, and m2 which the room held back
+        self.assertEqual(self.node.metrics.counter("chat_duplicates").value, 1)
+        self.assertEqual([m.content for m in x.outbox.values()], ["m1", "m2"])
+
+    def test_copies_of_delivered_messages_cost_no_tokens(self):
+        self.node.rate_limiter.client_limits = (0.001, 4)
+        x, _ = self.connect("x")
+        x.join_room("a")
+        x.send_message("m0", "a")
+        x.send_message("m1", "a")
+        self.network.run()
+
+        for _ in range(10):
+            for msg in list(x.outbox.values()):
+                x.server_connection.send(msg)
+        x.send_message("m2", "a")
+        self.network.run()
+
+        room = self.node.managed_rooms["a"]
+        self.assertEqual([m.content for m in room.message_history], ["joined room ", "m0", "m1", "m2"])
+        self.assertEqual(self.node.rate_limiter.rejected, 0)
+        self.assertEqual(self.node.metrics.counter("chat_duplicates").value, 30)
+
+    def test_lines_before_any_room_take_the_joined_rooms_clock(self):
+        x, _ = self.connect("x")
+        x.send_message("early one")
+        x.send_message("early two")
+        self.assertEqual(list(x.rooms), [])
+        self.assertEqual(x.outbox, {})
+
+        x.join_room("a")
+        self.network.run()
+        room = self.node.managed_rooms["a"]
+        self.assertEqual([m.content for m in room.message_history], ["early one", "early two", "joined room "])
+        self.assertEqual(room.vector_clock.timestamps["x"], 3)
+        self.assertEqual(self.node.metrics.counter("chat_duplicates").value, 0)
+
+        # a reconnect resubscribes to real rooms only
+        x.connection_manager.connect_to = lambda ip, port: self.network.open_client(self.node, "x", x.receive_message)
+        x.connection_manager.listen_to_connection = lambda conn, callback: None
+        x.start("127.0.0.1", 7301)
+        self.network.run()
+        self.assertEqual(list(x.rooms), ["a"])
+        self.assertEqual(self.node.memberships.rooms_of("x"), {"a"})
+        self.assertEqual(len(room.message_history), 3)
+
+if __name__ == "__main__":
+    unittest.main()
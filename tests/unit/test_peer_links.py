@@ -0,0 +1,209 @@
+import unittest
+from unittest.mock import MagicMock
+from src.domain.models import Message, MessageType
+from src.network.transport import ConnectionManager
+from src.network.constants import PEER_MAX_ATTEMPTS
+
+class ManualClock:
+    """Collects call_later callbacks so the test decides when timers fire."""
+    def __init__(self):
+        self.t = 0.0
+        self.pending = []
+
+    def now(self):
+        return self.t
+
+    def call_later(self, delay, fn):
+        self.pending.append((self.t + delay, fn))
+        return MagicMock()
+
+    def run_all(self, limit=100):
+        for _ in range(limit):
+            if not self.pending:
+                return
+            self.pending.sort(key=lambda p: p[0])
+            self.t, fn = self.pending.pop(0)
+            fn()
+
+class FakeConn:
+    def __init__(self, ip="10.0.0.2", port=5002):
+        self.ip = ip
+        self.port = port
+        self.sent = []
+        self.up = True
+
+    def send(self, msg):
+        if not self.up:
+            return False
+        self.sent.append(msg)
+        return True
+
+    def close(self):
+        self.up = False
+
+def chat(i):
+    return Message(type=MessageType.CHAT, content=str(i), sender_id="server-1")
+
+def election(i):
+    return Message(type=MessageType.ELECTION, content=str(i), sender_id="server-1")
+
+class TestPeerLinks(unittest.TestCase):
+    def setUp(self):
+        self.cm = ConnectionManager()
+        self.cm.clock = ManualClock()
+        self.cm.listen_to_connection = MagicMock()
+        self.cm.on_peer_message = MagicMock()
+        self.handshakes = []
+        self.cm.on_peer_connected = lambda node_id, conn, reconnect: (
+            self.handshakes.append(reconnect),
+            conn.send(Message(type=MessageType.SERVER_JOIN, sender_id="server-1")),
+        )
+        self.conns = []
+        def connect_to(ip, port, timeout=None):
+            conn = FakeConn(ip, port)
+            self.conns.append(conn)
+            return conn
+        self.cm.connect_to = MagicMock(side_effect=connect_to)
+
+    def test_lazy_connect_buffers_and_flushes_after_handshake(self):
+        self.cm.register_peer("server-2", "10.0.0.2", 5002)
+        self.cm.connect_to.assert_not_called()
+
+        for i in range(3):
+            self.cm.send_to_node("server-2", chat(i))
+        self.assertEqual(self.cm.peer_links["server-2"].stats()["buffered"], 3)
+
+        self.cm.clock.run_all()
+        control, data = self.conns
+        self.assertEqual([m.type for m in control.sent], [MessageType.SERVER_JOIN])
+        # data frames go out on the data lane, after its own join
+        self.assertEqual([m.type for m in data.sent], [MessageType.SERVER_JOIN] + [MessageType.CHAT] * 3)
+        self.assertEqual([m.content for m in data.sent[1:]], ["0", "1", "2"])
+        self.assertEqual(self.handshakes, [False])
+        self.assertTrue(self.cm.peer_links["server-2"].healthy())
+
+    def test_send_failure_reconnects_without_losing_frames(self):
+        link = self.cm.register_peer("server-2", "10.0.0.2", 5002)
+        self.cm.send_to_node("server-2", chat(0))
+        self.cm.clock.run_all()
+
+        # conns[1] is the data lane; control frames notice the broken control connection
+        self.conns[0].up = False
+        self.cm.send_to_node("server-2", election(1))
+        self.cm.send_to_node("server-2", election(2))
+        self.cm.clock.run_all()
+
+        # a new control connection, and a new data lane with it
+        self.assertEqual(len(self.conns), 4)
+        self.assertEqual([m.content for m in self.conns[2].sent[1:]], ["1", "2"])
+        self.assertEqual(self.handshakes, [False, True])
+        self.assertEqual(link.stats()["failures"], 1)
+        self.assertIs(self.cm.active_connections_peer_to_peer["server-2"], self.conns[2])
+
+    def test_reader_side_close_reconnects(self):
+        link = self.cm.register_peer("server-2", "10.0.0.2", 5002)
+        self.cm.send_to_node("server-2", election(0))
+        self.cm.clock.run_all()
+        control, data = self.conns
+
+        # the read loop saw the socket close; nothing is being sent
+        link.connection_lost(control)
+        self.assertNotIn("server-2", self.cm.active_connections_peer_to_peer)
+        self.assertNotIn("server-2", self.cm.data_connections)
+        self.assertFalse(data.up)
+        self.assertFalse(link.healthy())
+        self.assertFalse(link.stats()["connected"])
+
+        self.cm.clock.run_all()
+        self.assertIs(self.cm.active_connections_peer_to_peer["server-2"], self.conns[2])
+        self.assertIs(self.cm.data_connections["server-2"], self.conns[3])
+        self.assertEqual(self.handshakes, [False, True])
+        self.assertTrue(link.healthy())
+
+    def test_data_frames_use_the_data_lane(self):
+        self.cm.node_id = "server-1"
+        link = self.cm.register_peer("server-2", "10.0.0.2", 5002)
+        self.cm.send_to_node("server-2", election(0))
+        self.cm.clock.run_all()
+        control, data = self.conns
+        self.assertEqual(data.sent[0].type, MessageType.SERVER_JOIN)
+        self.assertEqual(data.sent[0].headers["lane"], "data")
+        self.assertEqual(data.sent[0].sender_id, "server-1")
+
+        self.cm.send_to_node("server-2", chat(1))
+        self.cm.send_to_node("server-2", election(2))
+        self.assertEqual([m.content for m in data.sent[1:]], ["1"])
+        self.assertEqual([m.content for m in control.sent[1:]], ["0", "2"])
+        self.assertEqual(link.stats()["data_frames_sent"], 1)
+
+    def test_data_frames_wait_for_the_data_lane(self):
+        link = self.cm.register_peer("server-2", "10.0.0.2", 5002)
+        self.cm.send_to_node("server-2", election(0))
+        self.cm.clock.run_all()
+        control, data = self.conns
+
+        data.up = False
+        self.cm.send_to_node("server-2", chat(1))
+        self.cm.send_to_node("server-2", chat(2))
+        # not on the control lane, where they could overtake frames still in flight on the data lane
+        self.assertEqual([m.content for m in control.sent[1:]], ["0"])
+        self.assertNotIn("server-2", self.cm.data_connections)
+        self.assertEqual(link.stats()["buffered"], 2)
+        # a fresh data lane is opened in the background and takes them in order
+        self.cm.clock.run_all()
+        self.cm.send_to_node("server-2", chat(3))
+        self.assertEqual([m.content for m in self.conns[2].sent[1:]], ["1", "2", "3"])
+        self.assertTrue(link.stats()["data_lane"])
+        self.assertEqual(link.stats()["buffered"], 0)
+
+    def test_data_lane_retries_with_backoff(self):
+        link = self.cm.register_peer("server-2", "10.0.0.2", 5002)
+        self.cm.send_to_node("server-2", election(0))
+        connect_to = self.cm.connect_to.side_effect
+        refusals = []
+
+        def refuse_data_lane(ip, port, timeout=None):
+            if self.conns and len(refusals) < 3:
+                refusals.append(ip)
+                raise ConnectionRefusedError("refused")
+            return connect_to(ip, port, timeout)
+        self.cm.connect_to.side_effect = refuse_data_lane
+        self.cm.send_to_node("server-2", chat(1))
+        self.cm.clock.run_all()
+
+        control, data = self.conns
+        self.assertEqual(len(refusals), 3)
+        self.assertEqual([m.content for m in data.sent[1:]], ["1"])
+        self.assertEqual([m.content for m in control.sent[1:]], ["0"])
+        self.assertEqual(link.data_attempts, 0)
+
+    def test_backoff_gives_up_after_max_attempts(self):
+        self.cm.connect_to.side_effect = ConnectionRefusedError("refused")
+        link = self.cm.register_peer("server-2", "10.0.0.2", 5002)
+        self.cm.send_to_node("server-2", chat(0))
+        self.cm.clock.run_all()
+
+        self.assertEqual(self.cm.connect_to.call_count, PEER_MAX_ATTEMPTS)
+        self.assertFalse(link.connecting)
+        self.assertEqual(link.stats()["buffered"], 1)
+        # exponential backoff: the last wait is capped, and much longer than the first
+        self.assertGreater(self.cm.clock.t, 10)
+
+    def test_buffer_is_bounded(self):
+        link = self.cm.register_peer("server-2", "10.0.0.2", 5002)
+        link.buffer_size = 2
+        for i in range(5):
+            self.cm.send_to_node("server-2", chat(i))
+        self.assertEqual([m.content for m in link.data_buffer], ["3", "4"])
+        self.assertEqual(link.stats()["frames_dropped"], 3)
+
+    def test_forget_peer_stops_link(self):
+        self.cm.register_peer("server-2", "10.0.0.2", 5002)
+        self.cm.forget_peer("server-2")
+        self.cm.send_to_node("server-2", chat(0))
+        self.cm.clock.run_all()
+        self.cm.connect_to.assert_not_called()
+        self.assertEqual(self.cm.undeliverable, 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+import unittest
+import contextlib
+import io
+import threading
+import time
+from unittest.mock import patch
+from src.domain.control import AdminCommand, AdminPayload
+from src.domain.models import Message, MessageType, VectorClock
+from src.observability.profiler import SamplingProfiler
+from src.server.server_node import ServerNode
+from src.sim.loopback import LoopbackNetwork
+
+def spin(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+class TestSamplingProfiler(unittest.TestCase):
+    def test_collapsed_stacks_of_busy_thread(self):
+        stop = threading.Event()
+        worker = threading.Thread(target=spin, args=(stop,), name="spinner")
+        worker.start()
+        profiler = SamplingProfiler(interval=0.001)
+        profiler.start()
+        time.sleep(0.1)
+        profiler.stop()
+        stop.set()
+        worker.join()
+
+        self.assertGreater(profiler.sample_count, 0)
+        lines = profiler.collapsed().splitlines()
+        spinner = [line for line in lines if line.startswith("spinner;")]
+        self.assertTrue(spinner)
+        stack, count = spinner[0].rsplit(" ", 1)
+        self.assertIn("spin (test_profiler.py:", stack)
+        self.assertGreater(int(count), 0)
+        self.assertFalse(any("sampling-profiler" in line for line in lines))
+
+    def test_collapsed_while_sampling(self):
+        stop = threading.Event()
+        workers = [threading.Thread(target=spin, args=(stop,), name=f"spinner-{i}") for i in range(4)]
+        for worker in workers:
+            worker.start()
+        profiler = SamplingProfiler(interval=0.0005)
+        profiler.start()
+        deadline = time.perf_counter() + 0.2
+        try:
+            while time.perf_counter() < deadline:
+                profiler.collapsed()
+                profiler.reset()
+        finally:
+            profiler.stop()
+            stop.set()
+            for worker in workers:
+                worker.join()
+
+
+class TestNodeProfiling(unittest.TestCase):
+    def setUp(self):
+        self.network = LoopbackNetwork()
+        with patch('src.server.server_node.ServerNode._get_local_ip', return_value="127.0.0.1"):
+            self.node = ServerNode("1", "127.0.0.1", 7801, 0)
+        self.network.attach(self.node)
+        self.replies = []
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.node.create_room("lobby")
+            self.conn = self.network.open_client(self.node, "ops", self.on_message)
+            self.network.run()
+
+    def on_message(self, msg):
+        if msg.type == MessageType.ADMIN:
+            self.replies.append(AdminPayload.from_message(msg))
+
+    def admin(self, command: AdminCommand):
+        self.conn.send(AdminPayload(command).to_message("ops"))
+        self.network.run()
+
+    def test_admin_needs_opt_in(self):
+        self.admin(AdminCommand.TIMING_ON)
+        self.assertEqual(self.replies, [])
+        self.assertFalse(self.node.timer.enabled)
+
+    def test_admin_is_authorized_by_connection_not_sender_id(self):
+        self.node.admin_enabled = True
+        remote = self.network.open_client(self.node, "mallory", lambda msg: None)
+        self.network.run()
+        remote.peer.ip = "10.0.0.7"
+        # claims to be the local operator
+        remote.send(AdminPayload(AdminCommand.TIMING_ON).to_message("ops"))
+        self.network.run()
+        self.assertFalse(self.node.timer.enabled)
+        self.assertEqual(self.replies, [])
+
+        self.admin(AdminCommand.TIMING_ON)
+        self.assertTrue(self.node.timer.enabled)
+
+    def test_per_type_and_handler_timing(self):
+        self.node.admin_enabled = True
+        self.admin(AdminCommand.TIMING_ON)
+        self.assertTrue(self.replies[-1].result["timing"])
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.conn.send(Message(type=MessageType.JOIN_ROOM, sender_id="ops", room_id="lobby"))
+            self.conn.send(Message(type=MessageType.CHAT, sender_id="ops", room_id="lobby", vector_clock=VectorClock({"ops": 1})))
+            self.network.run()
+
+        m = self.node.metrics
+        wall = m.histogram("handler_wall_seconds", type="CHAT", handler="_handle_chat")
+        cpu = m.histogram("handler_cpu_seconds", type="CHAT", handler="_handle_chat")
+        self.assertEqual(wall.count, 1)
+        self.assertEqual(cpu.count, 1)
+        self.assertEqual(m.histogram("handler_wall_seconds", type="JOIN_ROOM", handler="_handle_join_room").count, 1)
+
+        self.admin(AdminCommand.TIMING_OFF)
+        self.conn.send(Message(type=MessageType.CHAT, sender_id="ops", room_id="lobby", vector_clock=VectorClock({"ops": 2})))
+        self.network.run()
+        self.assertEqual(wall.count, 1)
+
+    def test_sampling_toggled_by_admin(self):
+        self.node.admin_enabled = True
+        self.admin(AdminCommand.PROFILE_START)
+        self.assertTrue(self.replies[-1].result["sampling"])
+        time.sleep(0.05)
+        self.admin(AdminCommand.PROFILE_STOP)
+        self.assertFalse(self.node.profiler.running)
+        self.admin(AdminCommand.PROFILE_DUMP)
+        # the test thread itself was sampled while sleeping
+        self.assertIn("test_sampling_toggled_by_admin", self.replies[-1].result["collapsed"])
+
+if __name__ == "__main__":
+    unittest.main()
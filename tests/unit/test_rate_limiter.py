@@ -0,0 +1,190 @@
+import unittest
+import threading
+import time
+import contextlib
+import io
+from unittest.mock import patch
+from src.domain.control import ThrottleAction, ThrottlePayload, ThrottleScope
+from src.domain.models import Message, MessageType, VectorClock
+from src.server.rate_limiter import RateLimiter, TokenBucket, rate_limiter_from_spec
+from src.server.server_node import ServerNode
+from src.sim.loopback import LoopbackNetwork
+
+class TestTokenBucket(unittest.TestCase):
+    def test_burst_then_refill(self):
+        bucket = TokenBucket(rate=10, burst=2, now=0.0)
+        for _ in range(2):
+            self.assertTrue(bucket.available(0.0))
+            bucket.take(0.0)
+        self.assertFalse(bucket.available(0.0))
+        self.assertAlmostEqual(bucket.wait_time(0.0), 0.1)
+        self.assertTrue(bucket.available(0.1))
+        # never more than burst
+        self.assertAlmostEqual(bucket.wait_time(100.0), 0.0)
+        self.assertEqual(bucket.tokens, 2)
+
+    def test_full_once_refilled(self):
+        bucket = TokenBucket(rate=10, burst=2, now=0.0)
+        bucket.take(0.0)
+        self.assertFalse(bucket.full(0.05))
+        self.assertTrue(bucket.full(0.1))
+
+
+class TestRateLimiter(unittest.TestCase):
+    def setUp(self):
+        self.network = LoopbackNetwork()
+        with patch('src.server.server_node.ServerNode._get_local_ip', return_value="127.0.0.1"):
+            self.node = ServerNode("1", "127.0.0.1", 7501, 0)
+        self.network.attach(self.node)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.room = self.node.create_room("lobby")
+
+        self.inbox = {"spammer": [], "listener": []}
+        self.conns = {}
+        for client_id in self.inbox:
+            conn = self.network.open_client(self.node, client_id, self.inbox[client_id].append)
+            conn.send(Message(type=MessageType.JOIN_ROOM, sender_id=client_id, room_id="lobby"))
+            self.conns[client_id] = conn
+        self.settle()
+
+    def use(self, policy):
+        self.node.rate_limiter = RateLimiter(self.node, policy=policy, client_rate=10, client_burst=2)
+
+    def settle(self, until=None):
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.network.run(until=until)
+
+    def flood(self, count, start=1):
+        messages = []
+        for seq in range(start, start + count):
+            msg = Message(
+                type=MessageType.CHAT, sender_id="spammer", room_id="lobby",
+                content=f"m{seq}", vector_clock=VectorClock({"spammer": seq}),
+            )
+            messages.append(msg)
+            self.conns["spammer"].send(msg)
+        return messages
+
+    def chats(self, client_id):
+        return [m.content for m in self.inbox[client_id] if m.type == MessageType.CHAT]
+
+    def notices(self):
+        return [ThrottlePayload.from_message(m) for m in self.inbox["spammer"] if m.type == MessageType.THROTTLED]
+
+    def test_reject_drops_before_causal_processing(self):
+        self.use(RateLimiter.POLICY_REJECT)
+        sent = self.flood(4)
+        self.settle()
+
+        self.assertEqual(self.chats("listener"), ["m1", "m2"])
+        self.assertEqual(self.room.hold_back_queue, [])
+        notices = self.notices()
+        self.assertEqual([n.message_id for n in notices], [m.message_id for m in sent[2:]])
+        self.assertTrue(all(n.action == ThrottleAction.REJECTED and n.scope == ThrottleScope.CLIENT for n in notices))
+        self.assertGreater(notices[0].retry_after, 0)
+
+        stats = self.node.rate_limiter.stats()
+        self.assertEqual((stats["admitted"], stats["rejected"]), (2, 2))
+        self.assertEqual(stats["by_client"], {"spammer": 2})
+
+        # resending the rejected ones with their clocks fills the gap in order
+        self.network.run(until=self.network.now + 0.5)
+        for msg in sent[2:]:
+            self.conns["spammer"].send(msg)
+        self.settle()
+        self.assertEqual(self.chats("listener"), ["m1", "m2", "m3", "m4"])
+
+    def test_delay_queues_in_order(self):
+        self.use(RateLimiter.POLICY_DELAY)
+        self.flood(5)
+        self.settle(until=self.network.now + 0.05)
+        self.assertEqual(self.chats("listener"), ["m1", "m2"])
+
+        self.settle()
+        self.assertEqual(self.chats("listener"), ["m1", "m2", "m3", "m4", "m5"])
+        self.assertTrue(all(n.action == ThrottleAction.DELAYED for n in self.notices()))
+        self.assertEqual(self.node.rate_limiter.stats()["delayed"], 3)
+        self.assertEqual(self.node.rate_limiter.stats()["queued"], 0)
+
+    def test_drain_delivers_under_the_room_lock(self):
+        self.use(RateLimiter.POLICY_DELAY)
+        self.flood(3)
+        self.settle(until=self.network.now + 0.01)
+        self.assertEqual(self.chats("listener"), ["m1", "m2"])
+
+        # a reader thread is delivering into the room while the drain timer fires
+        drain = threading.Thread(target=self.settle)
+        with self.room.lock:
+            drain.start()
+            time.sleep(0.05)
+            self.assertEqual(self.chats("listener"), ["m1", "m2"])
+        drain.join()
+        self.assertEqual(self.chats("listener"), ["m1", "m2", "m3"])
+
+    def test_queued_chats_report_the_blocking_bucket(self):
+        self.node.rate_limiter = RateLimiter(self.node, policy=RateLimiter.POLICY_DELAY,
+                                             client_rate=1000, client_burst=100, room_rate=10, room_burst=2)
+        self.flood(5)
+        self.settle(until=self.network.now + 0.01)
+
+        # the room bucket holds up the queue; the client's own bucket is full
+        notices = self.notices()
+        self.assertEqual(len(notices), 3)
+        self.assertTrue(all(n.scope == ThrottleScope.ROOM for n in notices))
+        self.assertTrue(all(n.retry_after > 0 for n in notices))
+        self.settle()
+        self.assertEqual(self.chats("listener"), ["m1", "m2", "m3", "m4", "m5"])
+
+    def test_forwarded_chats_skip_the_client_bucket(self):
+        self.use(RateLimiter.POLICY_REJECT)
+        for seq in range(1, 6):
+            self.node.process_message(Message(
+                type=MessageType.CHAT, sender_id="remote", room_id="lobby",
+                content=f"r{seq}", vector_clock=VectorClock({"remote": seq}),
+            ))
+        self.settle()
+        self.assertEqual(self.chats("listener"), [f"r{i}" for i in range(1, 6)])
+        self.assertEqual(self.node.rate_limiter.stats()["rejected"], 0)
+        self.assertNotIn("remote", self.node.rate_limiter.client_buckets)
+
+    def test_idle_buckets_are_dropped(self):
+        self.node.rate_limiter = RateLimiter(self.node, client_rate=10, client_burst=2, sweep_interval=1.0)
+        self.flood(3)
+        self.settle()
+        limiter = self.node.rate_limiter
+        self.assertEqual(set(limiter.client_buckets), {"spammer"})
+        self.assertEqual(limiter.throttled_by_client, {"spammer": 1})
+
+        # the listener's CHAT comes after the sweep interval, when the spammer's bucket is full again
+        self.network.run(until=self.network.now + 2.0)
+        self.conns["listener"].send(Message(
+            type=MessageType.CHAT, sender_id="listener", room_id="lobby",
+            content="hi", vector_clock=VectorClock({"spammer": 2, "listener": 1}),
+        ))
+        self.settle()
+        self.assertEqual(set(limiter.client_buckets), {"listener"})
+        self.assertEqual(limiter.throttled_by_client, {})
+        self.assertEqual(limiter.throttled_by_room, {})
+        self.assertEqual(limiter.stats()["rejected"], 1)
+
+
+class TestRateLimiterSpec(unittest.TestCase):
+    def test_default_is_reject_with_default_limits(self):
+        limiter = rate_limiter_from_spec(None, None)
+        self.assertEqual(limiter.policy, RateLimiter.POLICY_REJECT)
+        self.assertEqual(limiter.client_limits, RateLimiter(None).client_limits)
+
+    def test_policy_and_limits(self):
+        limiter = rate_limiter_from_spec(None, "delay, client=5/10, room=100, queue=8")
+        self.assertEqual(limiter.policy, RateLimiter.POLICY_DELAY)
+        self.assertEqual(limiter.client_limits, (5.0, 10.0))
+        self.assertEqual(limiter.room_limits, (100.0, 200.0))
+        self.assertEqual(limiter.queue_size, 8)
+
+    def test_unknown_input_is_an_error(self):
+        for spec in ("drop", "reject,clients=1/2", "delay,queue"):
+            with self.assertRaises(ValueError, msg=spec):
+                rate_limiter_from_spec(None, spec)
+
+if __name__ == "__main__":
+    unittest.main()
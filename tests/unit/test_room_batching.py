@@ -0,0 +1,152 @@
+import unittest
+import sys
+import threading
+import time
+from types import SimpleNamespace
+import contextlib
+import io
+from unittest.mock import patch
+from src.client.chat_client import ChatClient
+from src.domain.batch import pack_batch, unpack_batch
+from src.domain.models import Message, MessageType, Room, VectorClock
+from src.network.clock import SystemClock
+from src.server.multicast import CausalMulticastHandler
+from src.server.server_node import ServerNode
+from src.sim.loopback import LoopbackNetwork
+
+class TestBatchFrame(unittest.TestCase):
+    def test_round_trip_keeps_order_and_exact_clocks(self):
+        messages = [
+            Message(type=MessageType.CHAT, sender_id="a", room_id="r", content="1", vector_clock=VectorClock({"a": 1})),
+            Message(type=MessageType.CHAT, sender_id="b", room_id="r", content="2", vector_clock=VectorClock({"a": 1, "b": 1})),
+            Message(type=MessageType.CHAT, sender_id="a", room_id="r", content="3", vector_clock=VectorClock({"a": 2, "b": 1})),
+        ]
+        batch = Message.deserialize(pack_batch("r", messages).serialize())
+        self.assertEqual(batch.type, MessageType.BATCH)
+        self.assertEqual(batch.vector_clock.timestamps, {"a": 1})
+
+        unpacked = unpack_batch(batch)
+        self.assertEqual([m.content for m in unpacked], ["1", "2", "3"])
+        self.assertEqual([m.message_id for m in unpacked], [m.message_id for m in messages])
+        self.assertEqual(
+            [m.vector_clock.timestamps for m in unpacked],
+            [m.vector_clock.timestamps for m in messages],
+        )
+        self.assertTrue(all(m.type == MessageType.CHAT and m.room_id == "r" for m in unpacked))
+
+    def test_client_unpacks_batch_in_order(self):
+        client = ChatClient("bot", client_id="me")
+        seen = []
+        messages = [
+            Message(type=MessageType.CHAT, sender_id="a", room_id="r", content=str(i), vector_clock=VectorClock({"a": i}))
+            for i in range(1, 4)
+        ]
+        with patch('builtins.print', side_effect=lambda line: seen.append(line)):
+            client.receive_message(pack_batch("r", messages))
+        self.assertEqual([line.rsplit(" ", 1)[-1] for line in seen], ["1", "2", "3"])
+        self.assertEqual(client.rooms.session("r").clock.timestamps, {"a": 3})
+
+
+class TestRoomBatching(unittest.TestCase):
+    def setUp(self):
+        self.network = LoopbackNetwork()
+        with patch('src.server.server_node.ServerNode._get_local_ip', return_value="127.0.0.1"):
+            self.node = ServerNode("1", "127.0.0.1", 7401, 0)
+        self.network.attach(self.node)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.room = self.node.create_room("bots", batch_interval=0.05, batch_size=3)
+
+        self.inbox = []
+        self.bot = self.network.open_client(self.node, "bot", lambda msg: None)
+        self.listener = self.network.open_client(self.node, "listener", self.inbox.append)
+        for conn, client_id in ((self.bot, "bot"), (self.listener, "listener")):
+            conn.send(Message(type=MessageType.JOIN_ROOM, sender_id=client_id, room_id="bots"))
+        self.settle()
+        self.inbox.clear()
+
+    def settle(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.network.run()
+
+    def post(self, count, start=1):
+        for seq in range(start, start + count):
+            self.bot.send(Message(
+                type=MessageType.CHAT, sender_id="bot", room_id="bots",
+                content=f"m{seq}", vector_clock=VectorClock({"bot": seq}),
+            ))
+
+    def chats(self):
+        out = []
+        for frame in self.inbox:
+            out.extend(unpack_batch(frame) if frame.type == MessageType.BATCH else [frame])
+        return [m.content for m in out]
+
+    def test_full_batch_is_sent_at_once(self):
+        self.post(6)
+        self.settle()
+        self.assertEqual([f.type for f in self.inbox], [MessageType.BATCH, MessageType.BATCH])
+        self.assertEqual(self.chats(), [f"m{i}" for i in range(1, 7)])
+
+    def test_partial_batch_flushes_after_interval(self):
+        self.post(2)
+        self.network.run(until=self.network.now + 0.02)
+        self.assertEqual(self.inbox, [])
+        self.settle()
+        self.assertEqual(len(self.inbox), 1)
+        self.assertEqual(self.chats(), ["m1", "m2"])
+        self.assertEqual(self.room.pending_batch, [])
+        self.assertIsNone(self.room.batch_timer)
+
+class Sink:
+    def __init__(self):
+        self.frames = []
+
+    def send(self, msg):
+        self.frames.append(msg)
+
+
+class TestBatchingAcrossThreads(unittest.TestCase):
+    def test_timer_flushes_race_with_deliveries(self):
+        # reader threads deliver while the batch timer flushes on its own thread
+        member, edges = Sink(), []
+        host = SimpleNamespace(
+            server_id="1",
+            clock=SystemClock(),
+            connection_manager=SimpleNamespace(
+                active_connections_server_to_client={"listener": member},
+                send_to_node=lambda node_id, msg: edges.append(msg),
+            ),
+        )
+        room = Room(host, "bots", batch_interval=0.0001)
+        room.add_client("listener")
+        room.edge_subscribers.append("2")
+        handler = CausalMulticastHandler()
+
+        def post(sender):
+            for seq in range(1, 501):
+                handler.handle_chat_message(Message(
+                    type=MessageType.CHAT, sender_id=sender, room_id="bots",
+                    content=f"{sender}:{seq}", vector_clock=VectorClock({sender: seq}),
+                ), room)
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            threads = [threading.Thread(target=post, args=(f"bot{i}",)) for i in range(8)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        finally:
+            sys.setswitchinterval(interval)
+        time.sleep(0.05)
+        handler.flush_batch(room)
+
+        delivered = []
+        for frame in member.frames:
+            delivered.extend(unpack_batch(frame) if frame.type == MessageType.BATCH else [frame])
+        self.assertEqual(len(delivered), 4000)
+        self.assertEqual(len({m.content for m in delivered}), 4000)
+        self.assertEqual([m.headers["seq"] for m in edges], list(range(1, 4001)))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,141 @@
+import unittest
+import contextlib
+import io
+import json
+from unittest.mock import patch
+from src.domain.control import DirectoryPayload
+from src.domain.models import Message, MessageType
+from src.network.constants import DIRECTORY_MAX_DATAGRAM, DIRECTORY_MAX_PAGE
+from src.server.directory import ORDER_NAME, RoomDirectory
+from src.server.server_node import ServerNode
+from src.server.server_state import ServerState
+from src.sim.loopback import LoopbackNetwork
+
+class TestRoomDirectory(unittest.TestCase):
+    def test_prefix_search_and_popularity(self):
+        d = RoomDirectory()
+        for room_id in ("music", "movies", "math", "art"):
+            d.set_room(room_id, "1")
+        d.set_members("math", "1", 3)
+        d.set_members("math", "2", 4)  # members on an edge node add up
+        d.set_members("movies", "1", 5)
+
+        entries, total = d.page()
+        self.assertEqual(total, 4)
+        self.assertEqual([e[0] for e in entries[:2]], ["math", "movies"])
+        self.assertEqual(entries[0], ("math", "1", 7))
+
+        entries, total = d.page(prefix="m", order=ORDER_NAME, offset=1, limit=1)
+        self.assertEqual((entries, total), ([("movies", "1", 5)], 3))
+        self.assertEqual(d.page(prefix="mo")[1], 1)
+
+        d.set_members("math", "2", 0)
+        self.assertEqual(d.members("math"), 3)
+        # followers adopt the leader's totals wholesale; missing rooms are empty
+        self.assertTrue(d.set_totals({"art": 2}))
+        self.assertEqual((d.members("art"), d.members("math")), (2, 0))
+
+
+    def test_new_leader_drops_adopted_totals(self):
+        d = RoomDirectory()
+        d.set_room("lobby", "1")
+        d.set_totals({"lobby": 3})
+        # became leader: the old leader's totals give way to fresh reports
+        self.assertTrue(d.drop_node(""))
+        d.set_members("lobby", "2", 3)
+        self.assertEqual(d.members("lobby"), 3)
+
+        d.set_members("lobby", "3", 2)
+        self.assertTrue(d.drop_node("3"))
+        self.assertEqual(d.members("lobby"), 3)
+        self.assertFalse(d.drop_node("3"))
+
+
+class TestDirectoryServing(unittest.TestCase):
+    def setUp(self):
+        self.network = LoopbackNetwork()
+        with patch('src.server.server_node.ServerNode._get_local_ip', return_value="127.0.0.1"):
+            self.leader = ServerNode("1", "127.0.0.1", 7501, 0)
+            self.follower = ServerNode("2", "127.0.0.1", 7502, 0)
+        for node in (self.leader, self.follower):
+            self.network.attach(node)
+        self.network.connect(self.leader, self.follower)
+        self.follower.state = ServerState.FOLLOWER
+        self.follower.leader_id = self.leader.leader_id = "1"
+        with contextlib.redirect_stdout(io.StringIO()):
+            for i in range(500):
+                self.leader.create_room(f"room-{i:03d}")
+
+    def test_udp_pages_fit_a_datagram_and_cover_all_rooms(self):
+        seen = []
+        query = DirectoryPayload()
+        while True:
+            frame = self.leader._available_rooms_frame(query)
+            self.assertLessEqual(len(frame), DIRECTORY_MAX_DATAGRAM)
+            page = json.loads(Message.deserialize(frame).content)
+            self.assertEqual(page["total"], 500)
+            self.assertEqual(page["servers"]["1"]["port"], 7501)
+            seen.extend(page["rooms"])
+            if page["next_offset"] is None:
+                break
+            query = DirectoryPayload(offset=page["next_offset"])
+        self.assertEqual(sorted(seen), sorted(self.leader.metadata_store.room_locations))
+
+    def test_member_counts_reach_leader_and_followers(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.follower.metadata_store.set_room("room-007", "1")
+            for i in range(3):
+                conn = self.network.open_client(self.follower, f"c{i}", lambda msg: None)
+                conn.send(Message(type=MessageType.JOIN_ROOM, sender_id=f"c{i}", room_id="room-007"))
+            self.network.run(until=self.network.now + 2)
+            # the leader's next sync carries the totals
+            self.leader.metadata_store.sync_with_leader(
+                self.leader.connection_manager.active_connections_peer_to_peer["2"], "1", self.leader.connection_manager)
+            self.network.run()
+
+        self.assertEqual(self.leader.metadata_store.directory.members("room-007"), 3)
+        self.assertEqual(self.follower.metadata_store.directory.members("room-007"), 3)
+        top = self.leader.directory_page(DirectoryPayload(limit=1))
+        self.assertEqual(top.rooms, {"room-007": "1"})
+
+    def test_follower_turned_leader_recounts(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.follower.metadata_store.set_room("room-007", "1")
+            for i in range(3):
+                conn = self.network.open_client(self.follower, f"c{i}", lambda msg: None)
+                conn.send(Message(type=MessageType.JOIN_ROOM, sender_id=f"c{i}", room_id="room-007"))
+            self.network.run(until=self.network.now + 2)
+            self.leader.metadata_store.sync_with_leader(
+                self.leader.connection_manager.active_connections_peer_to_peer["2"], "1", self.leader.connection_manager)
+            self.network.run()
+
+            # 1 is gone; 2 takes over and must not add its own report to the totals it held
+            self.follower.failure_detector.on_failure_detected(("server", "1"), self.follower.connection_manager)
+            self.network.run()
+        self.assertEqual(self.follower.state, ServerState.LEADER)
+        self.assertEqual(self.follower.metadata_store.directory.members("room-007"), 3)
+
+    def test_crashed_node_counts_are_dropped(self):
+        self.leader.leader_id = "1"
+        self.leader.metadata_store.set_members({"room-001": 4}, "2")
+        self.leader._recompute_ring()
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.leader.failure_detector.on_failure_detected(("server", "2"), self.leader.connection_manager)
+        self.assertEqual(self.leader.metadata_store.directory.members("room-001"), 0)
+
+    def test_tcp_listing_with_prefix(self):
+        replies = []
+        with contextlib.redirect_stdout(io.StringIO()):
+            conn = self.network.open_client(self.leader, "c", replies.append)
+            conn.send(DirectoryPayload(prefix="room-1", limit=5000, order=ORDER_NAME).to_message("c"))
+            conn.send(DirectoryPayload(limit=5000).to_message("c"))
+            self.network.run()
+
+        pages = [DirectoryPayload.from_message(msg) for msg in replies if msg.type == MessageType.ROOM_DIRECTORY]
+        self.assertEqual(pages[0].total, 100)
+        self.assertEqual(list(pages[0].rooms)[:2], ["room-100", "room-101"])
+        self.assertIsNone(pages[0].next_offset)
+        self.assertEqual(len(pages[1].rooms), min(500, DIRECTORY_MAX_PAGE))
+
+if __name__ == "__main__":
+    unittest.main()
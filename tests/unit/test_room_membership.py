@@ -0,0 +1,88 @@
+import unittest
+import contextlib
+import io
+from unittest.mock import patch, MagicMock
+from src.domain.membership import MemberSet
+from src.domain.models import Message, MessageType, Room
+from src.server.server_node import ServerNode
+from src.server.server_state import ServerState
+from src.sim.loopback import LoopbackNetwork
+
+class TestMemberSet(unittest.TestCase):
+    def test_insertion_order_and_idempotent_updates(self):
+        members = MemberSet(["b", "a"])
+        self.assertTrue(members.add("c"))
+        self.assertFalse(members.add("a"))
+        self.assertEqual(list(members), ["b", "a", "c"])
+        self.assertTrue(members.discard("a"))
+        self.assertFalse(members.discard("a"))
+        self.assertEqual(members, ["b", "c"])
+        self.assertIn("c", members)
+
+    def test_iteration_survives_concurrent_leave(self):
+        room = Room(room_id="r", client_ids=["a", "b", "c"])
+        seen = []
+        for client_id in room.client_ids:
+            seen.append(client_id)
+            room.remove_client("c")
+        self.assertEqual(seen, ["a", "b", "c"])
+        self.assertEqual(room.client_ids, ["a", "b"])
+
+
+class TestClientCleanup(unittest.TestCase):
+    def setUp(self):
+        self.network = LoopbackNetwork()
+        with patch('src.server.server_node.ServerNode._get_local_ip', return_value="127.0.0.1"):
+            self.host = ServerNode("1", "127.0.0.1", 7401, 0)
+            self.edge = ServerNode("2", "127.0.0.1", 7402, 0)
+        for node in (self.host, self.edge):
+            self.network.attach(node)
+        self.network.connect(self.host, self.edge)
+        self.edge.state = ServerState.FOLLOWER
+        self.edge.leader_id = self.host.leader_id = "1"
+        with contextlib.redirect_stdout(io.StringIO()):
+            for i in range(20):
+                self.edge.create_room(f"local-{i}")
+            self.host.create_room("remote")
+            self.edge.metadata_store.set_room("remote", "1")
+
+    def join(self, client_id, rooms):
+        received = []
+        conn = self.network.open_client(self.edge, client_id, received.append)
+        for room_id in rooms:
+            conn.send(Message(type=MessageType.JOIN_ROOM, sender_id=client_id, room_id=room_id))
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.network.run(until=self.network.now + 2)
+        return received
+
+    def test_timeout_removes_hosted_and_edge_memberships(self):
+        self.join("a", ["local-3", "local-7", "remote"])
+        self.join("b", ["local-3"])
+        self.assertEqual(self.edge.memberships.rooms_of("a"), {"local-3", "local-7", "remote"})
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.edge.failure_detector.on_failure_detected(("client", "a"), self.edge.connection_manager)
+
+        self.assertEqual(self.edge.managed_rooms["local-3"].client_ids, ["b"])
+        self.assertEqual(self.edge.managed_rooms["local-7"].client_ids, [])
+        self.assertNotIn("remote", self.edge.federation.edge_members)
+        self.assertEqual(self.edge.memberships.rooms_of("a"), set())
+        self.assertNotIn("a", self.edge.connection_manager.active_connections_server_to_client)
+
+    def test_leave_updates_reverse_index(self):
+        self.join("a", ["local-1", "local-2"])
+        self.edge._handle_leave_room(Message(type=MessageType.LEAVE_ROOM, sender_id="a", room_id="local-1"))
+        self.assertEqual(self.edge.memberships.rooms_of("a"), {"local-2"})
+        self.assertEqual(self.edge.managed_rooms["local-1"].client_ids, [])
+
+    def test_multicast_skips_member_without_connection(self):
+        received = self.join("a", ["local-5"])
+        room = self.edge.managed_rooms["local-5"]
+        room.add_client("gone")
+        chat = Message(type=MessageType.CHAT, sender_id="a", room_id="local-5", content="hi")
+        self.edge.multicast_handler.multicast(chat, room)
+        self.network.run()
+        self.assertIn("hi", [msg.content for msg in received])
+
+if __name__ == "__main__":
+    unittest.main()